@@ -57,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",  # keep near top
+    "smartshop.middleware.PerfMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -163,6 +164,155 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
 
+# LLM request coalescing: identical in-flight prompts share one Gemini call.
+# CLUSTER=1 also coordinates across workers via the Django cache (needs a shared cache backend).
+LLM_SINGLE_FLIGHT_CLUSTER = os.getenv("LLM_SINGLE_FLIGHT_CLUSTER", "0") == "1"
+LLM_SINGLE_FLIGHT_WAIT = float(os.getenv("LLM_SINGLE_FLIGHT_WAIT", "60"))
+LLM_SINGLE_FLIGHT_RESULT_TTL = int(os.getenv("LLM_SINGLE_FLIGHT_RESULT_TTL", "10"))
+
+# Content-addressed LLM response cache (in-process LRU + LLMResponseCache table)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_MAX_ROWS = int(os.getenv("LLM_CACHE_MAX_ROWS", "5000"))
+# DB-tier hits update hits / last_used_at at most once per row per N seconds
+LLM_CACHE_TOUCH_SECONDS = int(os.getenv("LLM_CACHE_TOUCH_SECONDS", "300"))
+
+# Gemini circuit breaker + per-feature latency budgets (ms; also used as the SDK timeout)
+LLM_LATENCY_BUDGET_MS_DEFAULT = int(os.getenv("LLM_LATENCY_BUDGET_MS_DEFAULT", "8000"))
+LLM_LATENCY_BUDGETS_MS = {
+    "search_parse": 3000,
+    "search_rerank": 5000,
+    "recommendations": 8000,
+    "insights": 8000,
+    "review_digest": 8000,
+    "assistant": 15000,
+    "profile": 30000,
+}
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+# Gemini request quota used by batch jobs (token-bucket rate limiting)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+
+# LLM backend: "gemini" (default) or "fake" (offline stand-in for benchmarks)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_FAKE_LATENCY_MS = float(os.getenv("LLM_FAKE_LATENCY_MS", "300"))
+LLM_FAKE_JITTER_MS = float(os.getenv("LLM_FAKE_JITTER_MS", "100"))
+
+# LLM token / cost accounting (rolling window per feature)
+LLM_ACCOUNTING_WINDOW = int(os.getenv("LLM_ACCOUNTING_WINDOW", "500"))
+# USD per 1M tokens: model -> (input, output)
+LLM_PRICING_PER_MILLION = {
+    "models/gemini-2.5-flash": (0.30, 2.50),
+    "models/gemini-2.5-flash-lite": (0.10, 0.40),
+    "models/gemini-2.5-pro": (1.25, 10.00),
+}
+# Prompt-token budget per feature; prompts above it are counted as over budget
+LLM_PROMPT_TOKEN_BUDGETS = {
+    "search_parse": 1500,
+    "search_rerank": 4000,
+    "recommendations": 6000,
+    "insights": 2000,
+    "review_digest": 4000,
+    "assistant": 8000,
+    "profile": 3000,
+}
+
+# Encode product lists in prompts as compact tables (see smartshop/prompt_builder.py)
+LLM_COMPACT_PROMPTS = os.getenv("LLM_COMPACT_PROMPTS", "1") == "1"
+
+# Ask Gemini for schema-constrained JSON (response_schema / JSON mode)
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "1") == "1"
+
+# Materialized popularity tables (see smartshop/popularity.py)
+# Sliding windows in days (0 = all time) and rows kept per scope
+POPULARITY_WINDOWS = [int(x) for x in os.getenv("POPULARITY_WINDOWS", "7,30,365,0").split(",") if x.strip()]
+POPULARITY_TOP_N = int(os.getenv("POPULARITY_TOP_N", "50"))
+# Price bands: (label, lower bound inclusive); a band ends where the next begins
+POPULARITY_PRICE_BANDS = [
+    ("under_25", 0),
+    ("25_50", 25),
+    ("50_100", 50),
+    ("100_250", 100),
+    ("250_plus", 250),
+]
+
+# How long a process reuses the DB catalog version before re-reading it
+# (bounds how stale another process's catalog writes can look; 0 = every read)
+CATALOG_VERSION_CHECK_SECONDS = float(os.getenv("CATALOG_VERSION_CHECK_SECONDS", "1"))
+
+# Shared memory-mapped catalog files (manage.py build_catalog_files); empty = per-worker snapshot
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "")
+CATALOG_SNAPSHOT_KEEP = int(os.getenv("CATALOG_SNAPSHOT_KEEP", "3"))
+CATALOG_COPURCHASE_TOP_K = int(os.getenv("CATALOG_COPURCHASE_TOP_K", "50"))
+CATALOG_COPURCHASE_MAX_BASKET = int(os.getenv("CATALOG_COPURCHASE_MAX_BASKET", "100"))
+# Delay before the queued rebuild once a catalog write makes the files stale
+CATALOG_FILES_REBUILD_DELAY_SECONDS = float(os.getenv("CATALOG_FILES_REBUILD_DELAY_SECONDS", "10"))
+
+# Per-user purchased-product bitmaps (smartshop/purchased_bitmap.py), cache TTL in seconds
+PURCHASED_BITMAP_TTL = int(os.getenv("PURCHASED_BITMAP_TTL", "3600"))
+
+# Offline ALS model (manage.py train_als, smartshop/als.py); empty dir = disabled
+ALS_MODEL_DIR = os.getenv("ALS_MODEL_DIR", "")
+ALS_MODEL_KEEP = int(os.getenv("ALS_MODEL_KEEP", "2"))
+ALS_FACTORS = int(os.getenv("ALS_FACTORS", "32"))
+ALS_ITERATIONS = int(os.getenv("ALS_ITERATIONS", "15"))
+ALS_REGULARIZATION = float(os.getenv("ALS_REGULARIZATION", "0.05"))
+ALS_ALPHA = float(os.getenv("ALS_ALPHA", "10"))
+ALS_THREADS = int(os.getenv("ALS_THREADS", "0"))  # 0 = CPU count
+
+# Recommendation engines (smartshop/reco_engines.py): tried in order, first
+# non-empty result wins. A shadow engine runs on a sample of requests off the
+# request path to compare its latency and overlap with the primary.
+RECO_ENGINES = [x.strip() for x in os.getenv("RECO_ENGINES", "llm,als,popularity").split(",") if x.strip()]
+RECO_SHADOW_ENGINE = os.getenv("RECO_SHADOW_ENGINE", "")
+RECO_SHADOW_SAMPLE_RATE = float(os.getenv("RECO_SHADOW_SAMPLE_RATE", "1.0"))
+RECO_SHADOW_WORKERS = int(os.getenv("RECO_SHADOW_WORKERS", "2"))
+RECO_ENGINE_STATS_WINDOW = int(os.getenv("RECO_ENGINE_STATS_WINDOW", "500"))
+
+# Debounced background refresh of a user's recommendations / insights after purchases (smartshop/refresh.py)
+REFRESH_ON_PURCHASE = os.getenv("REFRESH_ON_PURCHASE", "1") == "1"
+REFRESH_DEBOUNCE_SECONDS = float(os.getenv("REFRESH_DEBOUNCE_SECONDS", "10"))
+
+# Background task queue (smartshop/tasks.py, manage.py run_ai_worker)
+# Per-type concurrency overrides, e.g. {"profiles.generate": 1}
+TASK_CONCURRENCY = {}
+TASK_POLL_SECONDS = float(os.getenv("TASK_POLL_SECONDS", "2"))
+TASK_RETRY_BASE_SECONDS = float(os.getenv("TASK_RETRY_BASE_SECONDS", "30"))
+TASK_RETRY_MAX_SECONDS = float(os.getenv("TASK_RETRY_MAX_SECONDS", "3600"))
+# Running tasks locked longer than this are presumed dead and re-queued (no
+# heartbeat: keep it above the slowest handler)
+TASK_LOCK_TIMEOUT_SECONDS = float(os.getenv("TASK_LOCK_TIMEOUT_SECONDS", "600"))
+TASK_KEEP_DAYS = float(os.getenv("TASK_KEEP_DAYS", "7"))
+
+# Transactional outbox of catalog / purchase / review changes (smartshop/outbox.py)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+# Ids skipped by a consumer (transaction not committed yet) are watched this
+# long before they count as rolled back; keep it above the longest writer
+OUTBOX_GAP_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_GAP_TIMEOUT_SECONDS", "900"))
+OUTBOX_CONSUME_DELAY_SECONDS = float(os.getenv("OUTBOX_CONSUME_DELAY_SECONDS", "5"))
+OUTBOX_KEEP_DAYS = float(os.getenv("OUTBOX_KEEP_DAYS", "7"))
+
+# "Trending now" heavy hitters (smartshop/trending.py): sliding window of
+# TRENDING_BUCKETS x TRENDING_BUCKET_SECONDS, count-min sketch shape, candidates
+# kept per bucket, and how often each worker reloads the shared state
+TRENDING_BUCKET_SECONDS = int(os.getenv("TRENDING_BUCKET_SECONDS", "3600"))
+TRENDING_BUCKETS = int(os.getenv("TRENDING_BUCKETS", "24"))
+TRENDING_SKETCH_WIDTH = int(os.getenv("TRENDING_SKETCH_WIDTH", "2048"))
+TRENDING_SKETCH_DEPTH = int(os.getenv("TRENDING_SKETCH_DEPTH", "4"))
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "50"))
+TRENDING_RELOAD_SECONDS = int(os.getenv("TRENDING_RELOAD_SECONDS", "30"))
+
+# Per-request perf instrumentation (Server-Timing header + /api/metrics/)
+PERF_METRICS_ENABLED = os.getenv("PERF_METRICS_ENABLED", "1") == "1"
+PERF_SERVER_TIMING = os.getenv("PERF_SERVER_TIMING", "1") == "1"
+# Diagnostics endpoints (/api/metrics/, /api/ai/tasks/, ...) are admin-only;
+# a scraper can send this value in an X-Metrics-Token header instead
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
 
@@ -1,23 +1,19 @@
-from typing import List, Dict, Any, Optional
-import json
-import re
+from typing import List, Dict, Any
 
-from google import genai
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
+from . import perf
+from .catalog_snapshot import get_catalog_snapshot
+from .llm import generate_text
+from .models import SmartShopPurchaseOrder, UserAIInsight
+from .prompt_builder import encode_products, format_note
+from .reco_service import get_recommendations_for_user
+from .structured_output import parse_structured, response_schema
+from .utils import purchase_signature
 
-def _extract_json_object(text: str) -> Optional[Dict[str, Any]]:
-    if not text:
-        return None
-
-    cleaned = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).replace("```", "").strip()
-    match = re.search(r"\{.*\}", cleaned, flags=re.DOTALL)
-    if not match:
-        return None
-
-    try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError:
-        return None
+PURCHASE_COLUMNS = ("name", "category", "price", "qty")
+RECOMMENDATION_COLUMNS = ("id", "name", "category", "price", "reason")
 
 
 def generate_user_insights_bullets(
@@ -30,10 +26,12 @@ def generate_user_insights_bullets(
 ) -> List[str]:
     """
     Returns readable bullet points as list[str].
-    Uses google.genai (new SDK).
+    Uses google.genai (new SDK). Failures (no API key, circuit open, latency
+    budget exceeded, any Gemini error) are raised, so the caller can serve a
+    fallback without caching it.
     """
     if not api_key:
-        return ["AI Insights unavailable: missing GEMINI_API_KEY."]
+        raise ImproperlyConfigured("GEMINI_API_KEY is not set")
 
     # Keep prompt small for speed
     purchases_small = purchases[:10]
@@ -41,14 +39,15 @@ def generate_user_insights_bullets(
 
     prompt = f"""
 You are SmartShop's shopping analyst.
+{format_note()}
 
 User: {username}
 
-Purchase history JSON:
-{json.dumps(purchases_small, ensure_ascii=False)}
+Purchase history:
+{encode_products(purchases_small, PURCHASE_COLUMNS)}
 
-Recommendations JSON:
-{json.dumps(recs_small, ensure_ascii=False)}
+Recommendations:
+{encode_products(recs_small, RECOMMENDATION_COLUMNS, max_chars={"reason": 120})}
 
 Return ONLY valid JSON in this exact schema:
 {{
@@ -64,22 +63,19 @@ Return ONLY valid JSON in this exact schema:
 Rules:
 - 5 to 7 bullets total.
 - Each bullet <= 18 words.
-- Do NOT invent products not in the JSON.
+- Do NOT invent products not listed above.
 - Make it easy to read.
 """.strip()
 
-    try:
-        client = genai.Client(api_key=api_key)
-        resp = client.models.generate_content(
-            model=model_name,
-            contents=prompt,
-        )
-        text = (resp.text or "").strip()
-    except Exception as e:
-        # return a single bullet with error type (safe)
-        return [f"AI Insights temporarily unavailable. ({type(e).__name__})"]
+    text = generate_text(
+        api_key=api_key,
+        model_name=model_name,
+        prompt=prompt,
+        feature="insights",
+        response_schema=response_schema("insights"),
+    )
 
-    data = _extract_json_object(text)
+    data = parse_structured(text, "insights")
     bullets = (data or {}).get("bullets", [])
 
     if isinstance(bullets, list) and bullets:
@@ -95,3 +91,73 @@ Rules:
         lines = [ln.strip().lstrip("•- ").strip() for ln in text.splitlines() if ln.strip()]
         return lines[:7] if lines else ["No insights generated."]
     return ["No insights generated."]
+
+
+def get_insights_for_user(user, force: bool = False) -> Dict[str, Any]:
+    """
+    Cached insight bullets, regenerated when the purchase signature changes.
+    When generation fails (circuit open, timeout, Gemini error) the fallback
+    text is returned unsaved, so the next call retries instead of serving it
+    until the next purchase.
+    Returns {"cached", "signature", "bullets", "text", "updated_at"}.
+    """
+    recent_orders = (
+        SmartShopPurchaseOrder.objects
+        .filter(user=user)
+        .order_by("-purchase_date")
+        .values_list("product_id", "quantity")[:15]
+    )
+    purchases_compact = get_catalog_snapshot().purchases_compact(recent_orders)
+
+    sig = purchase_signature(purchases_compact)
+
+    cached = UserAIInsight.objects.filter(user=user).first()
+    hit = (not force) and cached and cached.purchase_signature == sig and cached.bullets_json
+    perf.record_cache("insights", bool(hit))
+    if hit:
+        return {
+            "cached": True,
+            "signature": sig,
+            "bullets": cached.bullets_json,
+            "text": cached.text,
+            "updated_at": cached.updated_at,
+        }
+
+    # recommendations list (fast)
+    rec_data = get_recommendations_for_user(user, max_items=4, force=False)
+    recs = rec_data.get("recommended", [])
+
+    try:
+        bullets = generate_user_insights_bullets(
+            api_key=getattr(settings, "GEMINI_API_KEY", None),
+            model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
+            username=user.username,
+            purchases=purchases_compact,
+            recs=recs,
+        )
+    except Exception as e:
+        # Not saved: the next call regenerates
+        bullets = [f"AI Insights temporarily unavailable. ({type(e).__name__})"]
+        return {
+            "cached": False,
+            "signature": sig,
+            "bullets": bullets,
+            "text": "\n".join([f"• {b}" for b in bullets]),
+            "updated_at": cached.updated_at if cached else None,
+        }
+
+    if not cached:
+        cached = UserAIInsight(user=user)
+
+    cached.purchase_signature = sig
+    cached.bullets_json = bullets
+    cached.text = "\n".join([f"• {b}" for b in bullets])
+    cached.save()
+
+    return {
+        "cached": False,
+        "signature": sig,
+        "bullets": bullets,
+        "text": cached.text,
+        "updated_at": cached.updated_at,
+    }
@@ -0,0 +1,306 @@
+"""
+Implicit-feedback ALS (alternating least squares) over the user x product
+purchase matrix, trained offline and served from memory-mapped files.
+
+`manage.py train_als` factorizes the matrix built from SmartShopPurchaseOrder
+(confidence = 1 + ALS_ALPHA x units bought) into user and item factors and
+writes one versioned directory under settings.ALS_MODEL_DIR:
+
+    <dir>/<version>/meta.json          shape, hyper-parameters
+    <dir>/<version>/user_ids.bin       int64   user ids (ascending)
+    <dir>/<version>/item_ids.bin       int64   product ids (ascending)
+    <dir>/<version>/user_factors.bin   float32 users x factors
+    <dir>/<version>/item_factors.bin   float32 items x factors
+    <dir>/CURRENT                      name of the live version
+
+Publishing and pruning work like catalog_files. Workers map the factor files
+read-only; scoring every product for a user is one (items x factors) @
+(factors,) dot product plus a partial sort. Needs numpy; without it training
+raises ImproperlyConfigured and serving returns no results.
+"""
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Container, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Sum
+
+from .catalog_files import POINTER_NAME, new_version_dir, publish_version
+from .models import SmartShopPurchaseOrder
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+FORMAT_VERSION = 1
+
+
+def model_dir() -> str:
+    return str(getattr(settings, "ALS_MODEL_DIR", "") or "")
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise ImproperlyConfigured("ALS training needs numpy (pip install numpy).")
+
+
+# -----------------------------
+# Training
+# -----------------------------
+def _interactions() -> Tuple[Any, Any, Any, Any]:
+    """
+    (user_ids, item_ids, indptr, (item positions, units)) as a CSR matrix by user.
+    """
+    rows = list(
+        SmartShopPurchaseOrder.objects
+        .values("user_id", "product_id")
+        .annotate(units=Sum("quantity"))
+        .order_by("user_id", "product_id")
+        .values_list("user_id", "product_id", "units")
+    )
+    users = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    items = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    units = np.fromiter((max(1, int(r[2] or 1)) for r in rows), dtype=np.float32, count=len(rows))
+
+    user_ids = np.unique(users)
+    item_ids = np.unique(items)
+    indptr = np.searchsorted(users, user_ids).astype(np.int64)
+    indptr = np.append(indptr, len(rows))
+    return user_ids, item_ids, indptr, (np.searchsorted(item_ids, items), units)
+
+
+def _transpose(n_items: int, indptr, cols, values) -> Tuple[Any, Any, Any]:
+    """
+    CSR by user -> CSR by item.
+    """
+    user_of = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(cols, kind="stable")
+    item_indptr = np.searchsorted(cols[order], np.arange(n_items + 1))
+    return item_indptr, user_of[order], values[order]
+
+
+def _solve_rows(target, other, indptr, cols, conf, regularization: float, threads: int) -> None:
+    """
+    One ALS half-step: for each row r with observed columns I and confidences c,
+        (OtO + O_I^T diag(c - 1) O_I + reg I) x_r = O_I^T c
+    (Hu, Koren & Volinsky 2008). Rows are solved in chunks on a thread pool;
+    numpy's linear algebra releases the GIL.
+    """
+    k = other.shape[1]
+    base = other.T @ other + regularization * np.eye(k, dtype=np.float64)
+
+    def solve(chunk: range) -> None:
+        for r in chunk:
+            start, end = indptr[r], indptr[r + 1]
+            if start == end:
+                target[r] = 0.0
+                continue
+            o = other[cols[start:end]].astype(np.float64)
+            c = conf[start:end].astype(np.float64)
+            a = base + (o.T * (c - 1.0)) @ o
+            target[r] = np.linalg.solve(a, o.T @ c)
+
+    n = target.shape[0]
+    step = max(1, -(-n // (threads * 4)))
+    chunks = [range(i, min(n, i + step)) for i in range(0, n, step)]
+    if threads <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            solve(chunk)
+        return
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(solve, chunks))
+
+
+def train_als(
+    *,
+    factors: Optional[int] = None,
+    iterations: Optional[int] = None,
+    regularization: Optional[float] = None,
+    alpha: Optional[float] = None,
+    threads: Optional[int] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    Returns {"user_ids", "item_ids", "user_factors", "item_factors"} (numpy
+    arrays, factors as float32) plus the parameters used.
+    """
+    _require_numpy()
+    factors = int(factors or getattr(settings, "ALS_FACTORS", 32))
+    iterations = int(iterations or getattr(settings, "ALS_ITERATIONS", 15))
+    regularization = float(regularization if regularization is not None else getattr(settings, "ALS_REGULARIZATION", 0.05))
+    alpha = float(alpha if alpha is not None else getattr(settings, "ALS_ALPHA", 10.0))
+    threads = int(threads or getattr(settings, "ALS_THREADS", 0) or os.cpu_count() or 1)
+
+    user_ids, item_ids, indptr, (cols, units) = _interactions()
+    conf = 1.0 + alpha * units
+    item_indptr, item_cols, item_conf = _transpose(len(item_ids), indptr, cols, conf)
+
+    rng = np.random.default_rng(seed)
+    user_factors = np.zeros((len(user_ids), factors), dtype=np.float64)
+    item_factors = rng.normal(0.0, 0.01, size=(len(item_ids), factors))
+
+    if len(user_ids):
+        for _ in range(iterations):
+            _solve_rows(user_factors, item_factors, indptr, cols, conf, regularization, threads)
+            _solve_rows(item_factors, user_factors, item_indptr, item_cols, item_conf, regularization, threads)
+
+    return {
+        "user_ids": user_ids,
+        "item_ids": item_ids,
+        "user_factors": user_factors.astype(np.float32),
+        "item_factors": item_factors.astype(np.float32),
+        "factors": factors,
+        "iterations": iterations,
+        "regularization": regularization,
+        "alpha": alpha,
+        "threads": threads,
+        "interactions": int(len(cols)),
+    }
+
+
+def write_als_model(
+    base_dir: Optional[str] = None,
+    *,
+    keep: Optional[int] = None,
+    **train_opts: Any,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Trains, writes and publishes a new model version. Returns (version directory, meta).
+    """
+    base_dir = base_dir or model_dir()
+    if not base_dir:
+        raise ValueError("No ALS model directory (settings.ALS_MODEL_DIR).")
+    keep = int(keep if keep is not None else getattr(settings, "ALS_MODEL_KEEP", 2))
+
+    model = train_als(**train_opts)
+    version, tmp_dir = new_version_dir(base_dir)
+    for name in ("user_ids", "item_ids", "user_factors", "item_factors"):
+        model[name].tofile(os.path.join(tmp_dir, f"{name}.bin"))
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "users": int(len(model["user_ids"])),
+        "items": int(len(model["item_ids"])),
+        "byteorder": sys.byteorder,
+        **{k: model[k] for k in ("factors", "iterations", "regularization", "alpha", "threads", "interactions")},
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    return publish_version(base_dir, tmp_dir, version, keep=keep), meta
+
+
+# -----------------------------
+# Serving
+# -----------------------------
+class ALSModel:
+    def __init__(self, version: str, *, user_ids, item_ids, user_factors, item_factors):
+        self.version = version
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+
+    def _user_row(self, user_id: int) -> Optional[int]:
+        i = int(np.searchsorted(self.user_ids, user_id))
+        if i < len(self.user_ids) and self.user_ids[i] == user_id:
+            return i
+        return None
+
+    def recommend(self, user_id: int, limit: int, *, exclude: Container[int] = ()) -> List[Tuple[int, float]]:
+        """
+        [(product_id, score)] best first; unknown users get [].
+        exclude must be iterable as well (e.g. a PurchasedSet).
+        """
+        row = self._user_row(int(user_id))
+        if row is None or limit <= 0 or not len(self.item_ids):
+            return []
+        scores = self.item_factors @ self.user_factors[row]
+
+        excluded = np.fromiter(iter(exclude), dtype=np.int64)  # type: ignore[call-overload]
+        if len(excluded):
+            pos = np.searchsorted(self.item_ids, excluded)
+            inside = pos < len(self.item_ids)
+            pos, excluded = pos[inside], excluded[inside]
+            scores[pos[self.item_ids[pos] == excluded]] = -np.inf
+
+        n = min(limit, len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.item_ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i]) and scores[i] > 0]
+
+
+def load_als_model(version_dir: str) -> Optional[ALSModel]:
+    with open(os.path.join(version_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_VERSION or meta.get("byteorder") != sys.byteorder:
+        return None
+
+    def mapped(name: str, dtype, shape) -> Any:
+        if not shape[0]:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(os.path.join(version_dir, f"{name}.bin"), dtype=dtype, mode="r", shape=shape)
+
+    users, items, k = meta["users"], meta["items"], meta["factors"]
+    return ALSModel(
+        meta["version"],
+        user_ids=mapped("user_ids", np.int64, (users,)),
+        item_ids=mapped("item_ids", np.int64, (items,)),
+        user_factors=mapped("user_factors", np.float32, (users, k)),
+        item_factors=mapped("item_factors", np.float32, (items, k)),
+    )
+
+
+_model: Optional[ALSModel] = None
+_pointer_stat: Optional[Tuple[int, int]] = None
+_model_lock = threading.Lock()
+
+
+def current_als_model() -> Optional[ALSModel]:
+    """
+    Model named by CURRENT under settings.ALS_MODEL_DIR, or None when no
+    model has been trained (or numpy is missing).
+    """
+    global _model, _pointer_stat
+    base_dir = model_dir()
+    if np is None or not base_dir:
+        return None
+    pointer = os.path.join(base_dir, POINTER_NAME)
+    try:
+        st = os.stat(pointer)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_ino)
+    if _model is not None and stamp == _pointer_stat:
+        return _model
+
+    with _model_lock:
+        if _model is not None and stamp == _pointer_stat:
+            return _model
+        with open(pointer, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if _model is None or _model.version != version:
+            try:
+                model = load_als_model(os.path.join(base_dir, version))
+            except (OSError, ValueError, KeyError):
+                model = None
+            if model is None:
+                return None
+            _model = model
+        _pointer_stat = stamp
+        return _model
+
+
+def reset_als_model() -> None:
+    global _model, _pointer_stat
+    with _model_lock:
+        _model = None
+        _pointer_stat = None
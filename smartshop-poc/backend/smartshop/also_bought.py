@@ -1,20 +1,34 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from django.db.models import Count
 
+from .catalog_snapshot import get_catalog_snapshot
 from .models import SmartShopPurchaseOrder
+from .purchased_bitmap import PurchasedSet, purchased_set
 
 
-def also_bought_for_user(user, top_n: int = 4) -> List[Dict[str, Any]]:
+def also_bought_for_user(user, top_n: int = 4, *, purchased: Optional[PurchasedSet] = None) -> List[Dict[str, Any]]:
     """
     Returns items users also bought, based on the user's purchased products.
     Output: [{"product_id": 12, "count": 5}, ...]
+
+    With shared catalog files built, count is the co-purchase score of
+    CatalogSnapshot.co_purchased (co-buyers summed per purchased product);
+    otherwise it is the number of orders of that product placed by other
+    users who bought any of the user's products.
+
+    purchased: the user's PurchasedSet if the caller already has it.
     """
-    user_product_ids = list(
-        SmartShopPurchaseOrder.objects.filter(user=user).values_list("product_id", flat=True)
-    )
+    if purchased is None:
+        purchased = purchased_set(user)
+    user_product_ids = list(purchased)
     if not user_product_ids:
         return []
 
+    # Precomputed co-purchase table from the shared catalog files, if built
+    shared = get_catalog_snapshot().co_purchased(user_product_ids, top_n=top_n)
+    if shared is not None:
+        return shared
+
     # Find other users who bought any of user's items
     other_user_ids = (
         SmartShopPurchaseOrder.objects
@@ -27,13 +41,20 @@ def also_bought_for_user(user, top_n: int = 4) -> List[Dict[str, Any]]:
     if not other_user_ids:
         return []
 
-    # Count what those users also bought (excluding user's already purchased)
+    # Count what those users also bought; the user's own products are
+    # skipped in memory (bitmap) while streaming the ranked groups
     qs = (
         SmartShopPurchaseOrder.objects
         .filter(user_id__in=other_user_ids)
-        .exclude(product_id__in=user_product_ids)
         .values("product_id")
         .annotate(count=Count("product_id"))
-        .order_by("-count")[:top_n]
+        .order_by("-count", "product_id")
     )
-    return [{"product_id": row["product_id"], "count": row["count"]} for row in qs]
+    out: List[Dict[str, Any]] = []
+    for row in qs.iterator(chunk_size=100):
+        if row["product_id"] in purchased:
+            continue
+        out.append({"product_id": row["product_id"], "count": row["count"]})
+        if len(out) >= top_n:
+            break
+    return out
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SmartshopConfig(AppConfig):
     name = 'smartshop'
+
+    def ready(self):
+        from . import signals  # noqa: F401
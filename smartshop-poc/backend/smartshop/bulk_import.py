@@ -0,0 +1,439 @@
+"""
+Bulk loading helpers for seed/import management commands.
+
+Rows go in as dicts (from CSV/JSONL or Python lists) and are written in chunks:
+- existence is checked once per chunk with a single IN query (no per-row exists()),
+- new rows use bulk_create, changed rows bulk_update,
+- each chunk is its own transaction, so a failure only rolls back that chunk;
+- bulk writes skip model signals, so each chunk writes its outbox events
+  (outbox.emit_many) in the same transaction. Backends without RETURNING
+  (MySQL) leave bulk_create pks unset: the new rows are re-selected inside
+  the transaction (natural key, or id range for orders) before the events
+  are built.
+"""
+import csv
+import json
+import os
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import outbox
+from .catalog_snapshot import bump_catalog_version
+from .models import ChangeEvent, ProductAIProfile, ProductReview, SmartShopProduct, SmartShopPurchaseOrder
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+# -----------------------------
+# Input helpers
+# -----------------------------
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streams rows from a .csv (header row) or .jsonl/.ndjson file.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if ext in (".jsonl", ".ndjson"):
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        elif ext == ".csv":
+            yield from csv.DictReader(f)
+        else:
+            raise ValueError(f"Unsupported file type '{ext}' (use .csv or .jsonl)")
+
+
+def chunked(rows: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(rows)
+    size = max(1, int(size))
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _to_decimal(value: Any) -> Optional[Decimal]:
+    try:
+        return Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    else:
+        dt = parse_datetime(str(value).strip())
+        if dt is None:
+            return None
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, dt_timezone.utc)
+    return dt
+
+
+def _with_ids(objs: List[Any], qs: QuerySet, key: Callable[[Any], Any]) -> List[Any]:
+    """
+    objs after bulk_create, with their ids: as is when the backend returned
+    them, else the rows of qs matching objs by key (one row per object).
+    """
+    if all(o.pk is not None for o in objs):
+        return objs
+    wanted = Counter(key(o) for o in objs)
+    out = []
+    for row in qs.order_by("id"):
+        k = key(row)
+        if wanted[k] > 0:
+            wanted[k] -= 1
+            out.append(row)
+    return out
+
+
+def _last_id(model) -> int:
+    """
+    Highest id before a bulk insert, for re-selecting by id range (0 when
+    the backend returns ids, as it is not needed then).
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return 0
+    return model.objects.aggregate(m=Max("id"))["m"] or 0
+
+
+def _new_stats() -> Dict[str, int]:
+    return {"created": 0, "updated": 0, "skipped": 0, "invalid": 0}
+
+
+# -----------------------------
+# Products
+# -----------------------------
+def _product_event(p: SmartShopProduct, action: str) -> ChangeEvent:
+    return ChangeEvent(
+        topic=ChangeEvent.TOPIC_PRODUCT, action=action, object_id=p.id, product_id=p.id,
+        payload={"name": p.name, "category": p.category, "price": str(p.price)},
+    )
+
+
+def bulk_upsert_products(
+    rows: Iterable[Dict[str, Any]],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    update_existing: bool = True,
+) -> Dict[str, int]:
+    """
+    rows: {"name", "category", "price", "image"?}. Products are matched by name.
+    Existing products get category/price/image updated when update_existing.
+    """
+    stats = _new_stats()
+
+    for chunk in chunked(rows, chunk_size):
+        by_name: Dict[str, Dict[str, Any]] = {}
+        for row in chunk:
+            name = str(row.get("name") or "").strip()[:100]
+            price = _to_decimal(row.get("price"))
+            if not name or price is None:
+                stats["invalid"] += 1
+                continue
+            by_name[name] = {
+                "category": str(row.get("category") or "").strip()[:50],
+                "price": price,
+                "image": (row.get("image") or "").strip() or None,
+            }
+
+        with transaction.atomic():
+            existing = {p.name: p for p in SmartShopProduct.objects.filter(name__in=list(by_name))}
+
+            to_create: List[SmartShopProduct] = []
+            to_update: List[SmartShopProduct] = []
+            for name, vals in by_name.items():
+                p = existing.get(name)
+                if p is None:
+                    p = SmartShopProduct(name=name, category=vals["category"], price=vals["price"])
+                    if vals["image"]:
+                        p.image = vals["image"]
+                    to_create.append(p)
+                    continue
+
+                if not update_existing:
+                    stats["skipped"] += 1
+                    continue
+
+                changed = p.category != vals["category"] or p.price != vals["price"]
+                if vals["image"] and (p.image.name if p.image else "") != vals["image"]:
+                    p.image = vals["image"]
+                    changed = True
+                p.category = vals["category"]
+                p.price = vals["price"]
+                if changed:
+                    to_update.append(p)
+                else:
+                    stats["skipped"] += 1
+
+            SmartShopProduct.objects.bulk_create(to_create, batch_size=chunk_size)
+            created = _with_ids(
+                to_create, SmartShopProduct.objects.filter(name__in=[p.name for p in to_create]), lambda p: p.name,
+            )
+            if to_update:
+                SmartShopProduct.objects.bulk_update(to_update, ["category", "price", "image"], batch_size=chunk_size)
+            outbox.emit_many(
+                _product_event(p, action)
+                for action, products in ((ChangeEvent.ACTION_CREATED, created), (ChangeEvent.ACTION_UPDATED, to_update))
+                for p in products
+            )
+            if to_create or to_update:
+                bump_catalog_version()
+
+        stats["created"] += len(to_create)
+        stats["updated"] += len(to_update)
+
+    return stats
+
+
+def bulk_set_product_images(mapping: Dict[str, str], *, only_if_empty: bool = False) -> Dict[str, int]:
+    """
+    mapping: {product name: image path}. One query to load, one bulk_update to
+    write; product events and the catalog version bump go in the same
+    transaction, as in bulk_upsert_products.
+    """
+    stats = {"updated": 0, "missing": 0, "skipped": 0}
+    with transaction.atomic():
+        products = {p.name: p for p in SmartShopProduct.objects.filter(name__in=list(mapping))}
+
+        to_update = []
+        for name, path in mapping.items():
+            p = products.get(name)
+            if p is None:
+                stats["missing"] += 1
+                continue
+            if (only_if_empty and p.image) or (p.image.name if p.image else "") == path:
+                stats["skipped"] += 1
+                continue
+            p.image = path
+            to_update.append(p)
+
+        if to_update:
+            SmartShopProduct.objects.bulk_update(to_update, ["image"], batch_size=DEFAULT_CHUNK_SIZE)
+            outbox.emit_many(_product_event(p, ChangeEvent.ACTION_UPDATED) for p in to_update)
+            bump_catalog_version()
+    stats["updated"] = len(to_update)
+    return stats
+
+
+# -----------------------------
+# Users
+# -----------------------------
+def bulk_create_users(
+    usernames: Iterable[str],
+    *,
+    password: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    Creates missing users. The password is hashed once and shared by every
+    new user (hashing per user dominates bulk user creation).
+    """
+    User = get_user_model()
+    stats = _new_stats()
+    hashed = make_password(password)
+
+    for chunk in chunked(dict.fromkeys(u.strip() for u in usernames if u and u.strip()), chunk_size):
+        with transaction.atomic():
+            existing = set(User.objects.filter(username__in=chunk).values_list("username", flat=True))
+            new_users = [
+                User(username=u, email=f"{u}@example.com", password=hashed)
+                for u in chunk
+                if u not in existing
+            ]
+            User.objects.bulk_create(new_users, batch_size=chunk_size)
+        stats["created"] += len(new_users)
+        stats["skipped"] += len(chunk) - len(new_users)
+
+    return stats
+
+
+# -----------------------------
+# Purchases / reviews
+# -----------------------------
+def _resolve_ids(chunk: List[Dict[str, Any]]) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Maps usernames / product names used in a chunk to ids with one query each.
+    """
+    User = get_user_model()
+    usernames = {str(r["username"]).strip() for r in chunk if r.get("username") and not r.get("user_id")}
+    names = {str(r["product"]).strip() for r in chunk if r.get("product") and not r.get("product_id")}
+
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list("username", "id")) if usernames else {}
+    product_ids = dict(SmartShopProduct.objects.filter(name__in=names).values_list("name", "id")) if names else {}
+    return user_ids, product_ids
+
+
+def _row_user_product(row: Dict[str, Any], user_ids: Dict[str, int], product_ids: Dict[str, int]):
+    try:
+        uid = int(row["user_id"]) if row.get("user_id") else user_ids.get(str(row.get("username") or "").strip())
+        pid = int(row["product_id"]) if row.get("product_id") else product_ids.get(str(row.get("product") or "").strip())
+    except (TypeError, ValueError):
+        return None, None
+    return uid, pid
+
+
+def bulk_create_purchases(
+    rows: Iterable[Dict[str, Any]],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    skip_existing_pairs: bool = False,
+) -> Dict[str, int]:
+    """
+    rows: {"user_id" | "username", "product_id" | "product" (name), "quantity"?, "purchase_date"?}
+    skip_existing_pairs: don't insert a (user, product) that already has an order.
+    """
+    stats = _new_stats()
+
+    for chunk in chunked(rows, chunk_size):
+        user_ids, product_ids = _resolve_ids(chunk)
+
+        existing_pairs = set()
+        if skip_existing_pairs:
+            uids = {u for u in (_row_user_product(r, user_ids, product_ids)[0] for r in chunk) if u}
+            existing_pairs = set(
+                SmartShopPurchaseOrder.objects
+                .filter(user_id__in=uids)
+                .values_list("user_id", "product_id")
+            )
+
+        orders: List[SmartShopPurchaseOrder] = []
+        for row in chunk:
+            uid, pid = _row_user_product(row, user_ids, product_ids)
+            if not uid or not pid:
+                stats["invalid"] += 1
+                continue
+            if skip_existing_pairs:
+                if (uid, pid) in existing_pairs:
+                    stats["skipped"] += 1
+                    continue
+                existing_pairs.add((uid, pid))
+            try:
+                qty = max(1, int(row.get("quantity") or 1))
+            except (TypeError, ValueError):
+                qty = 1
+            po = SmartShopPurchaseOrder(user_id=uid, product_id=pid, quantity=qty)
+            purchased_at = _to_datetime(row.get("purchase_date"))
+            if purchased_at:
+                po.purchase_date = purchased_at
+            orders.append(po)
+
+        with transaction.atomic():
+            last_id = _last_id(SmartShopPurchaseOrder)
+            SmartShopPurchaseOrder.objects.bulk_create(orders, batch_size=chunk_size)
+            created = _with_ids(
+                orders,
+                SmartShopPurchaseOrder.objects.filter(id__gt=last_id, user_id__in={po.user_id for po in orders}),
+                lambda po: (po.user_id, po.product_id, po.quantity, po.purchase_date),
+            )
+            outbox.emit_many(outbox.purchase_event(po, ChangeEvent.ACTION_CREATED) for po in created)
+        stats["created"] += len(orders)
+
+    return stats
+
+
+def bulk_create_reviews(
+    rows: Iterable[Dict[str, Any]],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Dict[str, int]:
+    """
+    rows: {"user_id" | "username", "product_id" | "product", "rating", "title"?, "body"?, "created_at"?}
+    One review per (product, user): existing pairs are skipped.
+    """
+    stats = _new_stats()
+
+    for chunk in chunked(rows, chunk_size):
+        user_ids, product_ids = _resolve_ids(chunk)
+        resolved = [(row,) + _row_user_product(row, user_ids, product_ids) for row in chunk]
+        pids = {pid for _r, _u, pid in resolved if pid}
+        existing_pairs = set(
+            ProductReview.objects.filter(product_id__in=pids).values_list("product_id", "user_id")
+        )
+
+        reviews: List[ProductReview] = []
+        for row, uid, pid in resolved:
+            if not uid or not pid:
+                stats["invalid"] += 1
+                continue
+            if (pid, uid) in existing_pairs:
+                stats["skipped"] += 1
+                continue
+            existing_pairs.add((pid, uid))
+            try:
+                rating = max(1, min(int(row.get("rating") or 5), 5))
+            except (TypeError, ValueError):
+                rating = 5
+            reviews.append(ProductReview(
+                product_id=pid,
+                user_id=uid,
+                rating=rating,
+                title=str(row.get("title") or "")[:120],
+                body=str(row.get("body") or ""),
+                created_at=_to_datetime(row.get("created_at")) or timezone.now(),
+            ))
+
+        with transaction.atomic():
+            ProductReview.objects.bulk_create(reviews, batch_size=chunk_size)
+            created = _with_ids(
+                reviews,
+                ProductReview.objects.filter(
+                    product_id__in={r.product_id for r in reviews}, user_id__in={r.user_id for r in reviews},
+                ),
+                lambda r: (r.product_id, r.user_id),
+            )
+            outbox.emit_many(
+                ChangeEvent(
+                    topic=ChangeEvent.TOPIC_REVIEW, action=ChangeEvent.ACTION_CREATED,
+                    object_id=r.id, user_id=r.user_id, product_id=r.product_id, payload={"rating": r.rating},
+                )
+                for r in created
+            )
+        stats["created"] += len(reviews)
+
+    return stats
+
+
+def bulk_save_profiles(
+    to_create: List[ProductAIProfile],
+    to_update: List[ProductAIProfile],
+    fields: Iterable[str],
+    *,
+    chunk_size: int = 500,
+) -> int:
+    """
+    Writes ProductAIProfile rows (bulk_create / bulk_update) with their outbox
+    events and one catalog version bump, in one transaction. Returns rows written.
+    """
+    with transaction.atomic():
+        ProductAIProfile.objects.bulk_create(to_create, batch_size=chunk_size)
+        created = _with_ids(
+            to_create,
+            ProductAIProfile.objects.filter(product_id__in=[p.product_id for p in to_create]),
+            lambda p: p.product_id,
+        )
+        if to_update:
+            ProductAIProfile.objects.bulk_update(to_update, list(fields), batch_size=chunk_size)
+        outbox.emit_many(
+            outbox.profile_event(p, action)
+            for action, profiles in ((ChangeEvent.ACTION_CREATED, created), (ChangeEvent.ACTION_UPDATED, to_update))
+            for p in profiles
+        )
+        if to_create or to_update:
+            bump_catalog_version()
+    return len(to_create) + len(to_update)
@@ -0,0 +1,348 @@
+"""
+Memory-mapped catalog files shared by every worker.
+
+`manage.py build_catalog_files` writes one versioned directory under
+settings.CATALOG_SNAPSHOT_DIR:
+
+    <dir>/<version>/meta.json         categories, counts, array formats
+    <dir>/<version>/ids.bin           int64   product ids (ascending)
+    <dir>/<version>/prices.bin        float32
+    <dir>/<version>/categories.bin    uint16  category codes
+    <dir>/<version>/names.bin|.idx    UTF-8 blob + uint32 byte offsets
+    <dir>/<version>/text.bin|.idx     AI short description / review summary, 2 per row
+    <dir>/<version>/search.bin|.idx   lowercase "name\\ncategory" search text
+    <dir>/<version>/copurchase.*      CSR table: indptr (uint32), ids (int64), counts (uint32)
+    <dir>/CURRENT                     name of the live version
+
+The directory is written under a temporary name and renamed, then CURRENT is
+replaced with os.replace, so readers never see a half-written version.
+Workers map the files read-only (the OS page cache holds one copy for all of
+them) and re-check CURRENT with a single stat() per call; a new version is
+mapped on first use and the old mapping is dropped with the last snapshot
+that references it.
+
+meta.json records the DB catalog version the files were built at. Once a
+product / profile write moves the version on, get_catalog_snapshot falls back
+to the per-worker snapshot and queues a rebuild ("catalog.build_files" task,
+run by run_ai_worker), so edits are never hidden behind old files.
+"""
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+import uuid
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from .catalog_snapshot import SEARCH_SEPARATOR, CatalogSnapshot, StringColumn, catalog_rows, catalog_version
+from .models import SmartShopPurchaseOrder
+
+POINTER_NAME = "CURRENT"
+FORMAT_VERSION = 1
+
+# file stem -> array typecode
+ARRAY_FILES = {
+    "ids.bin": "q",
+    "prices.bin": "f",
+    "categories.bin": "H",
+    "names.idx": "I",
+    "text.idx": "I",
+    "search.idx": "I",
+    "copurchase.indptr": "I",
+    "copurchase.ids": "q",
+    "copurchase.counts": "I",
+}
+
+
+def snapshot_dir() -> str:
+    return str(getattr(settings, "CATALOG_SNAPSHOT_DIR", "") or "")
+
+
+# -----------------------------
+# Builder
+# -----------------------------
+class _BlobWriter:
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.offsets = array("I", [0])
+        self.pos = 0
+
+    def add(self, value: str) -> None:
+        data = value.encode("utf-8")
+        self.parts.append(data)
+        self.pos += len(data)
+        self.offsets.append(self.pos)
+
+
+def _copurchase_table(ids: array, top_k: int, max_products_per_user: int) -> Tuple[array, array, array]:
+    """
+    For each catalog row: the top_k products bought by the same users, with
+    the number of users who bought both.
+    """
+    pairs: Dict[int, Counter] = defaultdict(Counter)
+    orders = (
+        SmartShopPurchaseOrder.objects
+        .order_by("user_id", "-purchase_date")
+        .values_list("user_id", "product_id")
+        .iterator(chunk_size=5000)
+    )
+
+    def flush(products: List[int]) -> None:
+        basket = list(dict.fromkeys(products))[:max_products_per_user]
+        for a in basket:
+            counter = pairs[a]
+            for b in basket:
+                if a != b:
+                    counter[b] += 1
+
+    current_user, products = None, []
+    for user_id, product_id in orders:
+        if user_id != current_user:
+            flush(products)
+            current_user, products = user_id, []
+        products.append(product_id)
+    flush(products)
+
+    indptr, other_ids, counts = array("I", [0]), array("q"), array("I")
+    for pid in ids:
+        for other, n in sorted(pairs.get(pid, {}).items(), key=lambda kv: (-kv[1], kv[0]))[:top_k]:
+            other_ids.append(other)
+            counts.append(n)
+        indptr.append(len(other_ids))
+    return indptr, other_ids, counts
+
+
+def write_catalog_files(
+    base_dir: Optional[str] = None,
+    *,
+    top_k: Optional[int] = None,
+    keep: Optional[int] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Builds a new version from the DB, publishes it and prunes old versions.
+    Returns (version directory, meta).
+    """
+    base_dir = base_dir or snapshot_dir()
+    if not base_dir:
+        raise ValueError("No catalog snapshot directory (settings.CATALOG_SNAPSHOT_DIR).")
+    top_k = int(top_k if top_k is not None else getattr(settings, "CATALOG_COPURCHASE_TOP_K", 50))
+    keep = int(keep if keep is not None else getattr(settings, "CATALOG_SNAPSHOT_KEEP", 3))
+
+    source_version = catalog_version()
+    ids, prices, codes_arr = array("q"), array("f"), array("H")
+    codes: Dict[str, int] = {}
+    names, text, search = _BlobWriter(), _BlobWriter(), _BlobWriter()
+    for pid, name, category, price, desc, review in catalog_rows():
+        category = category or ""
+        ids.append(int(pid))
+        prices.append(float(price or 0))
+        codes_arr.append(codes.setdefault(category, len(codes)))
+        names.add(name or "")
+        text.add((desc or "").strip())
+        text.add((review or "").strip())
+        search.add(f"{name or ''}\n{category}".lower() + SEARCH_SEPARATOR)
+
+    indptr, other_ids, counts = _copurchase_table(
+        ids, top_k, int(getattr(settings, "CATALOG_COPURCHASE_MAX_BASKET", 100))
+    )
+
+    version, tmp_dir = new_version_dir(base_dir)
+
+    arrays = {
+        "ids.bin": ids,
+        "prices.bin": prices,
+        "categories.bin": codes_arr,
+        "names.idx": names.offsets,
+        "text.idx": text.offsets,
+        "search.idx": search.offsets,
+        "copurchase.indptr": indptr,
+        "copurchase.ids": other_ids,
+        "copurchase.counts": counts,
+    }
+    for filename, arr in arrays.items():
+        with open(os.path.join(tmp_dir, filename), "wb") as f:
+            arr.tofile(f)
+    for filename, blob in (("names.bin", names), ("text.bin", text), ("search.bin", search)):
+        with open(os.path.join(tmp_dir, filename), "wb") as f:
+            for part in blob.parts:
+                f.write(part)
+
+    meta = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "catalog_version": source_version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "products": len(ids),
+        "categories": list(codes),
+        "copurchase_pairs": len(other_ids),
+        "byteorder": sys.byteorder,
+        "itemsize": {name: array(code).itemsize for name, code in ARRAY_FILES.items()},
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    return publish_version(base_dir, tmp_dir, version, keep=keep), meta
+
+
+def new_version_dir(base_dir: str) -> Tuple[str, str]:
+    """
+    (version name, temporary directory to write it in) under base_dir.
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    version = f"{datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    tmp_dir = os.path.join(base_dir, f".{version}.tmp")
+    os.makedirs(tmp_dir)
+    return version, tmp_dir
+
+
+def publish_version(base_dir: str, tmp_dir: str, version: str, *, keep: int) -> str:
+    """
+    Renames a fully written tmp_dir to its version, points CURRENT at it and
+    prunes old versions. Returns the version directory.
+    """
+    final_dir = os.path.join(base_dir, version)
+    os.replace(tmp_dir, final_dir)
+
+    pointer_tmp = os.path.join(base_dir, f".{POINTER_NAME}.{uuid.uuid4().hex[:8]}")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(pointer_tmp, os.path.join(base_dir, POINTER_NAME))
+
+    _prune(base_dir, keep=max(1, keep), live=version)
+    return final_dir
+
+
+def _prune(base_dir: str, *, keep: int, live: str) -> None:
+    # Mapped files stay valid for workers still using them after unlink (POSIX)
+    versions = sorted(
+        (d for d in os.listdir(base_dir)
+         if os.path.isdir(os.path.join(base_dir, d)) and not d.startswith(".")),
+        key=lambda d: (os.stat(os.path.join(base_dir, d)).st_mtime_ns, d),
+    )
+    for old in versions[:-keep]:
+        if old != live:
+            shutil.rmtree(os.path.join(base_dir, old), ignore_errors=True)
+
+
+# -----------------------------
+# Reader
+# -----------------------------
+def _map(path: str) -> Any:
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _map_array(path: str, typecode: str) -> Any:
+    buf = _map(path)
+    if not buf:
+        return array(typecode)
+    return memoryview(buf).cast(typecode)
+
+
+def map_catalog_files(version_dir: str) -> Optional[CatalogSnapshot]:
+    """
+    Maps a version directory read-only. None if it was written on a machine
+    with a different byte order / item sizes or by another format version.
+    """
+    with open(os.path.join(version_dir, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_VERSION or meta.get("byteorder") != sys.byteorder:
+        return None
+    for name, code in ARRAY_FILES.items():
+        if meta.get("itemsize", {}).get(name) != array(code).itemsize:
+            return None
+
+    def arr(name: str) -> Any:
+        return _map_array(os.path.join(version_dir, name), ARRAY_FILES[name])
+
+    def column(stem: str) -> StringColumn:
+        return StringColumn(_map(os.path.join(version_dir, f"{stem}.bin")), arr(f"{stem}.idx"))
+
+    return CatalogSnapshot(
+        meta["version"],
+        ids=arr("ids.bin"),
+        prices=arr("prices.bin"),
+        category_codes=arr("categories.bin"),
+        categories=tuple(meta["categories"]),
+        names=column("names"),
+        search_text=column("search"),
+        text=column("text"),
+        copurchase=(arr("copurchase.indptr"), arr("copurchase.ids"), arr("copurchase.counts")),
+        source="mmap",
+        catalog_version=meta.get("catalog_version") or "",
+    )
+
+
+_mapped: Optional[CatalogSnapshot] = None
+_pointer_stat: Optional[Tuple[int, int]] = None
+_map_lock = threading.Lock()
+_rebuild_requested_for: Optional[str] = None
+
+
+def current_mapped_snapshot() -> Optional[CatalogSnapshot]:
+    """
+    Snapshot for the version named by CURRENT, or None when no files have
+    been built (callers then build an in-process snapshot from the DB).
+    """
+    global _mapped, _pointer_stat
+    base_dir = snapshot_dir()
+    pointer = os.path.join(base_dir, POINTER_NAME)
+    try:
+        st = os.stat(pointer)
+    except OSError:
+        return None
+    stamp = (st.st_mtime_ns, st.st_ino)
+    if _mapped is not None and stamp == _pointer_stat:
+        return _mapped
+
+    with _map_lock:
+        if _mapped is not None and stamp == _pointer_stat:
+            return _mapped
+        with open(pointer, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if _mapped is None or _mapped.version != version:
+            try:
+                snap = map_catalog_files(os.path.join(base_dir, version))
+            except (OSError, ValueError, KeyError):
+                snap = None
+            if snap is None:
+                return None
+            _mapped = snap
+        _pointer_stat = stamp
+        return _mapped
+
+
+def reset_mapped_snapshot() -> None:
+    global _mapped, _pointer_stat, _rebuild_requested_for
+    with _map_lock:
+        _mapped = None
+        _pointer_stat = None
+    _rebuild_requested_for = None
+
+
+def request_rebuild(catalog_version: str) -> None:
+    """
+    Queues one "catalog.build_files" task per catalog version seen to be
+    newer than the mapped files (called by get_catalog_snapshot).
+    """
+    from .tasks import enqueue
+
+    if _rebuild_requested_for == catalog_version:
+        return
+
+    def _enqueue() -> None:
+        global _rebuild_requested_for
+        _rebuild_requested_for = catalog_version
+        delay = float(getattr(settings, "CATALOG_FILES_REBUILD_DELAY_SECONDS", 10))
+        enqueue("catalog.build_files", key="all", delay=delay)
+
+    transaction.on_commit(_enqueue)
@@ -0,0 +1,457 @@
+"""
+Read-only, versioned snapshot of the product catalog held in each worker.
+
+Columns are stored compactly, sorted by product id:
+- ids: int64 array; a product's row is found with bisect
+- prices: float32 array, rounded to cents on the way out
+- category_codes: uint16 array into the categories tuple
+- names: interned strings
+- profile text (AI short description / review summary) and the lowercase
+  search text: one blob per column plus an offsets array (StringColumn)
+
+The same class is backed either by in-process arrays built from the DB
+(from_rows) or by memory-mapped files shared by every worker (see
+catalog_files.py, enabled with settings.CATALOG_SNAPSHOT_DIR). Mapped files
+are only served while they were built at the current catalog version.
+
+The catalog version is a single DB row (CatalogState), so it is shared by
+every web worker, management command and run_ai_worker process whatever the
+cache backend. Product / profile saves and deletes bump it in the writing
+transaction (see signals.py), and so do bulk writes that skip signals
+(bump_catalog_version inside their atomic block). Versions are random tokens,
+not counters, so a bump that rolls back is never reused by a later one.
+Readers call get_catalog_snapshot(): the version is re-read from the DB at
+most every CATALOG_VERSION_CHECK_SECONDS (a local bump is seen at once); if
+it moved, the snapshot is rebuilt with a single query and swapped in
+atomically, so a request always sees one consistent catalog.
+
+Search filtering, recommendation prompts and the assistant inventory read the
+snapshot instead of the ORM; final response serialization still uses the DB.
+"""
+import threading
+import time
+import uuid
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from sys import intern
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import CatalogState, SmartShopProduct
+
+PROMPT_COLUMNS = ("id", "name", "category", "price", "ai_short_description", "ai_review_summary")
+
+# float32 keeps ~7 significant digits; compare prices with half a cent slack
+_PRICE_EPSILON = 0.005
+
+# Ends every search-text row so a token never matches across two rows
+SEARCH_SEPARATOR = "\x00"
+
+
+class StringColumn:
+    """
+    Strings stored back to back in one blob; value i is
+    blob[offsets[i]:offsets[i + 1]]. The blob is a str (in-process) or a
+    UTF-8 buffer such as an mmap (offsets are then byte offsets).
+    """
+
+    __slots__ = ("blob", "offsets", "_is_text")
+
+    def __init__(self, blob: Any, offsets: Sequence[int]):
+        self.blob = blob
+        self.offsets = offsets
+        self._is_text = isinstance(blob, str)
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> "StringColumn":
+        offsets = array("I", [0])
+        parts: List[str] = []
+        pos = 0
+        for v in values:
+            parts.append(v)
+            pos += len(v)
+            offsets.append(pos)
+        return cls("".join(parts), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        value = self.blob[self.offsets[i]:self.offsets[i + 1]]
+        return value if self._is_text else bytes(value).decode("utf-8")
+
+    def rows_containing(self, needle: str) -> Set[int]:
+        """
+        Rows whose value contains needle: scans the blob with find() and maps
+        each hit back to its row, instead of decoding every row.
+        """
+        if not needle:
+            return set(range(len(self)))
+        target: Any = needle if self._is_text else needle.encode("utf-8")
+        rows: Set[int] = set()
+        pos = self.blob.find(target)
+        while pos != -1:
+            row = bisect_right(self.offsets, pos) - 1
+            rows.add(row)
+            # continue after the end of this row
+            pos = self.blob.find(target, self.offsets[row + 1])
+        return rows
+
+
+class CatalogSnapshot:
+    __slots__ = (
+        "version", "ids", "prices", "category_codes", "categories",
+        "names", "_search_text", "_text", "copurchase", "source", "catalog_version",
+    )
+
+    def __init__(
+        self,
+        version: str,
+        *,
+        ids: Sequence[int],
+        prices: Sequence[float],
+        category_codes: Sequence[int],
+        categories: Tuple[str, ...],
+        names: Sequence[str],
+        search_text: StringColumn,
+        text: StringColumn,
+        copurchase: Optional[Tuple[Sequence[int], Sequence[int], Sequence[int]]] = None,
+        source: str = "memory",
+        catalog_version: Optional[str] = None,
+    ):
+        self.version = version
+        self.ids = ids
+        self.prices = prices
+        self.category_codes = category_codes
+        self.categories = categories
+        self.names = names
+        self._search_text = search_text
+        # two values per row: short description, review summary
+        self._text = text
+        # CSR co-purchase table (indptr, product ids, counts), rows = catalog rows
+        self.copurchase = copurchase
+        self.source = source
+        # DB catalog version the data was read at (mapped files have their own version name)
+        self.catalog_version = catalog_version or version
+
+    @classmethod
+    def from_rows(
+        cls,
+        version: str,
+        rows: Iterable[Tuple[int, str, str, Any, Optional[str], Optional[str]]],
+    ) -> "CatalogSnapshot":
+        """
+        rows: (id, name, category, price, short description, review summary),
+        ordered by id.
+        """
+        ids = array("q")
+        prices = array("f")
+        category_codes = array("H")
+        codes: Dict[str, int] = {}
+        names: List[str] = []
+        search_text: List[str] = []
+        text: List[str] = []
+        for pid, name, category, price, desc, review in rows:
+            category = intern(category or "")
+            ids.append(int(pid))
+            prices.append(float(price or 0))
+            category_codes.append(codes.setdefault(category, len(codes)))
+            names.append(intern(name or ""))
+            search_text.append(f"{name or ''}\n{category}".lower() + SEARCH_SEPARATOR)
+            text.append((desc or "").strip())
+            text.append((review or "").strip())
+
+        return cls(
+            version,
+            ids=ids,
+            prices=prices,
+            category_codes=category_codes,
+            categories=tuple(codes),
+            names=tuple(names),
+            search_text=StringColumn.from_strings(search_text),
+            text=StringColumn.from_strings(text),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, product_id: int) -> bool:
+        return self.row(product_id) is not None
+
+    # -----------------------------
+    # Row access
+    # -----------------------------
+    def row(self, product_id: int) -> Optional[int]:
+        i = bisect_left(self.ids, int(product_id))
+        if i < len(self.ids) and self.ids[i] == int(product_id):
+            return i
+        return None
+
+    def price_at(self, i: int) -> float:
+        return round(float(self.prices[i]), 2)
+
+    def category_at(self, i: int) -> str:
+        return self.categories[self.category_codes[i]]
+
+    def short_description_at(self, i: int) -> str:
+        return self._text[2 * i]
+
+    def review_summary_at(self, i: int) -> str:
+        return self._text[2 * i + 1]
+
+    def row_dict(self, i: int, columns: Sequence[str] = PROMPT_COLUMNS) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for c in columns:
+            if c == "id":
+                out[c] = self.ids[i]
+            elif c == "name":
+                out[c] = self.names[i]
+            elif c == "category":
+                out[c] = self.category_at(i)
+            elif c == "price":
+                out[c] = self.price_at(i)
+            elif c == "ai_short_description":
+                out[c] = self.short_description_at(i)
+            elif c == "ai_review_summary":
+                out[c] = self.review_summary_at(i)
+            else:
+                raise KeyError(c)
+        return out
+
+    def product_dicts(
+        self,
+        product_ids: Optional[Iterable[int]] = None,
+        columns: Sequence[str] = PROMPT_COLUMNS,
+    ) -> List[Dict[str, Any]]:
+        """
+        Prompt-ready dicts, in the order of product_ids (unknown ids are
+        skipped), or for the whole catalog by ascending id.
+        """
+        if product_ids is None:
+            rows: Iterable[int] = range(len(self.ids))
+        else:
+            rows = (i for i in (self.row(pid) for pid in product_ids) if i is not None)
+        return [self.row_dict(i, columns) for i in rows]
+
+    def purchases_compact(self, orders: Iterable[Tuple[int, int]]) -> List[Dict[str, Any]]:
+        """
+        (product_id, quantity) pairs -> the {name, category, price, qty} rows
+        used for purchase signatures and insight prompts.
+        """
+        out = []
+        for pid, qty in orders:
+            i = self.row(pid)
+            if i is None:
+                continue
+            out.append({"name": self.names[i], "category": self.category_at(i), "price": self.price_at(i), "qty": qty})
+        return out
+
+    def newest_ids(self, limit: int) -> List[int]:
+        n = len(self.ids)
+        return [self.ids[i] for i in range(n - 1, max(-1, n - 1 - limit), -1)]
+
+    # -----------------------------
+    # Co-purchase
+    # -----------------------------
+    def co_purchased(self, product_ids: Iterable[int], *, top_n: int = 4) -> Optional[List[Dict[str, int]]]:
+        """
+        Products most often bought together with product_ids, excluding
+        product_ids: [{"product_id", "count"}, ...]. None when this snapshot
+        has no co-purchase table.
+
+        count is an item-to-item score: for each of product_ids, the number
+        of users who bought both it and the candidate, summed. A co-buyer who
+        shares k of product_ids therefore counts k times, which ranks
+        products by overlap with the whole basket. It is not the count the
+        DB fallback in also_bought_for_user returns (orders placed by
+        distinct buyers of any of product_ids).
+        """
+        if self.copurchase is None:
+            return None
+        indptr, other_ids, counts = self.copurchase
+        own = {int(pid) for pid in product_ids}
+        totals: Counter = Counter()
+        for pid in own:
+            i = self.row(pid)
+            if i is None:
+                continue
+            for j in range(indptr[i], indptr[i + 1]):
+                other = other_ids[j]
+                if other not in own:
+                    totals[other] += counts[j]
+        ranked = sorted(totals.items(), key=lambda kv: (-kv[1], kv[0]))[:top_n]
+        return [{"product_id": int(pid), "count": int(n)} for pid, n in ranked]
+
+    # -----------------------------
+    # Search filtering
+    # -----------------------------
+    def filter_ids(
+        self,
+        *,
+        categories: Optional[Sequence[str]] = None,
+        price_min: Optional[float] = None,
+        price_max: Optional[float] = None,
+        tokens: Sequence[str] = (),
+        exclude_tokens: Sequence[str] = (),
+        sort: str = "newest",
+        limit: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Same filters as the smart-search queryset: category in categories,
+        price range, any token in name/category, no exclude token; ordered by
+        price (price_asc / price_desc) or newest first.
+        """
+        codes = None
+        if categories:
+            wanted = set(categories)
+            codes = {c for c, name in enumerate(self.categories) if name in wanted}
+        lo = None if price_min is None else float(price_min) - _PRICE_EPSILON
+        hi = None if price_max is None else float(price_max) + _PRICE_EPSILON
+        tokens = [t for t in (str(t).strip().lower() for t in tokens) if t]
+        exclude_tokens = [t for t in (str(t).strip().lower() for t in exclude_tokens) if t]
+
+        if tokens:
+            rows: Set[int] = set()
+            for t in tokens:
+                rows |= self._search_text.rows_containing(t)
+            candidates: Iterable[int] = sorted(rows, reverse=True)
+        else:
+            candidates = range(len(self.ids) - 1, -1, -1)
+        excluded: Set[int] = set()
+        for t in exclude_tokens:
+            excluded |= self._search_text.rows_containing(t)
+
+        matched: List[int] = []
+        for i in candidates:
+            if i in excluded:
+                continue
+            if codes is not None and self.category_codes[i] not in codes:
+                continue
+            price = self.prices[i]
+            if lo is not None and price < lo:
+                continue
+            if hi is not None and price > hi:
+                continue
+            matched.append(i)
+
+        if sort == "price_asc":
+            matched.sort(key=lambda i: self.prices[i])
+        elif sort == "price_desc":
+            matched.sort(key=lambda i: self.prices[i], reverse=True)
+        if limit is not None:
+            matched = matched[:limit]
+        return [self.ids[i] for i in matched]
+
+
+# -----------------------------
+# Versioning
+# -----------------------------
+_snapshot: Optional[CatalogSnapshot] = None
+_build_lock = threading.Lock()
+
+
+def _state_row(version: str) -> None:
+    # pk is fixed, so concurrent first calls create one row between them
+    CatalogState.objects.bulk_create([CatalogState(pk=1, version=version)], ignore_conflicts=True)
+
+
+# (version, monotonic expiry): saves the version read on hot paths
+_version_memo: Tuple[Optional[str], float] = (None, 0.0)
+
+
+def _forget_version() -> None:
+    global _version_memo
+    _version_memo = (None, 0.0)
+
+
+def catalog_version() -> str:
+    """
+    Current catalog version, re-read from the DB at most every
+    CATALOG_VERSION_CHECK_SECONDS per process.
+    """
+    global _version_memo
+    version, expires = _version_memo
+    now = time.monotonic()
+    if version is not None and now < expires:
+        return version
+    version = CatalogState.objects.filter(pk=1).values_list("version", flat=True).first()
+    if version is None:
+        _state_row(uuid.uuid4().hex)
+        version = CatalogState.objects.filter(pk=1).values_list("version", flat=True).first()
+    _version_memo = (version, now + float(getattr(settings, "CATALOG_VERSION_CHECK_SECONDS", 1.0)))
+    return version
+
+
+def bump_catalog_version() -> str:
+    """
+    Marks every process's snapshot stale. Call inside the transaction of
+    writes that bypass model signals (bulk_create / bulk_update /
+    queryset.update), so the bump commits (or rolls back) with them.
+    """
+    version = uuid.uuid4().hex
+    if not CatalogState.objects.filter(pk=1).update(version=version, updated_at=timezone.now()):
+        _state_row(version)
+        CatalogState.objects.filter(pk=1).update(version=version, updated_at=timezone.now())
+    # This process re-reads at once, and again after commit in case another
+    # thread cached the pre-commit version in between
+    _forget_version()
+    transaction.on_commit(_forget_version)
+    return version
+
+
+def catalog_rows() -> Iterable[Tuple[int, str, str, Any, Optional[str], Optional[str]]]:
+    return (
+        SmartShopProduct.objects
+        .order_by("id")
+        .values_list(
+            "id", "name", "category", "price",
+            "ai_profile__short_description", "ai_profile__review_summary",
+        )
+        .iterator(chunk_size=2000)
+    )
+
+
+def build_catalog_snapshot(version: str) -> CatalogSnapshot:
+    return CatalogSnapshot.from_rows(version, catalog_rows())
+
+
+def get_catalog_snapshot() -> CatalogSnapshot:
+    global _snapshot
+    version = catalog_version()
+    if getattr(settings, "CATALOG_SNAPSHOT_DIR", ""):
+        # Shared memory-mapped files written by build_catalog_files, while
+        # they match the DB; otherwise this process's own snapshot until the
+        # queued rebuild is published
+        from .catalog_files import current_mapped_snapshot, request_rebuild
+
+        mapped = current_mapped_snapshot()
+        if mapped is not None:
+            if mapped.catalog_version == version:
+                return mapped
+            request_rebuild(version)
+
+    snap = _snapshot
+    if snap is not None and snap.version == version:
+        return snap
+    with _build_lock:
+        snap = _snapshot
+        if snap is None or snap.version != version:
+            snap = build_catalog_snapshot(version)
+            _snapshot = snap
+    return snap
+
+
+def reset_catalog_snapshot() -> None:
+    """
+    Drops this worker's snapshot, so the next read rebuilds it (tests /
+    admin tools). Other processes are not affected; use
+    bump_catalog_version() for that.
+    """
+    global _snapshot
+    with _build_lock:
+        _snapshot = None
+    _forget_version()
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+from django.conf import settings
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling Gemini while a feature's circuit is open.
+    Callers already catch Exception and fall back to their non-AI path.
+    """
+
+    def __init__(self, feature: str):
+        super().__init__(f"Gemini circuit open for '{feature}'")
+        self.feature = feature
+
+
+class CircuitBreaker:
+    """
+    Rolling-window circuit breaker for one LLM feature/endpoint.
+
+    - closed: calls go through; the last `window` outcomes are tracked.
+      A call slower than the latency budget counts as a failure.
+    - open: calls fail fast until `open_seconds` have passed.
+    - half_open: a single probe call is allowed; success closes, failure re-opens.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        latency_budget_ms: int,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        open_seconds: float = 30.0,
+    ):
+        self.name = name
+        self.latency_budget_ms = int(latency_budget_ms)
+        self.min_calls = max(1, int(min_calls))
+        self.failure_rate = float(failure_rate)
+        self.open_seconds = float(open_seconds)
+
+        self._lock = threading.Lock()
+        self._outcomes: Deque[bool] = deque(maxlen=max(1, int(window)))
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        # Counters for metrics
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.times_opened = 0
+        self.last_latency_ms = 0.0
+
+    # -----------------------------
+    # State
+    # -----------------------------
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def is_open(self) -> bool:
+        """
+        True while calls would be rejected. Does not consume the half-open probe.
+        """
+        with self._lock:
+            state = self._current_state()
+            return state == OPEN or (state == HALF_OPEN and self._probe_in_flight)
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self.times_opened += 1
+
+    # -----------------------------
+    # Outcomes
+    # -----------------------------
+    def record_success(self, latency_ms: float) -> None:
+        slow = latency_ms > self.latency_budget_ms
+        with self._lock:
+            self.calls += 1
+            self.last_latency_ms = float(latency_ms)
+            if slow:
+                self.slow_calls += 1
+            self._record(ok=not slow)
+
+    def record_failure(self, latency_ms: float = 0.0) -> None:
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.last_latency_ms = float(latency_ms)
+            self._record(ok=False)
+
+    def _record(self, ok: bool) -> None:
+        state = self._current_state()
+        if state == HALF_OPEN:
+            if ok:
+                self._state = CLOSED
+                self._outcomes.clear()
+            else:
+                self._trip()
+            self._probe_in_flight = False
+            return
+
+        self._outcomes.append(ok)
+        if state == CLOSED and len(self._outcomes) >= self.min_calls:
+            bad = sum(1 for x in self._outcomes if not x)
+            if bad / len(self._outcomes) >= self.failure_rate:
+                self._trip()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            bad = sum(1 for x in self._outcomes if not x)
+            return {
+                "feature": self.name,
+                "state": state,
+                "latency_budget_ms": self.latency_budget_ms,
+                "window_calls": len(self._outcomes),
+                "window_error_rate": round(bad / len(self._outcomes), 3) if self._outcomes else 0.0,
+                "calls": self.calls,
+                "failures": self.failures,
+                "slow_calls": self.slow_calls,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "last_latency_ms": round(self.last_latency_ms, 1),
+            }
+
+
+# -----------------------------
+# Per-feature registry
+# -----------------------------
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def latency_budget_ms(feature: str) -> int:
+    budgets = getattr(settings, "LLM_LATENCY_BUDGETS_MS", {}) or {}
+    return int(budgets.get(feature, getattr(settings, "LLM_LATENCY_BUDGET_MS_DEFAULT", 8000)))
+
+
+def get_breaker(feature: str) -> CircuitBreaker:
+    feature = feature or "default"
+    with _registry_lock:
+        breaker = _breakers.get(feature)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                feature,
+                latency_budget_ms=latency_budget_ms(feature),
+                window=getattr(settings, "LLM_BREAKER_WINDOW", 20),
+                min_calls=getattr(settings, "LLM_BREAKER_MIN_CALLS", 5),
+                failure_rate=getattr(settings, "LLM_BREAKER_FAILURE_RATE", 0.5),
+                open_seconds=getattr(settings, "LLM_BREAKER_OPEN_SECONDS", 30),
+            )
+            _breakers[feature] = breaker
+        return breaker
+
+
+def breaker_snapshot() -> List[Dict[str, Any]]:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return [b.snapshot() for b in sorted(breakers, key=lambda b: b.name)]
+
+
+def reset_breakers() -> None:
+    with _registry_lock:
+        _breakers.clear()
@@ -0,0 +1,123 @@
+"""
+Offline stand-in for Gemini, used for benchmarks and load tests
+(settings.LLM_BACKEND = "fake").
+
+Returns schema-valid JSON for each feature prompt, built from the ids and
+names found in the prompt itself, after a configurable simulated latency.
+Output is deterministic for a given prompt (apart from the sleep jitter).
+"""
+import hashlib
+import json
+import random
+import re
+import time
+from typing import List
+
+from django.conf import settings
+
+_ID_RE = re.compile(r'"id":\s*(\d+)')
+_ROW_ID_RE = re.compile(r"^(\d+)\|", re.MULTILINE)
+_NAME_RE = re.compile(r'"name":\s*"([^"]+)"')
+
+
+def _rng(prompt: str) -> random.Random:
+    return random.Random(int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16], 16))
+
+
+def _section(prompt: str, start: str, end: str = "") -> str:
+    i = prompt.find(start)
+    if i < 0:
+        return ""
+    i += len(start)
+    j = prompt.find(end, i) if end else -1
+    return prompt[i:j] if j >= 0 else prompt[i:]
+
+
+def _ids(text: str) -> List[int]:
+    """
+    Product ids from JSON objects or compact table rows (see prompt_builder).
+    """
+    found = _ID_RE.findall(text) + _ROW_ID_RE.findall(text)
+    return list(dict.fromkeys(int(x) for x in found))
+
+
+def simulate_latency() -> float:
+    """
+    Sleeps LLM_FAKE_LATENCY_MS +/- LLM_FAKE_JITTER_MS. Returns the ms slept.
+    """
+    base = float(getattr(settings, "LLM_FAKE_LATENCY_MS", 300))
+    jitter = float(getattr(settings, "LLM_FAKE_JITTER_MS", 100))
+    ms = max(0.0, base + random.uniform(-jitter, jitter))
+    if ms:
+        time.sleep(ms / 1000.0)
+    return ms
+
+
+def fake_response(feature: str, prompt: str) -> str:
+    rng = _rng(prompt)
+
+    if feature == "recommendations":
+        purchased = set(_ids(_section(prompt, "Purchased products", "Full product catalog")))
+        catalog = [i for i in _ids(_section(prompt, "Full product catalog", "Social proof")) if i not in purchased]
+        m = re.search(r"Recommend up to (\d+)", prompt)
+        picks = rng.sample(catalog, k=min(len(catalog), int(m.group(1)) if m else 4))
+        data = {"recommended": [{"id": i, "reason": "Fits your recent purchase pattern."} for i in picks]}
+
+    elif feature == "search_rerank":
+        candidates = _ids(_section(prompt, "CANDIDATE PRODUCTS", "Task:"))
+        m = re.search(r"Return the best (\d+)", prompt)
+        picks = candidates[: int(m.group(1)) if m else 12]
+        data = {"ranked": [{"id": i, "reason": "Matches the query category and budget."} for i in picks]}
+
+    elif feature == "search_parse":
+        q = _section(prompt, "User query:", "\n\n").strip()
+        data = {
+            "intent": "recommend" if "recommend" in q.lower() else "search",
+            "categories": [],
+            "price_min": None,
+            "price_max": None,
+            "keywords": [w for w in re.split(r"[\s,]+", q.lower()) if len(w) >= 3][:8],
+            "use_cases": [],
+            "audience": [],
+            "must_include": [],
+            "exclude": [],
+            "sort": "relevance",
+        }
+
+    elif feature == "insights":
+        names = _NAME_RE.findall(prompt)[:3] or ["your purchases"]
+        data = {"bullets": [f"You often shop for items like {n}." for n in names] + [
+            "Most purchases are everyday essentials.",
+            "Recommendations focus on complementary products.",
+        ]}
+
+    elif feature == "review_digest":
+        data = {
+            "highlights": ["Good value for the price", "Reliable for daily use"],
+            "sample_reviews": [
+                {"rating": 5, "title": "Great buy", "body": "Works as described."},
+                {"rating": 4, "title": "Solid", "body": "Does the job well."},
+            ],
+        }
+
+    elif feature == "profile":
+        profile = {
+            "short_description": "Practical everyday product.",
+            "use_cases": ["daily use"],
+            "features": ["durable"],
+            "keywords": ["essential"],
+            "audience": ["everyone"],
+            "pros": ["good value"],
+            "cons": [],
+            "review_summary": "Buyers are generally satisfied.",
+        }
+        batch_ids = _ids(_section(prompt, "PRODUCTS (each", "Task:"))
+        if '"profiles"' in prompt and batch_ids:
+            data = {"profiles": [dict(profile, id=i) for i in batch_ids]}
+        else:
+            data = profile
+
+    else:
+        return "Here are a few options from our catalog that should fit what you need."
+
+    return json.dumps(data, ensure_ascii=False)
@@ -6,9 +6,13 @@ from typing import Any, Dict, List
 from django.conf import settings
 from django.core.cache import cache
 
-from google import genai
+from . import perf
+from .llm import generate_text
+from .prompt_builder import compact_enabled, encode_products, format_note, table_budget
+from .catalog_snapshot import get_catalog_snapshot
 
-from .models import SmartShopProduct
+INVENTORY_COLUMNS = ("id", "name", "category", "price", "ai_short_description", "ai_review_summary")
+TRANSCRIPT_TOKEN_RESERVE = 3000
 
 
 def _inventory_digest() -> str:
@@ -16,38 +20,32 @@ def _inventory_digest() -> str:
     Compact inventory context for the assistant.
     Cached for speed.
     """
-    cache_key = "smartshop_inventory_digest_v1"
+    snap = get_catalog_snapshot()
+    cache_key = f"smartshop_inventory_digest_v3_{'table' if compact_enabled() else 'json'}_{snap.version}"
     cached = cache.get(cache_key)
+    perf.record_cache("assistant_inventory", bool(cached))
     if cached:
         return cached
 
-    qs = (
-        SmartShopProduct.objects
-        .select_related("ai_profile")
-        .all()
-        .order_by("-id")[:120]
-    )
-
-    items: List[Dict[str, Any]] = []
-    for p in qs:
-        prof = getattr(p, "ai_profile", None)
-        items.append({
-            "id": p.id,
-            "name": p.name,
-            "category": p.category,
-            "price": float(p.price),
-            # If these exist in your ProductAIProfile, they help grounding:
-            "ai_short_description": (getattr(prof, "short_description", "") or "").strip() if prof else "",
-            "ai_review_summary": (getattr(prof, "review_summary", "") or "").strip() if prof else "",
-        })
-
-    digest = json.dumps({"inventory": items}, ensure_ascii=False)
+    # Newest 120 products, with AI profile text for grounding
+    items: List[Dict[str, Any]] = snap.product_dicts(snap.newest_ids(120), INVENTORY_COLUMNS)
+
+    if compact_enabled():
+        # Leave room in the assistant budget for the conversation transcript
+        digest = encode_products(
+            items,
+            INVENTORY_COLUMNS,
+            max_chars={"ai_short_description": 120, "ai_review_summary": 100},
+            token_budget=table_budget("assistant", reserve=TRANSCRIPT_TOKEN_RESERVE),
+        )
+    else:
+        digest = json.dumps({"inventory": items}, ensure_ascii=False)
     cache.set(cache_key, digest, timeout=300)  # 5 minutes
     return digest
 
 
 def build_system_message() -> str:
-    inventory_json = _inventory_digest()
+    inventory = _inventory_digest()
 
     return f"""
 You are SmartShop's Virtual Shopping Assistant.
@@ -67,8 +65,9 @@ RESPONSE FORMAT
 - Then list recommendations as bullets:
   - Product Name (Category) — $Price — Reason (<= 18 words, grounded in context)
 
-INVENTORY CONTEXT (JSON)
-{inventory_json}
+INVENTORY CONTEXT
+{format_note()}
+{inventory}
 """.strip()
 
 
@@ -107,12 +106,7 @@ ASSISTANT:
 """.strip()
 
     try:
-        client = genai.Client(api_key=api_key)
-        resp = client.models.generate_content(
-            model=model_name,
-            contents=prompt,
-        )
-        text = (resp.text or "").strip()
+        text = generate_text(api_key=api_key, model_name=model_name, prompt=prompt, feature="assistant")
         return text or "Sorry, I couldn't generate a reply."
     except Exception as e:
         return f"Assistant error: {str(e)}"
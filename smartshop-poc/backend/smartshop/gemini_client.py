@@ -1,62 +1,38 @@
 import json
-import re
 from typing import Any, Dict, List, Optional
 
-from google import genai
+from .llm import generate_text
+from .prompt_builder import encode_products, format_note, table_budget
+from .structured_output import parse_structured, response_schema
 
 
-def _extract_json_object(text: str) -> Optional[Dict[str, Any]]:
-    if not text:
-        return None
-    cleaned = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).replace("```", "").strip()
-    match = re.search(r"\{.*\}", cleaned, flags=re.DOTALL)
-    if not match:
-        return None
-    try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError:
-        return None
-
-
-def gemini_recommend_products_with_reasons(
+def build_recommendation_prompt(
     *,
-    api_key: str,
-    model_name: str,
     purchased: List[Dict[str, Any]],
     catalog: List[Dict[str, Any]],
     max_items: int = 4,
     social_proof: Optional[Dict[str, Any]] = None,
-) -> List[Dict[str, Any]]:
+) -> str:
     """
-    Returns list like:
-    [
-      {"id": 12, "reason": "Because you often buy Office accessories under $30."},
-      ...
-    ]
-
-    social_proof (optional):
-      {
-        "also_bought_top": [{"id": 1, "name": "...", "category": "...", "count": 5}, ...],
-        "top_categories_among_similar": [{"category":"Electronics","count":12}, ...],
-        "note": "Use these only as supporting signals; never invent purchases."
-      }
+    Prompt for gemini_recommend_products_with_reasons. Product lists use the
+    shared compact encoding; the catalog is trimmed to the feature's token budget.
     """
-    if not api_key:
-        return []
-
     purchased_small = purchased[:20]
     catalog_small = catalog[:200]
 
     social_proof_payload = social_proof or {}
+    purchased_text = encode_products(purchased_small)
 
-    prompt = f"""
+    def render(catalog_text: str) -> str:
+        return f"""
 You are an e-commerce recommendation engine.
+{format_note()}
 
 Purchased products (do NOT recommend these):
-{json.dumps(purchased_small, ensure_ascii=False)}
+{purchased_text}
 
 Full product catalog:
-{json.dumps(catalog_small, ensure_ascii=False)}
+{catalog_text}
 
 Social proof signals from similar shoppers (optional supporting signal):
 {json.dumps(social_proof_payload, ensure_ascii=False)}
@@ -80,14 +56,61 @@ Rules:
 }}
 """.strip()
 
+    budget = table_budget("recommendations", render(""))
+    return render(encode_products(catalog_small, token_budget=budget))
+
+
+def gemini_recommend_products_with_reasons(
+    *,
+    api_key: str,
+    model_name: str,
+    purchased: List[Dict[str, Any]],
+    catalog: List[Dict[str, Any]],
+    max_items: int = 4,
+    social_proof: Optional[Dict[str, Any]] = None,
+    raise_errors: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    raise_errors: let a failed LLM call raise instead of returning [], so the
+    caller can count it as an error.
+
+    Returns list like:
+    [
+      {"id": 12, "reason": "Because you often buy Office accessories under $30."},
+      ...
+    ]
+
+    social_proof (optional):
+      {
+        "also_bought_top": [{"id": 1, "name": "...", "category": "...", "count": 5}, ...],
+        "top_categories_among_similar": [{"category":"Electronics","count":12}, ...],
+        "note": "Use these only as supporting signals; never invent purchases."
+      }
+    """
+    if not api_key:
+        return []
+
+    prompt = build_recommendation_prompt(
+        purchased=purchased,
+        catalog=catalog,
+        max_items=max_items,
+        social_proof=social_proof,
+    )
+
     try:
-        client = genai.Client(api_key=api_key)
-        resp = client.models.generate_content(model=model_name, contents=prompt)
-        text = (resp.text or "").strip()
+        text = generate_text(
+            api_key=api_key,
+            model_name=model_name,
+            prompt=prompt,
+            feature="recommendations",
+            response_schema=response_schema("recommendations"),
+        )
     except Exception:
+        if raise_errors:
+            raise
         return []
 
-    data = _extract_json_object(text)
+    data = parse_structured(text, "recommendations")
     if not data or "recommended" not in data:
         return []
 
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from google import genai
+from google.genai import types
+
+from . import fake_llm, llm_accounting, perf
+from .circuit_breaker import CircuitOpenError, get_breaker
+from .llm_cache import get_cached_response, store_response
+
+
+# -----------------------------
+# Single-flight (request coalescing)
+# -----------------------------
+class _Flight:
+    """
+    One in-flight call. The leader fills result/error, waiters block on event.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+
+def prompt_key(model_name: str, prompt: str, **params: Any) -> str:
+    """
+    Stable key for a (model, prompt, generation params) triple.
+    """
+    payload = {"model": model_name, "prompt": prompt, "params": params}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def single_flight(key: str, fn: Callable[[], Any], wait_seconds: Optional[float] = None) -> Any:
+    """
+    Runs fn() at most once per key at a time in this process.
+    Concurrent callers with the same key wait for the leader and share its
+    result (or its exception). If the leader takes longer than wait_seconds,
+    a waiter gives up and runs fn() itself.
+    """
+    if wait_seconds is None:
+        wait_seconds = float(getattr(settings, "LLM_SINGLE_FLIGHT_WAIT", 60))
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight()
+            _flights[key] = flight
+
+    if not leader:
+        if not flight.event.wait(wait_seconds):
+            return fn()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = fn()
+        return flight.result
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.event.set()
+
+
+def _cluster_single_flight(key: str, fn: Callable[[], Any], wait_seconds: float) -> Any:
+    """
+    Cross-process variant using the Django cache as a lock.
+    Only meaningful with a shared cache backend (Redis/Memcached/DB).
+    The leader publishes its result for a few seconds so waiters in other
+    workers can pick it up.
+    """
+    lock_key = f"llm:sf:lock:{key}"
+    result_key = f"llm:sf:result:{key}"
+    result_ttl = int(getattr(settings, "LLM_SINGLE_FLIGHT_RESULT_TTL", 10))
+
+    if cache.add(lock_key, 1, timeout=int(wait_seconds) + 1):
+        try:
+            result = fn()
+            cache.set(result_key, result, timeout=result_ttl)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + wait_seconds
+    while time.monotonic() < deadline:
+        hit = cache.get(result_key)
+        if hit is not None:
+            return hit
+        if cache.get(lock_key) is None:
+            # Leader finished without publishing (error) or lock expired
+            break
+        time.sleep(0.05)
+
+    hit = cache.get(result_key)
+    if hit is not None:
+        return hit
+    return fn()
+
+
+def coalesce(key: str, fn: Callable[[], Any]) -> Any:
+    """
+    Process-level single-flight, optionally backed by a cluster-wide cache lock
+    (settings.LLM_SINGLE_FLIGHT_CLUSTER).
+    """
+    wait_seconds = float(getattr(settings, "LLM_SINGLE_FLIGHT_WAIT", 60))
+    if getattr(settings, "LLM_SINGLE_FLIGHT_CLUSTER", False):
+        return single_flight(key, lambda: _cluster_single_flight(key, fn, wait_seconds), wait_seconds)
+    return single_flight(key, fn, wait_seconds)
+
+
+# -----------------------------
+# Shared generate-content call
+# -----------------------------
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (~4 characters per token) when the API gives no usage.
+    """
+    return (len(text or "") + 3) // 4
+
+
+def _token_counts(usage: Any, prompt: str, text: str) -> Tuple[int, int]:
+    tokens_in = getattr(usage, "prompt_token_count", None) if usage is not None else None
+    tokens_out = getattr(usage, "candidates_token_count", None) if usage is not None else None
+    return (
+        int(tokens_in) if tokens_in is not None else estimate_tokens(prompt),
+        int(tokens_out) if tokens_out is not None else estimate_tokens(text),
+    )
+
+
+def llm_available(feature: str) -> bool:
+    """
+    False while the feature's circuit is open, so callers can skip building
+    prompt inputs and go straight to their non-AI fallback.
+    """
+    return not get_breaker(feature).is_open()
+
+
+def generate_text(
+    *,
+    api_key: str,
+    model_name: str,
+    prompt: str,
+    feature: str = "default",
+    cache_ttl: Optional[int] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Calls Gemini generate_content and returns the stripped response text.
+
+    - Responses are cached by hash(model, prompt) (see llm_cache), so identical
+      prompts from any module only hit the network once per TTL.
+    - Identical calls that miss the cache at the same time share one request.
+    - Each feature has a circuit breaker and latency budget (see circuit_breaker):
+      the SDK timeout is set to the budget, and while the circuit is open
+      CircuitOpenError is raised immediately.
+    - Tokens, cost and latency are recorded per feature (see llm_accounting).
+    - response_schema (see structured_output.response_schema) switches Gemini
+      to JSON mode constrained to that schema; it is part of the cache key.
+    - settings.LLM_BACKEND = "fake" swaps the network call for the offline
+      stand-in in fake_llm (benchmarks / load tests); the backend is part of
+      the cache key too.
+
+    Errors are raised so callers keep their own fallbacks.
+    """
+    # The backend is part of the key so fake responses never answer real traffic
+    backend = getattr(settings, "LLM_BACKEND", "gemini")
+    params: Dict[str, Any] = {"backend": backend}
+    if response_schema:
+        params["response_schema"] = response_schema
+    key = prompt_key(model_name, prompt, **params)
+    cached = get_cached_response(key)
+    perf.record_cache("llm", cached is not None)
+    if cached is not None:
+        llm_accounting.record_cache_hit(feature)
+        return cached
+
+    breaker = get_breaker(feature)
+
+    def _call() -> str:
+        if not breaker.allow_request():
+            raise CircuitOpenError(feature)
+
+        started = time.monotonic()
+        usage = None
+        try:
+            if backend == "fake":
+                fake_llm.simulate_latency()
+                text = fake_llm.fake_response(feature, prompt)
+            else:
+                client = genai.Client(
+                    api_key=api_key,
+                    http_options=types.HttpOptions(timeout=breaker.latency_budget_ms),
+                )
+                kwargs: Dict[str, Any] = {}
+                if response_schema:
+                    kwargs["config"] = types.GenerateContentConfig(
+                        response_mime_type="application/json",
+                        response_schema=response_schema,
+                    )
+                resp = client.models.generate_content(model=model_name, contents=prompt, **kwargs)
+                text = (resp.text or "").strip()
+                usage = getattr(resp, "usage_metadata", None)
+        except Exception:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            breaker.record_failure(elapsed_ms)
+            perf.record_llm(feature, elapsed_ms, tokens_in=estimate_tokens(prompt))
+            llm_accounting.record_call(
+                feature,
+                model=model_name,
+                tokens_in=estimate_tokens(prompt),
+                tokens_out=0,
+                latency_ms=elapsed_ms,
+                ok=False,
+            )
+            raise
+
+        elapsed_ms = (time.monotonic() - started) * 1000
+        breaker.record_success(elapsed_ms)
+        tokens_in, tokens_out = _token_counts(usage, prompt, text)
+        perf.record_llm(feature, elapsed_ms, tokens_in=tokens_in, tokens_out=tokens_out)
+        llm_accounting.record_call(
+            feature,
+            model=model_name,
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            latency_ms=elapsed_ms,
+        )
+        store_response(key, model_name, text, ttl=cache_ttl)
+        return text
+
+    return coalesce(key, _call)
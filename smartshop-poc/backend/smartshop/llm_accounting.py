@@ -0,0 +1,232 @@
+"""
+Token / cost / latency accounting for every LLM prompt, per feature.
+
+generate_text records each call here. For each feature we keep:
+- lifetime totals (calls, cache hits, tokens, cost, errors, over-budget prompts,
+  prompt-token bucket counts for the Prometheus histogram),
+- a rolling window of the last LLM_ACCOUNTING_WINDOW calls, from which
+  percentiles and fixed-bucket histograms are computed on demand.
+
+Budgets (settings.LLM_PROMPT_TOKEN_BUDGETS) are per-feature prompt-token
+limits; prompts over budget are counted so the worst offenders stand out in
+usage_report() / /api/ai/llm-usage/.
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .utils import percentile
+
+TOKEN_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+class _Call:
+    __slots__ = ("at", "model", "tokens_in", "tokens_out", "latency_ms", "cost", "ok")
+
+    def __init__(self, model: str, tokens_in: int, tokens_out: int, latency_ms: float, cost: float, ok: bool):
+        self.at = time.time()
+        self.model = model
+        self.tokens_in = tokens_in
+        self.tokens_out = tokens_out
+        self.latency_ms = latency_ms
+        self.cost = cost
+        self.ok = ok
+
+
+class FeatureUsage:
+    def __init__(self, feature: str, window: int):
+        self.feature = feature
+        self.recent: Deque[_Call] = deque(maxlen=max(1, int(window)))
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.over_budget = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.cost = 0.0
+        self.max_tokens_in = 0
+        # Lifetime prompt-token counts per TOKEN_BUCKETS bucket (+ overflow)
+        self.tokens_in_buckets = [0] * (len(TOKEN_BUCKETS) + 1)
+
+
+_lock = threading.Lock()
+_usage: Dict[str, FeatureUsage] = {}
+
+
+def _window() -> int:
+    return int(getattr(settings, "LLM_ACCOUNTING_WINDOW", 500))
+
+
+def _get(feature: str) -> FeatureUsage:
+    u = _usage.get(feature)
+    if u is None:
+        u = _usage[feature] = FeatureUsage(feature, _window())
+    return u
+
+
+def prompt_token_budget(feature: str) -> Optional[int]:
+    budgets = getattr(settings, "LLM_PROMPT_TOKEN_BUDGETS", {}) or {}
+    value = budgets.get(feature)
+    return int(value) if value else None
+
+
+def estimate_cost(model: str, tokens_in: int, tokens_out: int) -> float:
+    """
+    USD cost from settings.LLM_PRICING_PER_MILLION = {model: (input, output)}.
+    Unknown models cost 0.
+    """
+    pricing = getattr(settings, "LLM_PRICING_PER_MILLION", {}) or {}
+    price = pricing.get(model) or pricing.get(model.split("/")[-1])
+    if not price:
+        return 0.0
+    price_in, price_out = price
+    return (tokens_in * float(price_in) + tokens_out * float(price_out)) / 1_000_000
+
+
+def record_call(
+    feature: str,
+    *,
+    model: str,
+    tokens_in: int,
+    tokens_out: int,
+    latency_ms: float,
+    ok: bool = True,
+) -> None:
+    cost = estimate_cost(model, tokens_in, tokens_out)
+    budget = prompt_token_budget(feature)
+    with _lock:
+        u = _get(feature)
+        u.recent.append(_Call(model, tokens_in, tokens_out, latency_ms, cost, ok))
+        u.calls += 1
+        u.errors += 0 if ok else 1
+        u.tokens_in += tokens_in
+        u.tokens_out += tokens_out
+        u.cost += cost
+        u.max_tokens_in = max(u.max_tokens_in, tokens_in)
+        u.tokens_in_buckets[bisect_left(TOKEN_BUCKETS, tokens_in)] += 1
+        if budget and tokens_in > budget:
+            u.over_budget += 1
+
+
+def record_cache_hit(feature: str) -> None:
+    with _lock:
+        _get(feature).cache_hits += 1
+
+
+def reset_usage() -> None:
+    with _lock:
+        _usage.clear()
+
+
+# -----------------------------
+# Reporting
+# -----------------------------
+def _histogram(values: List[float], buckets: Tuple[int, ...]) -> Dict[str, int]:
+    out = {f"le_{b}": 0 for b in buckets}
+    out["inf"] = 0
+    for v in values:
+        for b in buckets:
+            if v <= b:
+                out[f"le_{b}"] += 1
+                break
+        else:
+            out["inf"] += 1
+    return out
+
+
+def usage_report() -> Dict[str, Any]:
+    """
+    Per-feature totals + rolling-window stats, sorted by total cost then tokens.
+    """
+    with _lock:
+        snapshot = [
+            (u, list(u.recent))
+            for u in _usage.values()
+        ]
+
+    total_cost = sum(u.cost for u, _r in snapshot) or 0.0
+    total_tokens = sum(u.tokens_in + u.tokens_out for u, _r in snapshot) or 0
+
+    features = []
+    for u, recent in snapshot:
+        t_in = [c.tokens_in for c in recent]
+        t_out = [c.tokens_out for c in recent]
+        lat = [c.latency_ms for c in recent]
+        features.append({
+            "feature": u.feature,
+            "models": sorted({c.model for c in recent}),
+            "calls": u.calls,
+            "errors": u.errors,
+            "cache_hits": u.cache_hits,
+            "tokens_in": u.tokens_in,
+            "tokens_out": u.tokens_out,
+            "cost_usd": round(u.cost, 6),
+            "cost_share": round(u.cost / total_cost, 4) if total_cost else 0.0,
+            "token_share": round((u.tokens_in + u.tokens_out) / total_tokens, 4) if total_tokens else 0.0,
+            "prompt_token_budget": prompt_token_budget(u.feature),
+            "over_budget": u.over_budget,
+            "max_tokens_in": u.max_tokens_in,
+            "window": {
+                "calls": len(recent),
+                "tokens_in_p50": percentile(t_in, 50),
+                "tokens_in_p95": percentile(t_in, 95),
+                "tokens_out_p50": percentile(t_out, 50),
+                "tokens_out_p95": percentile(t_out, 95),
+                "latency_ms_p50": round(percentile(lat, 50), 1),
+                "latency_ms_p95": round(percentile(lat, 95), 1),
+                "tokens_in_histogram": _histogram(t_in, TOKEN_BUCKETS),
+                "latency_ms_histogram": _histogram(lat, LATENCY_BUCKETS_MS),
+            },
+        })
+
+    features.sort(key=lambda f: (f["cost_usd"], f["tokens_in"] + f["tokens_out"]), reverse=True)
+    return {
+        "total_cost_usd": round(total_cost, 6),
+        "total_tokens": total_tokens,
+        "features": features,
+    }
+
+
+def render_prometheus() -> str:
+    """
+    Cost / budget counters and the lifetime prompt-token histogram, in
+    Prometheus text format (appended to /api/metrics/). Every series is
+    cumulative, so rate() / histogram_quantile() work across scrapes.
+    """
+    with _lock:
+        snapshot = [(u.feature, u.cost, u.over_budget, u.cache_hits, list(u.tokens_in_buckets), u.tokens_in, u.calls)
+                    for u in sorted(_usage.values(), key=lambda x: x.feature)]
+
+    lines = [
+        "# HELP smartshop_llm_cost_usd_total Estimated LLM cost by feature.",
+        "# TYPE smartshop_llm_cost_usd_total counter",
+    ]
+    lines += [f'smartshop_llm_cost_usd_total{{feature="{f}"}} {cost:g}' for f, cost, *_rest in snapshot]
+    lines += [
+        "# HELP smartshop_llm_over_budget_total Prompts over the feature's token budget.",
+        "# TYPE smartshop_llm_over_budget_total counter",
+    ]
+    lines += [f'smartshop_llm_over_budget_total{{feature="{f}"}} {n}' for f, _c, n, *_rest in snapshot]
+    lines += [
+        "# HELP smartshop_llm_response_cache_hits_total LLM response cache hits by feature.",
+        "# TYPE smartshop_llm_response_cache_hits_total counter",
+    ]
+    lines += [f'smartshop_llm_response_cache_hits_total{{feature="{f}"}} {n}' for f, _c, _o, n, *_rest in snapshot]
+    lines += [
+        "# HELP smartshop_llm_prompt_tokens Prompt tokens per LLM call.",
+        "# TYPE smartshop_llm_prompt_tokens histogram",
+    ]
+    for f, _c, _o, _h, buckets, tokens_sum, calls in snapshot:
+        running = 0
+        for b, n in zip(TOKEN_BUCKETS, buckets):
+            running += n
+            lines.append(f'smartshop_llm_prompt_tokens_bucket{{feature="{f}",le="{b}"}} {running}')
+        lines.append(f'smartshop_llm_prompt_tokens_bucket{{feature="{f}",le="+Inf"}} {calls}')
+        lines.append(f'smartshop_llm_prompt_tokens_sum{{feature="{f}"}} {tokens_sum}')
+        lines.append(f'smartshop_llm_prompt_tokens_count{{feature="{f}"}} {calls}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,186 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import F
+from django.utils import timezone
+
+from .models import LLMResponseCache
+
+
+# -----------------------------
+# In-process LRU (first tier)
+# -----------------------------
+class _MemoryLRU:
+    """
+    Small thread-safe LRU with per-entry expiry (monotonic clock).
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, int(max_entries))
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= time.monotonic():
+                self._data.pop(key, None)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_memory = _MemoryLRU(getattr(settings, "LLM_CACHE_MEMORY_ENTRIES", 512))
+_store_counter = itertools.count(1)
+
+# Prune the persistent table every N stores rather than on every write
+_PRUNE_EVERY = 50
+
+# DB-tier hits not yet written to LLMResponseCache.hits (approximate counts;
+# dropped if the map grows past this many keys)
+_pending_hits: Dict[str, int] = {}
+_pending_lock = threading.Lock()
+_PENDING_MAX_KEYS = 10_000
+
+
+def _enabled() -> bool:
+    return bool(getattr(settings, "LLM_CACHE_ENABLED", True))
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "LLM_CACHE_TTL", 24 * 3600))
+
+
+def _touch_seconds() -> int:
+    return int(getattr(settings, "LLM_CACHE_TOUCH_SECONDS", 300))
+
+
+def _count_hit(key: str, last_used_at, now) -> int:
+    """
+    Adds a DB-tier hit to the in-process tally. Returns the hits to write
+    now: all of them once the row's last_used_at is older than
+    LLM_CACHE_TOUCH_SECONDS, else 0 (the UPDATE is skipped).
+    """
+    with _pending_lock:
+        pending = _pending_hits.pop(key, 0) + 1
+        if last_used_at > now - timedelta(seconds=_touch_seconds()):
+            if len(_pending_hits) >= _PENDING_MAX_KEYS:
+                _pending_hits.clear()
+            _pending_hits[key] = pending
+            return 0
+        return pending
+
+
+# -----------------------------
+# Public API
+# -----------------------------
+def get_cached_response(key: str) -> Optional[str]:
+    """
+    Memory first, then the persistent table. Expired rows are ignored.
+    A DB-tier hit only writes hits / last_used_at when the row was last
+    touched more than LLM_CACHE_TOUCH_SECONDS ago; hits in between are
+    counted in process and added by that write.
+    """
+    if not _enabled():
+        return None
+
+    hit = _memory.get(key)
+    if hit is not None:
+        return hit
+
+    now = timezone.now()
+    try:
+        row = (
+            LLMResponseCache.objects
+            .filter(key=key, expires_at__gt=now)
+            .values("response_text", "expires_at", "last_used_at")
+            .first()
+        )
+        if not row:
+            return None
+        hits = _count_hit(key, row["last_used_at"], now)
+        if hits:
+            LLMResponseCache.objects.filter(key=key).update(hits=F("hits") + hits, last_used_at=now)
+    except DatabaseError:
+        return None
+
+    remaining = int((row["expires_at"] - now).total_seconds())
+    if remaining > 0:
+        _memory.set(key, row["response_text"], remaining)
+    return row["response_text"]
+
+
+def store_response(key: str, model_name: str, text: str, ttl: Optional[int] = None) -> None:
+    """
+    Saves a response in both tiers. Empty responses are never cached.
+    """
+    if not _enabled() or not text:
+        return
+
+    ttl = _ttl() if ttl is None else int(ttl)
+    _memory.set(key, text, ttl)
+
+    now = timezone.now()
+    try:
+        LLMResponseCache.objects.update_or_create(
+            key=key,
+            defaults={
+                "model_name": (model_name or "")[:100],
+                "response_text": text,
+                "last_used_at": now,
+                "expires_at": now + timedelta(seconds=ttl),
+            },
+        )
+        if next(_store_counter) % _PRUNE_EVERY == 0:
+            prune_responses()
+    except DatabaseError:
+        pass
+
+
+def prune_responses(max_rows: Optional[int] = None) -> int:
+    """
+    Deletes expired rows, then least-recently-used rows above max_rows.
+    Returns number of rows deleted.
+    """
+    if max_rows is None:
+        max_rows = int(getattr(settings, "LLM_CACHE_MAX_ROWS", 5000))
+
+    deleted, _ = LLMResponseCache.objects.filter(expires_at__lte=timezone.now()).delete()
+
+    total = LLMResponseCache.objects.count()
+    if total > max_rows:
+        stale_ids = list(
+            LLMResponseCache.objects
+            .order_by("last_used_at")
+            .values_list("id", flat=True)[: total - max_rows]
+        )
+        more, _ = LLMResponseCache.objects.filter(id__in=stale_ids).delete()
+        deleted += more
+
+    return deleted
+
+
+def clear_memory_cache() -> None:
+    _memory.clear()
+    with _pending_lock:
+        _pending_hits.clear()
@@ -0,0 +1,267 @@
+import json
+import os
+import platform
+import time
+from datetime import datetime
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework_simplejwt.tokens import AccessToken
+
+from smartshop import llm_accounting
+from smartshop.circuit_breaker import reset_breakers
+from smartshop.llm_cache import clear_memory_cache
+from smartshop.models import ProductReview, SmartShopProduct, SmartShopPurchaseOrder
+from smartshop.query_plans import check_query_plans
+from smartshop.utils import percentile
+
+SEARCH_QUERIES = [
+    "wireless earbuds under $30",
+    "gift for a student who studies a lot",
+    "hiking gear for weekend trips",
+    "recommend something for my home office",
+    "cheap kitchen tools",
+]
+CHAT_MESSAGES = [
+    "What do you recommend for a new gym routine?",
+    "I need a budget desk setup.",
+    "Any good travel accessories?",
+]
+
+# name -> (method, path template, needs auth)
+ENDPOINTS = {
+    "products": ("get", "/api/products/", False),
+    "product_detail": ("get", "/api/products/{product_id}/", False),
+    "smart_search": ("get", "/api/ai/smart-search/", False),
+    "recommendations": ("get", "/api/ai/recommendations/", True),
+    "insights": ("get", "/api/ai/insights/", True),
+    "assistant_chat": ("post", "/api/assistant/chat/", False),
+}
+
+
+def _summary(latencies, queries, statuses):
+    n = len(latencies)
+    mean = sum(latencies) / n if n else 0.0
+    return {
+        "requests": n,
+        "errors": sum(1 for s in statuses if s >= 400),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(mean, 2),
+        "max_ms": round(max(latencies), 2) if latencies else 0.0,
+        "throughput_rps": round(1000.0 / mean, 2) if mean else 0.0,
+        "queries_mean": round(sum(queries) / n, 2) if n else 0.0,
+        "queries_max": max(queries) if queries else 0,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the main API endpoints against the current dataset (see generate_synthetic_data) "
+        "with an offline Gemini stand-in. Reports p50/p95/p99 and DB queries per request, checks with "
+        "EXPLAIN that the hot purchase-history queries use their indexes, writes JSON results and "
+        "optionally compares them with a baseline run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed requests per endpoint")
+        parser.add_argument("--endpoints", type=str, default=",".join(ENDPOINTS), help="Comma-separated subset")
+        parser.add_argument("--user", type=str, default="", help="Username (default: user with most purchases)")
+        parser.add_argument("--llm-latency-ms", type=float, default=getattr(settings, "LLM_FAKE_LATENCY_MS", 300))
+        parser.add_argument("--llm-jitter-ms", type=float, default=getattr(settings, "LLM_FAKE_JITTER_MS", 100))
+        parser.add_argument("--real-llm", action="store_true", help="Call Gemini instead of the offline stand-in")
+        parser.add_argument(
+            "--cold",
+            action="store_true",
+            help="Clear caches and force AI recomputation before every request (worst case)",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default="",
+            help="Result file (default BASE_DIR/benchmarks/<timestamp>.json)",
+        )
+        parser.add_argument("--baseline", type=str, default="", help="Previous result file to compare against")
+        parser.add_argument("--max-regression", type=float, default=20.0, help="Allowed p95 increase in %% (default 20)")
+        parser.add_argument(
+            "--fail-on-regression",
+            action="store_true",
+            help="Exit with an error on p95/query regressions or hot queries not using their index",
+        )
+
+    def handle(self, *args, **opts):
+        names = [n.strip() for n in opts["endpoints"].split(",") if n.strip()]
+        unknown = [n for n in names if n not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(unknown)}. Choose from: {', '.join(ENDPOINTS)}")
+
+        user = self._pick_user(opts["user"])
+        product = (
+            SmartShopProduct.objects
+            .annotate(n=Count("smartshoppurchaseorder"))
+            .order_by("-n", "id")
+            .first()
+        )
+        if product is None:
+            raise CommandError("No products found. Run generate_synthetic_data first.")
+
+        overrides = {
+            "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "localhost"],
+            "LLM_CACHE_ENABLED": getattr(settings, "LLM_CACHE_ENABLED", True) and not opts["cold"],
+        }
+        if not opts["real_llm"]:
+            overrides.update({
+                "LLM_BACKEND": "fake",
+                "LLM_FAKE_LATENCY_MS": float(opts["llm_latency_ms"]),
+                "LLM_FAKE_JITTER_MS": float(opts["llm_jitter_ms"]),
+                "GEMINI_API_KEY": getattr(settings, "GEMINI_API_KEY", None) or "offline-benchmark",
+            })
+
+        iterations = max(1, int(opts["iterations"]))
+        warmup = max(0, int(opts["warmup"]))
+
+        results = {}
+        with override_settings(**overrides):
+            reset_breakers()
+            clear_memory_cache()
+            llm_accounting.reset_usage()
+
+            client = Client(HTTP_HOST="localhost")
+            auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+
+            for name in names:
+                latencies, queries, statuses = [], [], []
+                for i in range(warmup + iterations):
+                    method, url, kwargs = self._request(name, i, product.id, auth, cold=opts["cold"])
+                    if opts["cold"]:
+                        cache.clear()
+                        clear_memory_cache()
+                    if name == "assistant_chat":
+                        client.post("/api/assistant/reset/")
+
+                    with CaptureQueriesContext(connection) as ctx:
+                        t0 = time.perf_counter()
+                        resp = getattr(client, method)(url, **kwargs)
+                        elapsed_ms = (time.perf_counter() - t0) * 1000
+
+                    if i < warmup:
+                        continue
+                    latencies.append(elapsed_ms)
+                    queries.append(len(ctx.captured_queries))
+                    statuses.append(resp.status_code)
+
+                results[name] = _summary(latencies, queries, statuses)
+                s = results[name]
+                self.stdout.write(
+                    f"{name:<16} p50={s['p50_ms']:>8.1f}ms p95={s['p95_ms']:>8.1f}ms p99={s['p99_ms']:>8.1f}ms "
+                    f"queries/req={s['queries_mean']:>6.1f} errors={s['errors']}"
+                )
+
+        plans = check_query_plans(user_id=user.id, product_id=product.id)
+        for p in plans:
+            line = f"plan {p['name']:<24} {'index ' + p['used'][0] if p['ok'] else 'NO INDEX'}"
+            self.stdout.write(line if p["ok"] else self.style.WARNING(line))
+
+        report = {
+            "meta": {
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "db_vendor": connection.vendor,
+                "llm_backend": "gemini" if opts["real_llm"] else "fake",
+                "llm_latency_ms": None if opts["real_llm"] else float(opts["llm_latency_ms"]),
+                "llm_jitter_ms": None if opts["real_llm"] else float(opts["llm_jitter_ms"]),
+                "cold": bool(opts["cold"]),
+                "iterations": iterations,
+                "warmup": warmup,
+                "user": user.username,
+                "dataset": {
+                    "products": SmartShopProduct.objects.count(),
+                    "users": get_user_model().objects.count(),
+                    "purchases": SmartShopPurchaseOrder.objects.count(),
+                    "reviews": ProductReview.objects.count(),
+                },
+            },
+            "endpoints": results,
+            "query_plans": plans,
+            "llm_usage": llm_accounting.usage_report(),
+        }
+
+        output = opts["output"] or os.path.join(
+            settings.BASE_DIR, "benchmarks", f"{datetime.now():%Y%m%d-%H%M%S}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"✅ Benchmark results written to {output}"))
+
+        unindexed = [p["name"] for p in plans if not p["ok"]]
+        if unindexed and opts["fail_on_regression"]:
+            raise CommandError(f"Hot queries not using their index ({connection.vendor}): {', '.join(unindexed)}")
+
+        if opts["baseline"]:
+            regressions = self._compare(opts["baseline"], results, float(opts["max_regression"]))
+            if regressions and opts["fail_on_regression"]:
+                raise CommandError(f"{len(regressions)} regression(s) vs baseline: " + "; ".join(regressions))
+
+    def _pick_user(self, username):
+        User = get_user_model()
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f"User '{username}' not found.")
+            return user
+        user = (
+            User.objects
+            .annotate(n=Count("smartshoppurchaseorder"))
+            .order_by("-n", "id")
+            .first()
+        )
+        if user is None:
+            raise CommandError("No users found. Run generate_synthetic_data first.")
+        return user
+
+    def _request(self, name, i, product_id, auth, *, cold):
+        method, path, needs_auth = ENDPOINTS[name]
+        kwargs = dict(auth) if needs_auth else {}
+        url = path.format(product_id=product_id)
+
+        if name == "smart_search":
+            kwargs["data"] = {"q": SEARCH_QUERIES[i % len(SEARCH_QUERIES)]}
+        elif name in ("recommendations", "insights") and cold:
+            kwargs["data"] = {"force": "1"}
+        elif name == "assistant_chat":
+            kwargs["data"] = {"message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)]}
+            kwargs["content_type"] = "application/json"
+        return method, url, kwargs
+
+    def _compare(self, baseline_path, results, max_regression):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("endpoints", {})
+
+        regressions = []
+        for name, cur in results.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            limit = base["p95_ms"] * (1 + max_regression / 100.0)
+            change = (cur["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100 if base["p95_ms"] else 0.0
+            line = (
+                f"{name:<16} p95 {base['p95_ms']:.1f} -> {cur['p95_ms']:.1f}ms ({change:+.1f}%), "
+                f"queries/req {base['queries_mean']:.1f} -> {cur['queries_mean']:.1f}"
+            )
+            if cur["p95_ms"] > limit or cur["queries_mean"] > base["queries_mean"]:
+                regressions.append(line)
+                self.stdout.write(self.style.WARNING(f"REGRESSION {line}"))
+            else:
+                self.stdout.write(f"ok         {line}")
+        return regressions
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from smartshop.bulk_import import (
+    DEFAULT_CHUNK_SIZE,
+    bulk_create_purchases,
+    bulk_create_reviews,
+    bulk_create_users,
+    bulk_upsert_products,
+    read_rows,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-load products, users, purchases or reviews from a CSV/JSONL file "
+        "(chunked bulk_create/bulk_update, one transaction per chunk)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["products", "users", "purchases", "reviews"])
+        parser.add_argument("path", help="Input file (.csv with header row, or .jsonl)")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--no-update", action="store_true", help="products: skip existing names instead of updating")
+        parser.add_argument("--password", type=str, default="abc123456", help="users: password for created users")
+        parser.add_argument(
+            "--skip-existing-pairs",
+            action="store_true",
+            help="purchases: don't add an order for a (user, product) pair that already has one",
+        )
+
+    def handle(self, *args, **opts):
+        kind = opts["kind"]
+        chunk_size = max(1, int(opts["chunk_size"]))
+        started = time.monotonic()
+
+        try:
+            rows = read_rows(opts["path"])
+            if kind == "products":
+                stats = bulk_upsert_products(rows, chunk_size=chunk_size, update_existing=not opts["no_update"])
+            elif kind == "users":
+                usernames = (str(r.get("username") or "") for r in rows)
+                stats = bulk_create_users(usernames, password=opts["password"], chunk_size=chunk_size)
+            elif kind == "purchases":
+                stats = bulk_create_purchases(
+                    rows, chunk_size=chunk_size, skip_existing_pairs=opts["skip_existing_pairs"]
+                )
+            else:
+                stats = bulk_create_reviews(rows, chunk_size=chunk_size)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        elapsed = max(1e-9, time.monotonic() - started)
+        written = stats.get("created", 0) + stats.get("updated", 0)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {kind}: created {stats.get('created', 0)}, updated {stats.get('updated', 0)}, "
+            f"skipped {stats.get('skipped', 0)}, invalid {stats.get('invalid', 0)} "
+            f"in {elapsed:.1f}s ({written / elapsed:.0f} rows/s)"
+        ))
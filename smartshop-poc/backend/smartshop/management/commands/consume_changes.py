@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from smartshop.outbox import consumer_lag, consumer_names, purge_consumed, run_consumers
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the outbox consumers (popularity, review digests, ...) over the change events "
+        "written since their cursors, then optionally purges events every consumer has processed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--consumers", type=str, default="",
+            help=f"Comma-separated consumer names (default: all of {', '.join(consumer_names())})",
+        )
+        parser.add_argument("--purge", action="store_true", help="Delete consumed events older than OUTBOX_KEEP_DAYS")
+
+    def handle(self, *args, **opts):
+        names = [n.strip() for n in opts["consumers"].split(",") if n.strip()] or consumer_names()
+        unknown = sorted(set(names) - set(consumer_names()))
+        if unknown:
+            raise CommandError(f"Unknown consumers: {', '.join(unknown)}")
+
+        processed = run_consumers(names=names)
+        for name, lag in consumer_lag().items():
+            if name in processed:
+                self.stdout.write(f"{name}: {processed[name]} events, cursor={lag['cursor']}, pending={lag['pending']}")
+
+        purged = purge_consumed() if opts["purge"] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Outbox consumed: {sum(processed.values())} events, {purged} purged"
+        ))
@@ -0,0 +1,181 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import override_settings
+
+from smartshop import llm_accounting
+from smartshop.ai_insights import generate_user_insights_bullets
+from smartshop.circuit_breaker import CircuitOpenError, reset_breakers
+from smartshop.gemini_assistant import call_gemini_with_session_history
+from smartshop.gemini_client import gemini_recommend_products_with_reasons
+from smartshop.llm_cache import clear_memory_cache
+from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder
+from smartshop.smart_search_ai import gemini_rerank_with_reasons
+
+SEARCH_QUERIES = [
+    "recommend wireless earbuds under $30",
+    "recommend a gift for a student",
+    "recommend hiking gear for weekend trips",
+    "recommend something for my home office",
+]
+CHAT_MESSAGES = [
+    "I need a budget desk setup.",
+    "What do you recommend for travel?",
+]
+
+
+def _product_row(p):
+    prof = getattr(p, "ai_profile", None)
+    return {
+        "id": p.id,
+        "name": p.name,
+        "category": p.category,
+        "price": float(p.price),
+        "ai_short_description": (prof.short_description if prof else "") or "",
+        "ai_review_summary": (prof.review_summary if prof else "") or "",
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Offline evaluation of the compact prompt encoding: builds the same prompts as JSON and as "
+        "compact tables, reports prompt tokens per feature and checks that responses still parse "
+        "back into valid results."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=5, help="Users / queries per feature")
+        parser.add_argument("--live", action="store_true", help="Use Gemini instead of the offline stand-in")
+        parser.add_argument("--output", type=str, default="", help="Optional JSON result file")
+
+    def handle(self, *args, **opts):
+        samples = max(1, int(opts["samples"]))
+
+        catalog_products = list(SmartShopProduct.objects.select_related("ai_profile").order_by("-id")[:200])
+        if not catalog_products:
+            raise CommandError("No products found. Run generate_synthetic_data first.")
+        catalog = [_product_row(p) for p in catalog_products]
+        catalog_ids = {r["id"] for r in catalog}
+
+        users = list(
+            get_user_model().objects
+            .annotate(n=Count("smartshoppurchaseorder"))
+            .filter(n__gt=0)
+            .order_by("-n", "id")[:samples]
+        )
+        purchases_by_user = {}
+        for u in users:
+            orders = (
+                SmartShopPurchaseOrder.objects
+                .filter(user=u)
+                .select_related("product")
+                .order_by("-purchase_date")[:20]
+            )
+            purchases_by_user[u.id] = [
+                dict(_product_row(o.product), qty=o.quantity) for o in orders
+            ]
+
+        api_key = getattr(settings, "GEMINI_API_KEY", None)
+        model_name = getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash")
+        if opts["live"] and not api_key:
+            raise CommandError("--live needs GEMINI_API_KEY")
+
+        def run_recommendations():
+            ok = 0
+            for u in users:
+                purchased = purchases_by_user[u.id]
+                bought = {r["id"] for r in purchased}
+                items = gemini_recommend_products_with_reasons(
+                    api_key=api_key, model_name=model_name, purchased=purchased, catalog=catalog, max_items=4,
+                )
+                ok += bool(items) and all(i["id"] in catalog_ids and i["id"] not in bought for i in items)
+            return ok, len(users)
+
+        def run_rerank():
+            ok = 0
+            candidates = catalog[:30]
+            valid = {c["id"] for c in candidates}
+            queries = (SEARCH_QUERIES * samples)[:samples]
+            for q in queries:
+                ranked = gemini_rerank_with_reasons(
+                    api_key=api_key, model_name=model_name, user_query=q,
+                    parsed={"intent": "recommend"}, candidates=candidates, max_items=8,
+                )
+                ok += bool(ranked) and all(int(r["id"]) in valid for r in ranked)
+            return ok, len(queries)
+
+        def run_insights():
+            ok = 0
+            for u in users:
+                recs = [dict(r, reason="Popular in your favourite category.") for r in catalog[:4]]
+                try:
+                    bullets = generate_user_insights_bullets(
+                        api_key=api_key, model_name=model_name, username=u.username,
+                        purchases=purchases_by_user[u.id], recs=recs,
+                    )
+                except CircuitOpenError:
+                    bullets = []
+                ok += bool(bullets) and not bullets[0].startswith("AI Insights")
+            return ok, len(users)
+
+        def run_assistant():
+            ok = 0
+            messages = (CHAT_MESSAGES * samples)[:samples]
+            for msg in messages:
+                reply = call_gemini_with_session_history([], msg)
+                ok += bool(reply) and not reply.startswith(("Assistant error", "Sorry", "Gemini API key"))
+            return ok, len(messages)
+
+        runners = {
+            "recommendations": run_recommendations,
+            "search_rerank": run_rerank,
+            "insights": run_insights,
+            "assistant": run_assistant,
+        }
+
+        overrides = {"LLM_CACHE_ENABLED": False}
+        if not opts["live"]:
+            overrides.update({
+                "LLM_BACKEND": "fake",
+                "LLM_FAKE_LATENCY_MS": 0,
+                "LLM_FAKE_JITTER_MS": 0,
+                "GEMINI_API_KEY": api_key or "offline-eval",
+            })
+            api_key = overrides["GEMINI_API_KEY"]
+
+        results = {}
+        for mode, compact in (("json", False), ("compact", True)):
+            with override_settings(LLM_COMPACT_PROMPTS=compact, **overrides):
+                for feature, run in runners.items():
+                    reset_breakers()
+                    clear_memory_cache()
+                    cache.clear()
+                    llm_accounting.reset_usage()
+                    ok, total = run()
+                    usage = {f["feature"]: f for f in llm_accounting.usage_report()["features"]}.get(feature, {})
+                    calls = usage.get("calls", 0) or 1
+                    results.setdefault(feature, {})[mode] = {
+                        "prompt_tokens_mean": round(usage.get("tokens_in", 0) / calls, 1),
+                        "prompt_tokens_max": usage.get("max_tokens_in", 0),
+                        "parse_ok": ok,
+                        "samples": total,
+                    }
+
+        self.stdout.write(f"{'feature':<16}{'json tok':>10}{'compact tok':>13}{'saved':>8}  parse ok (json -> compact)")
+        for feature, r in results.items():
+            before = r["json"]["prompt_tokens_mean"]
+            after = r["compact"]["prompt_tokens_mean"]
+            r["reduction"] = round(1 - after / before, 4) if before else 0.0
+            self.stdout.write(
+                f"{feature:<16}{before:>10.0f}{after:>13.0f}{r['reduction'] * 100:>7.1f}%  "
+                f"{r['json']['parse_ok']}/{r['json']['samples']} -> {r['compact']['parse_ok']}/{r['compact']['samples']}"
+            )
+
+        if opts["output"]:
+            with open(opts["output"], "w", encoding="utf-8") as f:
+                json.dump({"live": bool(opts["live"]), "features": results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"✅ Results written to {opts['output']}"))
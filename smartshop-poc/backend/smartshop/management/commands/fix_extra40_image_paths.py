@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from smartshop.models import SmartShopProduct
+from smartshop.bulk_import import bulk_set_product_images
 
 MAP = {
     "Compact Hiking Backpack 20L": "product_images/compact_hiking_backpack_20l.png",
@@ -52,16 +52,7 @@ class Command(BaseCommand):
     help = "Fix image paths for the extra 40 seeded products to use product_images/..."
 
     def handle(self, *args, **kwargs):
-        updated = 0
-        missing = 0
-        for name, path in MAP.items():
-            p = SmartShopProduct.objects.filter(name=name).first()
-            if not p:
-                missing += 1
-                continue
-            p.image = path
-            p.save(update_fields=["image"])
-            updated += 1
+        stats = bulk_set_product_images(MAP)
 
-        self.stdout.write(self.style.SUCCESS(f"✅ Updated: {updated} products"))
-        self.stdout.write(self.style.WARNING(f"⚠️ Missing in DB: {missing} products"))
+        self.stdout.write(self.style.SUCCESS(f"✅ Updated: {stats['updated']} products"))
+        self.stdout.write(self.style.WARNING(f"⚠️ Missing in DB: {stats['missing']} products"))
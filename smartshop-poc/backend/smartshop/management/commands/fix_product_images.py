@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from smartshop.models import SmartShopProduct
+from smartshop.bulk_import import bulk_set_product_images
 
 FILENAME_MAP = {
     "Compact Hiking Backpack 20L": "products/compact_hiking_backpack_20l.png",
@@ -52,20 +52,8 @@ class Command(BaseCommand):
     help = "Assign image paths to products by name (for seeded products)."
 
     def handle(self, *args, **options):
-        updated = 0
-        missing = 0
+        # Only set if empty (safe); one query + one bulk_update for the whole map
+        stats = bulk_set_product_images(FILENAME_MAP, only_if_empty=True)
 
-        for name, img in FILENAME_MAP.items():
-            p = SmartShopProduct.objects.filter(name=name).first()
-            if not p:
-                missing += 1
-                continue
-
-            # Only set if empty (safe)
-            if not p.image:
-                p.image = img
-                p.save(update_fields=["image"])
-                updated += 1
-
-        self.stdout.write(self.style.SUCCESS(f"✅ Updated images: {updated}"))
-        self.stdout.write(self.style.WARNING(f"⚠️ Products not found: {missing}"))
+        self.stdout.write(self.style.SUCCESS(f"✅ Updated images: {stats['updated']}"))
+        self.stdout.write(self.style.WARNING(f"⚠️ Products not found: {stats['missing']}"))
@@ -1,7 +1,44 @@
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
+
+from smartshop.bulk_import import bulk_save_profiles
 from smartshop.models import SmartShopProduct, ProductReview, ProductAIProfile
-from smartshop.product_profile_ai import generate_product_profile, compute_signature_for_profile
+from smartshop.product_profile_ai import (
+    PROFILE_FIELDS,
+    apply_profile,
+    compute_signature_for_profile,
+    generate_product_profile,
+    generate_product_profiles_batch,
+    valid_profile,
+)
+from smartshop.rate_limit import TokenBucket, retry_with_backoff
+from smartshop.utils import percentile
+
+
+def _reviews_by_product(product_ids, per_product=8):
+    """
+    One query for all reviews of the chunk, newest first, capped per product.
+    """
+    out = {pid: [] for pid in product_ids}
+    rows = (
+        ProductReview.objects
+        .filter(product_id__in=product_ids)
+        .order_by("product_id", "-created_at")
+        .values("product_id", "rating", "title", "body")
+    )
+    for r in rows:
+        bucket = out[r["product_id"]]
+        if len(bucket) < per_product:
+            bucket.append({"rating": r["rating"], "title": r["title"], "body": r["body"]})
+    return out
+
 
 class Command(BaseCommand):
     help = "Generate/refresh AI profiles for products using Gemini (cached in DB)."
@@ -9,6 +46,27 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--limit", type=int, default=120)
         parser.add_argument("--force", action="store_true")
+        parser.add_argument("--workers", type=int, default=4, help="Concurrent Gemini calls (default 4)")
+        parser.add_argument(
+            "--rpm",
+            type=float,
+            default=getattr(settings, "LLM_REQUESTS_PER_MINUTE", 60),
+            help="Token-bucket limit on Gemini requests per minute (default LLM_REQUESTS_PER_MINUTE)",
+        )
+        parser.add_argument("--retries", type=int, default=3, help="Retries per product with exponential backoff")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1,
+            help="Products packed into one Gemini prompt (default 1 = one call per product)",
+        )
+        parser.add_argument("--chunk-size", type=int, default=200, help="Products loaded/written per chunk")
+        parser.add_argument(
+            "--progress-file",
+            type=str,
+            default=os.path.join(settings.BASE_DIR, ".generate_product_profiles.progress.json"),
+        )
+        parser.add_argument("--resume", action="store_true", help="Skip products finished by an interrupted run")
 
     def handle(self, *args, **opts):
         api_key = getattr(settings, "GEMINI_API_KEY", None)
@@ -16,46 +74,157 @@ class Command(BaseCommand):
 
         limit = max(1, int(opts["limit"]))
         force = bool(opts["force"])
+        workers = max(1, int(opts["workers"]))
+        retries = max(0, int(opts["retries"]))
+        chunk_size = max(1, int(opts["chunk_size"]))
+        batch_size = max(1, int(opts["batch_size"]))
+        progress_file = opts["progress_file"]
+
+        bucket = TokenBucket.per_minute(max(1.0, float(opts["rpm"])), burst=workers)
+
+        done_ids = set()
+        if opts["resume"] and os.path.exists(progress_file):
+            with open(progress_file, "r", encoding="utf-8") as f:
+                done_ids = set(json.load(f).get("done_ids", []))
+            self.stdout.write(f"Resuming: {len(done_ids)} product(s) already done.")
+
+        product_ids = list(SmartShopProduct.objects.order_by("-id").values_list("id", flat=True)[:limit])
+        product_ids = [pid for pid in product_ids if pid not in done_ids]
+
+        stats = {"updated": 0, "skipped": 0, "failed": 0, "retries": 0}
+        latencies = []
+        started = time.monotonic()
+
+        request_counter = itertools.count()
+
+        def throttle():
+            bucket.acquire()
+            next(request_counter)
+
+        def run_batch(batch):
+            """
+            batch: [(pid, sig, payload, reviews), ...] -> ({pid: data}, attempts, latency_ms)
+
+            Only valid profiles are returned. A call that leaves products without
+            one raises, so retry_with_backoff retries just those; products still
+            missing after the last retry are left out (counted as failed).
+            """
+            t0 = time.monotonic()
+            out = {}
+
+            def call():
+                remaining = [b for b in batch if b[0] not in out]
+                if len(remaining) == 1:
+                    pid, _sig, payload, reviews = remaining[0]
+                    throttle()
+                    got = {pid: generate_product_profile(
+                        api_key=api_key,
+                        model_name=model_name,
+                        product=payload,
+                        reviews=reviews,
+                    )}
+                else:
+                    got = generate_product_profiles_batch(
+                        api_key=api_key,
+                        model_name=model_name,
+                        items=[{"product": payload, "reviews": reviews} for _p, _s, payload, reviews in remaining],
+                        throttle=throttle,
+                    )
+                out.update((pid, data) for pid, data in got.items() if valid_profile(data))
+                missing = [b[0] for b in remaining if b[0] not in out]
+                if missing:
+                    raise ValueError(f"No usable profile for products {missing}")
+                return out
+
+            try:
+                _data, attempts = retry_with_backoff(call, retries=retries)
+            except Exception as e:
+                if not out:
+                    raise
+                self.stderr.write(f"Batch {[b[0] for b in batch]} partly failed: {e}")
+                attempts = retries + 1
+            finally:
+                # Worker threads get their own DB connections (LLM cache); release them
+                connections.close_all()
+            return out, attempts, (time.monotonic() - t0) * 1000
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(product_ids), chunk_size):
+                chunk_ids = product_ids[start:start + chunk_size]
+                products = {p.id: p for p in SmartShopProduct.objects.filter(id__in=chunk_ids)}
+                reviews_map = _reviews_by_product(chunk_ids)
+                existing = {prof.product_id: prof for prof in ProductAIProfile.objects.filter(product_id__in=chunk_ids)}
+
+                pending = []
+                for pid in chunk_ids:
+                    p = products.get(pid)
+                    if not p:
+                        continue
+                    reviews = reviews_map.get(pid, [])
+                    payload = {"id": p.id, "name": p.name, "category": p.category, "price": float(p.price)}
+                    sig = compute_signature_for_profile(payload, reviews)
+
+                    prof = existing.get(pid)
+                    if prof and prof.source_signature == sig and not force:
+                        stats["skipped"] += 1
+                        done_ids.add(pid)
+                        continue
+
+                    pending.append((pid, sig, payload, reviews))
+
+                futures = {}
+                for i in range(0, len(pending), batch_size):
+                    batch = pending[i:i + batch_size]
+                    futures[pool.submit(run_batch, batch)] = batch
+
+                to_create, to_update = [], []
+                for fut in as_completed(futures):
+                    batch = futures[fut]
+                    try:
+                        data_by_id, attempts, latency_ms = fut.result()
+                    except Exception as e:
+                        stats["failed"] += len(batch)
+                        self.stderr.write(f"Batch {[b[0] for b in batch]} failed: {type(e).__name__}: {e}")
+                        continue
+
+                    stats["retries"] += attempts - 1
+                    latencies.append(latency_ms)
+
+                    for pid, sig, _payload, _reviews in batch:
+                        if pid not in data_by_id:
+                            stats["failed"] += 1
+                            continue
+                        data = data_by_id[pid]
+                        prof = existing.get(pid)
+                        if prof:
+                            to_update.append(apply_profile(prof, sig, data))
+                        else:
+                            to_create.append(apply_profile(ProductAIProfile(product_id=pid), sig, data))
+                        done_ids.add(pid)
+
+                # Bulk writes skip signals: events and the catalog bump go with the rows
+                stats["updated"] += bulk_save_profiles(to_create, to_update, PROFILE_FIELDS, chunk_size=500)
+
+                with open(progress_file, "w", encoding="utf-8") as f:
+                    json.dump({"done_ids": sorted(done_ids)}, f)
+
+                self.stdout.write(
+                    f"... {min(start + chunk_size, len(product_ids))}/{len(product_ids)} "
+                    f"(updated {stats['updated']}, skipped {stats['skipped']}, failed {stats['failed']})"
+                )
+
+        if not stats["failed"] and os.path.exists(progress_file):
+            os.remove(progress_file)
 
-        qs = SmartShopProduct.objects.all().order_by("-id")[:limit]
-        updated = 0
-        skipped = 0
-
-        for p in qs:
-            reviews = list(
-                ProductReview.objects.filter(product=p)
-                .order_by("-created_at")
-                .values("rating", "title", "body")[:8]
-            )
-
-            product_payload = {"id": p.id, "name": p.name, "category": p.category, "price": float(p.price)}
-            sig = compute_signature_for_profile(product_payload, reviews)
-
-            prof = ProductAIProfile.objects.filter(product=p).first()
-            if prof and prof.source_signature == sig and not force:
-                skipped += 1
-                continue
-
-            data = generate_product_profile(
-                api_key=api_key,
-                model_name=model_name,
-                product=product_payload,
-                reviews=reviews,
-            ) or {}
-
-            if not prof:
-                prof = ProductAIProfile(product=p)
-
-            prof.source_signature = sig
-            prof.short_description = str(data.get("short_description", "")).strip()
-            prof.use_cases = data.get("use_cases", []) or []
-            prof.features = data.get("features", []) or []
-            prof.keywords = data.get("keywords", []) or []
-            prof.audience = data.get("audience", []) or []
-            prof.pros = data.get("pros", []) or []
-            prof.cons = data.get("cons", []) or []
-            prof.review_summary = str(data.get("review_summary", "")).strip()
-            prof.save()
-            updated += 1
-
-        self.stdout.write(self.style.SUCCESS(f"✅ Profiles updated: {updated}, skipped: {skipped}"))
+        elapsed = max(1e-9, time.monotonic() - started)
+        requests_made = next(request_counter)
+        processed = stats["updated"] + stats["failed"]
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Profiles updated: {stats['updated']}, skipped: {stats['skipped']}, failed: {stats['failed']}"
+        ))
+        self.stdout.write(
+            f"Throughput: {processed / elapsed:.2f} products/s over {elapsed:.1f}s "
+            f"({workers} workers, batch size {batch_size}, {requests_made} Gemini requests, "
+            f"{stats['retries']} retries); "
+            f"latency per job p50={percentile(latencies, 50):.0f}ms p95={percentile(latencies, 95):.0f}ms"
+        )
@@ -0,0 +1,231 @@
+import bisect
+import itertools
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from smartshop.bulk_import import (
+    bulk_create_purchases,
+    bulk_create_reviews,
+    bulk_create_users,
+    bulk_save_profiles,
+    bulk_upsert_products,
+    chunked,
+)
+from smartshop.models import ProductAIProfile, SmartShopProduct
+
+# category -> (nouns, typical price)
+CATEGORIES = {
+    "Electronics": (["Earbuds", "Charger", "Cable", "Mouse", "Keyboard", "Power Bank", "Speaker", "Webcam"], 25.0),
+    "Office": (["Desk Lamp", "Laptop Stand", "Organizer", "Monitor Riser", "Chair Cushion", "Whiteboard"], 20.0),
+    "Stationery": (["Notebook", "Gel Pens", "Highlighters", "Sticky Notes", "Pencil Case", "File Folder"], 4.0),
+    "Fitness": (["Yoga Mat", "Resistance Bands", "Jump Rope", "Foam Roller", "Shaker Bottle", "Dumbbell"], 15.0),
+    "Outdoors": (["Backpack", "Water Bottle", "Lantern", "Rain Poncho", "Trekking Poles", "First Aid Kit"], 18.0),
+    "Home": (["Lunch Box", "Cutlery Set", "Umbrella", "Candle", "Cleaning Cloths", "Storage Box"], 10.0),
+    "Kitchen": (["Non-stick Pan", "Coffee Grinder", "Knife Set", "Cutting Board", "Measuring Cups"], 22.0),
+    "Beauty": (["Serum", "Sunscreen", "Face Mask", "Lip Balm", "Hand Cream", "Cleanser"], 14.0),
+    "Pets": (["Grooming Brush", "Cat Toy", "Dog Leash", "Pet Bowl", "Chew Toy"], 9.0),
+    "Lifestyle": (["Travel Pouch", "Tote Bag", "Sleep Mask", "Travel Pillow", "Wallet"], 12.0),
+    "Gaming": (["Gaming Mouse", "Headset", "Controller Grip", "Mouse Pad", "Stream Light"], 30.0),
+    "Books": (["Study Guide", "Cookbook", "Planner", "Sketchbook", "Puzzle Book"], 11.0),
+}
+ADJECTIVES = [
+    "Compact", "Premium", "Budget", "Eco", "Portable", "Lightweight", "Pro", "Classic",
+    "Wireless", "Adjustable", "Foldable", "Smart", "Durable", "Mini", "Deluxe", "Quick-Dry",
+]
+AUDIENCES = ["students", "commuters", "travelers", "home cooks", "gym goers", "office workers", "gamers"]
+
+# Rating distribution (1..5) roughly matching e-commerce reviews
+RATING_WEIGHTS = [0.05, 0.07, 0.13, 0.30, 0.45]
+REVIEW_TEXT = {
+    5: ("Love it", "Exactly what I needed. Great quality for the price."),
+    4: ("Good value", "Works well, minor quirks but would buy again."),
+    3: ("Okay", "Does the job, nothing special."),
+    2: ("Disappointing", "Quality lower than expected."),
+    1: ("Not recommended", "Broke quickly and support was unhelpful."),
+}
+
+
+def _zipf_cum_weights(n, s):
+    """
+    Cumulative weights for a Zipf(s) popularity over n ranks.
+    """
+    return list(itertools.accumulate(1.0 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def _pick(rng, items, cum_weights):
+    x = rng.random() * cum_weights[-1]
+    return items[bisect.bisect_right(cum_weights, x)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic synthetic dataset (products, users, Zipfian purchases, reviews, "
+        "AI profiles) via bulk inserts, for load tests and benchmarks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--orders-per-user", type=float, default=8.0, help="Mean orders per user (heavy-tailed)")
+        parser.add_argument("--review-rate", type=float, default=0.15, help="Share of purchases that get a review")
+        parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for product popularity")
+        parser.add_argument("--days", type=int, default=365, help="Spread purchase dates over the last N days")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--prefix", type=str, default="syn_", help="Prefix for generated product names/usernames")
+        parser.add_argument("--password", type=str, default="abc123456")
+        parser.add_argument("--no-profiles", action="store_true", help="Skip synthetic ProductAIProfile rows")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **opts):
+        rng = random.Random(int(opts["seed"]))
+        prefix = opts["prefix"]
+        n_products = max(1, int(opts["products"]))
+        n_users = max(1, int(opts["users"]))
+        chunk_size = max(1, int(opts["chunk_size"]))
+        now = timezone.now()
+        started = time.monotonic()
+
+        # -----------------------------
+        # Products
+        # -----------------------------
+        categories = list(CATEGORIES)
+        product_rows = []
+        for i in range(n_products):
+            category = categories[i % len(categories)]
+            nouns, base_price = CATEGORIES[category]
+            name = f"{prefix}{rng.choice(ADJECTIVES)} {rng.choice(nouns)} {i}"
+            price = max(0.5, rng.lognormvariate(0, 0.5) * base_price)
+            product_rows.append({"name": name, "category": category, "price": Decimal(f"{price:.2f}")})
+
+        p_stats = bulk_upsert_products(product_rows, chunk_size=chunk_size)
+        name_to_id = dict(
+            SmartShopProduct.objects.filter(name__startswith=prefix).values_list("name", "id")
+        )
+        products = [(name_to_id[r["name"]], r["category"]) for r in product_rows if r["name"] in name_to_id]
+        self.stdout.write(f"Products: {p_stats['created']} created ({time.monotonic() - started:.1f}s)")
+
+        # Power-law popularity: overall and within each category (random rank order)
+        popularity = [pid for pid, _c in products]
+        rng.shuffle(popularity)
+        overall_cum = _zipf_cum_weights(len(popularity), float(opts["zipf"]))
+
+        by_cat = {}
+        for pid, category in products:
+            by_cat.setdefault(category, []).append(pid)
+        cat_cum = {}
+        for category, pids in by_cat.items():
+            rng.shuffle(pids)
+            cat_cum[category] = _zipf_cum_weights(len(pids), float(opts["zipf"]))
+
+        # -----------------------------
+        # Users
+        # -----------------------------
+        usernames = [f"{prefix}user{i}" for i in range(n_users)]
+        u_stats = bulk_create_users(usernames, password=opts["password"], chunk_size=chunk_size)
+        user_ids = list(
+            get_user_model().objects
+            .filter(username__startswith=f"{prefix}user")
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        self.stdout.write(f"Users: {u_stats['created']} created ({time.monotonic() - started:.1f}s)")
+
+        # -----------------------------
+        # Purchases (Zipfian products, heavy-tailed activity, category affinity)
+        # -----------------------------
+        mean_orders = max(0.1, float(opts["orders_per_user"]))
+        review_rate = max(0.0, min(1.0, float(opts["review_rate"])))
+        days = max(1, int(opts["days"]))
+        review_candidates = []
+
+        def purchase_rows():
+            for uid in user_ids:
+                # Pareto(alpha=2) has mean 2 -> scale to the requested mean
+                n_orders = max(1, int(rng.paretovariate(2.0) * mean_orders / 2.0))
+                favourites = rng.sample(categories, k=min(2, len(categories)))
+                for _ in range(n_orders):
+                    if rng.random() < 0.7:
+                        category = rng.choice(favourites)
+                        pid = _pick(rng, by_cat[category], cat_cum[category]) if by_cat.get(category) else None
+                    else:
+                        pid = None
+                    if pid is None:
+                        pid = _pick(rng, popularity, overall_cum)
+
+                    # Recency bias: more purchases in recent days
+                    days_ago = min(days - 1, int(rng.expovariate(3.0 / days)))
+                    purchased_at = now - timedelta(days=days_ago, seconds=rng.randint(0, 86399))
+                    if rng.random() < review_rate:
+                        review_candidates.append((uid, pid, purchased_at))
+                    yield {
+                        "user_id": uid,
+                        "product_id": pid,
+                        "quantity": 1 if rng.random() < 0.8 else rng.randint(2, 4),
+                        "purchase_date": purchased_at,
+                    }
+
+        o_stats = bulk_create_purchases(purchase_rows(), chunk_size=chunk_size)
+        self.stdout.write(f"Purchases: {o_stats['created']} created ({time.monotonic() - started:.1f}s)")
+
+        # -----------------------------
+        # Reviews (only by purchasers)
+        # -----------------------------
+        def review_rows():
+            for uid, pid, purchased_at in review_candidates:
+                rating = rng.choices([1, 2, 3, 4, 5], weights=RATING_WEIGHTS)[0]
+                title, body = REVIEW_TEXT[rating]
+                yield {
+                    "user_id": uid,
+                    "product_id": pid,
+                    "rating": rating,
+                    "title": title,
+                    "body": body,
+                    "created_at": purchased_at + timedelta(days=rng.randint(1, 14)),
+                }
+
+        r_stats = bulk_create_reviews(review_rows(), chunk_size=chunk_size)
+        self.stdout.write(f"Reviews: {r_stats['created']} created ({time.monotonic() - started:.1f}s)")
+
+        # -----------------------------
+        # Synthetic AI profiles
+        # -----------------------------
+        profiles_created = 0
+        if not opts["no_profiles"]:
+            existing = set(
+                ProductAIProfile.objects
+                .filter(product_id__in=list(name_to_id.values()))
+                .values_list("product_id", flat=True)
+            )
+            rows = [r for r in product_rows if r["name"] in name_to_id and name_to_id[r["name"]] not in existing]
+            for chunk in chunked(rows, chunk_size):
+                profiles = []
+                for r in chunk:
+                    words = r["name"][len(prefix):].split()
+                    audience = rng.choice(AUDIENCES)
+                    profiles.append(ProductAIProfile(
+                        product_id=name_to_id[r["name"]],
+                        source_signature="synthetic",
+                        short_description=f"{' '.join(words[:-1])} for everyday {r['category'].lower()} use.",
+                        use_cases=[f"{r['category'].lower()} essentials"],
+                        features=[words[0].lower()],
+                        keywords=[w.lower() for w in words[:-1]],
+                        audience=[audience],
+                        pros=["good value"],
+                        cons=[],
+                        review_summary=f"Buyers find it practical for {audience}.",
+                    ))
+                profiles_created += bulk_save_profiles(profiles, [], (), chunk_size=chunk_size)
+            self.stdout.write(f"AI profiles: {profiles_created} created ({time.monotonic() - started:.1f}s)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Synthetic dataset ready in {time.monotonic() - started:.1f}s "
+            f"(seed={opts['seed']}, prefix='{prefix}'): {p_stats['created']} products, "
+            f"{u_stats['created']} users, {o_stats['created']} purchases, {r_stats['created']} reviews, "
+            f"{profiles_created} AI profiles."
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from smartshop.outbox import consume
+from smartshop.popularity import rebuild_daily_sales, refresh_rankings, top_n, windows
+
+
+class Command(BaseCommand):
+    help = (
+        "Applies pending purchase events to the daily sales table and rebuilds the materialized "
+        "popularity rankings (overall / per category / per price band, per sliding window)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Recompute daily sales from every order")
+        parser.add_argument(
+            "--windows", type=str, default="",
+            help="Comma-separated window sizes in days, 0 = all time (default: settings.POPULARITY_WINDOWS)",
+        )
+        parser.add_argument("--top-n", type=int, default=0, help="Products kept per scope (default: settings.POPULARITY_TOP_N)")
+
+    def handle(self, *args, **opts):
+        window_list = [int(w) for w in opts["windows"].split(",") if w.strip()] or windows()
+        limit = opts["top_n"] or top_n()
+
+        orders = rebuild_daily_sales() if opts["rebuild"] else consume("popularity")
+        rows = refresh_rankings(window_list=window_list, limit=limit)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Popularity refreshed: {orders} {'orders' if opts['rebuild'] else 'purchase events'}, {rows} ranking rows "
+            f"(windows={window_list}, top_n={limit})"
+        ))
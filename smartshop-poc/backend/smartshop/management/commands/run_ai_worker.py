@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from smartshop.tasks import default_worker_id, handler_types, purge_finished, queue_stats, requeue_stale, run_pending, run_worker
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs background AI tasks from the database queue (recommendation / insight refresh, "
+        "review digests, product profiles, popularity): priorities, per-key dedupe, retries "
+        "with backoff and per-type concurrency limits (settings.TASK_CONCURRENCY)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=2, help="Concurrent task loops in this process")
+        parser.add_argument("--types", type=str, default="", help="Comma-separated task types (default: all)")
+        parser.add_argument("--once", action="store_true", help="Run the tasks that are due, then exit")
+        parser.add_argument("--worker-id", type=str, default="", help="Name recorded on claimed tasks")
+
+    def handle(self, *args, **opts):
+        types = [t.strip() for t in opts["types"].split(",") if t.strip()] or None
+        worker_id = opts["worker_id"] or default_worker_id()
+
+        requeued = requeue_stale()
+        purged = purge_finished()
+        if requeued or purged:
+            self.stdout.write(f"Re-queued {requeued} stale task(s), purged {purged} finished task(s).")
+
+        if opts["once"]:
+            stats = run_pending(worker_id=worker_id, types=types)
+            depth = queue_stats()
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Tasks done: {stats['done']}, failed: {stats['failed']}, still due: {depth['queued_due']}"
+            ))
+            return
+
+        self.stdout.write(
+            f"Worker {worker_id}: {max(1, opts['threads'])} thread(s), "
+            f"types: {', '.join(types or handler_types())}. Ctrl+C to stop."
+        )
+        try:
+            run_worker(worker_id=worker_id, threads=max(1, opts["threads"]), types=types)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS("✅ Worker stopped."))
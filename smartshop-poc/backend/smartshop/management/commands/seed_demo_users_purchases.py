@@ -7,6 +7,7 @@ from django.utils.text import slugify
 from django.conf import settings
 import os
 
+from smartshop.bulk_import import bulk_create_purchases, bulk_create_users, bulk_upsert_products
 from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder
 
 
@@ -57,47 +58,31 @@ class Command(BaseCommand):
         abs_images_dir = os.path.join(settings.MEDIA_ROOT, images_subdir)
         os.makedirs(abs_images_dir, exist_ok=True)
 
-        products = []
+        rows = []
         for name, category, price in PRODUCTS_20:
-            p, _ = SmartShopProduct.objects.get_or_create(
-                name=name,
-                defaults={"category": category, "price": price},
-            )
-            p.category = category
-            p.price = price
-
             # Auto attach image if exists: MEDIA_ROOT/product_images/<slug>.png
-            slug = slugify(name)
-            rel_path = f"{images_subdir}/{slug}.png"
-            abs_path = os.path.join(settings.MEDIA_ROOT, rel_path)
-            if os.path.exists(abs_path):
-                if not p.image or p.image.name != rel_path:
-                    p.image.name = rel_path
+            rel_path = f"{images_subdir}/{slugify(name)}.png"
+            has_image = os.path.exists(os.path.join(settings.MEDIA_ROOT, rel_path))
+            rows.append({"name": name, "category": category, "price": price, "image": rel_path if has_image else ""})
+        bulk_upsert_products(rows)
 
-            p.save()
-            products.append(p)
+        by_name = {p.name: p for p in SmartShopProduct.objects.filter(name__in=[r["name"] for r in rows])}
+        products = [by_name[r["name"]] for r in rows]
 
         # Create demo users
         demo_usernames = ["alice", "bob", "carol", "david", "emma", "frank"]
-        users = []
-        for uname in demo_usernames:
-            u = User.objects.filter(username=uname).first()
-            if not u:
-                u = User.objects.create_user(username=uname, email=f"{uname}@example.com", password=password)
-                self.stdout.write(self.style.WARNING(f"Created user '{uname}' (password: {password})"))
-            users.append(u)
-
-        # Helper: create purchases without duplicates
+        user_stats = bulk_create_users(demo_usernames, password=password)
+        if user_stats["created"]:
+            self.stdout.write(self.style.WARNING(f"Created {user_stats['created']} demo user(s) (password: {password})"))
+        users_by_name = {u.username: u for u in User.objects.filter(username__in=demo_usernames)}
+        users = [users_by_name[u] for u in demo_usernames]
+
+        # Collected purchases; written once at the end (existing user/product pairs skipped)
+        purchase_rows = []
+
         def add_purchases(user, prod_list):
-            existing = set(SmartShopPurchaseOrder.objects.filter(user=user).values_list("product_id", flat=True))
             for p in prod_list:
-                if p.id in existing:
-                    continue
-                SmartShopPurchaseOrder.objects.create(
-                    user=user,
-                    product=p,
-                    quantity=random.randint(1, 3),
-                )
+                purchase_rows.append({"user_id": user.id, "product_id": p.id, "quantity": random.randint(1, 3)})
 
         # Build category pools for realistic overlap
         by_cat = {}
@@ -146,5 +131,7 @@ class Command(BaseCommand):
 
             add_purchases(u, picks)
 
+        bulk_create_purchases(purchase_rows, skip_existing_pairs=True)
+
         self.stdout.write(self.style.SUCCESS("Done seeding demo users + products + overlapping purchases."))
         self.stdout.write(self.style.SUCCESS("Try logging in as: alice/bob/carol/david/emma/frank"))
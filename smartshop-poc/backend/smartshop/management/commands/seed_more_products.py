@@ -1,9 +1,9 @@
 from __future__ import annotations
 
-from decimal import Decimal
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
+from smartshop.bulk_import import bulk_upsert_products
 from smartshop.models import SmartShopProduct
 
 
@@ -72,36 +72,22 @@ class Command(BaseCommand):
         dry = bool(options["dry_run"])
         prefix = (options["prefix"] or "").strip()
 
-        created = 0
-        skipped = 0
+        rows = [{**item, "name": f"{prefix}{item['name']}".strip()} for item in EXTRA_PRODUCTS_40]
 
-        for item in EXTRA_PRODUCTS_40:
-            name = f"{prefix}{item['name']}".strip()
-
-            exists = SmartShopProduct.objects.filter(name=name).exists()
-            if exists:
-                skipped += 1
-                continue
-
-            if dry:
-                self.stdout.write(self.style.WARNING(f"[DRY] would create: {name}"))
-                created += 1
-                continue
-
-            p = SmartShopProduct(
-                name=name,
-                category=item["category"],
-                price=Decimal(item["price"]),
+        if dry:
+            # One query for all names instead of exists() per item
+            existing = set(
+                SmartShopProduct.objects.filter(name__in=[r["name"] for r in rows]).values_list("name", flat=True)
             )
-
-            # Set ImageField path (file must exist in MEDIA_ROOT/products/)
+            for r in rows:
+                if r["name"] not in existing:
+                    self.stdout.write(self.style.WARNING(f"[DRY] would create: {r['name']}"))
+            created, skipped = len(rows) - len(existing), len(existing)
+        else:
+            # Image paths must exist in MEDIA_ROOT/products/
             # e.g. backend/media/products/compact_hiking_backpack_20l.png
-            img_path = item.get("image")
-            if img_path:
-                p.image = img_path
-
-            p.save()
-            created += 1
+            stats = bulk_upsert_products(rows, update_existing=False)
+            created, skipped = stats["created"], stats["skipped"]
 
         if dry:
             raise SystemExit("Dry-run complete (rolled back).")
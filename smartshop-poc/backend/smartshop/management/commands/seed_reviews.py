@@ -1,5 +1,8 @@
 import random
+from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
+from django.db.models import Count
+from smartshop.bulk_import import bulk_create_reviews
 from smartshop.models import SmartShopProduct, ProductReview
 
 TEMPLATES = [
@@ -30,16 +33,32 @@ class Command(BaseCommand):
         per = max(1, min(int(opts["per"]), 10))
         max_products = max(1, int(opts["max_products"]))
 
-        products = list(SmartShopProduct.objects.all().order_by("-id")[:max_products])
-        created = 0
+        # Review counts + reviewer pairs for all products in two queries (no per-product count())
+        products = list(
+            SmartShopProduct.objects
+            .annotate(review_count=Count("reviews"))
+            .order_by("-id")[:max_products]
+        )
+        reviewed = set(
+            ProductReview.objects
+            .filter(product_id__in=[p.id for p in products])
+            .values_list("product_id", "user_id")
+        )
 
+        # ProductReview.user is required and unique per product: draw reviewers from existing users
+        reviewer_ids = list(get_user_model().objects.order_by("id").values_list("id", flat=True)[:500])
+        if not reviewer_ids:
+            self.stdout.write(self.style.WARNING("No users found; create users first (e.g. seed_demo_users_purchases)."))
+            return
+
+        rows = []
         for p in products:
-            existing = ProductReview.objects.filter(product=p).count()
-            if existing >= per:
+            if p.review_count >= per:
                 continue
 
-            need = per - existing
-            for _ in range(need):
+            candidates = [uid for uid in reviewer_ids if (p.id, uid) not in reviewed]
+            need = min(per - p.review_count, len(candidates))
+            for uid in random.sample(candidates, k=need):
                 if random.random() < 0.75:
                     title, body = random.choice(TEMPLATES)
                     rating = random.choice([4, 5, 5, 4])
@@ -47,12 +66,7 @@ class Command(BaseCommand):
                     title, body = random.choice(CONS)
                     rating = random.choice([3, 3, 2])
 
-                ProductReview.objects.create(
-                    product=p,
-                    rating=rating,
-                    title=title,
-                    body=body
-                )
-                created += 1
+                rows.append({"product_id": p.id, "user_id": uid, "rating": rating, "title": title, "body": body})
 
-        self.stdout.write(self.style.SUCCESS(f"✅ Seeded {created} reviews."))
+        stats = bulk_create_reviews(rows)
+        self.stdout.write(self.style.SUCCESS(f"✅ Seeded {stats['created']} reviews."))
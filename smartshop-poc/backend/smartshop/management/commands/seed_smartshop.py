@@ -10,6 +10,7 @@ from django.db import transaction
 from django.conf import settings
 from django.utils.text import slugify
 
+from smartshop.bulk_import import bulk_create_purchases, bulk_upsert_products
 from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder
 
 
@@ -117,39 +118,32 @@ class Command(BaseCommand):
         abs_images_dir = os.path.join(settings.MEDIA_ROOT, images_subdir)
         os.makedirs(abs_images_dir, exist_ok=True)
 
-        created_count = 0
+        # Current image paths for the chosen names (one query) to report attach counts
+        current_images = dict(
+            SmartShopProduct.objects.filter(name__in=[c[0] for c in chosen]).values_list("name", "image")
+        )
         attached_images = 0
         missing_images = 0
 
-        # Seed / upsert products and attach images if present
+        # Seed / upsert products (keeps seeded values consistent on reruns) and attach images if present
+        rows = []
         for name, category, price in chosen:
-            obj, created = SmartShopProduct.objects.get_or_create(
-                name=name,
-                defaults={"category": category, "price": price},
-            )
-
-            if created:
-                created_count += 1
-            else:
-                # Keep seeded values consistent on reruns
-                obj.category = category
-                obj.price = price
-                obj.save(update_fields=["category", "price"])
-
             # Attach AI image if file exists: MEDIA_ROOT/<images_subdir>/<slug>.png
-            slug = slugify(name)
-            filename = f"{slug}.png"
-            rel_path = f"{images_subdir}/{filename}"
+            rel_path = f"{images_subdir}/{slugify(name)}.png"
             abs_path = os.path.join(settings.MEDIA_ROOT, rel_path)
 
+            image = ""
             if os.path.exists(abs_path):
-                if not obj.image or obj.image.name != rel_path:
-                    obj.image.name = rel_path
-                    obj.save(update_fields=["image"])
+                image = rel_path
+                if current_images.get(name) != rel_path:
                     attached_images += 1
             else:
                 missing_images += 1
 
+            rows.append({"name": name, "category": category, "price": price, "image": image})
+
+        created_count = bulk_upsert_products(rows)["created"]
+
         self.stdout.write(self.style.SUCCESS(
             f"Seeded products: {SmartShopProduct.objects.count()} total "
             f"({created_count} created this run)."
@@ -159,11 +153,11 @@ class Command(BaseCommand):
         ))
 
         # Create purchases for the target user (avoid duplicates)
-        all_products = list(SmartShopProduct.objects.all())
+        all_product_ids = list(SmartShopProduct.objects.values_list("id", flat=True))
         already = set(
             SmartShopPurchaseOrder.objects.filter(user=user).values_list("product_id", flat=True)
         )
-        available = [p for p in all_products if p.id not in already]
+        available = [pid for pid in all_product_ids if pid not in already]
 
         if not available:
             self.stdout.write(self.style.WARNING(
@@ -174,12 +168,9 @@ class Command(BaseCommand):
         purchase_count = min(purchase_count, len(available))
         picked = random.sample(available, k=purchase_count)
 
-        for p in picked:
-            SmartShopPurchaseOrder.objects.create(
-                user=user,
-                product=p,
-                quantity=random.randint(1, 3),
-            )
+        bulk_create_purchases(
+            [{"user_id": user.id, "product_id": pid, "quantity": random.randint(1, 3)} for pid in picked]
+        )
 
         self.stdout.write(self.style.SUCCESS(
             f"Created {purchase_count} purchase order(s) for user '{user.username}' (id={user.id})."
@@ -0,0 +1,53 @@
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import perf
+
+
+class PerfMiddleware:
+    """
+    Records wall time, DB queries/time, LLM calls and cache hits per request
+    (see perf), adds a Server-Timing header and feeds the /api/metrics/ counters.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, "PERF_METRICS_ENABLED", True):
+            return self.get_response(request)
+
+        metrics, token = perf.start_request()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(self._db_wrapper))
+                response = self.get_response(request)
+        finally:
+            perf.end_request(token)
+
+        match = getattr(request, "resolver_match", None)
+        endpoint = f"/{match.route}" if match and match.route else "unmatched"
+        size = len(response.content) if not getattr(response, "streaming", False) else 0
+
+        total_ms = perf.finish_request(
+            metrics,
+            endpoint=endpoint,
+            method=request.method,
+            status=response.status_code,
+            response_bytes=size,
+        )
+        if getattr(settings, "PERF_SERVER_TIMING", True):
+            response["Server-Timing"] = perf.server_timing(metrics, total_ms)
+        return response
+
+    @staticmethod
+    def _db_wrapper(execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            perf.record_db((time.perf_counter() - t0) * 1000)
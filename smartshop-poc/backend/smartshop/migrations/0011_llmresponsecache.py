@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-19 02:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0010_alter_productreview_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMResponseCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('model_name', models.CharField(blank=True, default='', max_length=100)),
+                ('response_text', models.TextField(blank=True, default='')),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
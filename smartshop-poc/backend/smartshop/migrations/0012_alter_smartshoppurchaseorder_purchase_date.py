@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0011_llmresponsecache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='smartshoppurchaseorder',
+            name='purchase_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-19 09:12
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0012_alter_smartshoppurchaseorder_purchase_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityRefreshState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_order_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='smartshop.smartshopproduct')),
+            ],
+            options={
+                'unique_together': {('product', 'day')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=20)),
+                ('scope_value', models.CharField(blank=True, default='', max_length=50)),
+                ('window_days', models.PositiveIntegerField()),
+                ('rank', models.PositiveIntegerField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='popularity_ranks', to='smartshop.smartshopproduct')),
+            ],
+            options={
+                'ordering': ('scope', 'scope_value', 'window_days', 'rank'),
+                'indexes': [models.Index(fields=['scope', 'scope_value', 'window_days', 'rank'], name='smartshop_popularity_lookup')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.1 on 2026-10-19 09:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0013_popularity_tables'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='smartshoppurchaseorder',
+            index=models.Index(fields=['user', '-purchase_date'], name='smartshop_po_user_date'),
+        ),
+        migrations.AddIndex(
+            model_name='smartshoppurchaseorder',
+            index=models.Index(fields=['user', 'product'], name='smartshop_po_user_product'),
+        ),
+        migrations.AddIndex(
+            model_name='smartshoppurchaseorder',
+            index=models.Index(fields=['product', 'user'], name='smartshop_po_product_user'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0014_purchase_order_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingSketchState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('data', models.BinaryField(blank=True, default=b'')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
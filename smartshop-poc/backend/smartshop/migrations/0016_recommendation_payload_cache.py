@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0015_trending_sketch_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userrecommendationcache',
+            name='catalog_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='userrecommendationcache',
+            name='payload_json',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='userrecommendationcache',
+            name='purchase_state',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-19 12:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0016_recommendation_payload_cache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AITask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_type', models.CharField(max_length=50)),
+                ('dedupe_key', models.CharField(blank=True, default='', max_length=200)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('priority', models.IntegerField(default=0)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=3)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after', 'priority'], name='smartshop_task_ready'), models.Index(fields=['task_type', 'status'], name='smartshop_task_type_status')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'queued'), models.Q(('dedupe_key', ''), _negated=True)), fields=('task_type', 'dedupe_key'), name='smartshop_task_active_dedupe')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0017_ai_task_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeConsumerCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_event_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('topic', models.CharField(max_length=30)),
+                ('action', models.CharField(max_length=10)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('product_id', models.BigIntegerField(blank=True, null=True)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['topic', 'id'], name='smartshop_outbox_topic')],
+            },
+        ),
+    ]
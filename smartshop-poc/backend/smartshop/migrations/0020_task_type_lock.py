@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0019_catalog_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AITaskTypeLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_type', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+    ]
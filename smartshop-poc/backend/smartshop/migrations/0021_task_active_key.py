@@ -0,0 +1,46 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:10
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_active_key(apps, schema_editor):
+    """
+    Queued keyed tasks get their active_key. Duplicates that slipped past the
+    conditional constraint (MySQL never enforced it) are closed as failed; the
+    oldest one per key stays queued.
+    """
+    AITask = apps.get_model("smartshop", "AITask")
+    seen = set()
+    qs = AITask.objects.filter(status="queued").exclude(dedupe_key="").order_by("id")
+    for task in qs.iterator():
+        key = f"{task.task_type}:{task.dedupe_key}"
+        if key in seen:
+            AITask.objects.filter(id=task.id).update(
+                status="failed",
+                last_error="Superseded by a queued task with the same key",
+                finished_at=timezone.now(),
+            )
+            continue
+        seen.add(key)
+        AITask.objects.filter(id=task.id).update(active_key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0020_task_type_lock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aitask',
+            name='active_key',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(backfill_active_key, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='aitask',
+            name='smartshop_task_active_dedupe',
+        ),
+    ]
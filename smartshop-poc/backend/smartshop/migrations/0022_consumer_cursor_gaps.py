@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0021_task_active_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changeconsumercursor',
+            name='gaps',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:50
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartshop', '0022_consumer_cursor_gaps'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='PopularityRefreshState',
+        ),
+    ]
@@ -18,7 +18,18 @@ class SmartShopPurchaseOrder(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     product = models.ForeignKey(SmartShopProduct, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
-    purchase_date = models.DateTimeField(auto_now_add=True)
+    # default (not auto_now_add) so bulk imports can load historical order dates
+    purchase_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # Hot access patterns (checked with EXPLAIN in smartshop/query_plans.py):
+        # a user's history newest first, "has user bought X", and
+        # product -> buyers for also-bought.
+        indexes = [
+            models.Index(fields=["user", "-purchase_date"], name="smartshop_po_user_date"),
+            models.Index(fields=["user", "product"], name="smartshop_po_user_product"),
+            models.Index(fields=["product", "user"], name="smartshop_po_product_user"),
+        ]
 
     def __str__(self) -> str:
         return f"User {self.user_id} purchased {self.product_id} x{self.quantity}"
@@ -39,6 +50,10 @@ class UserRecommendationCache(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="ai_recommendations")
     purchase_signature = models.CharField(max_length=64)
     items_json = models.JSONField(default=list)  # [{id, reason}, ...]
+    # Fully rendered response, valid while purchase_state and catalog_version match
+    purchase_state = models.CharField(max_length=64, blank=True, default="")
+    catalog_version = models.CharField(max_length=64, blank=True, default="")
+    payload_json = models.JSONField(default=dict, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
@@ -114,3 +129,199 @@ class ProductAIReviewDigest(models.Model):
 
     def __str__(self):
         return f"AI digest for product {self.product_id}"
+
+
+class LLMResponseCache(models.Model):
+    """
+    Content-addressed cache of Gemini responses.
+    key = sha256(model, prompt, generation params); shared by every AI module.
+    """
+    key = models.CharField(max_length=64, unique=True)
+    model_name = models.CharField(max_length=100, blank=True, default="")
+    response_text = models.TextField(blank=True, default="")
+    hits = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"LLMResponseCache({self.key[:12]}, model={self.model_name})"
+
+
+class ProductDailySales(models.Model):
+    """
+    Orders / units per product per day, kept up to date from purchase outbox
+    events (see popularity.apply_order_events).
+    """
+    product = models.ForeignKey("SmartShopProduct", on_delete=models.CASCADE, related_name="daily_sales")
+    day = models.DateField(db_index=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("product", "day")
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units} units"
+
+
+class ProductPopularity(models.Model):
+    """
+    Materialized top-N products per scope and sliding window.
+    scope = "overall" | "category" | "price_band"; scope_value is the category
+    or band label ("" for overall); window_days = 0 means all time.
+    """
+    SCOPE_OVERALL = "overall"
+    SCOPE_CATEGORY = "category"
+    SCOPE_PRICE_BAND = "price_band"
+
+    scope = models.CharField(max_length=20)
+    scope_value = models.CharField(max_length=50, blank=True, default="")
+    window_days = models.PositiveIntegerField()
+    rank = models.PositiveIntegerField()
+    product = models.ForeignKey("SmartShopProduct", on_delete=models.CASCADE, related_name="popularity_ranks")
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ("scope", "scope_value", "window_days", "rank")
+        indexes = [
+            models.Index(fields=["scope", "scope_value", "window_days", "rank"], name="smartshop_popularity_lookup"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.scope_value or '*'}/{self.window_days}d #{self.rank} -> {self.product_id}"
+
+
+class TrendingSketchState(models.Model):
+    """
+    Serialized sliding-window count-min sketches (see trending.py), merged
+    into by the "trending" outbox consumer.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    data = models.BinaryField(blank=True, default=b"")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"TrendingSketchState({self.name}, updated={self.updated_at})"
+
+
+class AITask(models.Model):
+    """
+    Durable background job (see tasks.py / manage.py run_ai_worker).
+    dedupe_key: at most one queued task per (task_type, key); a task that is
+    already running does not block the next one (it may have read old data).
+    active_key is "<task_type>:<dedupe_key>" while queued and NULL otherwise,
+    under a plain unique index: MySQL ignores conditional unique constraints,
+    but enforces this one (NULLs never collide).
+    Higher priority runs first; run_after delays retries and debounced work.
+    """
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    task_type = models.CharField(max_length=50)
+    dedupe_key = models.CharField(max_length=200, blank=True, default="")
+    active_key = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    payload = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, default="")
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after", "priority"], name="smartshop_task_ready"),
+            models.Index(fields=["task_type", "status"], name="smartshop_task_type_status"),
+        ]
+
+    def __str__(self):
+        return f"AITask({self.task_type}:{self.dedupe_key or self.id}, {self.status})"
+
+
+class AITaskTypeLock(models.Model):
+    """
+    One row per task type, locked while a worker counts that type's running
+    tasks and claims one (see tasks.claim_next), so two workers cannot both
+    take the last concurrency slot.
+    """
+    task_type = models.CharField(max_length=50, unique=True)
+
+    def __str__(self):
+        return f"AITaskTypeLock({self.task_type})"
+
+
+class ChangeEvent(models.Model):
+    """
+    Transactional outbox (see outbox.py): one row per catalog / purchase /
+    review change, written in the same transaction as the change. id is the
+    consumers' cursor.
+    """
+    TOPIC_PURCHASE = "purchase"
+    TOPIC_PRODUCT = "product"
+    TOPIC_PROFILE = "product_profile"
+    TOPIC_REVIEW = "review"
+
+    ACTION_CREATED = "created"
+    ACTION_UPDATED = "updated"
+    ACTION_DELETED = "deleted"
+
+    id = models.BigAutoField(primary_key=True)
+    topic = models.CharField(max_length=30)
+    action = models.CharField(max_length=10)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    user_id = models.BigIntegerField(null=True, blank=True)
+    product_id = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["topic", "id"], name="smartshop_outbox_topic"),
+        ]
+
+    def __str__(self):
+        return f"ChangeEvent#{self.id}({self.topic}.{self.action} {self.object_id})"
+
+
+class ChangeConsumerCursor(models.Model):
+    """
+    Last ChangeEvent id processed by a named consumer, plus the id ranges it
+    skipped below that id because they were not committed yet:
+    gaps = [[first id, last id, first seen (epoch seconds)], ...].
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    gaps = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"ChangeConsumerCursor({self.name} @ {self.last_event_id})"
+
+
+class CatalogState(models.Model):
+    """
+    Single row: current catalog version (see catalog_snapshot.py). Bumped in
+    the same transaction as the product / profile write it announces, so
+    every process sees the new version exactly when the write commits.
+    """
+    version = models.CharField(max_length=32, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"CatalogState({self.version})"
@@ -0,0 +1,303 @@
+"""
+Transactional outbox of catalog / purchase / review changes.
+
+Every change to SmartShopPurchaseOrder, SmartShopProduct, ProductAIProfile
+and ProductReview writes a ChangeEvent in the same transaction (model signals
+in signals.py; bulk writers in bulk_import.py call emit_many). Derived
+structures then update from the events, in O(changes), instead of rebuilding
+or re-checking signatures:
+
+    @outbox_consumer("my_index", topics=("purchase",))
+    def apply(events): ...          # list of ChangeEvent, ascending id
+
+consume(name) hands a consumer the events after its cursor
+(ChangeConsumerCursor) in batches and moves the cursor in the same
+transaction as the consumer's own DB writes, so a batch is applied exactly
+once for DB-side effects (at least once for anything else).
+
+Ids are assigned at insert but become visible at commit, so a slow
+transaction (a bulk_import chunk, say) can commit an id below a cursor that
+already moved past it. Every id the cursor skips is kept on the cursor as a
+gap; later rounds look the gaps up first and hand over whatever has committed
+since, so late events are delivered (after higher ids). A gap still empty
+after OUTBOX_GAP_TIMEOUT_SECONDS is taken as a rolled-back insert and dropped.
+
+Consumers run on the task queue ("outbox.consume", queued after each commit
+that wrote events, late ones included) or with `manage.py consume_changes`.
+"""
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ChangeConsumerCursor, ChangeEvent
+
+Consumer = Callable[[List[ChangeEvent]], None]
+
+_consumers: Dict[str, Dict[str, Any]] = {}
+
+
+def outbox_consumer(name: str, *, topics: Optional[Sequence[str]] = None):
+    def decorator(fn: Consumer) -> Consumer:
+        _consumers[name] = {"fn": fn, "topics": tuple(topics or ())}
+        return fn
+    return decorator
+
+
+def consumer_names() -> List[str]:
+    return sorted(_consumers)
+
+
+# -----------------------------
+# Producing
+# -----------------------------
+def _schedule_consumers() -> None:
+    from .tasks import enqueue
+
+    delay = float(getattr(settings, "OUTBOX_CONSUME_DELAY_SECONDS", 5))
+    transaction.on_commit(lambda: enqueue("outbox.consume", key="all", delay=delay))
+
+
+def emit(
+    topic: str,
+    action: str,
+    *,
+    object_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    product_id: Optional[int] = None,
+    payload: Optional[Dict[str, Any]] = None,
+) -> ChangeEvent:
+    """
+    Records one change in the caller's transaction.
+    """
+    event = ChangeEvent.objects.create(
+        topic=topic,
+        action=action,
+        object_id=object_id,
+        user_id=user_id,
+        product_id=product_id,
+        payload=payload or {},
+    )
+    _schedule_consumers()
+    return event
+
+
+def emit_many(events: Iterable[ChangeEvent], *, batch_size: int = 1000) -> int:
+    """
+    Bulk version of emit for bulk writers (unsaved ChangeEvent instances).
+    """
+    events = list(events)
+    if events:
+        ChangeEvent.objects.bulk_create(events, batch_size=batch_size)
+        _schedule_consumers()
+    return len(events)
+
+
+def purchase_event(order, action: str) -> ChangeEvent:
+    return ChangeEvent(
+        topic=ChangeEvent.TOPIC_PURCHASE,
+        action=action,
+        object_id=order.id,
+        user_id=order.user_id,
+        product_id=order.product_id,
+        payload={
+            "quantity": order.quantity,
+            "purchase_date": order.purchase_date.isoformat() if order.purchase_date else None,
+        },
+    )
+
+
+def profile_event(profile, action: str) -> ChangeEvent:
+    return ChangeEvent(
+        topic=ChangeEvent.TOPIC_PROFILE,
+        action=action,
+        object_id=profile.pk,
+        product_id=profile.product_id,
+    )
+
+
+# -----------------------------
+# Consuming
+# -----------------------------
+Gap = List[float]   # [first id, last id, first seen (epoch seconds)]
+
+
+def _gap_filter(gaps: Sequence[Gap]) -> Q:
+    q = Q()
+    for lo, hi, _seen in gaps:
+        q |= Q(id__range=(int(lo), int(hi)))
+    return q
+
+
+def _fill_gaps(gaps: Sequence[Gap], found: Sequence[int]) -> List[Gap]:
+    """
+    gaps without the ids in found (ascending).
+    """
+    out: List[Gap] = []
+    found_iter = iter(found)
+    nxt = next(found_iter, None)
+    for lo, hi, seen in gaps:
+        lo, hi = int(lo), int(hi)
+        while nxt is not None and nxt < lo:
+            nxt = next(found_iter, None)
+        while nxt is not None and nxt <= hi:
+            if nxt > lo:
+                out.append([lo, nxt - 1, seen])
+            lo = nxt + 1
+            nxt = next(found_iter, None)
+        if lo <= hi:
+            out.append([lo, hi, seen])
+    return out
+
+
+def _new_gaps(after_id: int, ids: Sequence[int], seen: float) -> List[Gap]:
+    """
+    Ranges missing between after_id and ids (ascending).
+    """
+    out: List[Gap] = []
+    expected = after_id + 1
+    for i in ids:
+        if i > expected:
+            out.append([expected, i - 1, seen])
+        expected = i + 1
+    return out
+
+
+def read_events(
+    after_id: int = 0,
+    *,
+    topics: Optional[Sequence[str]] = None,
+    limit: int = 500,
+    gaps: Sequence[Gap] = (),
+) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+    """
+    ([(id, topic)] committed since inside gaps, [(id, topic)] of the next
+    limit ids after after_id). Both cover all topics, so ids of other topics
+    are not mistaken for gaps.
+    """
+    late = []
+    if gaps:
+        late = list(ChangeEvent.objects.filter(_gap_filter(gaps)).order_by("id").values_list("id", "topic"))
+    new = list(ChangeEvent.objects.filter(id__gt=after_id).order_by("id").values_list("id", "topic")[:limit])
+    return late, new
+
+
+def consume(
+    name: str,
+    *,
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+    now=None,
+) -> int:
+    """
+    Feeds the consumer its new (and late-committed) events in batches.
+    Returns how many it processed.
+    """
+    consumer = _consumers[name]
+    batch_size = int(batch_size or getattr(settings, "OUTBOX_BATCH_SIZE", 500))
+    now_ts = (now or timezone.now()).timestamp()
+    expire_before = now_ts - float(getattr(settings, "OUTBOX_GAP_TIMEOUT_SECONDS", 900))
+
+    processed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            cursor, _created = ChangeConsumerCursor.objects.select_for_update().get_or_create(name=name)
+            late, new = read_events(cursor.last_event_id, limit=batch_size, gaps=cursor.gaps)
+            gaps = _fill_gaps(cursor.gaps, [i for i, _t in late])
+            gaps += _new_gaps(cursor.last_event_id, [i for i, _t in new], now_ts)
+            gaps = [g for g in gaps if g[2] >= expire_before]
+
+            wanted = [i for i, topic in late + new if not consumer["topics"] or topic in consumer["topics"]]
+            events = list(ChangeEvent.objects.filter(id__in=wanted).order_by("id")) if wanted else []
+            if events:
+                consumer["fn"](events)
+            changed = bool(late or new) or gaps != cursor.gaps
+            if new:
+                cursor.last_event_id = new[-1][0]
+            cursor.gaps = gaps
+            if changed:
+                cursor.save(update_fields=["last_event_id", "gaps", "updated_at"])
+        processed += len(events)
+        batches += 1
+        if not (late or new):
+            break
+    return processed
+
+
+def run_consumers(*, names: Optional[Sequence[str]] = None, now=None) -> Dict[str, int]:
+    return {name: consume(name, now=now) for name in (names or consumer_names())}
+
+
+def consumer_lag() -> Dict[str, Dict[str, Any]]:
+    """
+    Per consumer: cursor, number of events still to process (late commits in
+    its gaps included) and open gaps.
+    """
+    cursors = {c.name: c for c in ChangeConsumerCursor.objects.all()}
+    out = {}
+    for name in consumer_names():
+        cursor = cursors.get(name)
+        after, gaps = (cursor.last_event_id, cursor.gaps) if cursor else (0, [])
+        qs = ChangeEvent.objects.filter(Q(id__gt=after) | _gap_filter(gaps))
+        if _consumers[name]["topics"]:
+            qs = qs.filter(topic__in=_consumers[name]["topics"])
+        out[name] = {"cursor": after, "pending": qs.count(), "gaps": len(gaps)}
+    return out
+
+
+def purge_consumed(*, older_than_days: Optional[float] = None) -> int:
+    """
+    Deletes events every consumer has processed and that are older than
+    OUTBOX_KEEP_DAYS.
+    """
+    days = float(older_than_days if older_than_days is not None else getattr(settings, "OUTBOX_KEEP_DAYS", 7))
+    cursors = {c.name: c for c in ChangeConsumerCursor.objects.all()}
+    low = min((cursors[n].last_event_id if n in cursors else 0 for n in consumer_names()), default=0)
+    # Nothing at or above an open gap: a late commit there is still unconsumed
+    open_gaps = [int(g[0]) for c in cursors.values() for g in c.gaps]
+    if open_gaps:
+        low = min(low, min(open_gaps) - 1)
+    deleted, _ = ChangeEvent.objects.filter(
+        id__lte=low, created_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
+
+
+# -----------------------------
+# Built-in consumers
+# -----------------------------
+@outbox_consumer("popularity", topics=(ChangeEvent.TOPIC_PURCHASE,))
+def _popularity(events: List[ChangeEvent]) -> None:
+    """
+    New orders are added to ProductDailySales and deleted ones subtracted, so
+    daily sales stay exact without a rebuild.
+    """
+    from .popularity import apply_order_events
+
+    apply_order_events(events)
+
+
+@outbox_consumer("trending", topics=(ChangeEvent.TOPIC_PURCHASE,))
+def _trending(events: List[ChangeEvent]) -> None:
+    """
+    New orders are added to the shared "trending now" sketches.
+    """
+    from .trending import apply_purchase_events
+
+    apply_purchase_events(events)
+
+
+@outbox_consumer("review_ai", topics=(ChangeEvent.TOPIC_REVIEW,))
+def _review_ai(events: List[ChangeEvent]) -> None:
+    """
+    Queues one digest and one profile regeneration per reviewed product.
+    """
+    from .tasks import enqueue
+
+    for product_id in dict.fromkeys(e.product_id for e in events if e.product_id):
+        enqueue("reviews.digest", {"product_id": product_id}, key=str(product_id))
+        enqueue("profiles.generate", {"product_id": product_id}, key=str(product_id))
@@ -0,0 +1,241 @@
+"""
+Per-request performance accounting.
+
+PerfMiddleware opens a RequestMetrics for each request (held in a contextvar),
+code inside the request adds to it (DB wrapper, LLM calls, cache lookups,
+named spans) and at the end the totals are folded into process-wide
+per-endpoint counters exposed in Prometheus text format (render_prometheus).
+
+LLM and cache counters are also recorded outside requests (management
+commands, worker threads) so the process totals stay complete.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Request duration histogram buckets (seconds)
+DURATION_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_ms = 0.0
+        self.llm_calls = 0
+        self.llm_ms = 0.0
+        self.llm_tokens_in = 0
+        self.llm_tokens_out = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.spans: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("smartshop_perf", default=None)
+
+
+def start_request() -> Tuple[RequestMetrics, contextvars.Token]:
+    metrics = RequestMetrics()
+    return metrics, _current.set(metrics)
+
+
+def end_request(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+# -----------------------------
+# Process-wide counters
+# -----------------------------
+_lock = threading.Lock()
+_http: Dict[Tuple[str, str, int], int] = {}
+_endpoints: Dict[str, Dict[str, float]] = {}
+_duration_buckets: Dict[str, List[int]] = {}
+_spans: Dict[Tuple[str, str], float] = {}
+_llm: Dict[str, Dict[str, float]] = {}
+_cache: Dict[Tuple[str, str], int] = {}
+
+
+def _add(d: Dict, key, field: str, value: float) -> None:
+    d.setdefault(key, {})
+    d[key][field] = d[key].get(field, 0) + value
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Times a named section of the current request (shows up in Server-Timing).
+    No-op outside a request.
+    """
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.spans[name] = metrics.spans.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+def record_db(duration_ms: float) -> None:
+    metrics = current()
+    if metrics is not None:
+        metrics.db_queries += 1
+        metrics.db_ms += duration_ms
+
+
+def record_llm(feature: str, duration_ms: float, tokens_in: int = 0, tokens_out: int = 0) -> None:
+    metrics = current()
+    if metrics is not None:
+        metrics.llm_calls += 1
+        metrics.llm_ms += duration_ms
+        metrics.llm_tokens_in += tokens_in
+        metrics.llm_tokens_out += tokens_out
+    with _lock:
+        _add(_llm, feature, "calls", 1)
+        _add(_llm, feature, "seconds", duration_ms / 1000.0)
+        _add(_llm, feature, "tokens_in", tokens_in)
+        _add(_llm, feature, "tokens_out", tokens_out)
+
+
+def record_cache(name: str, hit: bool) -> None:
+    metrics = current()
+    if metrics is not None:
+        if hit:
+            metrics.cache_hits += 1
+        else:
+            metrics.cache_misses += 1
+    key = (name, "hit" if hit else "miss")
+    with _lock:
+        _cache[key] = _cache.get(key, 0) + 1
+
+
+def finish_request(metrics: RequestMetrics, *, endpoint: str, method: str, status: int, response_bytes: int) -> float:
+    """
+    Folds one finished request into the endpoint counters. Returns total ms.
+    """
+    total_ms = metrics.elapsed_ms()
+    seconds = total_ms / 1000.0
+    with _lock:
+        key = (endpoint, method, status)
+        _http[key] = _http.get(key, 0) + 1
+
+        _add(_endpoints, endpoint, "count", 1)
+        _add(_endpoints, endpoint, "seconds", seconds)
+        _add(_endpoints, endpoint, "db_queries", metrics.db_queries)
+        _add(_endpoints, endpoint, "db_seconds", metrics.db_ms / 1000.0)
+        _add(_endpoints, endpoint, "llm_calls", metrics.llm_calls)
+        _add(_endpoints, endpoint, "llm_seconds", metrics.llm_ms / 1000.0)
+        _add(_endpoints, endpoint, "response_bytes", response_bytes)
+
+        buckets = _duration_buckets.setdefault(endpoint, [0] * len(DURATION_BUCKETS))
+        for i, upper in enumerate(DURATION_BUCKETS):
+            if seconds <= upper:
+                buckets[i] += 1
+
+        for name, ms in metrics.spans.items():
+            _spans[(endpoint, name)] = _spans.get((endpoint, name), 0.0) + ms / 1000.0
+    return total_ms
+
+
+def server_timing(metrics: RequestMetrics, total_ms: float) -> str:
+    parts = [
+        f"total;dur={total_ms:.1f}",
+        f'db;dur={metrics.db_ms:.1f};desc="{metrics.db_queries} queries"',
+    ]
+    if metrics.llm_calls:
+        parts.append(f'llm;dur={metrics.llm_ms:.1f};desc="{metrics.llm_calls} calls"')
+    if metrics.cache_hits or metrics.cache_misses:
+        parts.append(f'cache;desc="{metrics.cache_hits} hit / {metrics.cache_misses} miss"')
+    for name, ms in metrics.spans.items():
+        parts.append(f"{name};dur={ms:.1f}")
+    return ", ".join(parts)
+
+
+def reset_metrics() -> None:
+    with _lock:
+        for d in (_http, _endpoints, _duration_buckets, _spans, _llm, _cache):
+            d.clear()
+
+
+# -----------------------------
+# Prometheus text exposition
+# -----------------------------
+def _labels(**kv: object) -> str:
+    inner = ",".join(f'{k}="{str(v)}"' for k, v in kv.items())
+    return "{" + inner + "}"
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{labels} {value:g}")
+
+    with _lock:
+        metric(
+            "smartshop_http_requests_total", "counter", "HTTP requests by endpoint, method and status.",
+            [(_labels(endpoint=e, method=m, status=s), n) for (e, m, s), n in sorted(_http.items())],
+        )
+
+        hist: List[Tuple[str, float]] = []
+        for endpoint, buckets in sorted(_duration_buckets.items()):
+            for upper, n in zip(DURATION_BUCKETS, buckets):
+                hist.append((_labels(endpoint=endpoint, le=upper), n))
+            hist.append((_labels(endpoint=endpoint, le="+Inf"), _endpoints[endpoint]["count"]))
+        lines.append("# HELP smartshop_http_request_duration_seconds Request wall time.")
+        lines.append("# TYPE smartshop_http_request_duration_seconds histogram")
+        for labels, value in hist:
+            lines.append(f"smartshop_http_request_duration_seconds_bucket{labels} {value:g}")
+        for endpoint, vals in sorted(_endpoints.items()):
+            lines.append(f"smartshop_http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {vals['seconds']:g}")
+            lines.append(f"smartshop_http_request_duration_seconds_count{_labels(endpoint=endpoint)} {vals['count']:g}")
+
+        for field, name, help_text in (
+            ("db_queries", "smartshop_http_db_queries_total", "DB queries issued while serving requests."),
+            ("db_seconds", "smartshop_http_db_seconds_total", "Time spent in DB queries."),
+            ("llm_calls", "smartshop_http_llm_calls_total", "LLM calls made while serving requests."),
+            ("llm_seconds", "smartshop_http_llm_seconds_total", "Time spent in LLM calls."),
+            ("response_bytes", "smartshop_http_response_bytes_total", "Serialized response size."),
+        ):
+            metric(name, "counter", help_text, [
+                (_labels(endpoint=e), vals.get(field, 0)) for e, vals in sorted(_endpoints.items())
+            ])
+
+        metric(
+            "smartshop_span_seconds_total", "counter", "Time spent in named request sections.",
+            [(_labels(endpoint=e, span=s), v) for (e, s), v in sorted(_spans.items())],
+        )
+
+        metric(
+            "smartshop_llm_calls_total", "counter", "LLM calls by feature.",
+            [(_labels(feature=f), v["calls"]) for f, v in sorted(_llm.items())],
+        )
+        metric(
+            "smartshop_llm_seconds_total", "counter", "LLM call time by feature.",
+            [(_labels(feature=f), v["seconds"]) for f, v in sorted(_llm.items())],
+        )
+        metric(
+            "smartshop_llm_tokens_total", "counter", "LLM tokens by feature and direction.",
+            [(_labels(feature=f, direction="in"), v["tokens_in"]) for f, v in sorted(_llm.items())]
+            + [(_labels(feature=f, direction="out"), v["tokens_out"]) for f, v in sorted(_llm.items())],
+        )
+
+        metric(
+            "smartshop_cache_requests_total", "counter", "Cache lookups by cache and result.",
+            [(_labels(cache=c, result=r), n) for (c, r), n in sorted(_cache.items())],
+        )
+
+    return "\n".join(lines) + "\n"
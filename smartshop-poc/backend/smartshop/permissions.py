@@ -0,0 +1,19 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import IsAdminUser
+
+
+class IsAdminOrMetricsToken(IsAdminUser):
+    """
+    Diagnostics endpoints (metrics, queue, token spend, breaker / engine state):
+    staff users, or a scraper sending settings.METRICS_TOKEN as X-Metrics-Token.
+    No token configured means staff only.
+    """
+
+    def has_permission(self, request, view):
+        if super().has_permission(request, view):
+            return True
+        token = getattr(settings, "METRICS_TOKEN", "") or ""
+        sent = request.headers.get("X-Metrics-Token", "")
+        return bool(token) and hmac.compare_digest(sent.encode(), token.encode())
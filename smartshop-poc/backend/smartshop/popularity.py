@@ -0,0 +1,243 @@
+"""
+Materialized popularity tables for cold-start and fallback recommendations.
+
+- ProductDailySales: orders / units per (product, day), fed only by the
+  outbox "popularity" consumer (apply_order_events): created orders are
+  added and deleted ones subtracted, in O(changes). The outbox's gap
+  handling delivers late-committed orders too, so there is no separate id
+  watermark to skip them. rebuild_daily_sales() recomputes it from orders.
+- ProductPopularity: top-N products overall, per category and per price band,
+  for each sliding window in settings.POPULARITY_WINDOWS (0 = all time).
+  refresh_rankings() rebuilds it from the daily table, never from orders.
+
+Readers (popular_product_ids) do one indexed range read on
+(scope, scope_value, window_days, rank) instead of scanning the catalog.
+Run `manage.py refresh_popularity` periodically (cron) to keep them fresh.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Container, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    ChangeEvent,
+    ProductDailySales,
+    ProductPopularity,
+    SmartShopPurchaseOrder,
+)
+
+DEFAULT_WINDOW_DAYS = 30
+
+
+def windows() -> List[int]:
+    return [int(w) for w in getattr(settings, "POPULARITY_WINDOWS", [7, 30, 365, 0])]
+
+
+def top_n() -> int:
+    return int(getattr(settings, "POPULARITY_TOP_N", 50))
+
+
+def price_band(price: Any) -> str:
+    """
+    Label of the settings.POPULARITY_PRICE_BANDS band containing price.
+    """
+    bands = getattr(settings, "POPULARITY_PRICE_BANDS", None) or [("all", 0)]
+    value = Decimal(str(price or 0))
+    label = bands[0][0]
+    for name, lower in bands:
+        if value >= Decimal(str(lower)):
+            label = name
+    return label
+
+
+# -----------------------------
+# Refresh
+# -----------------------------
+def apply_order_events(events: Sequence[Any]) -> int:
+    """
+    Folds purchase ChangeEvents into ProductDailySales: created orders are
+    added, deleted ones taken back out, by payload quantity / purchase_date.
+    Only the outbox popularity consumer calls this, so each order is counted
+    once, late-committed ones included. Returns rows touched.
+    """
+    deltas: Dict[tuple, List[int]] = defaultdict(lambda: [0, 0])
+    for e in events:
+        bought = parse_datetime((e.payload or {}).get("purchase_date") or "")
+        if e.product_id is None or bought is None:
+            continue
+        sign = -1 if e.action == ChangeEvent.ACTION_DELETED else 1
+        d = deltas[(e.product_id, timezone.localdate(bought))]
+        d[0] += sign
+        d[1] += sign * int((e.payload or {}).get("quantity") or 0)
+    deltas = {k: d for k, d in deltas.items() if d != [0, 0]}
+    if not deltas:
+        return 0
+
+    with transaction.atomic():
+        existing = {
+            (row.product_id, row.day): row
+            for row in ProductDailySales.objects.select_for_update().filter(
+                product_id__in={pid for pid, _day in deltas},
+                day__in={day for _pid, day in deltas},
+            )
+        }
+        to_update: List[ProductDailySales] = []
+        to_create: List[ProductDailySales] = []
+        for (pid, day), (orders, units) in deltas.items():
+            row = existing.get((pid, day))
+            if row is None:
+                if orders > 0:
+                    to_create.append(ProductDailySales(product_id=pid, day=day, orders=orders, units=max(0, units)))
+                continue
+            row.orders = max(0, row.orders + orders)
+            row.units = max(0, row.units + units)
+            to_update.append(row)
+        ProductDailySales.objects.bulk_create(to_create, batch_size=1000)
+        ProductDailySales.objects.bulk_update(to_update, ["orders", "units"], batch_size=1000)
+    return len(to_create) + len(to_update)
+
+
+def rebuild_daily_sales() -> int:
+    """
+    Recomputes ProductDailySales from every order (repair / first load).
+    The popularity consumer is drained first and its cursor stays locked
+    until commit, so the orders counted here are the ones it has been handed;
+    a late commit still in a cursor gap is not visible yet and reaches the
+    table through the consumer later. Returns the number of orders counted.
+    """
+    from .outbox import consume
+
+    with transaction.atomic():
+        consume("popularity")
+        ProductDailySales.objects.all().delete()
+        rows = (
+            SmartShopPurchaseOrder.objects
+            .annotate(day=TruncDate("purchase_date"))
+            .values("product_id", "day")
+            .annotate(orders=Count("id"), units=Sum("quantity"))
+        )
+        created = [
+            ProductDailySales(product_id=r["product_id"], day=r["day"], orders=r["orders"], units=r["units"] or 0)
+            for r in rows
+        ]
+        ProductDailySales.objects.bulk_create(created, batch_size=1000)
+    return sum(row.orders for row in created)
+
+
+def _window_totals(window_days: int, today: date) -> List[Dict[str, Any]]:
+    qs = ProductDailySales.objects.all()
+    if window_days:
+        qs = qs.filter(day__gt=today - timedelta(days=window_days))
+    rows = list(
+        qs.values("product_id", "product__category", "product__price")
+        .annotate(units=Sum("units"), orders=Sum("orders"))
+    )
+    rows.sort(key=lambda r: (-int(r["units"] or 0), -int(r["orders"] or 0), r["product_id"]))
+    return rows
+
+
+def refresh_rankings(
+    *,
+    window_list: Optional[Sequence[int]] = None,
+    limit: Optional[int] = None,
+    today: Optional[date] = None,
+) -> int:
+    """
+    Rebuilds ProductPopularity for each window from ProductDailySales.
+    Returns the number of ranking rows written.
+    """
+    window_list = windows() if window_list is None else list(window_list)
+    limit = top_n() if limit is None else int(limit)
+    today = today or timezone.localdate()
+    now = timezone.now()
+    written = 0
+
+    for window_days in window_list:
+        groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+        for r in _window_totals(window_days, today):
+            keys = (
+                (ProductPopularity.SCOPE_OVERALL, ""),
+                (ProductPopularity.SCOPE_CATEGORY, r["product__category"] or ""),
+                (ProductPopularity.SCOPE_PRICE_BAND, price_band(r["product__price"])),
+            )
+            for key in keys:
+                if len(groups[key]) < limit:
+                    groups[key].append(r)
+
+        rows = [
+            ProductPopularity(
+                scope=scope,
+                scope_value=value,
+                window_days=window_days,
+                rank=rank,
+                product_id=r["product_id"],
+                units=int(r["units"] or 0),
+                orders=int(r["orders"] or 0),
+                refreshed_at=now,
+            )
+            for (scope, value), ranked in groups.items()
+            for rank, r in enumerate(ranked, start=1)
+        ]
+        with transaction.atomic():
+            ProductPopularity.objects.filter(window_days=window_days).delete()
+            ProductPopularity.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+
+    return written
+
+
+def refresh_popularity(*, rebuild: bool = False) -> Dict[str, int]:
+    """
+    Catches daily sales up (outbox consumer, or a full rebuild) and rebuilds
+    the rankings from them.
+    """
+    if rebuild:
+        orders = rebuild_daily_sales()
+    else:
+        from .outbox import consume
+
+        orders = consume("popularity")
+    return {"orders": orders, "ranking_rows": refresh_rankings()}
+
+
+# -----------------------------
+# Reads
+# -----------------------------
+def popular_product_ids(
+    *,
+    scope: str = ProductPopularity.SCOPE_OVERALL,
+    value: str = "",
+    window_days: int = DEFAULT_WINDOW_DAYS,
+    exclude_ids: Container[int] = (),
+    limit: int = 4,
+) -> List[int]:
+    """
+    Top product ids for a scope, most popular first. If the window has fewer
+    than limit products, the all-time ranking fills the rest.
+    exclude_ids is checked in memory (e.g. a PurchasedSet): a scope holds at
+    most POPULARITY_TOP_N rows, so no NOT IN clause is needed.
+    """
+    picked: List[int] = []
+    for window in dict.fromkeys([window_days, 0]):
+        if len(picked) >= limit:
+            break
+        ranked = (
+            ProductPopularity.objects
+            .filter(scope=scope, scope_value=value, window_days=window)
+            .order_by("rank")
+            .values_list("product_id", flat=True)
+        )
+        for pid in ranked:
+            if pid in exclude_ids or pid in picked:
+                continue
+            picked.append(pid)
+            if len(picked) >= limit:
+                break
+    return picked
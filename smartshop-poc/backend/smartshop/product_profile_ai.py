@@ -1,9 +1,18 @@
 import hashlib
 import json
-import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-from google import genai
+from django.conf import settings
+from django.utils import timezone
+
+from .llm import generate_text
+from .models import ProductAIProfile, ProductReview, SmartShopProduct
+from .structured_output import parse_structured, response_schema
+
+PROFILE_FIELDS = [
+    "source_signature", "short_description", "use_cases", "features", "keywords",
+    "audience", "pros", "cons", "review_summary", "updated_at",
+]
 
 def _sig(name: str, category: str, price: float, reviews: List[Dict[str, Any]]) -> str:
     raw = json.dumps(
@@ -12,18 +21,6 @@ def _sig(name: str, category: str, price: float, reviews: List[Dict[str, Any]])
     )
     return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-def _extract_json(text: str) -> Optional[Dict[str, Any]]:
-    if not text:
-        return None
-    cleaned = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).replace("```", "").strip()
-    m = re.search(r"\{.*\}", cleaned, flags=re.DOTALL)
-    if not m:
-        return None
-    try:
-        return json.loads(m.group(0))
-    except json.JSONDecodeError:
-        return None
-
 def generate_product_profile(
     *,
     api_key: str,
@@ -81,10 +78,187 @@ Schema:
 }}
 """.strip()
 
-    client = genai.Client(api_key=api_key)
-    resp = client.models.generate_content(model=model_name, contents=prompt)
-    data = _extract_json((resp.text or "").strip()) or {}
+    text = generate_text(
+        api_key=api_key,
+        model_name=model_name,
+        prompt=prompt,
+        feature="profile",
+        response_schema=response_schema("profile"),
+    )
+    data = parse_structured(text, "profile") or {}
     return data
 
+PROFILE_LIST_FIELDS = ["use_cases", "features", "keywords", "audience", "pros", "cons"]
+
+
+def valid_profile(data: Any) -> bool:
+    """
+    Minimal shape check for a parsed profile.
+    """
+    if not isinstance(data, dict):
+        return False
+    if not str(data.get("short_description", "")).strip():
+        return False
+    for k in PROFILE_LIST_FIELDS:
+        if k in data and not isinstance(data[k], list):
+            return False
+    return True
+
+
+def generate_product_profiles_batch(
+    *,
+    api_key: str,
+    model_name: str,
+    items: List[Dict[str, Any]],
+    throttle: Optional[Callable[[], Any]] = None,
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Packs several products into one prompt and parses back one profile per id.
+
+    items: [{"product": {"id", "name", "category", "price"}, "reviews": [...]}, ...]
+
+    Returns {product_id: profile_dict}. Items missing from the batch response or
+    failing validation are retried with generate_product_profile (one call each);
+    items that still fail are left out. throttle (optional) is called before
+    every Gemini request, e.g. a rate limiter.
+    """
+    if not api_key or not items:
+        return {}
+
+    by_id = {int(it["product"]["id"]): it for it in items}
+
+    batch_payload = [
+        {"id": pid, "product": it["product"], "reviews": (it.get("reviews") or [])[:8]}
+        for pid, it in by_id.items()
+    ]
+
+    prompt = f"""
+You are generating product profiles for an e-commerce catalog search system.
+
+PRODUCTS (each with short buyer reviews):
+{json.dumps(batch_payload, ensure_ascii=False)}
+
+Task:
+Create one concise structured profile PER PRODUCT to improve search + recommendations.
+
+Rules:
+- Return exactly one profile for every product id above; use the same id.
+- DO NOT invent features not implied by name/category or that product's reviews.
+- Never mix information between products.
+- Use short phrases, not long paragraphs.
+- Output MUST be valid JSON ONLY.
+
+Schema:
+{{
+  "profiles": [
+    {{
+      "id": <int>,
+      "short_description": "<1-2 sentences>",
+      "use_cases": ["<use case>", "..."],
+      "features": ["<feature>", "..."],
+      "keywords": ["<keyword>", "..."],
+      "audience": ["<audience fit>", "..."],
+      "pros": ["<review-derived pro>", "..."],
+      "cons": ["<review-derived con>", "..."],
+      "review_summary": "<1 sentence summary of overall sentiment>"
+    }}
+  ]
+}}
+""".strip()
+
+    out: Dict[int, Dict[str, Any]] = {}
+    try:
+        if throttle:
+            throttle()
+        text = generate_text(
+            api_key=api_key,
+            model_name=model_name,
+            prompt=prompt,
+            feature="profile",
+            response_schema=response_schema("profile_batch"),
+        )
+        data = parse_structured(text, "profile_batch") or {}
+        profiles = data.get("profiles") if isinstance(data.get("profiles"), list) else []
+    except Exception:
+        profiles = []
+
+    for prof in profiles:
+        if not isinstance(prof, dict):
+            continue
+        try:
+            pid = int(prof.get("id"))
+        except (TypeError, ValueError):
+            continue
+        if pid in by_id and pid not in out and valid_profile(prof):
+            out[pid] = {k: v for k, v in prof.items() if k != "id"}
+
+    # Fallback: single-product calls for anything the batch did not cover
+    for pid, it in by_id.items():
+        if pid in out:
+            continue
+        try:
+            if throttle:
+                throttle()
+            single = generate_product_profile(
+                api_key=api_key,
+                model_name=model_name,
+                product=it["product"],
+                reviews=it.get("reviews") or [],
+            )
+        except Exception:
+            continue
+        if valid_profile(single):
+            out[pid] = single
+
+    return out
+
+
 def compute_signature_for_profile(product: Dict[str, Any], reviews: List[Dict[str, Any]]) -> str:
     return _sig(product.get("name",""), product.get("category",""), float(product.get("price",0)), reviews)
+
+
+def apply_profile(prof, sig, data):
+    prof.source_signature = sig
+    prof.short_description = str(data.get("short_description", "")).strip()
+    prof.use_cases = data.get("use_cases", []) or []
+    prof.features = data.get("features", []) or []
+    prof.keywords = data.get("keywords", []) or []
+    prof.audience = data.get("audience", []) or []
+    prof.pros = data.get("pros", []) or []
+    prof.cons = data.get("cons", []) or []
+    prof.review_summary = str(data.get("review_summary", "")).strip()
+    prof.updated_at = timezone.now()
+    return prof
+
+
+def refresh_product_profile(product_id: int, *, force: bool = False) -> bool:
+    """
+    Regenerates one product's AI profile if its signature (product fields +
+    latest 8 reviews) changed. Returns True if the profile was written.
+    Raises if Gemini returns nothing usable, so queued tasks are retried.
+    """
+    product = SmartShopProduct.objects.filter(id=product_id).first()
+    if product is None:
+        return False
+    reviews = list(
+        ProductReview.objects.filter(product_id=product_id)
+        .order_by("-created_at")
+        .values("rating", "title", "body")[:8]
+    )
+    payload = {"id": product.id, "name": product.name, "category": product.category, "price": float(product.price)}
+    sig = compute_signature_for_profile(payload, reviews)
+
+    prof = ProductAIProfile.objects.filter(product_id=product_id).first()
+    if prof and prof.source_signature == sig and not force:
+        return False
+
+    data = generate_product_profile(
+        api_key=getattr(settings, "GEMINI_API_KEY", None),
+        model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
+        product=payload,
+        reviews=reviews,
+    )
+    if not valid_profile(data):
+        raise ValueError(f"No usable profile generated for product {product_id}")
+    apply_profile(prof or ProductAIProfile(product_id=product_id), sig, data).save()
+    return True
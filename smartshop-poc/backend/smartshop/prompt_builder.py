@@ -0,0 +1,157 @@
+"""
+Shared prompt encoding for product lists sent to Gemini.
+
+Instead of one JSON object per product (keys repeated on every row), lists
+are encoded as a compact table:
+
+    CATEGORIES: C1=Electronics; C2=Office
+    id|name|cat|price
+    12|Gaming Mouse|C1|24.5
+    31|Desk Lamp|C2|19.9
+
+- a header row names the columns once,
+- repeated categories are replaced by short codes from a legend,
+- long text columns are truncated, and the whole table is kept under a
+  token budget (text is shortened first, then trailing rows are dropped).
+
+settings.LLM_COMPACT_PROMPTS = False switches every caller back to JSON.
+"""
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from django.conf import settings
+
+from .llm import estimate_tokens
+from .llm_accounting import prompt_token_budget
+
+TABLE_FORMAT_NOTE = (
+    "Tables are pipe-delimited with a header row; category codes (C1, C2, ...) are defined "
+    "in the CATEGORIES line. Always use the numeric id column when referring to products."
+)
+
+# column -> header label
+COLUMN_LABELS = {
+    "category": "cat",
+    "ai_short_description": "desc",
+    "ai_review_summary": "reviews",
+}
+
+
+def compact_enabled() -> bool:
+    return bool(getattr(settings, "LLM_COMPACT_PROMPTS", True))
+
+
+def _cell(value: Any, max_chars: Optional[int] = None) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        text = f"{value:.2f}".rstrip("0").rstrip(".")
+    else:
+        text = str(value)
+    text = " ".join(text.replace("|", "/").split())
+    if max_chars is not None and len(text) > max_chars:
+        text = text[: max(0, max_chars - 1)].rstrip() + "…"
+    return text
+
+
+def _render(
+    rows: Sequence[Dict[str, Any]],
+    columns: Sequence[str],
+    codes: Dict[str, str],
+    dict_columns: Sequence[str],
+    max_chars: Dict[str, int],
+) -> str:
+    lines: List[str] = []
+    if codes:
+        lines.append("CATEGORIES: " + "; ".join(f"{code}={value}" for value, code in codes.items()))
+    lines.append("|".join(COLUMN_LABELS.get(c, c) for c in columns))
+    for row in rows:
+        cells = []
+        for c in columns:
+            value = row.get(c)
+            if c in dict_columns and value is not None:
+                cells.append(codes.get(str(value), _cell(value)))
+            else:
+                cells.append(_cell(value, max_chars.get(c)))
+        lines.append("|".join(cells))
+    return "\n".join(lines)
+
+
+def encode_table(
+    rows: Iterable[Dict[str, Any]],
+    columns: Sequence[str],
+    *,
+    dict_columns: Sequence[str] = ("category",),
+    max_chars: Optional[Dict[str, int]] = None,
+    token_budget: Optional[int] = None,
+) -> str:
+    """
+    Encodes rows as a header + pipe-delimited table (see module docstring).
+    Values from dict_columns share one code legend.
+    """
+    rows = list(rows)
+    max_chars = dict(max_chars or {})
+
+    codes: Dict[str, str] = {}
+    for row in rows:
+        for c in dict_columns:
+            value = row.get(c)
+            if value is not None and str(value) not in codes:
+                codes[str(value)] = f"C{len(codes) + 1}"
+
+    text = _render(rows, columns, codes, dict_columns, max_chars)
+    if token_budget is None or estimate_tokens(text) <= token_budget:
+        return text
+
+    # 1) shorten text columns
+    while max_chars and any(v > 24 for v in max_chars.values()):
+        max_chars = {k: max(24, v // 2) for k, v in max_chars.items()}
+        text = _render(rows, columns, codes, dict_columns, max_chars)
+        if estimate_tokens(text) <= token_budget:
+            return text
+
+    # 2) drop trailing rows (callers pass rows in priority order)
+    lo, hi = 0, len(rows)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(_render(rows[:mid], columns, codes, dict_columns, max_chars)) <= token_budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    kept = rows[:lo]
+    used = {str(r.get(c)) for r in kept for c in dict_columns if r.get(c) is not None}
+    codes = {v: code for v, code in codes.items() if v in used}
+    return _render(kept, columns, codes, dict_columns, max_chars)
+
+
+def encode_products(
+    rows: Iterable[Dict[str, Any]],
+    columns: Sequence[str] = ("id", "name", "category", "price"),
+    *,
+    max_chars: Optional[Dict[str, int]] = None,
+    token_budget: Optional[int] = None,
+) -> str:
+    """
+    Product list for a prompt: compact table, or JSON when compact prompts are off.
+    """
+    if not compact_enabled():
+        return json.dumps([{c: r.get(c) for c in columns} for r in rows], ensure_ascii=False)
+    return encode_table(rows, columns, max_chars=max_chars, token_budget=token_budget)
+
+
+def table_budget(feature: str, fixed_text: str = "", reserve: int = 0) -> Optional[int]:
+    """
+    Tokens left for a table once the rest of the prompt (fixed_text) and a
+    reserve are taken out of the feature's prompt budget. None = no budget.
+    """
+    budget = prompt_token_budget(feature)
+    if not budget:
+        return None
+    return max(100, budget - estimate_tokens(fixed_text) - int(reserve))
+
+
+def format_note() -> str:
+    """
+    One-line explanation of the table format for the prompt ("" for JSON).
+    """
+    return TABLE_FORMAT_NOTE if compact_enabled() else ""
@@ -0,0 +1,132 @@
+"""
+Per-user purchased-product sets as compressed bitmaps.
+
+Bit n is set when the user has bought product id n. The bitmap is a Python
+int (bit ops are C-speed), stored in the Django cache as zlib-compressed
+bytes, so long runs of unbought ids cost almost nothing. Callers use it for
+exclusion ("not already bought") in memory instead of NOT IN (...) queries
+that grow with purchase history; a request looks the set up once and passes
+it down (reco_service, also_bought). A lone "has the user bought X" check
+(has_purchased without a set) stays a single indexed exists().
+
+Maintenance: the cache key carries the user's purchase state
+("<orders>:<last order id>", one aggregate on the user index), which changes
+on every new or deleted order. Nothing has to be invalidated, so a worker with
+its own local cache can never serve a bitmap from before another worker's
+write; entries for old states just expire after PURCHASED_BITMAP_TTL. A miss
+rebuilds the set with one indexed query on (user, product).
+"""
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import SmartShopPurchaseOrder
+
+
+class PurchasedSet:
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+
+    @classmethod
+    def from_ids(cls, product_ids: Iterable[int]) -> "PurchasedSet":
+        bits = 0
+        for pid in product_ids:
+            bits |= 1 << int(pid)
+        return cls(bits)
+
+    def add(self, product_id: int) -> None:
+        self.bits |= 1 << int(product_id)
+
+    def __contains__(self, product_id: object) -> bool:
+        try:
+            pid = int(product_id)  # type: ignore[arg-type]
+        except (TypeError, ValueError):
+            return False
+        return pid >= 0 and bool(self.bits >> pid & 1)
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __iter__(self) -> Iterator[int]:
+        """
+        Product ids in ascending order.
+        """
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __or__(self, other: "PurchasedSet") -> "PurchasedSet":
+        return PurchasedSet(self.bits | other.bits)
+
+    def without(self, product_ids: Iterable[int]) -> List[int]:
+        """
+        product_ids that are not in the set, order kept.
+        """
+        return [pid for pid in product_ids if pid not in self]
+
+    def to_bytes(self) -> bytes:
+        raw = self.bits.to_bytes((self.bits.bit_length() + 7) // 8, "little")
+        return zlib.compress(raw)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "PurchasedSet":
+        return cls(int.from_bytes(zlib.decompress(data), "little"))
+
+
+def purchase_state(user_or_id) -> str:
+    """
+    "<orders>:<last order id>": changes on every purchase or deleted order.
+    """
+    user_id = getattr(user_or_id, "pk", user_or_id)
+    agg = SmartShopPurchaseOrder.objects.filter(user_id=user_id).aggregate(n=Count("id"), last=Max("id"))
+    return f"{agg['n']}:{agg['last'] or 0}"
+
+
+def _key(user_id: int, state: str) -> str:
+    return f"smartshop_purchased_bits_{user_id}_{state}"
+
+
+def purchased_set(user_or_id, *, refresh: bool = False, state: Optional[str] = None) -> PurchasedSet:
+    """
+    state: the caller's purchase_state() for this user, to skip the aggregate.
+    """
+    user_id = getattr(user_or_id, "pk", user_or_id)
+    if user_id is None:
+        return PurchasedSet()
+    key = _key(user_id, state if state is not None else purchase_state(user_id))
+    if not refresh:
+        data = cache.get(key)
+        if data is not None:
+            return PurchasedSet.from_bytes(data)
+
+    s = PurchasedSet.from_ids(
+        SmartShopPurchaseOrder.objects
+        .filter(user_id=user_id)
+        .values_list("product_id", flat=True)
+        .distinct()
+    )
+    cache.set(key, s.to_bytes(), timeout=int(getattr(settings, "PURCHASED_BITMAP_TTL", 3600)))
+    return s
+
+
+def has_purchased(user_or_id, product_id: int, *, purchased: Optional[PurchasedSet] = None) -> bool:
+    """
+    In memory against purchased when given; a single check otherwise is one
+    exists() on the (user, product) index, cheaper than a bitmap lookup.
+    """
+    if purchased is not None:
+        return int(product_id) in purchased
+    user_id = getattr(user_or_id, "pk", user_or_id)
+    if user_id is None:
+        return False
+    return SmartShopPurchaseOrder.objects.filter(user_id=user_id, product_id=product_id).exists()
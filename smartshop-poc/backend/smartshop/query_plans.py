@@ -0,0 +1,79 @@
+"""
+EXPLAIN checks for the hot purchase-history queries.
+
+Each entry in HOT_QUERIES builds the same queryset the app runs and lists the
+indexes (SmartShopPurchaseOrder.Meta.indexes) the plan is expected to use.
+check_query_plans() runs QuerySet.explain() and looks for one of those index
+names in the plan text; SQLite ("USING [COVERING] INDEX name"), MySQL (key
+column) and PostgreSQL ("Index Scan using name") all print it.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.db import connection
+from django.db.models import Count, QuerySet
+
+from .models import SmartShopPurchaseOrder
+
+
+def _purchase_history(user_id: int, product_id: int) -> QuerySet:
+    # reco_service / ai_insights / gemini_assistant: user's orders, newest first
+    return SmartShopPurchaseOrder.objects.filter(user_id=user_id).order_by("-purchase_date")
+
+
+def _user_purchased_product(user_id: int, product_id: int) -> QuerySet:
+    # views._user_purchased_product (review permission)
+    return SmartShopPurchaseOrder.objects.filter(user_id=user_id, product_id=product_id).values("id")[:1]
+
+
+def _also_bought_buyers(user_id: int, product_id: int) -> QuerySet:
+    # also_bought: other buyers of the user's products
+    return (
+        SmartShopPurchaseOrder.objects
+        .filter(product_id__in=[product_id])
+        .exclude(user_id=user_id)
+        .values_list("user_id", flat=True)
+        .distinct()
+    )
+
+
+def _also_bought_counts(user_id: int, product_id: int) -> QuerySet:
+    # also_bought: what those buyers bought, grouped by product
+    return (
+        SmartShopPurchaseOrder.objects
+        .filter(user_id__in=[user_id])
+        .exclude(product_id__in=[product_id])
+        .values("product_id")
+        .annotate(count=Count("product_id"))
+        .order_by("-count")
+    )
+
+
+# name -> (queryset builder(user_id, product_id), acceptable index names)
+HOT_QUERIES: Dict[str, Tuple[Callable[[int, int], QuerySet], Tuple[str, ...]]] = {
+    "purchase_history": (_purchase_history, ("smartshop_po_user_date",)),
+    "user_purchased_product": (
+        _user_purchased_product,
+        ("smartshop_po_user_product", "smartshop_po_product_user"),
+    ),
+    "also_bought_buyers": (_also_bought_buyers, ("smartshop_po_product_user",)),
+    "also_bought_counts": (_also_bought_counts, ("smartshop_po_user_product", "smartshop_po_user_date")),
+}
+
+
+def check_query_plans(*, user_id: int, product_id: int) -> List[Dict[str, Any]]:
+    """
+    Returns [{name, expected, used, ok, plan}, ...] for every hot query.
+    """
+    results = []
+    for name, (build, expected) in HOT_QUERIES.items():
+        plan = build(user_id, product_id).explain()
+        used = [idx for idx in expected if idx in plan]
+        results.append({
+            "name": name,
+            "vendor": connection.vendor,
+            "expected": list(expected),
+            "used": used,
+            "ok": bool(used),
+            "plan": plan,
+        })
+    return results
@@ -0,0 +1,74 @@
+import random
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple, Type
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+    rate = tokens added per second, capacity = max burst.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = max(0.001, float(rate))
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: Optional[float] = None) -> "TokenBucket":
+        return cls(rate=float(requests_per_minute) / 60.0, capacity=burst)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        with self._lock:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """
+        Blocks until tokens are available. Returns seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                sleep_for = (tokens - self._tokens) / self.rate
+            time.sleep(sleep_for)
+            waited += sleep_for
+
+
+def retry_with_backoff(
+    fn: Callable[[], Any],
+    *,
+    retries: int = 3,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,),
+) -> Tuple[Any, int]:
+    """
+    Calls fn() with exponential backoff + jitter.
+    Returns (result, attempts_used). Re-raises the last error when out of retries.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn(), attempt
+        except retry_on:
+            if attempt > retries:
+                raise
+            delay = min(max_delay, base_delay * (2 ** (attempt - 1)))
+            time.sleep(delay * (0.5 + random.random() / 2))
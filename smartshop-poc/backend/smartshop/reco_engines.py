@@ -0,0 +1,258 @@
+"""
+Pluggable recommendation engines, with shadow-mode comparison.
+
+An engine is a function registered with @register_engine(name):
+
+    engine(user, *, purchased: PurchasedSet, max_items: int) -> [{"id": int, "reason": str}, ...]
+
+It returns [] when it has nothing to offer (no model, circuit open, ...).
+reco_service registers "llm", "als" and "popularity" and tries them in
+settings.RECO_ENGINES order (first non-empty result wins); a request can pick
+an engine explicitly (GET /api/ai/recommendations/?engine=als).
+
+Shadow mode: with settings.RECO_SHADOW_ENGINE set, a sample
+(RECO_SHADOW_SAMPLE_RATE) of requests also runs that engine on a small
+background pool, after the response is computed. Its latency and its overlap
+with what the primary engine served are recorded next to the primary's own
+latency (engine_report() / /api/ai/reco-engines/, and /api/metrics/), so
+traffic can be moved to a faster engine on evidence. Shadow runs never touch
+the response or the recommendation cache; when the pool is busy they are
+dropped rather than queued.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connections
+
+from .utils import percentile
+
+Engine = Callable[..., List[Dict[str, Any]]]
+
+_engines: Dict[str, Engine] = {}
+
+
+def register_engine(name: str) -> Callable[[Engine], Engine]:
+    def decorator(fn: Engine) -> Engine:
+        _engines[name] = fn
+        return fn
+    return decorator
+
+
+def engine_names() -> List[str]:
+    return list(_engines)
+
+
+def get_engine(name: str) -> Optional[Engine]:
+    return _engines.get(name)
+
+
+def default_chain() -> List[str]:
+    configured = getattr(settings, "RECO_ENGINES", None) or ["llm", "als", "popularity"]
+    return [name for name in configured if name in _engines]
+
+
+# -----------------------------
+# Stats
+# -----------------------------
+def _window() -> int:
+    return int(getattr(settings, "RECO_ENGINE_STATS_WINDOW", 500))
+
+
+class _Stats:
+    def __init__(self, window: int):
+        self.calls = 0
+        self.empty = 0
+        self.errors = 0
+        self.latency_ms: Deque[float] = deque(maxlen=max(1, window))
+        self.overlap: Deque[float] = deque(maxlen=max(1, window))
+
+
+_lock = threading.Lock()
+_primary: Dict[str, _Stats] = {}
+_shadow: Dict[Tuple[str, str], _Stats] = {}
+_shadow_dropped = 0
+
+
+def _record(table: Dict, key, latency_ms: float, *, empty: bool, error: bool, overlap: Optional[float] = None) -> None:
+    with _lock:
+        s = table.get(key)
+        if s is None:
+            s = table[key] = _Stats(_window())
+        s.calls += 1
+        s.empty += int(empty)
+        s.errors += int(error)
+        s.latency_ms.append(latency_ms)
+        if overlap is not None:
+            s.overlap.append(overlap)
+
+
+def overlap_ratio(primary: Sequence[int], shadow: Sequence[int]) -> float:
+    """
+    Share of the primary's products that the shadow engine also returned.
+    """
+    if not primary:
+        return 1.0 if not shadow else 0.0
+    return len(set(primary) & set(shadow)) / len(set(primary))
+
+
+def _summary(s: _Stats) -> Dict[str, Any]:
+    lat, ov = list(s.latency_ms), list(s.overlap)
+    out = {
+        "calls": s.calls,
+        "empty": s.empty,
+        "errors": s.errors,
+        "latency_ms_p50": round(percentile(lat, 50), 2),
+        "latency_ms_p95": round(percentile(lat, 95), 2),
+    }
+    if ov:
+        out["overlap_mean"] = round(sum(ov) / len(ov), 4)
+    return out
+
+
+def engine_report() -> Dict[str, Any]:
+    with _lock:
+        primary = {name: _summary(s) for name, s in sorted(_primary.items())}
+        shadow = [
+            {"primary": p, "shadow": sh, **_summary(s)}
+            for (p, sh), s in sorted(_shadow.items())
+        ]
+        dropped = _shadow_dropped
+    return {
+        "chain": default_chain(),
+        "shadow_engine": getattr(settings, "RECO_SHADOW_ENGINE", "") or None,
+        "engines": primary,
+        "shadow": shadow,
+        "shadow_dropped": dropped,
+    }
+
+
+def render_prometheus() -> str:
+    with _lock:
+        primary = [(name, s.calls, s.errors, sum(s.latency_ms), len(s.latency_ms)) for name, s in sorted(_primary.items())]
+        shadow = [(p, sh, s.calls, sum(s.latency_ms), len(s.latency_ms), list(s.overlap))
+                  for (p, sh), s in sorted(_shadow.items())]
+
+    lines = [
+        "# HELP smartshop_reco_engine_calls_total Recommendation engine runs on the request path.",
+        "# TYPE smartshop_reco_engine_calls_total counter",
+    ]
+    lines += [f'smartshop_reco_engine_calls_total{{engine="{n}"}} {c}' for n, c, _e, _s, _k in primary]
+    lines += [
+        "# HELP smartshop_reco_engine_errors_total Recommendation engine errors on the request path.",
+        "# TYPE smartshop_reco_engine_errors_total counter",
+    ]
+    lines += [f'smartshop_reco_engine_errors_total{{engine="{n}"}} {e}' for n, _c, e, _s, _k in primary]
+    lines += [
+        "# HELP smartshop_reco_engine_latency_ms_mean Mean engine latency over the rolling window.",
+        "# TYPE smartshop_reco_engine_latency_ms_mean gauge",
+    ]
+    lines += [f'smartshop_reco_engine_latency_ms_mean{{engine="{n}",mode="primary"}} {s / k:g}'
+              for n, _c, _e, s, k in primary if k]
+    lines += [f'smartshop_reco_engine_latency_ms_mean{{engine="{sh}",mode="shadow",primary="{p}"}} {s / k:g}'
+              for p, sh, _c, s, k, _o in shadow if k]
+    lines += [
+        "# HELP smartshop_reco_shadow_overlap_mean Mean overlap of shadow results with the primary's.",
+        "# TYPE smartshop_reco_shadow_overlap_mean gauge",
+    ]
+    lines += [f'smartshop_reco_shadow_overlap_mean{{engine="{sh}",primary="{p}"}} {sum(o) / len(o):g}'
+              for p, sh, _c, _s, _k, o in shadow if o]
+    return "\n".join(lines) + "\n"
+
+
+def reset_engine_stats() -> None:
+    global _shadow_dropped
+    with _lock:
+        _primary.clear()
+        _shadow.clear()
+        _shadow_dropped = 0
+
+
+# -----------------------------
+# Running engines
+# -----------------------------
+def _call(name: str, user, *, purchased, max_items: int) -> Tuple[List[Dict[str, Any]], float, bool]:
+    t0 = time.perf_counter()
+    try:
+        items = _engines[name](user, purchased=purchased, max_items=max_items) or []
+        error = False
+    except Exception:
+        items, error = [], True
+    return items, (time.perf_counter() - t0) * 1000, error
+
+
+def run_engines(chain: Sequence[str], user, *, purchased, max_items: int) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    Tries each engine in chain; returns (engine name, items) for the first
+    non-empty result, or (None, []).
+    """
+    for name in chain:
+        items, latency_ms, error = _call(name, user, purchased=purchased, max_items=max_items)
+        _record(_primary, name, latency_ms, empty=not items, error=error)
+        if items:
+            return name, items
+    return None, []
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_in_flight = 0
+
+
+def _submit(job: Callable[[], None]) -> bool:
+    """
+    Runs job on the shadow pool; False (dropped) when the pool is saturated.
+    """
+    global _executor, _in_flight, _shadow_dropped
+    workers = max(1, int(getattr(settings, "RECO_SHADOW_WORKERS", 2)))
+    with _lock:
+        if _in_flight >= workers * 2:
+            _shadow_dropped += 1
+            return False
+        _in_flight += 1
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reco-shadow")
+
+    def run() -> None:
+        global _in_flight
+        try:
+            job()
+        finally:
+            # Pool threads get their own DB connections; release them
+            connections.close_all()
+            with _lock:
+                _in_flight -= 1
+
+    _executor.submit(run)
+    return True
+
+
+def maybe_shadow(primary: Optional[str], served: Sequence[int], user, *, purchased, max_items: int) -> bool:
+    """
+    Schedules the configured shadow engine for this request (sampled).
+    Returns True if a shadow run was scheduled.
+    """
+    shadow = getattr(settings, "RECO_SHADOW_ENGINE", "") or ""
+    if not shadow or shadow == primary or shadow not in _engines:
+        return False
+    if random.random() >= float(getattr(settings, "RECO_SHADOW_SAMPLE_RATE", 1.0)):
+        return False
+    served = list(served)
+
+    def job() -> None:
+        items, latency_ms, error = _call(shadow, user, purchased=purchased, max_items=max_items)
+        ids = []
+        for it in items:
+            try:
+                ids.append(int(it["id"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+        _record(
+            _shadow, (primary or "none", shadow), latency_ms,
+            empty=not ids, error=error, overlap=overlap_ratio(served, ids),
+        )
+
+    return _submit(job)
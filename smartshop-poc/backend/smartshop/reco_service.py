@@ -1,44 +1,115 @@
-from typing import Dict, Any, List
+from collections import Counter
+from typing import Dict, Any, List, Optional
 from django.conf import settings
 from django.db.models import Count
 
-from .models import SmartShopProduct, SmartShopPurchaseOrder, UserRecommendationCache
+from .models import ProductPopularity, SmartShopProduct, SmartShopPurchaseOrder, UserRecommendationCache
 from .serializers import ProductSerializer
 from .utils import purchase_signature
 from .gemini_client import gemini_recommend_products_with_reasons
+from .llm import llm_available
+from . import perf
 from .also_bought import also_bought_for_user
+from .popularity import popular_product_ids, price_band
+from .catalog_snapshot import catalog_version, get_catalog_snapshot
+from .purchased_bitmap import PurchasedSet, purchase_state, purchased_set
+from .trending import trending_products
+from .als import current_als_model
+from .reco_engines import default_chain, engine_names, get_engine, maybe_shadow, register_engine, run_engines
 
+PROMPT_COLUMNS = ("id", "name", "category", "price")
 
-def _fallback_recommendations_for_user(user, max_items: int = 4) -> List[SmartShopProduct]:
+
+def _cheapest_unpurchased(exclude, limit: int, *, categories=None, skip_categories=None) -> List[int]:
     """
-    Simple non-AI fallback:
-    - If user has categories purchased, recommend similar categories first (cheaper first).
-    - Else recommend cheapest items not yet purchased.
+    Cheapest product ids not in exclude (streamed in price order, filtered in memory).
     """
-    purchased_ids = set(
-        SmartShopPurchaseOrder.objects.filter(user=user).values_list("product_id", flat=True)
-    )
-    purchased_categories = list(
-        SmartShopPurchaseOrder.objects.filter(user=user).values_list("product__category", flat=True)
-    )
+    qs = SmartShopProduct.objects.order_by("price", "id")
+    if categories:
+        qs = qs.filter(category__in=categories)
+    if skip_categories:
+        qs = qs.exclude(category__in=skip_categories)
+    out: List[int] = []
+    if limit <= 0:
+        return out
+    for pid in qs.values_list("id", flat=True).iterator(chunk_size=200):
+        if pid in exclude:
+            continue
+        out.append(pid)
+        if len(out) >= limit:
+            break
+    return out
 
-    qs = SmartShopProduct.objects.exclude(id__in=purchased_ids)
-    products = list(qs)
 
-    if purchased_categories:
-        products.sort(key=lambda p: (p.category not in purchased_categories, float(p.price)))
-        return products[:max_items]
+def _als_items_for_user(user, purchased: PurchasedSet, max_items: int) -> List[Dict[str, Any]]:
+    """
+    Top products from the offline ALS model (see als.py), purchases excluded.
+    [] when no model is published or the user was not in its training data.
+    """
+    model = current_als_model()
+    if model is None:
+        return []
+    return [
+        {"id": pid, "reason": "Popular with shoppers whose purchases look like yours."}
+        for pid, _score in model.recommend(user.id, max_items, exclude=purchased)
+    ]
+
+
+def _fallback_recommendations_for_user(
+    user, max_items: int = 4, *, purchased: Optional[PurchasedSet] = None,
+) -> List[SmartShopProduct]:
+    """
+    Simple non-AI fallback, read from the popularity tables (see popularity.py):
+    - best sellers in the categories the user buys most, then in the user's
+      usual price band, then overall;
+    - cold start (no purchases): overall best sellers.
+    If the tables are empty or too small, cheapest unpurchased products fill
+    the rest (same-category first).
+    Purchased products are excluded with the user's purchased bitmap
+    (purchased: the caller's, to avoid looking it up again).
+    """
+    if purchased is None:
+        purchased = purchased_set(user)
+    snap = get_catalog_snapshot()
+    rows = [i for i in (snap.row(pid) for pid in purchased) if i is not None]
+    categories = [c for c, _n in Counter(snap.category_at(i) for i in rows if snap.category_at(i)).most_common()]
+    bands = [b for b, _n in Counter(price_band(snap.price_at(i)) for i in rows).most_common()]
+
+    scopes = [(ProductPopularity.SCOPE_CATEGORY, c) for c in categories]
+    scopes += [(ProductPopularity.SCOPE_PRICE_BAND, b) for b in bands]
+    scopes.append((ProductPopularity.SCOPE_OVERALL, ""))
+
+    picked: List[int] = []
+    for scope, value in scopes:
+        if len(picked) >= max_items:
+            break
+        picked += popular_product_ids(
+            scope=scope,
+            value=value,
+            exclude_ids=purchased | PurchasedSet.from_ids(picked),
+            limit=max_items - len(picked),
+        )
+
+    if len(picked) < max_items:
+        exclude = purchased | PurchasedSet.from_ids(picked)
+        if categories:
+            picked += _cheapest_unpurchased(exclude, max_items - len(picked), categories=categories)
+            exclude = purchased | PurchasedSet.from_ids(picked)
+        picked += _cheapest_unpurchased(exclude, max_items - len(picked), skip_categories=categories)
 
-    return list(qs.order_by("price")[:max_items])
+    by_id = SmartShopProduct.objects.in_bulk(picked)
+    return [by_id[pid] for pid in picked if pid in by_id]
 
 
-def _attach_social_proof(user, recommended_products: List[Dict[str, Any]], top_n: int = 4):
+def _attach_social_proof(
+    user, recommended_products: List[Dict[str, Any]], top_n: int = 4, *, purchased: Optional[PurchasedSet] = None,
+):
     """
     Adds:
       - also_bought_count per recommended product
       - also_bought list for the response payload
     """
-    also = also_bought_for_user(user, top_n=top_n)
+    also = also_bought_for_user(user, top_n=top_n, purchased=purchased)
     also_counts = {int(x["product_id"]): int(x["count"]) for x in also}
 
     for p in recommended_products:
@@ -48,38 +119,53 @@ def _attach_social_proof(user, recommended_products: List[Dict[str, Any]], top_n
     return also
 
 
-def _social_proof_context(user, top_n: int = 6) -> Dict[str, Any]:
+def _social_proof_context(user, top_n: int = 6, *, purchased: Optional[PurchasedSet] = None) -> Dict[str, Any]:
     """
     Returns small 'social proof' context for Gemini prompt:
     - also_bought list with names/categories
     - top categories among similar shoppers
+    - products trending right now (sliding-window heavy hitters, no order scan)
     """
-    # 1) Also-bought product ids + counts
-    also = also_bought_for_user(user, top_n=top_n)
-    also_ids = [int(x["product_id"]) for x in also]
+    if purchased is None:
+        purchased = purchased_set(user)
 
-    products = SmartShopProduct.objects.filter(id__in=also_ids)
-    by_id = {p.id: p for p in products}
+    # 1) Also-bought product ids + counts
+    also = also_bought_for_user(user, top_n=top_n, purchased=purchased)
+    snap = get_catalog_snapshot()
 
     also_named = []
     for row in also:
         pid = int(row["product_id"])
-        p = by_id.get(pid)
-        if not p:
+        i = snap.row(pid)
+        if i is None:
             continue
         also_named.append({
             "id": pid,
-            "name": p.name,
-            "category": p.category,
+            "name": snap.names[i],
+            "category": snap.category_at(i),
             "count": int(row["count"]),
         })
 
+    trending_now = []
+    for row in trending_products(limit=top_n):
+        i = snap.row(row["product_id"])
+        if i is None:
+            continue
+        trending_now.append({
+            "id": row["product_id"],
+            "name": snap.names[i],
+            "category": snap.category_at(i),
+            "units": row["units"],
+        })
+
     # 2) Find similar shoppers and their top categories (lightweight)
-    user_product_ids = list(
-        SmartShopPurchaseOrder.objects.filter(user=user).values_list("product_id", flat=True)
-    )
+    user_product_ids = list(purchased)
     if not user_product_ids:
-        return {"also_bought_named": also_named, "top_categories_among_similar": []}
+        return {
+            "also_bought_named": also_named,
+            "top_categories_among_similar": [],
+            "trending_now": trending_now,
+        }
 
     similar_user_ids = (
         SmartShopPurchaseOrder.objects
@@ -106,153 +192,92 @@ def _social_proof_context(user, top_n: int = 6) -> Dict[str, Any]:
     return {
         "also_bought_named": also_named,
         "top_categories_among_similar": top_categories,
+        "trending_now": trending_now,
     }
 
 
-def get_recommendations_for_user(user, max_items: int = 4, force: bool = False) -> Dict[str, Any]:
+def _gemini_items_for_user(
+    user, purchased_qs, max_items: int, *, purchased: Optional[PurchasedSet] = None,
+) -> List[Dict[str, Any]]:
     """
-    Returns:
-    {
-      "cached": bool,
-      "signature": "...",
-      "purchase_count": n,
-      "recommended": [{...product fields..., "reason": "...", "also_bought_count": int}],
-      "also_bought": [{"product_id": int, "count": int}, ...],
-      "updated_at": "...",
-    }
+    Builds prompt inputs (catalog, purchases, social proof) and asks Gemini.
+    Returns [{id, reason}, ...] ([] for an unusable answer); a failed call
+    raises, so run_engines counts it as an engine error.
     """
-    purchased_qs = (
-        SmartShopPurchaseOrder.objects
-        .filter(user=user)
-        .select_related("product")
-        .order_by("-purchase_date")
-    )
-    purchase_count = purchased_qs.count()
-
-    purchases_compact = [
-        {
-            "name": po.product.name,
-            "category": po.product.category,
-            "price": float(po.product.price),
-            "qty": po.quantity,
-        }
-        for po in purchased_qs[:15]
-    ]
-    sig = purchase_signature(purchases_compact)
-
-    # -----------------------------
-    # Cache hit
-    # -----------------------------
-    cache = UserRecommendationCache.objects.filter(user=user).first()
-    if (not force) and cache and cache.purchase_signature == sig and cache.items_json:
-        ids = []
-        id_to_reason = {}
-        for item in cache.items_json:
-            if isinstance(item, dict) and "id" in item:
-                try:
-                    pid = int(item["id"])
-                    ids.append(pid)
-                    id_to_reason[pid] = (item.get("reason") or "").strip()
-                except Exception:
-                    continue
-
-        qs = SmartShopProduct.objects.filter(id__in=ids)
-        products = ProductSerializer(qs, many=True).data
-        products_by_id = {p["id"]: p for p in products}
-
-        ordered: List[Dict[str, Any]] = []
-        for pid in ids:
-            p = products_by_id.get(pid)
-            if p:
-                p["reason"] = id_to_reason.get(pid) or "Recommended based on your shopping patterns."
-                ordered.append(p)
-
-        also = _attach_social_proof(user, ordered, top_n=max_items)
-
-        return {
-            "cached": True,
-            "signature": sig,
-            "purchase_count": purchase_count,
-            "recommended": ordered,
-            "also_bought": also,
-            "updated_at": cache.updated_at,
-        }
-
     # -----------------------------
     # Build prompt inputs for Gemini
     # -----------------------------
-    catalog_qs = SmartShopProduct.objects.all()
-    catalog_for_prompt = [
-        {"id": p.id, "name": p.name, "category": p.category, "price": float(p.price)}
-        for p in catalog_qs
-    ]
-
-    purchased_for_prompt = [
-        {
-            "id": po.product.id,
-            "name": po.product.name,
-            "category": po.product.category,
-            "price": float(po.product.price),
-        }
-        for po in purchased_qs[:20]
-    ]
-
-    purchased_ids = set(purchased_qs.values_list("product_id", flat=True))
+    snap = get_catalog_snapshot()
+    catalog_for_prompt = snap.product_dicts(columns=PROMPT_COLUMNS)
+    purchased_for_prompt = snap.product_dicts(
+        purchased_qs.values_list("product_id", flat=True)[:20],
+        columns=PROMPT_COLUMNS,
+    )
 
     # -----------------------------
     # Social proof context for Gemini (compact)
     # -----------------------------
-    sp = _social_proof_context(user, top_n=6)
+    sp = _social_proof_context(user, top_n=6, purchased=purchased)
 
     # Keep the prompt small: only include top 5 also-bought items
     social_proof_context = {
         "also_bought_top": sp.get("also_bought_named", [])[:5],
         "top_categories_among_similar": sp.get("top_categories_among_similar", [])[:3],
+        "trending_now": sp.get("trending_now", [])[:5],
         "note": "Use these only as supporting signals; never invent purchases.",
     }
 
     # -----------------------------
     # Gemini recommendations with reasons (with social proof)
     # -----------------------------
-    items: List[Dict[str, Any]] = []
-    try:
-        items = gemini_recommend_products_with_reasons(
-            api_key=getattr(settings, "GEMINI_API_KEY", None),
-            model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-            purchased=purchased_for_prompt,
-            catalog=catalog_for_prompt,
-            max_items=max_items,
-            # ✅ NEW: pass social proof context
-            social_proof=social_proof_context,
-        )
-    except TypeError:
-        # If your gemini_client does not yet accept social_proof, fall back safely
-        items = gemini_recommend_products_with_reasons(
-            api_key=getattr(settings, "GEMINI_API_KEY", None),
-            model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-            purchased=purchased_for_prompt,
-            catalog=catalog_for_prompt,
-            max_items=max_items,
-        )
-    except Exception:
-        items = []
-
-    # Filter out already purchased
-    items = [
-        x for x in items
-        if isinstance(x, dict)
-        and "id" in x
-        and (int(x["id"]) not in purchased_ids)
+    return gemini_recommend_products_with_reasons(
+        api_key=getattr(settings, "GEMINI_API_KEY", None),
+        model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
+        purchased=purchased_for_prompt,
+        catalog=catalog_for_prompt,
+        max_items=max_items,
+        social_proof=social_proof_context,
+        raise_errors=True,
+    )
+
+
+# -----------------------------
+# Engines (see reco_engines.py)
+# -----------------------------
+@register_engine("llm")
+def _llm_engine(user, *, purchased: PurchasedSet, max_items: int) -> List[Dict[str, Any]]:
+    # Gemini circuit open: skip catalog/social-proof work and let the next engine answer
+    if not llm_available("recommendations"):
+        return []
+    purchased_qs = SmartShopPurchaseOrder.objects.filter(user=user).order_by("-purchase_date")
+    items = []
+    for x in _gemini_items_for_user(user, purchased_qs, max_items, purchased=purchased):
+        try:
+            if int(x["id"]) not in purchased:
+                items.append(x)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return items
+
+
+@register_engine("als")
+def _als_engine(user, *, purchased: PurchasedSet, max_items: int) -> List[Dict[str, Any]]:
+    return _als_items_for_user(user, purchased, max_items)
+
+
+@register_engine("popularity")
+def _popularity_engine(user, *, purchased: PurchasedSet, max_items: int) -> List[Dict[str, Any]]:
+    return [
+        {"id": p.id, "reason": "Recommended based on similar categories you’ve purchased."}
+        for p in _fallback_recommendations_for_user(user, max_items=max_items, purchased=purchased)
     ]
 
-    # -----------------------------
-    # Fallback (if Gemini fails/empty)
-    # -----------------------------
-    if not items:
-        fallback_products = _fallback_recommendations_for_user(user, max_items=max_items)
-        items = [{"id": p.id, "reason": "Recommended based on similar categories you’ve purchased."} for p in fallback_products]
 
-    # Load product details in correct order
+def _render_items(user, items: List[Dict[str, Any]], max_items: int, *, purchased: Optional[PurchasedSet] = None):
+    """
+    [{id, reason}] -> (serialized products in order with reasons and
+    also_bought_count, also_bought list).
+    """
     ids = []
     id_to_reason = {}
     for it in items:
@@ -275,23 +300,115 @@ def get_recommendations_for_user(user, max_items: int = 4, force: bool = False)
             ordered.append(p)
 
     # Attach also-bought signals to response
-    also = _attach_social_proof(user, ordered, top_n=max_items)
+    also = _attach_social_proof(user, ordered, top_n=max_items, purchased=purchased)
+    return ordered, also
+
+
+def get_recommendations_for_user(
+    user,
+    max_items: int = 4,
+    force: bool = False,
+    engine: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    engine: run this registered engine (then "popularity" as a safety net)
+    instead of settings.RECO_ENGINES; such requests bypass the cache.
+    Raises ValueError for an unknown engine.
+
+    Caching (UserRecommendationCache), cheapest first:
+    - rendered hit: the stored payload (product fields, reasons, also-bought
+      counts) was built for the user's current orders and the current catalog
+      version -> returned as is (cache row + one aggregate, no rendering);
+    - items hit: same purchase signature but the catalog changed -> the stored
+      [{id, reason}] are re-rendered, no engine runs;
+    - miss: engines run.
+
+    Returns:
+    {
+      "cached": bool,
+      "engine": "llm" | "als" | ... (None on a cache hit),
+      "signature": "...",
+      "purchase_count": n,
+      "recommended": [{...product fields..., "reason": "...", "also_bought_count": int}],
+      "also_bought": [{"product_id": int, "count": int}, ...],
+      "updated_at": "...",
+    }
+    """
+    if engine is not None and get_engine(engine) is None:
+        raise ValueError(f"Unknown recommendation engine {engine!r}; available: {', '.join(engine_names())}")
+    chain = default_chain() if engine is None else list(dict.fromkeys([engine, "popularity"]))
+    use_cache = (not force) and engine is None
 
     # -----------------------------
-    # Save/update cache
+    # Rendered payload hit
     # -----------------------------
-    if not cache:
-        cache = UserRecommendationCache(user=user)
+    cache = UserRecommendationCache.objects.filter(user=user).first()
+    state = purchase_state(user)
+    version = catalog_version()
+    rendered = (
+        use_cache and cache and cache.payload_json
+        and cache.purchase_state == state and cache.catalog_version == version
+    )
+    perf.record_cache("recommendations_rendered", bool(rendered))
+    if rendered:
+        perf.record_cache("recommendations", True)
+        return {**cache.payload_json, "cached": True, "engine": None, "updated_at": cache.updated_at}
+
+    purchased_qs = (
+        SmartShopPurchaseOrder.objects
+        .filter(user=user)
+        .order_by("-purchase_date")
+    )
+    purchase_count = purchased_qs.count()
 
-    cache.purchase_signature = sig
-    cache.items_json = [{"id": p["id"], "reason": p.get("reason", "")} for p in ordered]
-    cache.save()
+    purchases_compact = get_catalog_snapshot().purchases_compact(
+        purchased_qs.values_list("product_id", "quantity")[:15]
+    )
+    sig = purchase_signature(purchases_compact)
 
-    return {
-        "cached": False,
+    # -----------------------------
+    # Items hit (re-render only)
+    # -----------------------------
+    hit = use_cache and cache and cache.purchase_signature == sig and cache.items_json
+    perf.record_cache("recommendations", bool(hit))
+    # One bitmap lookup for the whole request, passed down to every helper
+    purchased = purchased_set(user, state=state)
+    if hit:
+        engine_used, items = None, cache.items_json
+    else:
+        # Engines in order (first non-empty result wins)
+        engine_used, items = run_engines(chain, user, purchased=purchased, max_items=max_items)
+
+    ordered, also = _render_items(user, items, max_items, purchased=purchased)
+
+    if not hit:
+        # Shadow engine (if configured) runs off the request path for comparison
+        maybe_shadow(engine_used, [p["id"] for p in ordered], user, purchased=purchased, max_items=max_items)
+
+    payload = {
         "signature": sig,
         "purchase_count": purchase_count,
         "recommended": ordered,
         "also_bought": also,
-        "updated_at": cache.updated_at,
+    }
+
+    # -----------------------------
+    # Save/update cache (default engine chain only)
+    # -----------------------------
+    if engine is None:
+        if not cache:
+            cache = UserRecommendationCache(user=user)
+
+        cache.purchase_signature = sig
+        cache.items_json = [{"id": p["id"], "reason": p.get("reason", "")} for p in ordered]
+        cache.purchase_state = state
+        cache.catalog_version = version
+        cache.payload_json = payload
+        cache.save()
+
+    return {
+        **payload,
+        "cached": bool(hit),
+        "engine": engine_used,
+        "updated_at": cache.updated_at if engine is None else None,
     }
@@ -0,0 +1,54 @@
+"""
+Background refresh of a user's derived data after purchases.
+
+A committed purchase (signals.purchases_changed) calls
+schedule_user_refresh(user_id), which queues recommendations.refresh and
+insights.refresh for the user (tasks.py, run by `manage.py run_ai_worker`),
+debounced: each new purchase pushes the queued task back to now +
+settings.REFRESH_DEBOUNCE_SECONDS, so a burst of purchases leads to one
+refresh. The user's next page load is then a cache hit. Co-purchase counts
+are read from the orders (or the mapped co-purchase table) and are warmed as
+part of the rendered recommendation payload.
+
+Popularity is not refreshed per purchase: daily sales follow the outbox
+("popularity" consumer) and the rankings are rebuilt on a schedule
+(`manage.py refresh_popularity` from cron).
+"""
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from . import tasks
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "REFRESH_ON_PURCHASE", True))
+
+
+def schedule_user_refresh(user_id: Optional[int]) -> bool:
+    """
+    Queues the user's refresh tasks. Returns False when disabled.
+    """
+    if user_id is None or not enabled():
+        return False
+    delay = float(getattr(settings, "REFRESH_DEBOUNCE_SECONDS", 10))
+    for task_type in ("recommendations.refresh", "insights.refresh"):
+        tasks.enqueue(task_type, {"user_id": user_id}, key=str(user_id), delay=delay, debounce=True)
+    return True
+
+
+def refresh_recommendations(user_id: int) -> None:
+    from .reco_service import get_recommendations_for_user
+
+    user = get_user_model().objects.filter(id=user_id).first()
+    if user is not None:
+        get_recommendations_for_user(user, max_items=4)
+
+
+def refresh_insights(user_id: int) -> None:
+    from .ai_insights import get_insights_for_user
+
+    user = get_user_model().objects.filter(id=user_id).first()
+    if user is not None:
+        get_insights_for_user(user)
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import outbox
+from .catalog_snapshot import bump_catalog_version
+from .models import ChangeEvent, ProductAIProfile, ProductReview, SmartShopProduct, SmartShopPurchaseOrder
+from .refresh import schedule_user_refresh
+
+
+def _action(kwargs) -> str:
+    if "created" not in kwargs:
+        return ChangeEvent.ACTION_DELETED
+    return ChangeEvent.ACTION_CREATED if kwargs["created"] else ChangeEvent.ACTION_UPDATED
+
+
+@receiver(post_save, sender=SmartShopProduct)
+@receiver(post_delete, sender=SmartShopProduct)
+@receiver(post_save, sender=ProductAIProfile)
+@receiver(post_delete, sender=ProductAIProfile)
+def catalog_changed(sender, instance, **kwargs):
+    bump_catalog_version()
+    if sender is SmartShopProduct:
+        outbox.emit(
+            ChangeEvent.TOPIC_PRODUCT, _action(kwargs),
+            object_id=instance.id, product_id=instance.id,
+            payload={"name": instance.name, "category": instance.category, "price": str(instance.price)},
+        )
+    else:
+        outbox.emit_many([outbox.profile_event(instance, _action(kwargs))])
+
+
+@receiver(post_save, sender=SmartShopPurchaseOrder)
+@receiver(post_delete, sender=SmartShopPurchaseOrder)
+def purchases_changed(sender, instance, **kwargs):
+    # Debounced background refresh of the user's recommendations / insights
+    transaction.on_commit(lambda: schedule_user_refresh(instance.user_id))
+    outbox.emit_many([outbox.purchase_event(instance, _action(kwargs))])
+
+
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def reviews_changed(sender, instance, **kwargs):
+    outbox.emit(
+        ChangeEvent.TOPIC_REVIEW, _action(kwargs),
+        object_id=instance.id, user_id=instance.user_id, product_id=instance.product_id,
+        payload={"rating": instance.rating},
+    )
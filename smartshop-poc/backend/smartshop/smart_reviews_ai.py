@@ -1,21 +1,15 @@
 import json
-import re
 from typing import Any, Dict, List, Optional
 
-from google import genai
+from django.conf import settings
 
+from .circuit_breaker import CircuitOpenError
+from .llm import generate_text
+from .models import ProductAIReviewDigest, ProductReview, SmartShopProduct
+from .structured_output import parse_structured, response_schema
+from .utils import reviews_signature
 
-def _extract_json_object(text: str) -> Optional[Dict[str, Any]]:
-    if not text:
-        return None
-    cleaned = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).replace("```", "").strip()
-    match = re.search(r"\{.*\}", cleaned, flags=re.DOTALL)
-    if not match:
-        return None
-    try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError:
-        return None
+DIGEST_LABEL = "AI-generated highlights & sample reviews (not real user reviews)."
 
 
 def generate_product_review_digest(
@@ -33,6 +27,8 @@ def generate_product_review_digest(
     }
 
     IMPORTANT: sample_reviews are AI-generated and must be labeled as such in the UI.
+    Both lists are empty when nothing could be generated (the caller does not
+    save that); CircuitOpenError is re-raised.
     """
     if not api_key:
         return {"highlights": [], "sample_reviews": []}
@@ -78,9 +74,16 @@ Schema:
 """.strip()
 
     try:
-        client = genai.Client(api_key=api_key)
-        resp = client.models.generate_content(model=model_name, contents=prompt)
-        data = _extract_json_object((resp.text or "").strip())
+        text = generate_text(
+            api_key=api_key,
+            model_name=model_name,
+            prompt=prompt,
+            feature="review_digest",
+            response_schema=response_schema("review_digest"),
+        )
+        data = parse_structured(text, "review_digest")
+    except CircuitOpenError:
+        raise
     except Exception:
         return {"highlights": [], "sample_reviews": []}
 
@@ -109,3 +112,74 @@ Schema:
         samples_out.append({"rating": rating, "title": title, "body": body})
 
     return {"highlights": highlights_out, "sample_reviews": samples_out}
+
+
+def review_digest_for_product(product, *, force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Cached AI digest for a product (instance or id), regenerated when the
+    signature of its latest 30 reviews changes. None if the product is gone.
+    An empty result (circuit open, timeout, Gemini error, unparseable output)
+    is not saved: the previous digest is served and the next call retries.
+    Returns {"cached", "highlights", "sample_reviews", "updated_at", "label"}.
+    """
+    if not isinstance(product, SmartShopProduct):
+        product = SmartShopProduct.objects.select_related("ai_profile").filter(id=product).first()
+        if product is None:
+            return None
+
+    # Build compact reviews for signature + AI generation
+    reviews_qs = ProductReview.objects.filter(product_id=product.id).order_by("-updated_at")[:30]
+    reviews_compact = [
+        {"rating": r.rating, "title": r.title, "body": r.body}
+        for r in reviews_qs
+    ]
+    sig = reviews_signature(reviews_compact)
+
+    digest = ProductAIReviewDigest.objects.filter(product_id=product.id).first()
+    cached = (not force) and digest is not None and digest.reviews_signature == sig
+    if not cached:
+        # Generate (only if we have Gemini key)
+        profile = getattr(product, "ai_profile", None)
+        product_for_ai = {
+            "name": product.name,
+            "category": product.category,
+            "price": float(product.price),
+            "ai_short_description": (getattr(profile, "short_description", "") or "").strip(),
+            "ai_review_summary": (getattr(profile, "review_summary", "") or "").strip(),
+        }
+
+        try:
+            ai = generate_product_review_digest(
+                api_key=getattr(settings, "GEMINI_API_KEY", None),
+                model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
+                product=product_for_ai,
+                reviews=reviews_compact,
+            )
+        except CircuitOpenError:
+            ai = {}
+        if not (ai.get("highlights") or ai.get("sample_reviews")):
+            # Keep serving the previous digest (or nothing) without saving,
+            # so the next call regenerates
+            return {
+                "cached": False,
+                "highlights": digest.highlights_json if digest else [],
+                "sample_reviews": digest.sample_reviews_json if digest else [],
+                "updated_at": digest.updated_at if digest else None,
+                "label": DIGEST_LABEL,
+            }
+
+        if not digest:
+            digest = ProductAIReviewDigest(product_id=product.id)
+
+        digest.reviews_signature = sig
+        digest.highlights_json = ai.get("highlights", []) or []
+        digest.sample_reviews_json = ai.get("sample_reviews", []) or []
+        digest.save()
+
+    return {
+        "cached": bool(cached),
+        "highlights": digest.highlights_json,
+        "sample_reviews": digest.sample_reviews_json,
+        "updated_at": digest.updated_at,
+        "label": DIGEST_LABEL,
+    }
@@ -1,27 +1,18 @@
 import hashlib
 import json
 import re
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List
 
-from google import genai
+from .llm import generate_text, llm_available
+from .prompt_builder import encode_products, format_note, table_budget
+from .structured_output import parse_structured, response_schema
+
+RERANK_COLUMNS = ("id", "name", "category", "price", "ai_short_description", "ai_review_summary")
 
 
 # -----------------------------
 # Helpers
 # -----------------------------
-def _extract_json_object(text: str) -> Optional[Dict[str, Any]]:
-    if not text:
-        return None
-    cleaned = re.sub(r"```(?:json)?", "", text, flags=re.IGNORECASE).replace("```", "").strip()
-    match = re.search(r"\{.*\}", cleaned, flags=re.DOTALL)
-    if not match:
-        return None
-    try:
-        return json.loads(match.group(0))
-    except json.JSONDecodeError:
-        return None
-
-
 def _limit_words(s: str, max_words: int = 18) -> str:
     s = (s or "").strip()
     if not s:
@@ -32,6 +23,16 @@ def _limit_words(s: str, max_words: int = 18) -> str:
     return " ".join(words[:max_words])
 
 
+def _heuristic_parse(q: str, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Non-AI query parse: keyword tokens + "recommend" intent detection.
+    """
+    out = dict(defaults)
+    out["keywords"] = [x for x in re.split(r"[\s,]+", q.lower()) if len(x) >= 3][:8]
+    out["intent"] = "recommend" if "recommend" in q.lower() else "search"
+    return out
+
+
 def smart_search_cache_key(user_query: str, parsed: Dict[str, Any]) -> str:
     """
     Stable cache key so identical query+constraints returns cached payload.
@@ -87,11 +88,9 @@ def gemini_parse_smart_search_v2(
     if not q:
         return defaults
 
-    if not api_key:
-        # Simple heuristic fallback (no Gemini)
-        defaults["keywords"] = [x for x in re.split(r"[\s,]+", q.lower()) if len(x) >= 3][:8]
-        defaults["intent"] = "recommend" if "recommend" in q.lower() else "search"
-        return defaults
+    if not api_key or not llm_available("search_parse"):
+        # Simple heuristic fallback (no Gemini, or Gemini circuit open)
+        return _heuristic_parse(q, defaults)
 
     # Keep category list small
     categories_small = categories[:60]
@@ -131,14 +130,19 @@ Schema:
 """.strip()
 
     try:
-        client = genai.Client(api_key=api_key)
-        resp = client.models.generate_content(model=model_name, contents=prompt)
-        data = _extract_json_object((resp.text or "").strip())
+        text = generate_text(
+            api_key=api_key,
+            model_name=model_name,
+            prompt=prompt,
+            feature="search_parse",
+            response_schema=response_schema("search_parse"),
+        )
+        data = parse_structured(text, "search_parse")
     except Exception:
-        return defaults
+        return _heuristic_parse(q, defaults)
 
     if not isinstance(data, dict):
-        return defaults
+        return _heuristic_parse(q, defaults)
 
     # Normalize fields
     out = dict(defaults)
@@ -178,36 +182,19 @@ Schema:
     return out
 
 
-# -----------------------------
-# Step 2: Rerank candidates with grounded reasons (<= 18 words)
-# -----------------------------
-def gemini_rerank_with_reasons(
+def build_rerank_prompt(
     *,
-    api_key: str,
-    model_name: str,
     user_query: str,
     parsed: Dict[str, Any],
     candidates: List[Dict[str, Any]],
     max_items: int = 12,
-) -> List[Dict[str, Any]]:
+) -> str:
     """
-    Reranks candidates and returns short GROUNDED reasons (<= 18 words).
-    Candidates SHOULD include:
-      - id, name, category, price
-      - ai_short_description (recommended)
-      - ai_review_summary (recommended)
-
-    Returns:
-      [{"id": <int>, "reason": "<=18 words>"} ...]
+    Prompt for gemini_rerank_with_reasons. Candidates use the shared compact
+    encoding with descriptions truncated to fit the feature's token budget.
     """
-    if not api_key or not candidates:
-        return []
-
-    # Keep prompt small
-    cand_small = candidates[: min(len(candidates), 30)]
-
     cand_for_prompt = []
-    for c in cand_small:
+    for c in candidates:
         cand_for_prompt.append({
             "id": c.get("id"),
             "name": c.get("name"),
@@ -228,8 +215,10 @@ def gemini_rerank_with_reasons(
         "exclude": parsed.get("exclude") or [],
     }
 
-    prompt = f"""
+    def render(candidates_text: str) -> str:
+        return f"""
 You are SmartShop's smart search reranker.
+{format_note()}
 
 USER QUERY:
 {user_query}
@@ -238,14 +227,14 @@ INTERPRETED CONSTRAINTS:
 {json.dumps(parsed_min, ensure_ascii=False)}
 
 CANDIDATE PRODUCTS (choose ONLY from these):
-{json.dumps(cand_for_prompt, ensure_ascii=False)}
+{candidates_text}
 
 Task:
 Return the best {max_items} products in ranked order.
 
 Reason rules (STRICT):
 - Each reason MUST be grounded ONLY in provided fields:
-  name, category, price, ai_short_description, ai_review_summary, and interpreted constraints.
+  name, category, price, ai_short_description (desc), ai_review_summary (reviews), and interpreted constraints.
 - Each reason MUST be <= 18 words.
 - Avoid generic phrasing ("based on your intent", "great choice", "recommended for you").
 - Prefer: use case + feature/benefit + review sentiment + budget fit (if applicable).
@@ -259,14 +248,56 @@ Output JSON ONLY (no extra text):
 }}
 """.strip()
 
+    budget = table_budget("search_rerank", render(""))
+    return render(encode_products(
+        cand_for_prompt,
+        RERANK_COLUMNS,
+        max_chars={"ai_short_description": 160, "ai_review_summary": 120},
+        token_budget=budget,
+    ))
+
+
+# -----------------------------
+# Step 2: Rerank candidates with grounded reasons (<= 18 words)
+# -----------------------------
+def gemini_rerank_with_reasons(
+    *,
+    api_key: str,
+    model_name: str,
+    user_query: str,
+    parsed: Dict[str, Any],
+    candidates: List[Dict[str, Any]],
+    max_items: int = 12,
+) -> List[Dict[str, Any]]:
+    """
+    Reranks candidates and returns short GROUNDED reasons (<= 18 words).
+    Candidates SHOULD include:
+      - id, name, category, price
+      - ai_short_description (recommended)
+      - ai_review_summary (recommended)
+
+    Returns:
+      [{"id": <int>, "reason": "<=18 words>"} ...]
+    """
+    if not api_key or not candidates:
+        return []
+
+    # Keep prompt small
+    cand_small = candidates[: min(len(candidates), 30)]
+    prompt = build_rerank_prompt(user_query=user_query, parsed=parsed, candidates=cand_small, max_items=max_items)
+
     try:
-        client = genai.Client(api_key=api_key)
-        resp = client.models.generate_content(model=model_name, contents=prompt)
-        text = (resp.text or "").strip()
+        text = generate_text(
+            api_key=api_key,
+            model_name=model_name,
+            prompt=prompt,
+            feature="search_rerank",
+            response_schema=response_schema("search_rerank"),
+        )
     except Exception:
         return []
 
-    data = _extract_json_object(text)
+    data = parse_structured(text, "search_rerank")
     if not data or "ranked" not in data:
         return []
 
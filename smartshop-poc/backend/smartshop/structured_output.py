@@ -0,0 +1,286 @@
+"""
+Shared parser for JSON returned by Gemini.
+
+- extract_json_object: finds the first JSON object in a response (code fences,
+  leading/trailing prose and stray braces are fine) using
+  json.JSONDecoder.raw_decode from each candidate "{", so the text is never
+  matched with a greedy regex.
+- parse_structured: same, but returns the first object that matches the
+  feature's schema (FEATURE_SCHEMAS).
+- RESPONSE_SCHEMAS / response_schema: the same shapes as Gemini response
+  schemas, passed to generate_text so the model returns bare JSON
+  (response_mime_type="application/json").
+- IncrementalJSONParser: fed chunk by chunk (streaming), scans every
+  character once and yields each top-level object, and each element of the
+  top-level arrays inside it, as soon as it is complete.
+"""
+import json
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+_decoder = json.JSONDecoder()
+
+# feature -> {key: required type}; keys not listed are not checked
+FEATURE_SCHEMAS: Dict[str, Dict[str, type]] = {
+    "recommendations": {"recommended": list},
+    "search_rerank": {"ranked": list},
+    "search_parse": {},
+    "insights": {"bullets": list},
+    "review_digest": {"highlights": list, "sample_reviews": list},
+    "profile": {"short_description": str},
+    "profile_batch": {"profiles": list},
+}
+
+
+# -----------------------------
+# Gemini response schemas (OpenAPI subset used by google-genai)
+# -----------------------------
+def _string_list() -> Dict[str, Any]:
+    return {"type": "ARRAY", "items": {"type": "STRING"}}
+
+
+def _id_reason_list() -> Dict[str, Any]:
+    return {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {"id": {"type": "INTEGER"}, "reason": {"type": "STRING"}},
+            "required": ["id", "reason"],
+        },
+    }
+
+
+_PROFILE_PROPERTIES: Dict[str, Any] = {
+    "short_description": {"type": "STRING"},
+    "use_cases": _string_list(),
+    "features": _string_list(),
+    "keywords": _string_list(),
+    "audience": _string_list(),
+    "pros": _string_list(),
+    "cons": _string_list(),
+    "review_summary": {"type": "STRING"},
+}
+
+RESPONSE_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "recommendations": {
+        "type": "OBJECT",
+        "properties": {"recommended": _id_reason_list()},
+        "required": ["recommended"],
+    },
+    "search_rerank": {
+        "type": "OBJECT",
+        "properties": {"ranked": _id_reason_list()},
+        "required": ["ranked"],
+    },
+    "search_parse": {
+        "type": "OBJECT",
+        "properties": {
+            "intent": {"type": "STRING", "enum": ["search", "recommend"]},
+            "categories": _string_list(),
+            "price_min": {"type": "NUMBER", "nullable": True},
+            "price_max": {"type": "NUMBER", "nullable": True},
+            "keywords": _string_list(),
+            "use_cases": _string_list(),
+            "audience": _string_list(),
+            "must_include": _string_list(),
+            "exclude": _string_list(),
+            "sort": {"type": "STRING", "enum": ["relevance", "price_asc", "price_desc", "newest"]},
+        },
+        "required": ["intent", "keywords", "sort"],
+    },
+    "insights": {
+        "type": "OBJECT",
+        "properties": {"bullets": _string_list()},
+        "required": ["bullets"],
+    },
+    "review_digest": {
+        "type": "OBJECT",
+        "properties": {
+            "highlights": _string_list(),
+            "sample_reviews": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "rating": {"type": "INTEGER"},
+                        "title": {"type": "STRING"},
+                        "body": {"type": "STRING"},
+                    },
+                    "required": ["rating", "title", "body"],
+                },
+            },
+        },
+        "required": ["highlights", "sample_reviews"],
+    },
+    "profile": {
+        "type": "OBJECT",
+        "properties": _PROFILE_PROPERTIES,
+        "required": ["short_description", "review_summary"],
+    },
+    "profile_batch": {
+        "type": "OBJECT",
+        "properties": {
+            "profiles": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {"id": {"type": "INTEGER"}, **_PROFILE_PROPERTIES},
+                    "required": ["id", "short_description"],
+                },
+            },
+        },
+        "required": ["profiles"],
+    },
+}
+
+
+def response_schema(feature: str) -> Optional[Dict[str, Any]]:
+    """
+    Gemini response schema for the feature, or None when structured output is
+    off (settings.LLM_STRUCTURED_OUTPUT) or the feature has no schema.
+    """
+    if not getattr(settings, "LLM_STRUCTURED_OUTPUT", True):
+        return None
+    return RESPONSE_SCHEMAS.get(feature)
+
+
+def _strip_fences(text: str) -> str:
+    if "```" not in text:
+        return text
+    out = text.replace("```json", "").replace("```JSON", "").replace("```", "")
+    return out.strip()
+
+
+def iter_json_objects(text: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields every top-level JSON object found in text, left to right.
+    """
+    if not text:
+        return
+    text = _strip_fences(text)
+    idx = text.find("{")
+    while idx != -1:
+        try:
+            obj, end = _decoder.raw_decode(text, idx)
+        except json.JSONDecodeError:
+            idx = text.find("{", idx + 1)
+            continue
+        if isinstance(obj, dict):
+            yield obj
+        idx = text.find("{", end)
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    First JSON object in text, or None.
+    """
+    return next(iter_json_objects(text), None)
+
+
+def matches_schema(data: Any, schema: Dict[str, type]) -> bool:
+    if not isinstance(data, dict):
+        return False
+    for key, typ in schema.items():
+        if not isinstance(data.get(key), typ):
+            return False
+    return True
+
+
+def parse_structured(text: str, feature: str) -> Optional[Dict[str, Any]]:
+    """
+    First JSON object in text that matches FEATURE_SCHEMAS[feature], or None.
+    """
+    schema = FEATURE_SCHEMAS.get(feature, {})
+    for obj in iter_json_objects(text):
+        if matches_schema(obj, schema):
+            return obj
+    return None
+
+
+class IncrementalJSONParser:
+    """
+    Streaming parser. feed(chunk) returns the events completed by that chunk:
+      ("item", key, obj)   - an element of a top-level array, e.g. one
+                             {"id", "reason"} of "recommended"
+      ("object", None, obj) - a complete top-level object
+    Text outside objects (prose, code fences) is skipped.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0                   # absolute offset of the next char to scan
+        self._stack: List[str] = []     # open containers: "{" / "["
+        self._in_string = False
+        self._escape = False
+        self._obj_start = -1            # offset of the current top-level "{"
+        self._item_start = -1           # offset of the current array element
+        self._last_key = ""             # last top-level key seen (array name)
+        self._key_start = -1
+        self.objects: List[Dict[str, Any]] = []
+
+    def feed(self, chunk: str) -> List[Tuple[str, Optional[str], Any]]:
+        events: List[Tuple[str, Optional[str], Any]] = []
+        self._buf += chunk
+        base = self._pos
+        for i, ch in enumerate(chunk):
+            at = base + i
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._key_start >= 0:
+                        self._last_key = self._buf[self._key_start + 1:at]
+                        self._key_start = -1
+                continue
+
+            if not self._stack and ch != "{":
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                # strings directly inside the top-level object may be keys
+                if len(self._stack) == 1:
+                    self._key_start = at
+            elif ch in "{[":
+                if not self._stack:
+                    self._obj_start = at
+                elif ch == "{" and self._stack == ["{", "["]:
+                    self._item_start = at
+                self._stack.append(ch)
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if ch == "}" and self._stack == ["{", "["] and self._item_start >= 0:
+                    item = self._decode(self._item_start, at + 1)
+                    if item is not None:
+                        events.append(("item", self._last_key, item))
+                    self._item_start = -1
+                elif not self._stack:
+                    obj = self._decode(self._obj_start, at + 1)
+                    if isinstance(obj, dict):
+                        self.objects.append(obj)
+                        events.append(("object", None, obj))
+                    self._obj_start = -1
+        self._pos = base + len(chunk)
+        return events
+
+    def _decode(self, start: int, end: int) -> Any:
+        try:
+            return json.loads(self._buf[start:end])
+        except json.JSONDecodeError:
+            return None
+
+    def result(self, feature: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        First complete top-level object (matching the feature schema, if given).
+        """
+        schema = FEATURE_SCHEMAS.get(feature or "", {})
+        for obj in self.objects:
+            if matches_schema(obj, schema):
+                return obj
+        return None
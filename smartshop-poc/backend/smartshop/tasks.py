@@ -0,0 +1,433 @@
+"""
+Durable background task queue in the app database (AITask), for AI
+regeneration work that should not run inline in a request.
+
+Producers call enqueue(task_type, payload, key=...). Per (task_type, key)
+there is at most one queued task (unique AITask.active_key, enforced on every
+backend including MySQL): enqueueing again merges into it (higher
+priority wins; debounce=True pushes its start back instead). Workers
+(`manage.py run_ai_worker`) claim the highest-priority due task with a
+conditional UPDATE, so any number of worker processes can share the table,
+and run it through the handler registered with @task_handler:
+
+- failures are retried with exponential backoff (TASK_RETRY_BASE_SECONDS x
+  2^(attempt-1), capped at TASK_RETRY_MAX_SECONDS) up to max_attempts;
+- at most `concurrency` tasks of one type run at once (settings.TASK_CONCURRENCY
+  overrides the handler's default), e.g. to keep LLM work under rate limits;
+- a task is re-queued once it has been "running" for longer than
+  TASK_LOCK_TIMEOUT_SECONDS, as its worker is presumed dead. There is no
+  heartbeat, so a handler that legitimately runs longer is re-queued too and
+  may run twice: keep the timeout above the slowest handler.
+
+queue_stats() (also /api/ai/tasks/ and /api/metrics/) reports queue depth by
+type and status and the age of the oldest due task.
+"""
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Case, CharField, Count, F, Min, Value, When
+from django.db.models.functions import Concat, Greatest, Least
+from django.utils import timezone
+
+from .models import AITask, AITaskTypeLock
+
+logger = logging.getLogger(__name__)
+
+
+class TaskHandler:
+    def __init__(self, task_type: str, fn: Callable[..., Any], *, concurrency: int, max_attempts: int, priority: int):
+        self.task_type = task_type
+        self.fn = fn
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+
+_handlers: Dict[str, TaskHandler] = {}
+
+
+def task_handler(task_type: str, *, concurrency: int = 1, max_attempts: int = 3, priority: int = 0):
+    """
+    Registers fn(**payload) as the handler for task_type.
+    """
+    def decorator(fn: Callable[..., Any]) -> Callable[..., Any]:
+        _handlers[task_type] = TaskHandler(
+            task_type, fn, concurrency=concurrency, max_attempts=max_attempts, priority=priority,
+        )
+        return fn
+    return decorator
+
+
+def handler_types() -> List[str]:
+    return sorted(_handlers)
+
+
+def concurrency_limit(task_type: str) -> int:
+    overrides = getattr(settings, "TASK_CONCURRENCY", {}) or {}
+    if task_type in overrides:
+        return max(1, int(overrides[task_type]))
+    handler = _handlers.get(task_type)
+    return handler.concurrency if handler else 1
+
+
+def _backoff_seconds(attempts: int) -> float:
+    base = float(getattr(settings, "TASK_RETRY_BASE_SECONDS", 30))
+    cap = float(getattr(settings, "TASK_RETRY_MAX_SECONDS", 3600))
+    return min(cap, base * 2 ** max(0, attempts - 1))
+
+
+def _active_key(task_type: str, key: str) -> Optional[str]:
+    return f"{task_type}:{key}" if key else None
+
+
+# The same, computed per row when a task goes back to the queue
+_ACTIVE_KEY_SQL = Case(
+    When(dedupe_key="", then=Value(None)),
+    default=Concat(F("task_type"), Value(":"), F("dedupe_key")),
+    output_field=CharField(),
+)
+
+
+# -----------------------------
+# Producing
+# -----------------------------
+def enqueue(
+    task_type: str,
+    payload: Optional[Dict[str, Any]] = None,
+    *,
+    key: str = "",
+    priority: Optional[int] = None,
+    delay: float = 0,
+    debounce: bool = False,
+    max_attempts: Optional[int] = None,
+) -> AITask:
+    """
+    Queues a task (or merges into the queued task with the same key) and
+    returns it. Raises ValueError for an unknown task_type.
+    """
+    handler = _handlers.get(task_type)
+    if handler is None:
+        raise ValueError(f"Unknown task type {task_type!r}; registered: {', '.join(handler_types())}")
+    priority = handler.priority if priority is None else int(priority)
+    run_after = timezone.now() + timedelta(seconds=max(0.0, float(delay)))
+    key = str(key or "")
+
+    for _ in range(3):
+        existing = _queued_with_key(task_type, key) if key else None
+        if existing is not None:
+            # Conditional: a worker may claim it between the read and this write
+            merged = AITask.objects.filter(id=existing.id, status=AITask.STATUS_QUEUED).update(
+                priority=Greatest(F("priority"), priority),
+                run_after=run_after if debounce else Least(F("run_after"), run_after),
+            )
+            if merged:
+                existing.refresh_from_db()
+                return existing
+        try:
+            with transaction.atomic():
+                return AITask.objects.create(
+                    task_type=task_type,
+                    dedupe_key=key,
+                    active_key=_active_key(task_type, key),
+                    payload=payload or {},
+                    priority=priority,
+                    run_after=run_after,
+                    max_attempts=int(max_attempts or handler.max_attempts),
+                )
+        except IntegrityError:
+            # Another producer queued the same key in between (unique
+            # active_key): merge into it
+            continue
+    raise RuntimeError(f"Could not enqueue {task_type}:{key}")
+
+
+def _queued_with_key(task_type: str, key: str) -> Optional[AITask]:
+    return AITask.objects.filter(active_key=_active_key(task_type, key)).first()
+
+
+def enqueue_on_commit(task_type: str, payload: Optional[Dict[str, Any]] = None, **opts: Any) -> None:
+    transaction.on_commit(lambda: enqueue(task_type, payload, **opts))
+
+
+# -----------------------------
+# Consuming
+# -----------------------------
+def requeue_stale(*, now=None) -> int:
+    """
+    Tasks running for longer than TASK_LOCK_TIMEOUT_SECONDS go back to the
+    queue (their worker is presumed dead; nothing refreshes locked_at).
+    """
+    now = now or timezone.now()
+    timeout = timedelta(seconds=float(getattr(settings, "TASK_LOCK_TIMEOUT_SECONDS", 600)))
+    stale = AITask.objects.filter(status=AITask.STATUS_RUNNING, locked_at__lt=now - timeout)
+    requeued = 0
+    for task_id in stale.values_list("id", flat=True):
+        requeued += _requeue(task_id, run_after=timezone.now(), error="Worker lock expired")
+    return requeued
+
+
+def _requeue(task_id: int, *, run_after, error: str) -> int:
+    """
+    Puts a task back in the queue; if another task with the same key was
+    queued meanwhile, this one is closed as failed instead (that one covers it).
+    """
+    try:
+        with transaction.atomic():
+            return AITask.objects.filter(id=task_id).update(
+                status=AITask.STATUS_QUEUED, active_key=_ACTIVE_KEY_SQL,
+                locked_by="", locked_at=None, last_error=error, run_after=run_after,
+            )
+    except IntegrityError:
+        AITask.objects.filter(id=task_id).update(
+            status=AITask.STATUS_FAILED, active_key=None, locked_by="", locked_at=None,
+            last_error=f"{error} (superseded by a queued task with the same key)", finished_at=timezone.now(),
+        )
+        return 0
+
+
+def _blocked_types() -> List[str]:
+    """
+    Types at their concurrency limit, from one GROUP BY (a hint: claim_next
+    checks again under the type's lock).
+    """
+    running = dict(
+        AITask.objects.filter(status=AITask.STATUS_RUNNING)
+        .values("task_type").annotate(n=Count("id")).values_list("task_type", "n")
+    )
+    return [t for t, n in running.items() if n >= concurrency_limit(t)]
+
+
+def claim_next(worker_id: str, *, types: Optional[Sequence[str]] = None, now=None) -> Optional[AITask]:
+    """
+    Marks the highest-priority due task as running for worker_id and returns
+    it, skipping types that are at their concurrency limit. None if idle.
+
+    The running count and the claim happen in one transaction holding the
+    type's AITaskTypeLock row, so concurrent workers never exceed the limit.
+    """
+    now = now or timezone.now()
+    blocked = set(_blocked_types())
+    for _ in range(5):
+        qs = AITask.objects.filter(status=AITask.STATUS_QUEUED, run_after__lte=now).exclude(task_type__in=blocked)
+        if types:
+            qs = qs.filter(task_type__in=types)
+        task = qs.order_by("-priority", "run_after", "id").first()
+        if task is None:
+            return None
+        with transaction.atomic():
+            AITaskTypeLock.objects.select_for_update().get_or_create(task_type=task.task_type)
+            running = AITask.objects.filter(task_type=task.task_type, status=AITask.STATUS_RUNNING).count()
+            if running >= concurrency_limit(task.task_type):
+                blocked.add(task.task_type)
+                continue
+            claimed = AITask.objects.filter(id=task.id, status=AITask.STATUS_QUEUED).update(
+                status=AITask.STATUS_RUNNING,
+                active_key=None,
+                locked_by=worker_id,
+                locked_at=now,
+                attempts=F("attempts") + 1,
+            )
+        if claimed:
+            task.refresh_from_db()
+            return task
+        # Lost the race to another worker: pick again
+    return None
+
+
+def run_task(task: AITask) -> bool:
+    """
+    Runs a claimed task; records success, a scheduled retry or the final
+    failure. Returns True on success.
+    """
+    handler = _handlers.get(task.task_type)
+    try:
+        if handler is None:
+            raise LookupError(f"No handler registered for {task.task_type!r}")
+        handler.fn(**(task.payload or {}))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        now = timezone.now()
+        if handler is not None and task.attempts < task.max_attempts:
+            _requeue(task.id, run_after=now + timedelta(seconds=_backoff_seconds(task.attempts)), error=error)
+            logger.warning("Task %s failed (attempt %s/%s), retrying: %s", task, task.attempts, task.max_attempts, error)
+        else:
+            AITask.objects.filter(id=task.id).update(
+                status=AITask.STATUS_FAILED, active_key=None, locked_by="", locked_at=None, last_error=error, finished_at=now,
+            )
+            logger.error("Task %s failed permanently: %s", task, error)
+        return False
+
+    AITask.objects.filter(id=task.id).update(
+        status=AITask.STATUS_DONE, active_key=None, locked_by="", locked_at=None, last_error="", finished_at=timezone.now(),
+    )
+    return True
+
+
+def run_pending(
+    *,
+    worker_id: str = "inline",
+    types: Optional[Sequence[str]] = None,
+    limit: Optional[int] = None,
+    now=None,
+) -> Dict[str, int]:
+    """
+    Runs due tasks in this thread until the queue is idle (or limit tasks ran).
+    """
+    stats = {"done": 0, "failed": 0}
+    while limit is None or stats["done"] + stats["failed"] < limit:
+        task = claim_next(worker_id, types=types, now=now)
+        if task is None:
+            break
+        stats["done" if run_task(task) else "failed"] += 1
+    return stats
+
+
+def purge_finished(*, older_than_days: Optional[float] = None) -> int:
+    days = float(older_than_days if older_than_days is not None else getattr(settings, "TASK_KEEP_DAYS", 7))
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = AITask.objects.filter(
+        status__in=[AITask.STATUS_DONE, AITask.STATUS_FAILED], finished_at__lt=cutoff,
+    ).delete()
+    return deleted
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(
+    *,
+    worker_id: Optional[str] = None,
+    threads: int = 1,
+    types: Optional[Sequence[str]] = None,
+    poll_seconds: Optional[float] = None,
+    stop: Optional[threading.Event] = None,
+) -> None:
+    """
+    Worker loop for manage.py run_ai_worker: `threads` claim/run loops, each
+    with its own DB connection, sleeping poll_seconds when the queue is idle.
+    """
+    worker_id = worker_id or default_worker_id()
+    poll = float(poll_seconds if poll_seconds is not None else getattr(settings, "TASK_POLL_SECONDS", 2))
+    stop = stop or threading.Event()
+
+    def loop(n: int) -> None:
+        name = f"{worker_id}/{n}"
+        try:
+            while not stop.is_set():
+                if n == 0:
+                    requeue_stale()
+                ran = run_pending(worker_id=name, types=types, limit=50)
+                if not ran["done"] + ran["failed"]:
+                    stop.wait(poll)
+        finally:
+            connections.close_all()
+
+    if threads <= 1:
+        loop(0)
+        return
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ai-worker") as pool:
+        try:
+            list(pool.map(loop, range(threads)))
+        except KeyboardInterrupt:
+            # Let running tasks finish, then stop the loops
+            stop.set()
+            raise
+
+
+# -----------------------------
+# Visibility
+# -----------------------------
+def queue_stats() -> Dict[str, Any]:
+    now = timezone.now()
+    by_type: Dict[str, Dict[str, int]] = {}
+    for row in AITask.objects.values("task_type", "status").annotate(n=Count("id")).order_by("task_type", "status"):
+        by_type.setdefault(row["task_type"], {})[row["status"]] = row["n"]
+    due = AITask.objects.filter(status=AITask.STATUS_QUEUED, run_after__lte=now)
+    oldest = due.aggregate(at=Min("run_after"))["at"]
+    return {
+        "types": {
+            t: {**counts, "concurrency": concurrency_limit(t)}
+            for t, counts in by_type.items()
+        },
+        "queued_due": due.count(),
+        "oldest_due_seconds": round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
+
+
+def render_prometheus() -> str:
+    stats = queue_stats()
+    lines = [
+        "# HELP smartshop_tasks Background tasks by type and status.",
+        "# TYPE smartshop_tasks gauge",
+    ]
+    for t, counts in sorted(stats["types"].items()):
+        for status, _label in AITask.STATUS_CHOICES:
+            lines.append(f'smartshop_tasks{{type="{t}",status="{status}"}} {counts.get(status, 0)}')
+    lines += [
+        "# HELP smartshop_tasks_oldest_due_seconds Age of the oldest due task.",
+        "# TYPE smartshop_tasks_oldest_due_seconds gauge",
+        f"smartshop_tasks_oldest_due_seconds {stats['oldest_due_seconds']:g}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# -----------------------------
+# Handlers
+# -----------------------------
+@task_handler("recommendations.refresh", concurrency=2, priority=20)
+def _refresh_recommendations(user_id: int) -> None:
+    from .refresh import refresh_recommendations
+
+    refresh_recommendations(user_id)
+
+
+@task_handler("insights.refresh", concurrency=2, priority=10)
+def _refresh_insights(user_id: int) -> None:
+    from .refresh import refresh_insights
+
+    refresh_insights(user_id)
+
+
+@task_handler("popularity.refresh", concurrency=1, priority=5)
+def _refresh_popularity() -> None:
+    from .popularity import refresh_popularity
+
+    refresh_popularity()
+
+
+@task_handler("reviews.digest", concurrency=2, priority=5)
+def _refresh_review_digest(product_id: int) -> None:
+    from .smart_reviews_ai import review_digest_for_product
+
+    review_digest_for_product(product_id)
+
+
+@task_handler("profiles.generate", concurrency=2, priority=0)
+def _generate_profile(product_id: int, force: bool = False) -> None:
+    from .product_profile_ai import refresh_product_profile
+
+    refresh_product_profile(product_id, force=force)
+
+
+@task_handler("catalog.build_files", concurrency=1, priority=0)
+def _build_catalog_files() -> None:
+    from .catalog_files import snapshot_dir, write_catalog_files
+
+    if snapshot_dir():
+        write_catalog_files()
+
+
+@task_handler("outbox.consume", concurrency=1, priority=15)
+def _consume_outbox() -> None:
+    from .outbox import run_consumers
+
+    # A late commit queues this task again itself (outbox._schedule_consumers)
+    run_consumers()
@@ -0,0 +1,305 @@
+"""
+"Trending now": streaming heavy hitters over a sliding time window.
+
+Purchases are counted in time buckets (settings.TRENDING_BUCKET_SECONDS,
+TRENDING_BUCKETS of them make the window). Each bucket holds
+- a count-min sketch (TRENDING_SKETCH_DEPTH rows x TRENDING_SKETCH_WIDTH
+  counters): estimated units per product, never under-counted,
+- the TRENDING_TOP_K heaviest products seen in that bucket (candidates).
+top() sums the sketch estimates of the candidates over the buckets in the
+window. Memory is buckets x (width x depth + top_k), whatever the order volume,
+and no GROUP BY runs over SmartShopPurchaseOrder.
+
+Purchases reach the shared state row (TrendingSketchState) through the
+outbox: the "trending" consumer (outbox.py, on the task queue) folds each
+batch of purchase events into the row under a row lock, in the same
+transaction that moves its cursor, so a failed merge is retried with the same
+events instead of losing them. Requests only read the row, at most every
+TRENDING_RELOAD_SECONDS, and skip decoding it while updated_at is unchanged.
+"""
+import base64
+import heapq
+import json
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .models import ChangeEvent, TrendingSketchState
+
+STATE_NAME = "purchases"
+
+# Fixed odd multipliers / offsets for the row hashes (deterministic across processes)
+_HASH_SEEDS = (
+    (0x9E3779B97F4A7C15, 0x632BE59BD9B4E019),
+    (0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9),
+    (0xD6E8FEB86659FD93, 0x85EBCA77C2B2AE63),
+    (0xFF51AFD7ED558CCD, 0xC4CEB9FE1A85EC53),
+    (0x27D4EB2F165667C5, 0x94D049BB133111EB),
+    (0xBF58476D1CE4E5B9, 0x2545F4914F6CDD1D),
+)
+_MASK64 = (1 << 64) - 1
+
+
+def _config() -> Dict[str, int]:
+    return {
+        "bucket_seconds": int(getattr(settings, "TRENDING_BUCKET_SECONDS", 3600)),
+        "buckets": int(getattr(settings, "TRENDING_BUCKETS", 24)),
+        "width": int(getattr(settings, "TRENDING_SKETCH_WIDTH", 2048)),
+        "depth": min(len(_HASH_SEEDS), int(getattr(settings, "TRENDING_SKETCH_DEPTH", 4))),
+        "top_k": int(getattr(settings, "TRENDING_TOP_K", 50)),
+    }
+
+
+class CountMinSketch:
+    __slots__ = ("width", "depth", "table")
+
+    def __init__(self, width: int, depth: int, table: Optional[array] = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else array("Q", bytes(8 * width * depth))
+
+    def _cells(self, key: int):
+        for row in range(self.depth):
+            a, b = _HASH_SEEDS[row]
+            h = ((a * (key + 1) + b) & _MASK64) >> 17
+            yield row * self.width + h % self.width
+
+    def add(self, key: int, count: int = 1) -> None:
+        for cell in self._cells(key):
+            self.table[cell] += count
+
+    def estimate(self, key: int) -> int:
+        return min(self.table[cell] for cell in self._cells(key))
+
+    def merge(self, other: "CountMinSketch") -> None:
+        for i, v in enumerate(other.table):
+            if v:
+                self.table[i] += v
+
+
+class _Bucket:
+    __slots__ = ("sketch", "heavy")
+
+    def __init__(self, width: int, depth: int):
+        self.sketch = CountMinSketch(width, depth)
+        self.heavy: Dict[int, int] = {}   # product id -> estimate (at most top_k)
+
+    def add(self, key: int, count: int, top_k: int) -> None:
+        self.sketch.add(key, count)
+        self.heavy[key] = self.sketch.estimate(key)
+        if len(self.heavy) > top_k:
+            del self.heavy[min(self.heavy, key=self.heavy.__getitem__)]
+
+    def merge(self, other: "_Bucket", top_k: int) -> None:
+        self.sketch.merge(other.sketch)
+        candidates = set(self.heavy) | set(other.heavy)
+        estimates = {k: self.sketch.estimate(k) for k in candidates}
+        self.heavy = dict(heapq.nlargest(top_k, estimates.items(), key=lambda kv: kv[1]))
+
+
+class TrendingCounter:
+    """
+    Sliding window of buckets keyed by bucket number (timestamp // bucket_seconds).
+    """
+
+    def __init__(self, config: Optional[Dict[str, int]] = None):
+        self.config = dict(config or _config())
+        self.buckets: Dict[int, _Bucket] = {}
+
+    def _bucket_no(self, at: float) -> int:
+        return int(at // self.config["bucket_seconds"])
+
+    def _expire(self, now_bucket: int) -> None:
+        oldest = now_bucket - self.config["buckets"] + 1
+        for no in [n for n in self.buckets if n < oldest]:
+            del self.buckets[no]
+
+    def add(self, product_id: int, count: int = 1, *, at: Optional[float] = None) -> None:
+        no = self._bucket_no(time.time() if at is None else at)
+        bucket = self.buckets.get(no)
+        if bucket is None:
+            bucket = self.buckets[no] = _Bucket(self.config["width"], self.config["depth"])
+            self._expire(no)
+        bucket.add(int(product_id), int(count), self.config["top_k"])
+
+    def merge(self, other: "TrendingCounter") -> None:
+        for no, bucket in other.buckets.items():
+            mine = self.buckets.get(no)
+            if mine is None:
+                mine = self.buckets[no] = _Bucket(self.config["width"], self.config["depth"])
+            mine.merge(bucket, self.config["top_k"])
+        if self.buckets:
+            self._expire(max(self.buckets))
+
+    def top(
+        self,
+        limit: int = 10,
+        *,
+        window_seconds: Optional[int] = None,
+        now: Optional[float] = None,
+        extra: Optional["TrendingCounter"] = None,
+    ) -> List[Tuple[int, int]]:
+        """
+        [(product_id, estimated units)] over the last window_seconds
+        (default: the whole window), heaviest first. extra (same shape) is
+        counted as well without being merged in.
+        """
+        now_bucket = self._bucket_no(time.time() if now is None else now)
+        span = self.config["buckets"]
+        if window_seconds:
+            span = max(1, min(span, -(-int(window_seconds) // self.config["bucket_seconds"])))
+        numbers = range(now_bucket - span + 1, now_bucket + 1)
+        sources = [self] + ([extra] if extra is not None else [])
+        buckets = [b for src in sources for n in numbers if (b := src.buckets.get(n)) is not None]
+
+        candidates = {k for b in buckets for k in b.heavy}
+        totals = {k: sum(b.sketch.estimate(k) for b in buckets) for k in candidates}
+        ranked = heapq.nlargest(limit, totals.items(), key=lambda kv: (kv[1], -kv[0]))
+        return [(k, n) for k, n in ranked if n > 0]
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    def to_bytes(self) -> bytes:
+        payload = {
+            "config": self.config,
+            "buckets": {
+                str(no): {
+                    "table": base64.b64encode(zlib.compress(b.sketch.table.tobytes())).decode("ascii"),
+                    "heavy": {str(k): v for k, v in b.heavy.items()},
+                }
+                for no, b in self.buckets.items()
+            },
+        }
+        return json.dumps(payload).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes, config: Optional[Dict[str, int]] = None) -> "TrendingCounter":
+        """
+        Restores a counter; if the stored sketch shape differs from config
+        (settings changed), the stored state is dropped.
+        """
+        counter = cls(config)
+        if not data:
+            return counter
+        payload = json.loads(bytes(data).decode("utf-8"))
+        stored = payload.get("config", {})
+        if (stored.get("width"), stored.get("depth"), stored.get("bucket_seconds")) != (
+            counter.config["width"], counter.config["depth"], counter.config["bucket_seconds"]
+        ):
+            return counter
+        for no, raw in payload.get("buckets", {}).items():
+            table = array("Q")
+            table.frombytes(zlib.decompress(base64.b64decode(raw["table"])))
+            bucket = _Bucket(counter.config["width"], counter.config["depth"])
+            bucket.sketch = CountMinSketch(counter.config["width"], counter.config["depth"], table)
+            bucket.heavy = {int(k): int(v) for k, v in raw.get("heavy", {}).items()}
+            counter.buckets[int(no)] = bucket
+        if counter.buckets:
+            counter._expire(max(counter.buckets))
+        return counter
+
+
+# -----------------------------
+# Shared state
+# -----------------------------
+_lock = threading.Lock()
+_shared: Optional[TrendingCounter] = None   # last state loaded from the DB
+_shared_at = None                           # its updated_at
+_last_load = 0.0
+
+
+def _reload_seconds() -> float:
+    return float(getattr(settings, "TRENDING_RELOAD_SECONDS", 30))
+
+
+def _event_time(event) -> float:
+    """
+    The order's purchase_date (bulk imports carry history), else the event time.
+    """
+    raw = (event.payload or {}).get("purchase_date")
+    if raw:
+        try:
+            return datetime.fromisoformat(raw).timestamp()
+        except ValueError:
+            pass
+    return event.created_at.timestamp()
+
+
+def apply_purchase_events(events) -> int:
+    """
+    Adds created-order ChangeEvents to the shared state row. Runs in the
+    caller's transaction (outbox.consume); returns how many were counted.
+    """
+    counter = TrendingCounter()
+    oldest = time.time() - counter.config["buckets"] * counter.config["bucket_seconds"]
+    counted = 0
+    for e in events:
+        if e.action != ChangeEvent.ACTION_CREATED or not e.product_id:
+            continue
+        at = _event_time(e)
+        if at < oldest:
+            continue
+        counter.add(e.product_id, max(1, int((e.payload or {}).get("quantity") or 1)), at=at)
+        counted += 1
+    if not counted:
+        return 0
+
+    row, _created = TrendingSketchState.objects.select_for_update().get_or_create(name=STATE_NAME)
+    shared = TrendingCounter.from_bytes(row.data or b"")
+    shared.merge(counter)
+    row.data = shared.to_bytes()
+    row.save(update_fields=["data", "updated_at"])
+    return counted
+
+
+def _load() -> TrendingCounter:
+    """
+    The shared state as of at most TRENDING_RELOAD_SECONDS ago.
+    """
+    global _shared, _shared_at, _last_load
+    with _lock:
+        if _shared is not None and time.monotonic() - _last_load < _reload_seconds():
+            return _shared
+    stamp = TrendingSketchState.objects.filter(name=STATE_NAME).values_list("updated_at", flat=True).first()
+    with _lock:
+        unchanged = _shared is not None and stamp == _shared_at
+    if unchanged:
+        shared = _shared
+    elif stamp is None:
+        shared = TrendingCounter()
+    else:
+        row = TrendingSketchState.objects.filter(name=STATE_NAME).only("data", "updated_at").first()
+        shared = TrendingCounter.from_bytes(row.data or b"") if row else TrendingCounter()
+        stamp = row.updated_at if row else None
+    with _lock:
+        _shared, _shared_at, _last_load = shared, stamp, time.monotonic()
+    return shared
+
+
+def trending_products(
+    limit: int = 10,
+    *,
+    window_seconds: Optional[int] = None,
+    now: Optional[float] = None,
+) -> List[Dict[str, Any]]:
+    """
+    [{"product_id", "units"}] heaviest first, over the shared state. units
+    are count-min estimates (upper bounds, exact for heavy hitters in
+    practice).
+    """
+    ranked = _load().top(limit, window_seconds=window_seconds, now=now)
+    return [{"product_id": pid, "units": int(n)} for pid, n in ranked]
+
+
+def reset_trending() -> None:
+    global _shared, _shared_at, _last_load
+    with _lock:
+        _shared = None
+        _shared_at = None
+        _last_load = 0.0
@@ -19,6 +19,12 @@ urlpatterns = [
     path("ai/recommendations/", views.recommendations),
     path("ai/insights/", views.ai_insights),
     path("ai/smart-search/", views.smart_search),
+    path("ai/circuit/", views.ai_circuit_status),
+    path("ai/trending/", views.ai_trending),
+    path("ai/reco-engines/", views.ai_reco_engines),
+    path("ai/tasks/", views.ai_tasks),
+    path("ai/llm-usage/", views.ai_llm_usage),
+    path("metrics/", views.metrics),
     path("products/<int:product_id>/", views.product_detail),
     path("products/<int:product_id>/review/", views.upsert_product_review),
     
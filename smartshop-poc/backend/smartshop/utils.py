@@ -1,6 +1,6 @@
 import hashlib
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence
 
 def reviews_signature(reviews_compact: List[Dict[str, Any]]) -> str:
     """
@@ -16,3 +16,14 @@ def purchase_signature(purchases_compact):
     """
     payload = json.dumps(purchases_compact, sort_keys=True, ensure_ascii=False)
     return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """
+    Nearest-rank percentile (pct in 0..100) of values; 0.0 when empty.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
@@ -2,24 +2,30 @@
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.db.models import Q
 from django.core.cache import cache
+from django.http import HttpResponse
 
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from .models import SmartShopProduct, SmartShopPurchaseOrder, UserAIInsight, ProductReview, ProductAIReviewDigest
+from .models import SmartShopProduct, SmartShopPurchaseOrder, ProductReview
 from .serializers import RegisterSerializer, PurchaseSerializer, ProductSerializer, ProductReviewSerializer
 from .reco_service import get_recommendations_for_user
-from .ai_insights import generate_user_insights_bullets
-from .utils import purchase_signature, reviews_signature
+from .catalog_snapshot import get_catalog_snapshot
+from .purchased_bitmap import has_purchased
+from .trending import trending_products
+from .ai_insights import get_insights_for_user
+from .permissions import IsAdminOrMetricsToken
 
+from django.db import transaction
 from django.db.models import Avg, Count
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .smart_reviews_ai import generate_product_review_digest
+from .smart_reviews_ai import review_digest_for_product
 from .gemini_assistant import call_gemini_with_session_history
+from .circuit_breaker import breaker_snapshot
+from . import llm_accounting, perf, reco_engines, tasks
 
 # Smart Search AI helpers (you already imported these earlier)
 from .smart_search_ai import (
@@ -80,11 +86,13 @@ def buy_product(request):
     except SmartShopProduct.DoesNotExist:
         return Response({"detail": "Product not found."}, status=404)
 
-    po = SmartShopPurchaseOrder.objects.create(
-        user=request.user,
-        product=product,
-        quantity=max(1, qty),
-    )
+    # The order and its outbox event commit together
+    with transaction.atomic():
+        po = SmartShopPurchaseOrder.objects.create(
+            user=request.user,
+            product=product,
+            quantity=max(1, qty),
+        )
     return Response({"ok": True, "purchase_id": po.id})
 
 
@@ -95,70 +103,92 @@ def buy_product(request):
 @permission_classes([IsAuthenticated])
 def recommendations(request):
     force = request.query_params.get("force") == "1"
-    data = get_recommendations_for_user(request.user, max_items=4, force=force)
+    engine = request.query_params.get("engine") or None
+    try:
+        data = get_recommendations_for_user(request.user, max_items=4, force=force, engine=engine)
+    except ValueError as e:
+        return Response({"detail": str(e)}, status=400)
     return Response(data)
 
 
 # ----------------------------
-# AI: INSIGHTS (cached)
+# AI: RECOMMENDATION ENGINES (latency / shadow overlap)
 # ----------------------------
 @api_view(["GET"])
-@permission_classes([IsAuthenticated])
-def ai_insights(request):
-    user = request.user
+@permission_classes([IsAdminOrMetricsToken])
+def ai_reco_engines(request):
+    return Response(reco_engines.engine_report())
 
-    purchases_qs = (
-        SmartShopPurchaseOrder.objects
-        .filter(user=user)
-        .select_related("product")
-        .order_by("-purchase_date")[:15]
-    )
 
-    purchases_compact = [
-        {"name": p.product.name, "category": p.product.category, "price": float(p.product.price), "qty": p.quantity}
-        for p in purchases_qs
-    ]
+# ----------------------------
+# AI: GEMINI CIRCUIT STATE (metrics)
+# ----------------------------
+@api_view(["GET"])
+@permission_classes([IsAdminOrMetricsToken])
+def ai_circuit_status(request):
+    return Response({"breakers": breaker_snapshot()})
 
-    sig = purchase_signature(purchases_compact)
-    force = request.query_params.get("force") == "1"
 
-    cached = UserAIInsight.objects.filter(user=user).first()
-    if (not force) and cached and cached.purchase_signature == sig and cached.bullets_json:
-        return Response({
-            "cached": True,
-            "signature": sig,
-            "bullets": cached.bullets_json,
-            "text": cached.text,
-            "updated_at": cached.updated_at,
-        })
-
-    # recommendations list (fast)
-    rec_data = get_recommendations_for_user(user, max_items=4, force=False)
-    recs = rec_data.get("recommended", [])
-
-    bullets = generate_user_insights_bullets(
-        api_key=getattr(settings, "GEMINI_API_KEY", None),
-        model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-        username=user.username,
-        purchases=purchases_compact,
-        recs=recs,
-    )
+# ----------------------------
+# TRENDING NOW (sliding-window heavy hitters)
+# ----------------------------
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def ai_trending(request):
+    """
+    GET /api/ai/trending/?limit=10&hours=24
+    """
+    try:
+        limit = max(1, min(50, int(request.query_params.get("limit") or 10)))
+        hours = int(request.query_params.get("hours") or 0)
+    except ValueError:
+        return Response({"detail": "limit and hours must be integers."}, status=400)
 
-    if not cached:
-        cached = UserAIInsight(user=user)
+    ranked = trending_products(limit=limit, window_seconds=hours * 3600 or None)
+    snap = get_catalog_snapshot()
+    units = {row["product_id"]: row["units"] for row in ranked}
+    products = snap.product_dicts(units, columns=("id", "name", "category", "price"))
+    for p in products:
+        p["units_estimate"] = units[p["id"]]
+    return Response({"window_hours": hours or None, "results": products})
 
-    cached.purchase_signature = sig
-    cached.bullets_json = bullets
-    cached.text = "\n".join([f"• {b}" for b in bullets])
-    cached.save()
 
-    return Response({
-        "cached": False,
-        "signature": sig,
-        "bullets": bullets,
-        "text": cached.text,
-        "updated_at": cached.updated_at,
-    })
+# ----------------------------
+# AI: BACKGROUND TASK QUEUE (depth / concurrency)
+# ----------------------------
+@api_view(["GET"])
+@permission_classes([IsAdminOrMetricsToken])
+def ai_tasks(request):
+    return Response(tasks.queue_stats())
+
+
+# ----------------------------
+# AI: GEMINI TOKEN / COST USAGE (metrics)
+# ----------------------------
+@api_view(["GET"])
+@permission_classes([IsAdminOrMetricsToken])
+def ai_llm_usage(request):
+    return Response(llm_accounting.usage_report())
+
+
+# ----------------------------
+# METRICS (Prometheus text format)
+# ----------------------------
+@api_view(["GET"])
+@permission_classes([IsAdminOrMetricsToken])
+def metrics(request):
+    text = perf.render_prometheus() + llm_accounting.render_prometheus() + reco_engines.render_prometheus() + tasks.render_prometheus()
+    return HttpResponse(text, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ----------------------------
+# AI: INSIGHTS (cached)
+# ----------------------------
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def ai_insights(request):
+    force = request.query_params.get("force") == "1"
+    return Response(get_insights_for_user(request.user, force=force))
 
 
 # ----------------------------
@@ -174,35 +204,26 @@ def smart_search(request):
     limit = int(request.query_params.get("limit") or 24)
     limit = max(1, min(limit, 50))
 
-    # categories available in DB
-    categories = list(SmartShopProduct.objects.values_list("category", flat=True).distinct())
+    snap = get_catalog_snapshot()
 
-    parsed = gemini_parse_smart_search_v2(
-        api_key=getattr(settings, "GEMINI_API_KEY", None),
-        model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-        user_query=q,
-        categories=categories,
-    )
+    # categories available in the catalog
+    categories = list(snap.categories)
+
+    with perf.span("parse"):
+        parsed = gemini_parse_smart_search_v2(
+            api_key=getattr(settings, "GEMINI_API_KEY", None),
+            model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
+            user_query=q,
+            categories=categories,
+        )
 
     # Cache whole search response for identical query+parsed constraints
     key = smart_search_cache_key(q, parsed)
     cached_payload = cache.get(key)
+    perf.record_cache("smart_search", bool(cached_payload))
     if cached_payload:
         return Response({**cached_payload, "cached": True})
 
-    qs = SmartShopProduct.objects.select_related("ai_profile").all()
-
-
-    # Apply category filter (if any)
-    if parsed.get("categories"):
-        qs = qs.filter(category__in=parsed["categories"])
-
-    # Apply price filters
-    if parsed.get("price_min") is not None:
-        qs = qs.filter(price__gte=parsed["price_min"])
-    if parsed.get("price_max") is not None:
-        qs = qs.filter(price__lte=parsed["price_max"])
-
     # Keyword matching (name + category) using parsed tokens
     tokens = []
     for t in (parsed.get("must_include") or []) + (parsed.get("keywords") or []) + (parsed.get("use_cases") or []) + (parsed.get("audience") or []):
@@ -210,69 +231,44 @@ def smart_search(request):
         if t and t not in tokens:
             tokens.append(t)
 
-    exclude_tokens = parsed.get("exclude") or []
-
-    if tokens:
-        cond = Q()
-        for t in tokens:
-            cond |= Q(name__icontains=t) | Q(category__icontains=t)
-        qs = qs.filter(cond)
-
-    for t in exclude_tokens:
-        t = str(t).strip().lower()
-        if t:
-            qs = qs.exclude(Q(name__icontains=t) | Q(category__icontains=t))
-
-    # Ordering for candidate pool (keep stable)
-    if parsed.get("sort") == "price_asc":
-        qs = qs.order_by("price")
-    elif parsed.get("sort") == "price_desc":
-        qs = qs.order_by("-price")
-    elif parsed.get("sort") == "newest":
-        qs = qs.order_by("-id")
-    else:
-        qs = qs.order_by("-id")
-
-    # Candidate pool (bigger than limit for reranking)
-    candidates = list(qs[:60])
-
-    # If nothing found, broaden (remove strict category filter)
-    if not candidates:
-        qs2 = SmartShopProduct.objects.select_related("ai_profile").all().order_by("-id")
-        if parsed.get("price_max") is not None:
-            qs2 = qs2.filter(price__lte=parsed["price_max"])
-        candidates = list(qs2[:60])
-
+    # Candidate pool (bigger than limit for reranking), filtered in the
+    # in-process catalog snapshot: category, price range, tokens, ordering
+    with perf.span("retrieval"):
+        candidate_ids = snap.filter_ids(
+            categories=parsed.get("categories") or None,
+            price_min=parsed.get("price_min"),
+            price_max=parsed.get("price_max"),
+            tokens=tokens,
+            exclude_tokens=parsed.get("exclude") or [],
+            sort=parsed.get("sort") or "relevance",
+            limit=60,
+        )
 
+        # If nothing found, broaden (remove strict category filter)
+        if not candidate_ids:
+            candidate_ids = snap.filter_ids(price_max=parsed.get("price_max"), limit=60)
 
     # Build compact candidate list for Gemini reranker (includes AI profile fields)
-    cand_compact = []
-    for p in candidates[:30]:
-        prof = getattr(p, "ai_profile", None)
-        cand_compact.append({
-            "id": p.id,
-            "name": p.name,
-            "category": p.category,
-            "price": float(p.price),
-            "ai_short_description": (getattr(prof, "short_description", "") or "").strip() if prof else "",
-            "ai_review_summary": (getattr(prof, "review_summary", "") or "").strip() if prof else "",
-        })
+    cand_compact = snap.product_dicts(candidate_ids[:30])
 
     ranked = []
     if parsed.get("intent") == "recommend":
-        ranked = gemini_rerank_with_reasons(
-            api_key=getattr(settings, "GEMINI_API_KEY", None),
-            model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-            user_query=q,
-            parsed=parsed,
-            candidates=cand_compact,
-            max_items=min(limit, 12),
-        )
+        with perf.span("rerank"):
+            ranked = gemini_rerank_with_reasons(
+                api_key=getattr(settings, "GEMINI_API_KEY", None),
+                model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
+                user_query=q,
+                parsed=parsed,
+                candidates=cand_compact,
+                max_items=min(limit, 12),
+            )
 
     # If rerank failed or intent is search, do simple relevance scoring
     if not ranked:
-        def score(p: SmartShopProduct) -> int:
-            text = f"{p.name} {p.category}".lower()
+        def score(pid: int) -> int:
+            i = snap.row(pid)
+            category = snap.category_at(i)
+            text = f"{snap.names[i]} {category}".lower()
             s = 0
             for t in parsed.get("must_include", []):
                 if t in text:
@@ -283,22 +279,23 @@ def smart_search(request):
             for t in parsed.get("use_cases", []):
                 if t in text:
                     s += 2
-            if parsed.get("categories") and p.category in parsed["categories"]:
+            if parsed.get("categories") and category in parsed["categories"]:
                 s += 2
             return s
 
-        sorted_candidates = candidates[:]
+        sorted_candidates = candidate_ids[:]
         if parsed.get("sort") == "relevance":
             sorted_candidates.sort(key=score, reverse=True)
 
-        ranked = [{"id": p.id, "reason": ""} for p in sorted_candidates[: min(limit, 12)]]
+        ranked = [{"id": pid, "reason": ""} for pid in sorted_candidates[: min(limit, 12)]]
 
     ranked_ids = [int(x["id"]) for x in ranked if isinstance(x, dict) and "id" in x]
     reason_by_id = {int(x["id"]): (x.get("reason") or "").strip() for x in ranked if isinstance(x, dict) and "id" in x}
 
     # Fetch final products (and their ai_profile if exists)
-    prod_qs = SmartShopProduct.objects.filter(id__in=ranked_ids).select_related("ai_profile")
-    prod_data = ProductSerializer(prod_qs, many=True).data
+    with perf.span("serialize"):
+        prod_qs = SmartShopProduct.objects.filter(id__in=ranked_ids).select_related("ai_profile")
+        prod_data = ProductSerializer(prod_qs, many=True).data
     by_id = {p["id"]: p for p in prod_data}
 
     results = []
@@ -364,7 +361,7 @@ def smart_search(request):
     return Response(payload)
 
 def _user_purchased_product(user, product_id: int) -> bool:
-    return SmartShopPurchaseOrder.objects.filter(user=user, product_id=product_id).exists()
+    return has_purchased(user, product_id)
 
 
 @api_view(["GET"])
@@ -391,56 +388,8 @@ def product_detail(request, product_id: int):
     data["avg_rating"] = float(data["avg_rating"] or 0.0)
     data["ratings_count"] = int(data["ratings_count"] or 0)
 
-    # Build compact reviews for signature + AI generation
-    reviews_qs = ProductReview.objects.filter(product_id=product_id).select_related("user").order_by("-updated_at")[:30]
-    reviews_compact = [
-        {"rating": r.rating, "title": r.title, "body": r.body}
-        for r in reviews_qs
-    ]
-    sig = reviews_signature(reviews_compact)
-
     # Fetch or update AI digest cache
-    digest = ProductAIReviewDigest.objects.filter(product_id=product_id).first()
-    if digest and digest.reviews_signature == sig:
-        ai_digest = {
-            "cached": True,
-            "highlights": digest.highlights_json,
-            "sample_reviews": digest.sample_reviews_json,
-            "updated_at": digest.updated_at,
-            "label": "AI-generated highlights & sample reviews (not real user reviews).",
-        }
-    else:
-        # Generate (only if we have Gemini key)
-        product_for_ai = {
-            "name": product.name,
-            "category": product.category,
-            "price": float(product.price),
-            "ai_short_description": (getattr(getattr(product, "ai_profile", None), "short_description", "") or "").strip(),
-            "ai_review_summary": (getattr(getattr(product, "ai_profile", None), "review_summary", "") or "").strip(),
-        }
-
-        ai = generate_product_review_digest(
-            api_key=getattr(settings, "GEMINI_API_KEY", None),
-            model_name=getattr(settings, "GEMINI_MODEL", "models/gemini-2.5-flash"),
-            product=product_for_ai,
-            reviews=reviews_compact,
-        )
-
-        if not digest:
-            digest = ProductAIReviewDigest(product_id=product_id)
-
-        digest.reviews_signature = sig
-        digest.highlights_json = ai.get("highlights", []) or []
-        digest.sample_reviews_json = ai.get("sample_reviews", []) or []
-        digest.save()
-
-        ai_digest = {
-            "cached": False,
-            "highlights": digest.highlights_json,
-            "sample_reviews": digest.sample_reviews_json,
-            "updated_at": digest.updated_at,
-            "label": "AI-generated highlights & sample reviews (not real user reviews).",
-        }
+    ai_digest = review_digest_for_product(product)
 
     # Can current user review?
     can_review = False
@@ -487,16 +436,19 @@ def upsert_product_review(request, product_id: int):
         rating = 5
     rating = max(1, min(rating, 5))
 
-    review, _created = ProductReview.objects.get_or_create(
-        product_id=product_id,
-        user=request.user,
-        defaults={"rating": rating, "title": title, "body": body},
-    )
-    if not _created:
-        review.rating = rating
-        review.title = title
-        review.body = body
-        review.save()
+    # The review and its outbox event commit together; the outbox "review_ai"
+    # consumer then regenerates the review digest and AI profile
+    with transaction.atomic():
+        review, _created = ProductReview.objects.get_or_create(
+            product_id=product_id,
+            user=request.user,
+            defaults={"rating": rating, "title": title, "body": body},
+        )
+        if not _created:
+            review.rating = rating
+            review.title = title
+            review.body = body
+            review.save()
 
     return Response(ProductReviewSerializer(review).data, status=status.HTTP_200_OK)
 
@@ -18,6 +18,21 @@ REGISTER_URL = "/api/auth/register/"
 AUTH_MODE = os.getenv("TEST_AUTH_MODE", "jwt")  # jwt | session | none
 
 
+@pytest.fixture(autouse=True)
+def fresh_catalog_snapshot():
+    """
+    Each test's DB is rolled back without signals, so drop the in-process
+    catalog snapshot (and trending counts) instead of reusing state built
+    from another test's rows.
+    """
+    from smartshop.catalog_snapshot import reset_catalog_snapshot
+    from smartshop.trending import reset_trending
+
+    reset_catalog_snapshot()
+    reset_trending()
+    yield
+
+
 @pytest.fixture
 def api_client():
     return APIClient()
@@ -0,0 +1,79 @@
+import os
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+
+from smartshop import reco_service
+from smartshop.als import current_als_model, reset_als_model, train_als
+from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder
+
+
+def _catalog_and_orders():
+    products = {
+        name: SmartShopProduct.objects.create(name=name, category=cat, price=Decimal("10.00"))
+        for name, cat in (
+            ("Tent", "Outdoor"), ("Sleeping Bag", "Outdoor"), ("Headlamp", "Outdoor"),
+            ("Espresso Beans", "Kitchen"), ("Milk Frother", "Kitchen"), ("Grinder", "Kitchen"),
+        )
+    }
+    User = get_user_model()
+    baskets = {
+        "camper_1": ["Tent", "Sleeping Bag", "Headlamp"],
+        "camper_2": ["Tent", "Sleeping Bag", "Headlamp"],
+        "camper_3": ["Tent", "Headlamp"],
+        "barista_1": ["Espresso Beans", "Milk Frother", "Grinder"],
+        "barista_2": ["Espresso Beans", "Milk Frother", "Grinder"],
+        "new_camper": ["Tent"],
+    }
+    users = {}
+    for username, names in baskets.items():
+        users[username] = User.objects.create_user(username=username, password="x")
+        for name in names:
+            qty = 3 if name == "Grinder" else 1
+            SmartShopPurchaseOrder.objects.create(user=users[username], product=products[name], quantity=qty)
+    return products, users
+
+
+@pytest.mark.django_db
+def test_als_factors_separate_baskets_and_use_threads():
+    products, users = _catalog_and_orders()
+    model = train_als(factors=4, iterations=10, regularization=0.05, alpha=5, threads=2)
+
+    assert model["user_factors"].dtype == np.float32 and model["item_factors"].shape == (6, 4)
+    row = int(np.searchsorted(model["user_ids"], users["new_camper"].id))
+    scores = dict(zip(model["item_ids"].tolist(), (model["item_factors"] @ model["user_factors"][row]).tolist()))
+    assert scores[products["Headlamp"].id] > scores[products["Grinder"].id]
+    assert scores[products["Sleeping Bag"].id] > scores[products["Milk Frother"].id]
+
+
+@pytest.mark.django_db
+def test_train_als_publishes_mapped_model_used_by_recommendations(tmp_path, monkeypatch):
+    products, users = _catalog_and_orders()
+    reset_als_model()
+    with override_settings(ALS_MODEL_DIR=str(tmp_path)):
+        assert current_als_model() is None
+
+        call_command("train_als", "--factors", "4", "--iterations", "10", "--threads", "1")
+        model = current_als_model()
+        assert model is not None and isinstance(model.item_factors, np.memmap)
+        assert current_als_model() is model, "Unchanged CURRENT must reuse the mapping"
+
+        recs = model.recommend(users["new_camper"].id, 2, exclude=[products["Tent"].id])
+        assert [pid for pid, _ in recs][:1] in ([products["Headlamp"].id], [products["Sleeping Bag"].id])
+        assert products["Tent"].id not in dict(recs), "Purchased products must be excluded"
+        assert model.recommend(999_999, 3) == [], "Unknown users get no ALS results"
+
+        monkeypatch.setattr(reco_service, "llm_available", lambda feature: False)
+        data = reco_service.get_recommendations_for_user(users["new_camper"], max_items=2, force=True)
+        names = {p["name"] for p in data["recommended"]}
+        assert names == {"Headlamp", "Sleeping Bag"}, f"ALS should drive the non-LLM path: {names}"
+
+        call_command("train_als", "--factors", "4", "--iterations", "5", "--keep", "1")
+        assert current_als_model().version != model.version
+        versions = [d for d in os.listdir(tmp_path) if not d.startswith(".") and d != "CURRENT"]
+        assert len(versions) == 1, f"Old versions should be pruned: {versions}"
+    reset_als_model()
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from smartshop import fake_llm
+from smartshop.llm import generate_text
+
+
+@override_settings(LLM_BACKEND="fake", LLM_FAKE_LATENCY_MS=0, LLM_FAKE_JITTER_MS=0, LLM_CACHE_ENABLED=False)
+@pytest.mark.django_db
+def test_fake_llm_returns_schema_valid_json_per_feature():
+    prompt = (
+        'Purchased products (do NOT recommend these):\n[{"id": 1, "name": "A"}]\n\n'
+        'Full product catalog:\n[{"id": 1, "name": "A"}, {"id": 2, "name": "B"}, {"id": 3, "name": "C"}]\n\n'
+        "Social proof signals from similar shoppers (optional supporting signal):\n{}\n\n"
+        "Recommend up to 2 products the user is likely to buy next."
+    )
+    data = json.loads(generate_text(api_key="x", model_name="m", prompt=prompt, feature="recommendations"))
+    ids = [r["id"] for r in data["recommended"]]
+    assert ids and 1 not in ids and len(ids) <= 2, f"Unexpected fake recommendations: {data}"
+
+    parsed = json.loads(fake_llm.fake_response("search_parse", "User query:\ncheap hiking boots\n\nAvailable"))
+    assert parsed["keywords"] == ["cheap", "hiking", "boots"], f"Unexpected parse: {parsed}"
+
+
+@pytest.mark.django_db
+def test_benchmark_endpoints_writes_json_report(tmp_path):
+    call_command("generate_synthetic_data", "--products", "30", "--users", "5", "--seed", "3")
+    out = tmp_path / "bench.json"
+
+    call_command(
+        "benchmark_endpoints",
+        "--iterations", "3",
+        "--warmup", "0",
+        "--llm-latency-ms", "0",
+        "--llm-jitter-ms", "0",
+        "--output", str(out),
+    )
+
+    report = json.loads(out.read_text())
+    assert report["meta"]["llm_backend"] == "fake"
+    assert report["meta"]["dataset"]["products"] == 30
+    for name in ("products", "product_detail", "smart_search", "recommendations", "insights", "assistant_chat"):
+        stats = report["endpoints"][name]
+        assert stats["requests"] == 3, f"{name}: {stats}"
+        assert stats["errors"] == 0, f"{name} returned errors: {stats}"
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
+        assert stats["queries_mean"] > 0, f"{name} should hit the DB: {stats}"
+
+    # Hot purchase-history queries use the composite indexes
+    for plan in report["query_plans"]:
+        assert plan["ok"], f"{plan['name']} does not use {plan['expected']}: {plan['plan']}"
+
+    # Comparing a run with itself finds no regressions
+    call_command(
+        "benchmark_endpoints",
+        "--endpoints", "products",
+        "--iterations", "3",
+        "--output", str(tmp_path / "again.json"),
+        "--baseline", str(out),
+        "--max-regression", "1000",
+        "--fail-on-regression",
+    )
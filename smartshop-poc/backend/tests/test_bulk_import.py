@@ -0,0 +1,96 @@
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from smartshop.bulk_import import bulk_set_product_images
+from smartshop.catalog_snapshot import catalog_version
+from smartshop.models import ChangeEvent, ProductReview, SmartShopProduct, SmartShopPurchaseOrder
+
+
+@pytest.mark.django_db
+def test_bulk_import_products_csv_upserts_by_name(tmp_path):
+    SmartShopProduct.objects.create(name="Yoga Mat", category="Fitness", price="18.00")
+    path = tmp_path / "products.csv"
+    path.write_text(
+        "name,category,price,image\n"
+        "Yoga Mat,Fitness,15.50,\n"
+        "Gaming Mouse,Electronics,24.50,product_images/gaming-mouse.png\n"
+        ",Broken,1.00,\n",
+        encoding="utf-8",
+    )
+
+    call_command("bulk_import", "products", str(path), chunk_size=1)
+
+    assert SmartShopProduct.objects.count() == 2
+    assert str(SmartShopProduct.objects.get(name="Yoga Mat").price) == "15.50"
+    assert SmartShopProduct.objects.get(name="Gaming Mouse").image.name == "product_images/gaming-mouse.png"
+
+
+@pytest.mark.django_db
+def test_bulk_image_fix_bumps_catalog_version_and_emits_product_events():
+    mat = SmartShopProduct.objects.create(name="Yoga Mat", category="Fitness", price="18.00")
+    SmartShopProduct.objects.create(name="Kettlebell", category="Fitness", price="30.00", image="product_images/kb.png")
+    before = catalog_version()
+    ChangeEvent.objects.all().delete()
+
+    stats = bulk_set_product_images({
+        "Yoga Mat": "product_images/yoga-mat.png",
+        "Kettlebell": "product_images/kb.png",
+        "Ghost": "product_images/ghost.png",
+    })
+
+    assert stats == {"updated": 1, "missing": 1, "skipped": 1}
+    assert catalog_version() != before, "Rendered payloads keyed on the old version must go stale"
+    events = list(ChangeEvent.objects.values_list("topic", "action", "product_id"))
+    assert events == [(ChangeEvent.TOPIC_PRODUCT, ChangeEvent.ACTION_UPDATED, mat.id)]
+
+    before = catalog_version()
+    assert bulk_set_product_images({"Yoga Mat": "product_images/yoga-mat.png"})["updated"] == 0
+    assert catalog_version() == before, "Nothing changed, nothing to bump"
+
+
+@pytest.mark.django_db
+def test_bulk_import_purchases_and_reviews_jsonl(tmp_path):
+    users = tmp_path / "users.jsonl"
+    users.write_text("\n".join(json.dumps({"username": u}) for u in ["ann", "ben"]), encoding="utf-8")
+    call_command("bulk_import", "users", str(users))
+    p = SmartShopProduct.objects.create(name="HDMI Cable 2m", category="Electronics", price="6.90")
+
+    purchases = tmp_path / "purchases.jsonl"
+    purchases.write_text("\n".join(json.dumps(r) for r in [
+        {"username": "ann", "product": "HDMI Cable 2m", "quantity": 2, "purchase_date": "2025-01-02T10:00:00"},
+        {"username": "ben", "product_id": p.id},
+        {"username": "ghost", "product_id": p.id},
+    ]), encoding="utf-8")
+    call_command("bulk_import", "purchases", str(purchases))
+
+    assert SmartShopPurchaseOrder.objects.count() == 2
+    ann_order = SmartShopPurchaseOrder.objects.get(user__username="ann")
+    assert ann_order.quantity == 2
+    assert ann_order.purchase_date.year == 2025
+
+    reviews = tmp_path / "reviews.jsonl"
+    reviews.write_text("\n".join(json.dumps(r) for r in [
+        {"username": "ann", "product_id": p.id, "rating": 9, "title": "Great"},
+        {"username": "ann", "product_id": p.id, "rating": 1},
+    ]), encoding="utf-8")
+    call_command("bulk_import", "reviews", str(reviews))
+
+    assert ProductReview.objects.count() == 1
+    assert ProductReview.objects.get().rating == 5
+    assert get_user_model().objects.get(username="ben").check_password("abc123456")
+
+
+@pytest.mark.django_db
+def test_seed_commands_rerun_without_duplicates():
+    call_command("seed_demo_users_purchases")
+    call_command("seed_demo_users_purchases")
+
+    pairs = list(SmartShopPurchaseOrder.objects.values_list("user_id", "product_id"))
+    assert SmartShopProduct.objects.count() == 20
+    assert len(pairs) == len(set(pairs)), "Reruns must not duplicate (user, product) purchases"
+
+    call_command("seed_reviews", per=2)
+    assert ProductReview.objects.count() == 40
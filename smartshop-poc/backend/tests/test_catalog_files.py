@@ -0,0 +1,117 @@
+import os
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from smartshop.also_bought import also_bought_for_user
+from smartshop.catalog_files import reset_mapped_snapshot
+from smartshop.catalog_snapshot import build_catalog_snapshot, get_catalog_snapshot
+from smartshop.models import AITask, ProductAIProfile, SmartShopProduct, SmartShopPurchaseOrder
+from smartshop.tasks import run_pending
+
+
+@pytest.mark.django_db
+def test_workers_map_catalog_files_and_pick_up_rebuilds(tmp_path):
+    lamp = SmartShopProduct.objects.create(name="Desk Lamp", category="Office", price=Decimal("19.90"))
+    chair = SmartShopProduct.objects.create(name="Ergo Chair", category="Office", price=Decimal("189.00"))
+    mug = SmartShopProduct.objects.create(name="Café Mug", category="Kitchen", price=Decimal("7.25"))
+    ProductAIProfile.objects.create(product=mug, short_description="Stoneware, 350 ml.", review_summary="Keeps heat.")
+
+    User = get_user_model()
+    alice = User.objects.create_user(username="files_alice", password="x")
+    bob = User.objects.create_user(username="files_bob", password="x")
+    carol = User.objects.create_user(username="files_carol", password="x")
+    for user, products in ((alice, [lamp, chair]), (bob, [lamp, chair, mug]), (carol, [lamp])):
+        for p in products:
+            SmartShopPurchaseOrder.objects.create(user=user, product=p)
+
+    reset_mapped_snapshot()
+    with override_settings(CATALOG_SNAPSHOT_DIR=str(tmp_path)):
+        assert get_catalog_snapshot().source == "memory", "No files yet: per-worker snapshot"
+
+        call_command("build_catalog_files")
+        mapped = get_catalog_snapshot()
+        assert mapped.source == "mmap"
+        assert get_catalog_snapshot() is mapped, "Unchanged CURRENT must reuse the mapping"
+
+        memory = build_catalog_snapshot("check")
+        assert mapped.product_dicts() == memory.product_dicts(), "Mapped columns must match the DB snapshot"
+        assert mapped.filter_ids(tokens=["café"]) == [mug.id]
+        assert mapped.filter_ids(categories=["Office"], sort="price_asc") == [lamp.id, chair.id]
+
+        # lamp buyers also bought chair (2 users) and mug (1 user)
+        assert also_bought_for_user(carol, top_n=4) == [
+            {"product_id": chair.id, "count": 2},
+            {"product_id": mug.id, "count": 1},
+        ]
+
+        SmartShopProduct.objects.create(name="Notebook", category="Office", price=Decimal("4.50"))
+        call_command("build_catalog_files", "--keep", "1")
+        rebuilt = get_catalog_snapshot()
+        assert rebuilt.version != mapped.version and "Notebook" in rebuilt.names
+        # The old mapping stays readable for requests still holding it
+        assert mapped.product_dicts([lamp.id])[0]["name"] == "Desk Lamp"
+
+        versions = [d for d in os.listdir(tmp_path) if not d.startswith(".") and d != "CURRENT"]
+        assert versions == [rebuilt.version], f"Old versions should be pruned: {versions}"
+
+    reset_mapped_snapshot()
+
+
+@pytest.mark.django_db
+def test_stale_files_fall_back_to_the_db_and_queue_a_rebuild(tmp_path):
+    lamp = SmartShopProduct.objects.create(name="Desk Lamp", category="Office", price=Decimal("19.90"))
+    reset_mapped_snapshot()
+    with override_settings(CATALOG_SNAPSHOT_DIR=str(tmp_path), CATALOG_VERSION_CHECK_SECONDS=0):
+        call_command("build_catalog_files")
+        assert get_catalog_snapshot().source == "mmap"
+
+        lamp.name = "Reading Lamp"
+        lamp.save()
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            snap = get_catalog_snapshot()
+        assert snap.source == "memory", "Files built before the edit must not be served"
+        assert snap.product_dicts([lamp.id])[0]["name"] == "Reading Lamp"
+        assert AITask.objects.filter(task_type="catalog.build_files", status=AITask.STATUS_QUEUED).count() == 1
+
+        run_pending(types=["catalog.build_files"], now=timezone.now() + timedelta(minutes=5))
+        rebuilt = get_catalog_snapshot()
+        assert rebuilt.source == "mmap" and rebuilt.product_dicts([lamp.id])[0]["name"] == "Reading Lamp"
+    reset_mapped_snapshot()
+
+
+@pytest.mark.django_db
+def test_co_purchased_score_sums_co_buyers_per_owned_product(tmp_path):
+    lamp, chair, mug, desk = [
+        SmartShopProduct.objects.create(name=n, category="Office", price=Decimal("10.00"))
+        for n in ("Lamp", "Chair", "Mug", "Desk")
+    ]
+    User = get_user_model()
+    me = User.objects.create_user(username="co_me", password="x")
+    dana = User.objects.create_user(username="co_dana", password="x")
+    erin = User.objects.create_user(username="co_erin", password="x")
+    for user, products in ((me, [lamp, chair]), (dana, [lamp, chair, mug]), (erin, [lamp, desk, desk])):
+        for p in products:
+            SmartShopPurchaseOrder.objects.create(user=user, product=p)
+
+    reset_mapped_snapshot()
+    with override_settings(CATALOG_SNAPSHOT_DIR=str(tmp_path)):
+        call_command("build_catalog_files")
+        # mug: dana shares lamp and chair with me -> 2; desk: erin shares lamp only -> 1,
+        # whatever the number of desk orders
+        assert get_catalog_snapshot().co_purchased([lamp.id, chair.id]) == [
+            {"product_id": mug.id, "count": 2},
+            {"product_id": desk.id, "count": 1},
+        ]
+    reset_mapped_snapshot()
+
+    # DB fallback: orders placed by distinct buyers of any of my products
+    assert also_bought_for_user(me, top_n=4) == [
+        {"product_id": desk.id, "count": 2},
+        {"product_id": mug.id, "count": 1},
+    ]
@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from smartshop.bulk_import import bulk_upsert_products
+from smartshop.catalog_snapshot import get_catalog_snapshot
+from smartshop.models import ProductAIProfile, SmartShopProduct
+
+
+@pytest.mark.django_db
+def test_snapshot_columns_and_filters_match_catalog():
+    lamp = SmartShopProduct.objects.create(name="Desk Lamp", category="Office", price=Decimal("19.90"))
+    chair = SmartShopProduct.objects.create(name="Ergo Chair", category="Office", price=Decimal("189.00"))
+    pack = SmartShopProduct.objects.create(name="Trail Backpack", category="Outdoors", price=Decimal("39.00"))
+    ProductAIProfile.objects.create(product=lamp, short_description="Warm LED light.", review_summary="Bright.")
+
+    snap = get_catalog_snapshot()
+    assert len(snap) == 3 and snap.ids.typecode == "q" and snap.prices.typecode == "f"
+    assert set(snap.categories) == {"Office", "Outdoors"}
+
+    lamp_row = snap.product_dicts([lamp.id])[0]
+    assert lamp_row == {
+        "id": lamp.id,
+        "name": "Desk Lamp",
+        "category": "Office",
+        "price": 19.9,
+        "ai_short_description": "Warm LED light.",
+        "ai_review_summary": "Bright.",
+    }, f"Unexpected row: {lamp_row}"
+    assert snap.product_dicts([chair.id])[0]["ai_short_description"] == ""
+
+    # float32 prices still match exact bounds
+    assert snap.filter_ids(price_min=19.90, price_max=19.90) == [lamp.id]
+    assert snap.filter_ids(categories=["Office"], sort="price_desc") == [chair.id, lamp.id]
+    assert snap.filter_ids(tokens=["outdoors"]) == [pack.id]
+    assert snap.filter_ids(tokens=["lamp", "chair"], exclude_tokens=["ergo"]) == [lamp.id]
+    assert snap.filter_ids() == [pack.id, chair.id, lamp.id], "Default order is newest first"
+
+    # Served from memory while the version is unchanged
+    with CaptureQueriesContext(connection) as ctx:
+        assert get_catalog_snapshot() is snap
+    assert not ctx.captured_queries, f"Unexpected queries: {ctx.captured_queries}"
+
+
+@pytest.mark.django_db
+def test_snapshot_rebuilds_after_saves_and_bulk_writes():
+    lamp = SmartShopProduct.objects.create(name="Desk Lamp", category="Office", price=Decimal("19.90"))
+    first = get_catalog_snapshot()
+
+    lamp.price = Decimal("17.50")
+    lamp.save()
+    second = get_catalog_snapshot()
+    assert second is not first and second.version != first.version
+    assert second.product_dicts([lamp.id])[0]["price"] == 17.5
+    assert first.product_dicts([lamp.id])[0]["price"] == 19.9, "Old snapshot must stay immutable"
+
+    bulk_upsert_products([{"name": "Notebook", "category": "Office", "price": "4.50"}])
+    third = get_catalog_snapshot()
+    assert "Notebook" in third.names, "bulk_create bypasses signals but must bump the version"
+
+
+@pytest.mark.django_db
+def test_version_is_shared_through_the_db_not_the_local_cache(settings):
+    from django.core.cache import cache
+
+    from smartshop import catalog_snapshot
+    from smartshop.models import CatalogState
+
+    SmartShopProduct.objects.create(name="Shared Lamp", category="Office", price=Decimal("12.00"))
+    snap = get_catalog_snapshot()
+    version = catalog_snapshot.catalog_version()
+
+    # Another process's local cache is empty: the version is the same
+    cache.clear()
+    catalog_snapshot._forget_version()
+    assert catalog_snapshot.catalog_version() == version
+    assert get_catalog_snapshot() is snap
+
+    # Another process writes a product (no signal here) and bumps the row
+    SmartShopProduct.objects.bulk_create([SmartShopProduct(name="Remote Lamp", category="Office", price=Decimal("13.00"))])
+    CatalogState.objects.filter(pk=1).update(version="from-another-process")
+    settings.CATALOG_VERSION_CHECK_SECONDS = 0
+    catalog_snapshot._forget_version()
+    fresh = get_catalog_snapshot()
+    assert fresh is not snap and fresh.version == "from-another-process"
+    assert len(fresh) == 2
+
+
+@pytest.mark.django_db
+def test_bump_rolls_back_with_its_transaction(settings):
+    from django.db import transaction
+
+    from smartshop import catalog_snapshot
+
+    settings.CATALOG_VERSION_CHECK_SECONDS = 0
+    before = catalog_snapshot.catalog_version()
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            assert catalog_snapshot.bump_catalog_version() == catalog_snapshot.catalog_version()
+            raise RuntimeError("rollback")
+    assert catalog_snapshot.catalog_version() == before
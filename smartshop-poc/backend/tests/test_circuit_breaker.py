@@ -0,0 +1,136 @@
+import pytest
+
+from smartshop.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from smartshop import circuit_breaker, llm
+
+
+def _breaker(**kwargs):
+    opts = {"latency_budget_ms": 100, "window": 4, "min_calls": 4, "failure_rate": 0.5, "open_seconds": 60}
+    opts.update(kwargs)
+    return CircuitBreaker("test", **opts)
+
+
+def test_opens_after_error_rate_and_rejects():
+    b = _breaker()
+    b.record_success(10)
+    b.record_success(10)
+    b.record_failure()
+    assert b.snapshot()["state"] == CLOSED
+    b.record_failure()
+
+    assert b.snapshot()["state"] == OPEN
+    assert b.allow_request() is False
+    assert b.snapshot()["rejected"] == 1
+
+
+def test_slow_calls_count_as_failures():
+    b = _breaker()
+    for _ in range(4):
+        b.record_success(500)
+    assert b.snapshot()["state"] == OPEN
+    assert b.snapshot()["slow_calls"] == 4
+
+
+def test_half_open_allows_single_probe_then_closes():
+    b = _breaker(open_seconds=0)
+    for _ in range(4):
+        b.record_failure()
+
+    assert b.snapshot()["state"] == HALF_OPEN
+    assert b.allow_request() is True
+    assert b.allow_request() is False  # probe already in flight
+    b.record_success(10)
+    assert b.snapshot()["state"] == CLOSED
+
+
+@pytest.mark.django_db
+def test_open_circuit_fails_fast_without_network(monkeypatch, settings):
+    settings.LLM_CACHE_ENABLED = False
+    circuit_breaker.reset_breakers()
+
+    def _boom(*args, **kwargs):
+        raise AssertionError("Gemini must not be called while the circuit is open")
+
+    monkeypatch.setattr(llm.genai, "Client", _boom)
+    breaker = circuit_breaker.get_breaker("search_rerank")
+    for _ in range(settings.LLM_BREAKER_WINDOW):
+        breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        llm.generate_text(api_key="k", model_name="m", prompt="p", feature="search_rerank")
+    assert llm.llm_available("search_rerank") is False
+    circuit_breaker.reset_breakers()
+
+
+@pytest.mark.django_db
+def test_circuit_status_endpoint(api_client):
+    from django.contrib.auth import get_user_model
+
+    admin = get_user_model().objects.create_user(username="breaker_admin", password="x", is_staff=True)
+    api_client.force_authenticate(user=admin)
+    resp = api_client.get("/api/ai/circuit/")
+    assert resp.status_code == 200, f"{resp.status_code} {resp.content}"
+    assert "breakers" in resp.json()
+
+
+@pytest.mark.django_db
+def test_open_circuit_fallbacks_are_not_saved(monkeypatch, settings):
+    from decimal import Decimal
+
+    from django.contrib.auth import get_user_model
+
+    from smartshop import ai_insights, smart_reviews_ai
+    from smartshop.models import ProductAIReviewDigest, SmartShopProduct, UserAIInsight
+
+    settings.GEMINI_API_KEY = "k"
+    settings.LLM_CACHE_ENABLED = False
+    circuit_breaker.reset_breakers()
+    for feature in ("insights", "review_digest"):
+        breaker = circuit_breaker.get_breaker(feature)
+        for _ in range(settings.LLM_BREAKER_WINDOW):
+            breaker.record_failure()
+    monkeypatch.setattr(ai_insights, "get_recommendations_for_user", lambda *a, **kw: {"recommended": []})
+
+    user = get_user_model().objects.create_user(username="breaker_user", password="x")
+    data = ai_insights.get_insights_for_user(user)
+    assert "temporarily unavailable" in data["bullets"][0]
+    assert not UserAIInsight.objects.filter(user=user).exists(), "Fallback must not be cached"
+
+    product = SmartShopProduct.objects.create(name="Breaker Lamp", category="Home", price=Decimal("9.00"))
+    digest = smart_reviews_ai.review_digest_for_product(product)
+    assert digest["highlights"] == [] and digest["cached"] is False
+    assert not ProductAIReviewDigest.objects.filter(product=product).exists()
+    circuit_breaker.reset_breakers()
+
+
+@pytest.mark.django_db
+def test_timed_out_or_failed_generation_is_not_saved(monkeypatch, settings):
+    from decimal import Decimal
+
+    from django.contrib.auth import get_user_model
+
+    from smartshop import ai_insights, smart_reviews_ai
+    from smartshop.models import ProductAIReviewDigest, SmartShopProduct, UserAIInsight
+
+    settings.GEMINI_API_KEY = "k"
+
+    def timed_out(**kwargs):
+        raise TimeoutError("latency budget exceeded")
+
+    monkeypatch.setattr(ai_insights, "generate_text", timed_out)
+    monkeypatch.setattr(smart_reviews_ai, "generate_text", timed_out)
+    monkeypatch.setattr(ai_insights, "get_recommendations_for_user", lambda *a, **kw: {"recommended": []})
+
+    user = get_user_model().objects.create_user(username="timeout_user", password="x")
+    data = ai_insights.get_insights_for_user(user)
+    assert data["bullets"] == ["AI Insights temporarily unavailable. (TimeoutError)"]
+    assert not UserAIInsight.objects.filter(user=user).exists(), "A timeout must not pin the fallback"
+
+    product = SmartShopProduct.objects.create(name="Timeout Lamp", category="Home", price=Decimal("9.00"))
+    digest = smart_reviews_ai.review_digest_for_product(product)
+    assert digest["highlights"] == [] and digest["cached"] is False
+    assert not ProductAIReviewDigest.objects.filter(product=product).exists(), "Nor an empty digest"
+
+    monkeypatch.setattr(ai_insights, "generate_text", lambda **kw: '{"bullets": ["Buys lamps."]}')
+    assert ai_insights.get_insights_for_user(user)["bullets"] == ["Buys lamps."]
+    assert UserAIInsight.objects.get(user=user).bullets_json == ["Buys lamps."], "The next call regenerates"
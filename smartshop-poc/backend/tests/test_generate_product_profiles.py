@@ -0,0 +1,148 @@
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from smartshop.management.commands import generate_product_profiles as cmd
+from smartshop.models import ChangeEvent, ProductAIProfile, SmartShopProduct
+
+
+@pytest.fixture
+def products(db):
+    return [
+        SmartShopProduct.objects.create(name=f"Product {i}", category="Home", price=Decimal("9.90"))
+        for i in range(5)
+    ]
+
+
+@pytest.fixture
+def fake_profile(monkeypatch):
+    calls = []
+
+    def _fake(*, api_key, model_name, product, reviews):
+        calls.append(product["id"])
+        return {"short_description": f"About {product['name']}", "keywords": ["home"]}
+
+    monkeypatch.setattr(cmd, "generate_product_profile", _fake)
+    return calls
+
+
+def test_concurrent_run_writes_profiles_then_skips(products, fake_profile, tmp_path):
+    progress = str(tmp_path / "progress.json")
+    opts = {"workers": 3, "rpm": 6000, "chunk_size": 2, "progress_file": progress}
+
+    call_command("generate_product_profiles", **opts)
+    assert ProductAIProfile.objects.count() == 5
+    assert len(fake_profile) == 5
+    assert ProductAIProfile.objects.get(product=products[0]).short_description == "About Product 0"
+
+    call_command("generate_product_profiles", **opts)
+    assert len(fake_profile) == 5, "Unchanged products should be skipped by signature"
+
+
+def test_bulk_profile_writes_emit_outbox_events(products, fake_profile, tmp_path, monkeypatch):
+    from django.db import connection
+
+    # MySQL-like backend: bulk_create leaves the new rows' ids unset
+    monkeypatch.setattr(connection.features, "can_return_columns_from_insert", False)
+    opts = {"workers": 1, "rpm": 6000, "chunk_size": 5, "progress_file": str(tmp_path / "progress.json")}
+
+    call_command("generate_product_profiles", **opts)
+    events = ChangeEvent.objects.filter(topic=ChangeEvent.TOPIC_PROFILE)
+    assert sorted(events.values_list("object_id", "product_id")) == sorted(
+        ProductAIProfile.objects.values_list("id", "product_id")
+    )
+    assert set(events.values_list("action", flat=True)) == {ChangeEvent.ACTION_CREATED}
+
+    call_command("generate_product_profiles", force=True, **opts)
+    assert events.filter(action=ChangeEvent.ACTION_UPDATED).count() == 5
+
+
+def test_retries_transient_failures(products, monkeypatch, tmp_path):
+    attempts = {}
+
+    def _flaky(*, api_key, model_name, product, reviews):
+        attempts[product["id"]] = attempts.get(product["id"], 0) + 1
+        if attempts[product["id"]] == 1:
+            raise RuntimeError("429 quota")
+        return {"short_description": "ok"}
+
+    monkeypatch.setattr(cmd, "generate_product_profile", _flaky)
+    monkeypatch.setattr("smartshop.rate_limit.time.sleep", lambda s: None)
+
+    call_command(
+        "generate_product_profiles",
+        workers=2, rpm=6000, retries=2, progress_file=str(tmp_path / "p.json"),
+    )
+    assert ProductAIProfile.objects.filter(short_description="ok").count() == 5
+    assert all(n == 2 for n in attempts.values())
+
+
+def test_batched_prompt_falls_back_to_single_calls(products, monkeypatch, settings, tmp_path):
+    from smartshop import product_profile_ai
+
+    batch_prompts = []
+    single_calls = []
+    ids = [p.id for p in products]
+
+    def _fake_generate_text(*, api_key, model_name, prompt, feature="default", **kwargs):
+        batch_prompts.append(prompt)
+        # Valid profiles for all but the first product; first one is invalid
+        profiles = [{"id": ids[0], "short_description": ""}]
+        profiles += [{"id": pid, "short_description": f"batched {pid}", "keywords": ["x"]} for pid in ids[1:]]
+        return json.dumps({"profiles": profiles})
+
+    def _fake_single(*, api_key, model_name, product, reviews):
+        single_calls.append(product["id"])
+        return {"short_description": "single"}
+
+    monkeypatch.setattr(product_profile_ai, "generate_text", _fake_generate_text)
+    monkeypatch.setattr(product_profile_ai, "generate_product_profile", _fake_single)
+    settings.GEMINI_API_KEY = "test-key"
+
+    call_command(
+        "generate_product_profiles",
+        workers=1, rpm=6000, batch_size=5, progress_file=str(tmp_path / "p.json"),
+    )
+
+    assert len(batch_prompts) == 1
+    assert single_calls == [ids[0]]
+    assert ProductAIProfile.objects.get(product_id=ids[0]).short_description == "single"
+    assert ProductAIProfile.objects.get(product_id=ids[1]).short_description == f"batched {ids[1]}"
+
+
+def test_unusable_single_profile_is_a_failure_not_a_blank_save(products, monkeypatch, tmp_path):
+    monkeypatch.setattr(cmd, "generate_product_profile", lambda **kw: {})
+    monkeypatch.setattr("smartshop.rate_limit.time.sleep", lambda s: None)
+    progress = tmp_path / "p.json"
+
+    call_command("generate_product_profiles", workers=1, rpm=6000, retries=1, progress_file=str(progress))
+
+    assert not ProductAIProfile.objects.exists()
+    assert json.loads(progress.read_text())["done_ids"] == [], "Failed products must be retried next run"
+
+
+def test_batch_mode_retries_products_the_batch_left_out(products, monkeypatch, settings, tmp_path):
+    calls = []
+
+    def _flaky_batch(*, api_key, model_name, items, throttle=None):
+        ids = [it["product"]["id"] for it in items]
+        calls.append(ids)
+        # First call: transient outage, nothing usable; then everything but the last product
+        if len(calls) == 1:
+            return {}
+        return {pid: {"short_description": f"batched {pid}"} for pid in ids if pid != products[-1].id}
+
+    monkeypatch.setattr(cmd, "generate_product_profiles_batch", _flaky_batch)
+    monkeypatch.setattr(cmd, "generate_product_profile", lambda **kw: {"short_description": "single"})
+    monkeypatch.setattr("smartshop.rate_limit.time.sleep", lambda s: None)
+
+    call_command(
+        "generate_product_profiles",
+        workers=1, rpm=6000, retries=2, batch_size=5, progress_file=str(tmp_path / "p.json"),
+    )
+
+    assert len(calls) == 2, f"Empty batch result should be retried: {calls}"
+    assert ProductAIProfile.objects.filter(short_description__startswith="batched").count() == 4
+    assert ProductAIProfile.objects.get(product=products[-1]).short_description == "single"
@@ -0,0 +1,48 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+
+from smartshop.models import ProductAIProfile, ProductReview, SmartShopProduct, SmartShopPurchaseOrder
+
+
+def _snapshot():
+    products = list(SmartShopProduct.objects.order_by("name").values_list("name", "category", "price"))
+    purchases = list(
+        SmartShopPurchaseOrder.objects
+        .order_by("id")
+        .values_list("user__username", "product__name", "quantity")
+    )
+    return products, purchases
+
+
+@pytest.mark.django_db
+def test_generate_synthetic_data_is_deterministic_and_consistent():
+    args = ["--products", "60", "--users", "15", "--orders-per-user", "6", "--seed", "7"]
+    call_command("generate_synthetic_data", *args)
+    first = _snapshot()
+
+    assert SmartShopProduct.objects.count() == 60, f"Expected 60 products, got {SmartShopProduct.objects.count()}"
+    assert get_user_model().objects.filter(username__startswith="syn_user").count() == 15
+    assert SmartShopPurchaseOrder.objects.count() >= 15, "Every user should have at least one purchase"
+    assert ProductAIProfile.objects.count() == 60
+
+    # Reviews only come from buyers of the product
+    bought = set(SmartShopPurchaseOrder.objects.values_list("user_id", "product_id"))
+    for uid, pid in ProductReview.objects.values_list("user_id", "product_id"):
+        assert (uid, pid) in bought, f"Review by non-buyer user={uid} product={pid}"
+
+    # Power-law popularity: the most bought product clearly beats the median one
+    counts = {}
+    for _u, pid in SmartShopPurchaseOrder.objects.values_list("user_id", "product_id"):
+        counts[pid] = counts.get(pid, 0) + 1
+    ordered = sorted(counts.values(), reverse=True)
+    assert ordered[0] > ordered[len(ordered) // 2], f"Popularity not skewed: {ordered}"
+
+    SmartShopPurchaseOrder.objects.all().delete()
+    ProductReview.objects.all().delete()
+    ProductAIProfile.objects.all().delete()
+    SmartShopProduct.objects.all().delete()
+    get_user_model().objects.all().delete()
+
+    call_command("generate_synthetic_data", *args)
+    assert _snapshot() == first, "Same seed should produce the same dataset"
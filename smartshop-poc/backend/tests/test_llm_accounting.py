@@ -0,0 +1,76 @@
+import pytest
+from django.test import override_settings
+
+from smartshop import llm_accounting
+from smartshop.circuit_breaker import reset_breakers
+from smartshop.llm import generate_text
+from smartshop.llm_cache import clear_memory_cache
+
+
+@pytest.fixture(autouse=True)
+def _clean_usage():
+    llm_accounting.reset_usage()
+    reset_breakers()
+    clear_memory_cache()
+    yield
+    llm_accounting.reset_usage()
+
+
+@override_settings(
+    LLM_PRICING_PER_MILLION={"models/test": (1.0, 2.0)},
+    LLM_PROMPT_TOKEN_BUDGETS={"insights": 10},
+)
+def test_report_ranks_features_by_cost_and_counts_over_budget():
+    llm_accounting.record_call("insights", model="models/test", tokens_in=40, tokens_out=10, latency_ms=120)
+    llm_accounting.record_call("insights", model="models/test", tokens_in=5, tokens_out=5, latency_ms=80)
+    llm_accounting.record_call("search_parse", model="models/test", tokens_in=4, tokens_out=2, latency_ms=30)
+
+    report = llm_accounting.usage_report()
+    first = report["features"][0]
+
+    assert first["feature"] == "insights", f"Most expensive feature should come first: {report}"
+    assert first["calls"] == 2 and first["tokens_in"] == 45
+    assert first["over_budget"] == 1, f"Only the 40-token prompt is over budget: {first}"
+    assert first["cost_usd"] == pytest.approx((45 * 1.0 + 15 * 2.0) / 1_000_000)
+    assert first["window"]["tokens_in_histogram"]["le_250"] == 2
+    assert report["total_tokens"] == 66
+
+
+@override_settings(LLM_BACKEND="fake", LLM_FAKE_LATENCY_MS=0, LLM_FAKE_JITTER_MS=0)
+@pytest.mark.django_db
+def test_generate_text_records_calls_and_cache_hits():
+    prompt = 'User query:\nwireless mouse\n\nAvailable'
+    generate_text(api_key="x", model_name="models/test", prompt=prompt, feature="search_parse")
+    generate_text(api_key="x", model_name="models/test", prompt=prompt, feature="search_parse")
+
+    usage = {f["feature"]: f for f in llm_accounting.usage_report()["features"]}["search_parse"]
+    assert usage["calls"] == 1, f"Second call should be served from the response cache: {usage}"
+    assert usage["cache_hits"] == 1
+    assert usage["tokens_in"] == (len(prompt) + 3) // 4, "Fake backend has no usage metadata -> estimate"
+    assert usage["models"] == ["models/test"]
+
+
+@override_settings(LLM_ACCOUNTING_WINDOW=2)
+def test_prometheus_prompt_token_histogram_is_cumulative():
+    def series():
+        text = llm_accounting.render_prometheus()
+        return {
+            line.rsplit(" ", 1)[0]: int(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if line.startswith("smartshop_llm_prompt_tokens")
+        }
+
+    for tokens in (100, 3000, 50_000):
+        llm_accounting.record_call("insights", model="m", tokens_in=tokens, tokens_out=0, latency_ms=10)
+    first = series()
+    assert first['smartshop_llm_prompt_tokens_count{feature="insights"}'] == 3, "Not capped by the window"
+    assert first['smartshop_llm_prompt_tokens_sum{feature="insights"}'] == 53_100
+    assert first['smartshop_llm_prompt_tokens_bucket{feature="insights",le="250"}'] == 1
+    assert first['smartshop_llm_prompt_tokens_bucket{feature="insights",le="4000"}'] == 2
+    assert first['smartshop_llm_prompt_tokens_bucket{feature="insights",le="+Inf"}'] == 3
+
+    # Small prompts push the large ones out of the window; no series goes down
+    for _ in range(3):
+        llm_accounting.record_call("insights", model="m", tokens_in=10, tokens_out=0, latency_ms=10)
+    second = series()
+    assert all(second[k] >= v for k, v in first.items()), f"Histogram went down: {first} -> {second}"
+    assert second['smartshop_llm_prompt_tokens_bucket{feature="insights",le="32000"}'] == 5
@@ -0,0 +1,105 @@
+import pytest
+
+from smartshop import llm, llm_cache
+from smartshop.llm_cache import clear_memory_cache, prune_responses
+from smartshop.models import LLMResponseCache
+
+
+class _FakeModels:
+    def __init__(self, calls):
+        self.calls = calls
+
+    def generate_content(self, *, model, contents):
+        self.calls.append((model, contents))
+        return type("Resp", (), {"text": '{"ok": true}'})()
+
+
+@pytest.fixture
+def fake_genai(monkeypatch):
+    calls = []
+
+    class _FakeClient:
+        def __init__(self, api_key=None, **kwargs):
+            self.models = _FakeModels(calls)
+
+    monkeypatch.setattr(llm.genai, "Client", _FakeClient)
+    clear_memory_cache()
+    yield calls
+    clear_memory_cache()
+
+
+@pytest.mark.django_db
+def test_identical_prompt_hits_network_once(fake_genai):
+    a = llm.generate_text(api_key="k", model_name="m", prompt="same prompt")
+    b = llm.generate_text(api_key="k", model_name="m", prompt="same prompt")
+
+    assert a == b == '{"ok": true}'
+    assert len(fake_genai) == 1, f"Expected 1 network call, got {len(fake_genai)}"
+    assert LLMResponseCache.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_persistent_tier_survives_memory_clear(fake_genai):
+    llm.generate_text(api_key="k", model_name="m", prompt="persisted")
+    clear_memory_cache()
+    llm.generate_text(api_key="k", model_name="m", prompt="persisted")
+
+    assert len(fake_genai) == 1
+    assert LLMResponseCache.objects.get().hits == 0, "Row touched just now: the hit is only tallied"
+
+
+@pytest.mark.django_db
+def test_db_tier_hits_write_at_most_once_per_touch_window(fake_genai, settings):
+    from datetime import timedelta
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+
+    settings.LLM_CACHE_TOUCH_SECONDS = 60
+    llm.generate_text(api_key="k", model_name="m", prompt="hot")
+    with CaptureQueriesContext(connection) as ctx:
+        for _ in range(3):
+            llm_cache._memory.clear()
+            llm.generate_text(api_key="k", model_name="m", prompt="hot")
+    assert not [q for q in ctx.captured_queries if q["sql"].startswith("UPDATE")], "No write per hit"
+
+    LLMResponseCache.objects.update(last_used_at=timezone.now() - timedelta(seconds=61))
+    llm_cache._memory.clear()
+    llm.generate_text(api_key="k", model_name="m", prompt="hot")
+    row = LLMResponseCache.objects.get()
+    assert row.hits == 4, "Tallied hits are written with the next touch"
+    assert row.last_used_at > timezone.now() - timedelta(seconds=5)
+    assert len(fake_genai) == 1
+
+
+@pytest.mark.django_db
+def test_model_is_part_of_the_key(fake_genai):
+    llm.generate_text(api_key="k", model_name="m1", prompt="p")
+    llm.generate_text(api_key="k", model_name="m2", prompt="p")
+    assert len(fake_genai) == 2
+
+
+@pytest.mark.django_db
+def test_fake_backend_responses_never_answer_real_traffic(fake_genai, settings):
+    settings.LLM_BACKEND = "fake"
+    settings.LLM_FAKE_LATENCY_MS = 0
+    settings.LLM_FAKE_JITTER_MS = 0
+    llm.generate_text(api_key="k", model_name="m", prompt="p", feature="insights")
+    assert len(fake_genai) == 0
+
+    settings.LLM_BACKEND = "gemini"
+    clear_memory_cache()
+    assert llm.generate_text(api_key="k", model_name="m", prompt="p", feature="insights") == '{"ok": true}'
+    assert len(fake_genai) == 1, "A cached fake response must not be served to the real backend"
+
+
+@pytest.mark.django_db
+def test_prune_keeps_most_recently_used(fake_genai):
+    for i in range(5):
+        llm.generate_text(api_key="k", model_name="m", prompt=f"p{i}")
+
+    deleted = prune_responses(max_rows=2)
+
+    assert deleted == 3
+    assert LLMResponseCache.objects.count() == 2
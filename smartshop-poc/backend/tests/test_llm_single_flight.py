@@ -0,0 +1,64 @@
+import threading
+import time
+
+from smartshop.llm import prompt_key, single_flight
+
+
+def test_concurrent_identical_calls_share_one_result():
+    calls = []
+    results = []
+    start = threading.Barrier(8)
+
+    def slow_call():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"ok": True}
+
+    def worker():
+        start.wait()
+        results.append(single_flight("same-key", slow_call))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1, f"Expected one underlying call, got {len(calls)}"
+    assert results == [{"ok": True}] * 8
+
+
+def test_leader_error_is_shared_with_waiters():
+    errors = []
+    start = threading.Barrier(4)
+
+    def failing_call():
+        time.sleep(0.1)
+        raise RuntimeError("gemini down")
+
+    def worker():
+        start.wait()
+        try:
+            single_flight("failing-key", failing_call)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == ["gemini down"] * 4
+
+
+def test_key_is_released_after_call():
+    assert single_flight("k", lambda: 1) == 1
+    assert single_flight("k", lambda: 2) == 2
+
+
+def test_prompt_key_depends_on_model_and_params():
+    base = prompt_key("m1", "hello")
+    assert base == prompt_key("m1", "hello")
+    assert base != prompt_key("m2", "hello")
+    assert base != prompt_key("m1", "hello", temperature=0.2)
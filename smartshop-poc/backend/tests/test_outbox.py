@@ -0,0 +1,205 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from smartshop import outbox
+from smartshop.bulk_import import bulk_create_purchases, bulk_create_reviews, bulk_upsert_products
+from smartshop.models import (
+    AITask,
+    ChangeConsumerCursor,
+    ChangeEvent,
+    ProductDailySales,
+    ProductReview,
+    SmartShopProduct,
+    SmartShopPurchaseOrder,
+)
+from smartshop.popularity import rebuild_daily_sales
+
+
+def _later():
+    return timezone.now() + timedelta(seconds=60)
+
+
+@pytest.fixture
+def seen():
+    events = []
+    outbox.outbox_consumer("test.seen", topics=(ChangeEvent.TOPIC_PURCHASE,))(events.extend)
+    yield events
+    outbox._consumers.pop("test.seen", None)
+
+
+@pytest.mark.django_db
+def test_buy_writes_event_in_the_same_transaction_and_queues_consumers():
+    user = get_user_model().objects.create_user(username="outbox_buyer", password="x")
+    product = SmartShopProduct.objects.create(name="Kettle", category="Home", price=Decimal("20.00"))
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        resp = client.post("/api/purchases/buy/", {"product_id": product.id, "quantity": 2}, format="json")
+    assert resp.status_code == 200
+
+    event = ChangeEvent.objects.get(topic=ChangeEvent.TOPIC_PURCHASE)
+    assert (event.action, event.object_id, event.user_id, event.product_id) == (
+        ChangeEvent.ACTION_CREATED, resp.json()["purchase_id"], user.id, product.id,
+    )
+    assert event.payload["quantity"] == 2
+    assert AITask.objects.filter(task_type="outbox.consume", status=AITask.STATUS_QUEUED).count() == 1
+
+
+@pytest.mark.django_db
+def test_consumer_cursor_sees_each_event_once(seen):
+    user = get_user_model().objects.create_user(username="outbox_cursor", password="x")
+    product = SmartShopProduct.objects.create(name="Mug", category="Home", price=Decimal("5.00"))
+    orders = [SmartShopPurchaseOrder.objects.create(user=user, product=product) for _ in range(3)]
+
+    assert outbox.consume("test.seen", batch_size=2) == 3, "Other topics' ids are not gaps"
+    assert ChangeConsumerCursor.objects.get(name="test.seen").gaps == []
+    assert [e.object_id for e in seen] == [o.id for o in orders]
+    assert outbox.consume("test.seen", now=_later()) == 0
+
+    SmartShopPurchaseOrder.objects.create(user=user, product=product)
+    assert outbox.consume("test.seen", now=_later()) == 1
+    assert ChangeConsumerCursor.objects.get(name="test.seen").last_event_id == seen[-1].id
+    assert outbox.consumer_lag()["test.seen"]["pending"] == 0
+
+
+@pytest.mark.django_db
+def test_failing_consumer_does_not_move_its_cursor():
+    user = get_user_model().objects.create_user(username="outbox_fail", password="x")
+    product = SmartShopProduct.objects.create(name="Plate", category="Home", price=Decimal("4.00"))
+    SmartShopPurchaseOrder.objects.create(user=user, product=product)
+
+    def boom(events):
+        raise RuntimeError("down")
+
+    outbox.outbox_consumer("test.boom")(boom)
+    try:
+        with pytest.raises(RuntimeError):
+            outbox.consume("test.boom", now=_later())
+        assert ChangeConsumerCursor.objects.filter(name="test.boom", last_event_id__gt=0).count() == 0
+    finally:
+        outbox._consumers.pop("test.boom", None)
+
+
+@pytest.mark.django_db
+def test_popularity_consumer_applies_new_and_deleted_orders():
+    user = get_user_model().objects.create_user(username="outbox_pop", password="x")
+    product = SmartShopProduct.objects.create(name="Pan", category="Kitchen", price=Decimal("30.00"))
+    keep = SmartShopPurchaseOrder.objects.create(user=user, product=product, quantity=2)
+    drop = SmartShopPurchaseOrder.objects.create(user=user, product=product, quantity=3)
+
+    outbox.consume("popularity", now=_later())
+    row = ProductDailySales.objects.get(product=product)
+    assert (row.orders, row.units) == (2, 5)
+
+    drop.delete()
+    # Created and deleted in the same round: nets out to nothing
+    ghost = SmartShopPurchaseOrder.objects.create(user=user, product=product, quantity=7)
+    ghost.delete()
+    outbox.consume("popularity", now=_later())
+    row.refresh_from_db()
+    assert (row.orders, row.units) == (1, 2)
+
+    assert rebuild_daily_sales() == 1
+    row = ProductDailySales.objects.get(product=product)
+    assert (row.orders, row.units) == (1, keep.quantity), "Incremental result matches a full rebuild"
+
+
+@pytest.mark.django_db
+def test_bulk_import_and_reviews_emit_events():
+    user = get_user_model().objects.create_user(username="outbox_bulk", password="x")
+    product = SmartShopProduct.objects.create(name="Bowl", category="Kitchen", price=Decimal("8.00"))
+
+    bulk_create_purchases([{"user_id": user.id, "product_id": product.id, "quantity": 4}] * 2)
+    bulk_events = ChangeEvent.objects.filter(topic=ChangeEvent.TOPIC_PURCHASE)
+    assert sorted(bulk_events.values_list("object_id", flat=True)) == sorted(
+        SmartShopPurchaseOrder.objects.values_list("id", flat=True)
+    )
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+    resp = client.post(f"/api/products/{product.id}/review/", {"rating": 4, "body": "Solid"}, format="json")
+    assert resp.status_code == 200
+    assert ChangeEvent.objects.filter(topic=ChangeEvent.TOPIC_REVIEW, product_id=product.id).exists()
+
+    outbox.consume("review_ai")
+    queued = set(AITask.objects.filter(status=AITask.STATUS_QUEUED).values_list("task_type", "dedupe_key"))
+    assert {("reviews.digest", str(product.id)), ("profiles.generate", str(product.id))} <= queued
+
+
+@pytest.mark.django_db
+def test_bulk_import_events_carry_ids_when_the_backend_returns_none(monkeypatch):
+    from django.db import connection
+
+    user = get_user_model().objects.create_user(username="outbox_noreturn", password="x")
+    SmartShopPurchaseOrder.objects.create(
+        user=user, product=SmartShopProduct.objects.create(name="Old", category="Home", price=Decimal("1.00")),
+    )
+    before = ChangeEvent.objects.order_by("-id").values_list("id", flat=True).first()
+    # MySQL-like backend: bulk_create leaves the new rows' ids unset
+    monkeypatch.setattr(connection.features, "can_return_columns_from_insert", False)
+
+    bulk_upsert_products([
+        {"name": "Cup", "category": "Kitchen", "price": "3.00"},
+        {"name": "Jar", "category": "Kitchen", "price": "4.00"},
+    ])
+    bulk_create_purchases([
+        {"user_id": user.id, "product": "Cup", "quantity": 2},
+        {"user_id": user.id, "product": "Cup", "quantity": 2},
+        {"user_id": user.id, "product": "Jar"},
+    ])
+    bulk_create_reviews([{"user_id": user.id, "product": "Jar", "rating": 5}])
+
+    def event_ids(topic):
+        return sorted(ChangeEvent.objects.filter(topic=topic, id__gt=before).values_list("object_id", flat=True))
+
+    new = {"product__name__in": ["Cup", "Jar"]}
+    assert event_ids(ChangeEvent.TOPIC_PRODUCT) == sorted(
+        SmartShopProduct.objects.filter(name__in=["Cup", "Jar"]).values_list("id", flat=True)
+    )
+    assert event_ids(ChangeEvent.TOPIC_PURCHASE) == sorted(
+        SmartShopPurchaseOrder.objects.filter(**new).values_list("id", flat=True)
+    )
+    assert event_ids(ChangeEvent.TOPIC_REVIEW) == list(ProductReview.objects.values_list("id", flat=True))
+
+
+@pytest.mark.django_db
+@override_settings(OUTBOX_GAP_TIMEOUT_SECONDS=300)
+def test_event_committed_late_below_the_cursor_is_still_delivered(seen):
+    user = get_user_model().objects.create_user(username="outbox_late", password="x")
+    product = SmartShopProduct.objects.create(name="Tray", category="Home", price=Decimal("6.00"))
+    outbox.consume("test.seen")
+    first, slow, last = [SmartShopPurchaseOrder.objects.create(user=user, product=product) for _ in range(3)]
+
+    # The slow writer's transaction has not committed yet: its event is invisible
+    late_event = ChangeEvent.objects.get(topic=ChangeEvent.TOPIC_PURCHASE, object_id=slow.id)
+    late_id = late_event.id
+    late_event.delete()
+    assert outbox.consume("test.seen") == 2
+    cursor = ChangeConsumerCursor.objects.get(name="test.seen")
+    assert cursor.last_event_id > late_id and [g[:2] for g in cursor.gaps] == [[late_id, late_id]]
+    assert outbox.consumer_lag()["test.seen"]["gaps"] == 1
+
+    # ... now it commits, below the cursor
+    late_event.id = late_id
+    late_event.save(force_insert=True)
+    assert outbox.consumer_lag()["test.seen"]["pending"] == 1
+    assert outbox.consume("test.seen") == 1
+    assert [e.object_id for e in seen] == [first.id, last.id, slow.id]
+    assert ChangeConsumerCursor.objects.get(name="test.seen").gaps == []
+    assert outbox.consume("test.seen") == 0, "Delivered once"
+
+    # A gap that never fills (rolled back) is dropped after the timeout
+    SmartShopPurchaseOrder.objects.create(user=user, product=product)
+    ChangeEvent.objects.order_by("-id").first().delete()
+    SmartShopPurchaseOrder.objects.create(user=user, product=product)
+    outbox.consume("test.seen")
+    assert len(ChangeConsumerCursor.objects.get(name="test.seen").gaps) == 1
+    outbox.consume("test.seen", now=timezone.now() + timedelta(seconds=301))
+    assert ChangeConsumerCursor.objects.get(name="test.seen").gaps == []
@@ -0,0 +1,66 @@
+import pytest
+from django.test import override_settings
+
+from smartshop import perf
+from smartshop.models import SmartShopProduct
+
+
+@pytest.fixture(autouse=True)
+def _clean_metrics():
+    perf.reset_metrics()
+    yield
+    perf.reset_metrics()
+
+
+@pytest.mark.django_db
+def test_server_timing_header_reports_db_and_total(api_client):
+    SmartShopProduct.objects.create(name="Desk Lamp", category="Office", price="19.90")
+
+    resp = api_client.get("/api/products/")
+
+    assert resp.status_code == 200
+    header = resp["Server-Timing"]
+    assert header.startswith("total;dur="), f"Unexpected Server-Timing: {header}"
+    assert 'db;dur=' in header and "queries" in header, f"DB timing missing: {header}"
+
+
+@override_settings(LLM_BACKEND="fake", LLM_FAKE_LATENCY_MS=0, LLM_FAKE_JITTER_MS=0, GEMINI_API_KEY="x")
+@pytest.mark.django_db
+def test_smart_search_spans_and_prometheus_endpoint(api_client):
+    SmartShopProduct.objects.create(name="Trail Backpack", category="Outdoors", price="39.00")
+
+    resp = api_client.get("/api/ai/smart-search/", {"q": "recommend a backpack for hiking"})
+
+    assert resp.status_code == 200
+    header = resp["Server-Timing"]
+    for part in ("parse;dur=", "retrieval;dur=", "rerank;dur=", "llm;dur="):
+        assert part in header, f"{part} missing from Server-Timing: {header}"
+
+    with override_settings(METRICS_TOKEN="scrape-me"):
+        text = api_client.get("/api/metrics/", HTTP_X_METRICS_TOKEN="scrape-me").content.decode()
+    assert 'smartshop_http_requests_total{endpoint="/api/ai/smart-search/",method="GET",status="200"} 1' in text
+    assert 'smartshop_span_seconds_total{endpoint="/api/ai/smart-search/",span="rerank"}' in text
+    assert 'smartshop_llm_calls_total{feature="search_parse"}' in text
+    assert 'smartshop_llm_tokens_total{feature="search_rerank",direction="in"}' in text
+    assert 'smartshop_cache_requests_total{cache="smart_search",result="miss"} 1' in text
+
+
+@pytest.mark.django_db
+@override_settings(METRICS_TOKEN="scrape-me")
+def test_diagnostics_endpoints_need_staff_or_metrics_token(api_client):
+    from django.contrib.auth import get_user_model
+
+    urls = ["/api/metrics/", "/api/ai/tasks/", "/api/ai/llm-usage/", "/api/ai/reco-engines/", "/api/ai/circuit/"]
+    for url in urls:
+        assert api_client.get(url).status_code in (401, 403), f"{url} must not be public"
+        assert api_client.get(url, HTTP_X_METRICS_TOKEN="wrong").status_code in (401, 403), url
+        assert api_client.get(url, HTTP_X_METRICS_TOKEN="scrape-me").status_code == 200, url
+
+    user = get_user_model().objects.create_user(username="plain_user", password="x")
+    api_client.force_authenticate(user=user)
+    assert api_client.get("/api/ai/tasks/").status_code == 403
+
+    admin = get_user_model().objects.create_user(username="ops", password="x", is_staff=True)
+    api_client.force_authenticate(user=admin)
+    for url in urls:
+        assert api_client.get(url).status_code == 200, url
@@ -0,0 +1,131 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from smartshop.models import ChangeEvent, ProductDailySales, ProductPopularity, SmartShopProduct, SmartShopPurchaseOrder
+from smartshop import outbox
+from smartshop.popularity import popular_product_ids, price_band
+from smartshop.reco_service import _fallback_recommendations_for_user
+
+
+def _products():
+    specs = [
+        ("Desk Lamp", "Office", "19.90"),
+        ("Ergo Chair", "Office", "189.00"),
+        ("Notebook", "Office", "4.50"),
+        ("Trail Backpack", "Outdoors", "39.00"),
+        ("Tent", "Outdoors", "120.00"),
+        ("Water Bottle", "Outdoors", "9.00"),
+    ]
+    return {
+        name: SmartShopProduct.objects.create(name=name, category=cat, price=Decimal(price))
+        for name, cat, price in specs
+    }
+
+
+def _buy(user, product, qty=1, days_ago=0):
+    return SmartShopPurchaseOrder.objects.create(
+        user=user, product=product, quantity=qty, purchase_date=timezone.now() - timedelta(days=days_ago),
+    )
+
+
+@pytest.mark.django_db
+def test_refresh_is_incremental_and_rankings_follow_windows():
+    p = _products()
+    User = get_user_model()
+    u1 = User.objects.create_user(username="pop_u1", password="x")
+    u2 = User.objects.create_user(username="pop_u2", password="x")
+
+    _buy(u1, p["Tent"], qty=5, days_ago=200)       # old best seller
+    _buy(u1, p["Water Bottle"], qty=2, days_ago=1)
+    _buy(u2, p["Water Bottle"], qty=1, days_ago=2)
+    _buy(u2, p["Desk Lamp"], qty=1, days_ago=3)
+
+    call_command("refresh_popularity")
+    assert ProductDailySales.objects.count() == 4
+
+    recent = popular_product_ids(window_days=30, limit=3)
+    assert recent[:2] == [p["Water Bottle"].id, p["Desk Lamp"].id], f"Unexpected 30d ranking: {recent}"
+    all_time = popular_product_ids(window_days=0, limit=1)
+    assert all_time == [p["Tent"].id], f"Unexpected all-time ranking: {all_time}"
+    # The 30d window is short, so the all-time ranking fills the remaining slot
+    assert recent[2] == p["Tent"].id
+
+    outdoors = popular_product_ids(scope="category", value="Outdoors", window_days=0, limit=5)
+    assert outdoors == [p["Tent"].id, p["Water Bottle"].id]
+    band = popular_product_ids(scope="price_band", value=price_band("9.00"), window_days=0, limit=5)
+    assert p["Water Bottle"].id in band and p["Tent"].id not in band
+
+    # Daily sales follow the purchase events: only new ones are applied
+    assert outbox.consume("popularity") == 0
+    _buy(u2, p["Water Bottle"], qty=3, days_ago=1)
+    assert outbox.consume("popularity") == 1
+    units = sum(ProductDailySales.objects.filter(product=p["Water Bottle"]).values_list("units", flat=True))
+    assert units == 6, f"Expected 6 units after incremental refresh, got {units}"
+
+    # A rebuild gives the same totals
+    call_command("refresh_popularity", "--rebuild")
+    units = sum(ProductDailySales.objects.filter(product=p["Water Bottle"]).values_list("units", flat=True))
+    assert units == 6
+
+
+@pytest.mark.django_db
+def test_order_committed_late_below_a_newer_one_is_still_counted():
+    p = _products()
+    user = get_user_model().objects.create_user(username="pop_late", password="x")
+    slow = _buy(user, p["Tent"], qty=2)
+    _buy(user, p["Tent"], qty=1)
+
+    # The slow order's transaction has not committed when the consumer runs
+    late_event = ChangeEvent.objects.get(topic=ChangeEvent.TOPIC_PURCHASE, object_id=slow.id)
+    late_id = late_event.id
+    late_event.delete()
+    outbox.consume("popularity")
+    assert ProductDailySales.objects.get(product=p["Tent"]).units == 1
+
+    late_event.id = late_id
+    late_event.save(force_insert=True)
+    outbox.consume("popularity")
+    assert ProductDailySales.objects.get(product=p["Tent"]).units == 3, "The late order is folded in too"
+
+
+@pytest.mark.django_db
+def test_fallback_reads_rankings_with_few_queries():
+    p = _products()
+    User = get_user_model()
+    buyer = User.objects.create_user(username="pop_buyer", password="x")
+    fan = User.objects.create_user(username="pop_fan", password="x")
+    newbie = User.objects.create_user(username="pop_newbie", password="x")
+
+    _buy(fan, p["Ergo Chair"], qty=4)
+    _buy(fan, p["Tent"], qty=3)
+    _buy(fan, p["Desk Lamp"], qty=1)
+    _buy(buyer, p["Desk Lamp"], qty=1)
+    call_command("refresh_popularity")
+
+    # Office buyer: best-selling unpurchased Office product first (not the cheapest)
+    recs = _fallback_recommendations_for_user(buyer, max_items=2)
+    assert [r.name for r in recs] == ["Ergo Chair", "Tent"], f"Unexpected fallback: {[r.name for r in recs]}"
+
+    # Cold start: overall best sellers
+    with CaptureQueriesContext(connection) as ctx:
+        recs = _fallback_recommendations_for_user(newbie, max_items=2)
+    assert [r.name for r in recs] == ["Ergo Chair", "Tent"]
+    assert len(ctx.captured_queries) <= 5, f"Too many queries: {len(ctx.captured_queries)}"
+
+
+@pytest.mark.django_db
+def test_fallback_without_rankings_uses_cheapest_same_category_first():
+    p = _products()
+    user = get_user_model().objects.create_user(username="pop_empty", password="x")
+    _buy(user, p["Desk Lamp"])
+
+    assert not ProductPopularity.objects.exists()
+    recs = _fallback_recommendations_for_user(user, max_items=3)
+    assert [r.name for r in recs] == ["Notebook", "Ergo Chair", "Water Bottle"]
@@ -0,0 +1,57 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+
+from smartshop.llm import estimate_tokens
+from smartshop.prompt_builder import encode_products, encode_table
+
+
+ROWS = [
+    {"id": 1, "name": "Gaming Mouse", "category": "Electronics", "price": 24.5, "ai_short_description": "x" * 300},
+    {"id": 2, "name": "Desk|Lamp", "category": "Office", "price": 19.0, "ai_short_description": "Warm light"},
+    {"id": 3, "name": "USB Cable", "category": "Electronics", "price": 4.99, "ai_short_description": ""},
+]
+
+
+def test_encode_table_uses_header_category_codes_and_escapes_delimiters():
+    text = encode_table(ROWS, ("id", "name", "category", "price"))
+    lines = text.splitlines()
+
+    assert lines[0] == "CATEGORIES: C1=Electronics; C2=Office"
+    assert lines[1] == "id|name|cat|price"
+    assert lines[2] == "1|Gaming Mouse|C1|24.5"
+    assert lines[3] == "2|Desk/Lamp|C2|19", f"Pipe in a value must not break the row: {lines[3]}"
+    assert lines[4] == "3|USB Cable|C1|4.99"
+
+
+def test_encode_table_respects_token_budget():
+    columns = ("id", "name", "category", "price", "ai_short_description")
+    full = encode_table(ROWS, columns, max_chars={"ai_short_description": 400})
+    budget = estimate_tokens(full) // 2
+
+    text = encode_table(ROWS, columns, max_chars={"ai_short_description": 400}, token_budget=budget)
+
+    assert estimate_tokens(text) <= budget, f"Over budget: {estimate_tokens(text)} > {budget}"
+    assert text.splitlines()[2].startswith("1|Gaming Mouse|"), "Highest-priority row should be kept"
+
+
+def test_encode_products_falls_back_to_json():
+    with override_settings(LLM_COMPACT_PROMPTS=False):
+        data = json.loads(encode_products(ROWS[:1], ("id", "name")))
+    assert data == [{"id": 1, "name": "Gaming Mouse"}]
+
+
+@pytest.mark.django_db
+def test_evaluate_prompt_encoding_reduces_tokens_without_parse_failures(tmp_path):
+    call_command("generate_synthetic_data", "--products", "120", "--users", "6", "--seed", "5")
+    out = tmp_path / "eval.json"
+
+    call_command("evaluate_prompt_encoding", "--samples", "3", "--output", str(out))
+
+    features = json.loads(out.read_text())["features"]
+    for name, r in features.items():
+        assert r["compact"]["parse_ok"] == r["json"]["parse_ok"] == r["json"]["samples"], f"{name}: {r}"
+    assert features["recommendations"]["reduction"] > 0.3, f"Catalog prompt should shrink: {features['recommendations']}"
+    assert features["search_rerank"]["reduction"] > 0, features["search_rerank"]
@@ -0,0 +1,118 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from smartshop.also_bought import also_bought_for_user
+from smartshop.bulk_import import bulk_create_purchases
+from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder
+from smartshop.purchased_bitmap import PurchasedSet, has_purchased, purchase_state, purchased_set
+
+
+def test_purchased_set_bit_ops_and_compact_encoding():
+    s = PurchasedSet.from_ids([5, 3, 1_000_000, 3])
+    assert list(s) == [3, 5, 1_000_000] and len(s) == 3
+    assert 5 in s and 4 not in s and -1 not in s and "x" not in s
+    assert s.without([1, 3, 7, 1_000_000]) == [1, 7]
+
+    data = s.to_bytes()
+    assert len(data) < 1024, f"Sparse bitmap should compress well, got {len(data)} bytes"
+    assert list(PurchasedSet.from_bytes(data)) == [3, 5, 1_000_000]
+    assert list(PurchasedSet.from_bytes(PurchasedSet().to_bytes())) == []
+
+
+@pytest.mark.django_db
+def test_purchased_set_is_cached_per_purchase_state():
+    user = get_user_model().objects.create_user(username="bits_user", password="x")
+    lamp = SmartShopProduct.objects.create(name="Desk Lamp", category="Office", price=Decimal("19.90"))
+    chair = SmartShopProduct.objects.create(name="Ergo Chair", category="Office", price=Decimal("189.00"))
+    SmartShopPurchaseOrder.objects.create(user=user, product=lamp)
+
+    assert list(purchased_set(user)) == [lamp.id]
+    with CaptureQueriesContext(connection) as ctx:
+        bits = purchased_set(user)
+        assert has_purchased(user, lamp.id, purchased=bits) and not has_purchased(user, chair.id, purchased=bits)
+    assert len(ctx.captured_queries) == 1 and "DISTINCT" not in ctx.captured_queries[0]["sql"], (
+        "A cached set costs the purchase-state read only; checks against it are in memory"
+    )
+    with CaptureQueriesContext(connection) as ctx:
+        assert has_purchased(user, lamp.id)
+    assert len(ctx.captured_queries) == 1 and "MAX(" not in ctx.captured_queries[0]["sql"], (
+        "A lone check is one exists(), no aggregate"
+    )
+
+    SmartShopPurchaseOrder.objects.create(user=user, product=chair)
+    assert chair.id in purchased_set(user), "A new order changes the key"
+
+    SmartShopPurchaseOrder.objects.filter(user=user, product=chair).delete()
+    assert chair.id not in purchased_set(user), "So does a deleted one"
+    bulk_create_purchases([{"user_id": user.id, "product_id": chair.id}])
+    assert chair.id in purchased_set(user.id), "And a bulk import"
+
+
+@pytest.mark.django_db
+def test_recommendation_miss_reads_the_purchase_state_once(monkeypatch):
+    from smartshop import reco_service
+
+    monkeypatch.setattr(reco_service, "llm_available", lambda feature: False)
+    User = get_user_model()
+    me = User.objects.create_user(username="bits_once", password="x")
+    other = User.objects.create_user(username="bits_once_other", password="x")
+    p = [
+        SmartShopProduct.objects.create(name=f"Thing {i}", category="Home", price=Decimal(f"{i}.00"))
+        for i in range(1, 6)
+    ]
+    SmartShopPurchaseOrder.objects.create(user=me, product=p[0])
+    for prod in (p[0], p[1], p[2]):
+        SmartShopPurchaseOrder.objects.create(user=other, product=prod)
+
+    with CaptureQueriesContext(connection) as ctx:
+        data = reco_service.get_recommendations_for_user(me, max_items=3, force=True)
+    assert data["recommended"] and p[0].id not in [r["id"] for r in data["recommended"]]
+    state_reads = [q for q in ctx.captured_queries if 'MAX("smartshop_smartshoppurchaseorder"."id")' in q["sql"]]
+    assert len(state_reads) == 1, f"Purchase state read {len(state_reads)} times"
+
+
+@pytest.mark.django_db
+def test_bitmap_cached_by_another_process_is_not_served_after_a_purchase():
+    user = get_user_model().objects.create_user(username="bits_other_proc", password="x")
+    lamp = SmartShopProduct.objects.create(name="Floor Lamp", category="Home", price=Decimal("49.00"))
+    rug = SmartShopProduct.objects.create(name="Rug", category="Home", price=Decimal("99.00"))
+    SmartShopPurchaseOrder.objects.create(user=user, product=lamp)
+    old_state = purchase_state(user)
+    assert list(purchased_set(user)) == [lamp.id]
+
+    # Another worker writes an order: its post_save runs there, not here, so
+    # this process's local cache still holds the bitmap built above
+    data = cache.get(f"smartshop_purchased_bits_{user.id}_{old_state}")
+    cache.clear()
+    SmartShopPurchaseOrder.objects.create(user=user, product=rug)
+    cache.set(f"smartshop_purchased_bits_{user.id}_{old_state}", data)
+
+    assert has_purchased(user, rug.id) and has_purchased(user, lamp.id)
+
+
+@pytest.mark.django_db
+def test_also_bought_skips_own_products_in_memory():
+    User = get_user_model()
+    me = User.objects.create_user(username="bits_me", password="x")
+    other = User.objects.create_user(username="bits_other", password="x")
+    p = [
+        SmartShopProduct.objects.create(name=f"Item {i}", category="Home", price=Decimal("5.00"))
+        for i in range(4)
+    ]
+    for prod in (p[0], p[1]):
+        SmartShopPurchaseOrder.objects.create(user=me, product=prod)
+    for prod in (p[0], p[1], p[2], p[2], p[3]):
+        SmartShopPurchaseOrder.objects.create(user=other, product=prod)
+
+    with CaptureQueriesContext(connection) as ctx:
+        result = also_bought_for_user(me, top_n=4)
+    assert result == [{"product_id": p[2].id, "count": 2}, {"product_id": p[3].id, "count": 1}]
+    not_in = '"product_id" IN'
+    assert not any("NOT (" in q["sql"] and not_in in q["sql"].split("NOT (", 1)[1] for q in ctx.captured_queries), (
+        "Own products must be skipped in memory, not with NOT IN"
+    )
@@ -0,0 +1,94 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from smartshop import reco_engines, reco_service
+from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder, UserRecommendationCache
+from smartshop.reco_engines import engine_report, overlap_ratio, reset_engine_stats
+
+
+@pytest.fixture
+def shopper(db, monkeypatch):
+    monkeypatch.setattr(reco_service, "llm_available", lambda feature: False)
+    user = get_user_model().objects.create_user(username="engine_user", password="x")
+    products = [
+        SmartShopProduct.objects.create(name=f"Item {i}", category="Home", price=Decimal(f"{i}.00"))
+        for i in range(1, 7)
+    ]
+    SmartShopPurchaseOrder.objects.create(user=user, product=products[0])
+    reset_engine_stats()
+    yield user, products
+    reset_engine_stats()
+
+
+def test_overlap_ratio():
+    assert overlap_ratio([1, 2, 3, 4], [4, 3, 9]) == 0.5
+    assert overlap_ratio([], []) == 1.0 and overlap_ratio([], [1]) == 0.0
+
+
+def test_engine_chain_falls_through_and_request_can_pick_an_engine(shopper, monkeypatch):
+    user, products = shopper
+    data = reco_service.get_recommendations_for_user(user, max_items=2)
+    assert data["engine"] == "popularity", "LLM down and no ALS model: popularity answers"
+    assert reco_service.get_recommendations_for_user(user, max_items=2)["cached"] is True
+
+    monkeypatch.setitem(
+        reco_engines._engines, "newest",
+        lambda user, *, purchased, max_items: [{"id": products[-1].id, "reason": "New in."}],
+    )
+    client = APIClient()
+    client.force_authenticate(user=user)
+    r = client.get("/api/ai/recommendations/?engine=newest")
+    assert r.status_code == 200, r.content
+    body = r.json()
+    assert body["engine"] == "newest" and not body["cached"]
+    assert [p["id"] for p in body["recommended"]] == [products[-1].id]
+    cached_ids = [it["id"] for it in UserRecommendationCache.objects.get(user=user).items_json]
+    assert products[-1].id not in cached_ids, "Explicit-engine requests must not overwrite the cache"
+
+    assert client.get("/api/ai/recommendations/?engine=nope").status_code == 400
+
+    report = engine_report()
+    assert report["engines"]["llm"]["empty"] == 1 and report["engines"]["popularity"]["calls"] == 1
+    assert report["engines"]["newest"]["calls"] == 1
+
+
+def test_shadow_engine_records_latency_and_overlap_off_the_response(shopper, monkeypatch):
+    user, products = shopper
+    scheduled = []
+    monkeypatch.setattr(reco_engines, "_submit", lambda job: scheduled.append(job) or True)
+
+    def slow_guess(user, *, purchased, max_items):
+        return [{"id": products[1].id, "reason": "x"}, {"id": products[5].id, "reason": "y"}]
+
+    monkeypatch.setitem(reco_engines._engines, "guess", slow_guess)
+    with override_settings(RECO_SHADOW_ENGINE="guess", RECO_SHADOW_SAMPLE_RATE=1.0):
+        data = reco_service.get_recommendations_for_user(user, max_items=2)
+        served = [p["id"] for p in data["recommended"]]
+        assert len(scheduled) == 1 and not engine_report()["shadow"], "Shadow work must not run inline"
+
+        scheduled[0]()
+        (row,) = engine_report()["shadow"]
+        assert (row["primary"], row["shadow"], row["calls"]) == ("popularity", "guess", 1)
+        assert row["overlap_mean"] == overlap_ratio(served, [products[1].id, products[5].id])
+
+        reco_service.get_recommendations_for_user(user, max_items=2)
+        assert len(scheduled) == 1, "Cache hits do not run engines, so no shadow either"
+
+
+@override_settings(GEMINI_API_KEY="k")
+def test_failed_llm_call_counts_as_an_engine_error(shopper, monkeypatch):
+    user, _products = shopper
+    monkeypatch.setattr(reco_service, "llm_available", lambda feature: True)
+
+    def down(**kwargs):
+        raise RuntimeError("503 from the model")
+
+    monkeypatch.setattr("smartshop.gemini_client.generate_text", down)
+    data = reco_service.get_recommendations_for_user(user, max_items=2, force=True)
+    assert data["engine"] == "popularity"
+    llm = engine_report()["engines"]["llm"]
+    assert (llm["calls"], llm["errors"]) == (1, 1), f"LLM failure not reported: {llm}"
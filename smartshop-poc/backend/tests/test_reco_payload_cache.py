@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from smartshop import reco_service
+from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder
+
+
+@pytest.mark.django_db
+def test_rendered_payload_hit_is_one_read_and_catalog_changes_only_rerender(monkeypatch):
+    monkeypatch.setattr(reco_service, "llm_available", lambda feature: False)
+    engine_runs = []
+    run_engines = reco_service.run_engines
+    monkeypatch.setattr(
+        reco_service, "run_engines",
+        lambda *a, **kw: engine_runs.append(1) or run_engines(*a, **kw),
+    )
+
+    user = get_user_model().objects.create_user(username="payload_user", password="x")
+    products = [
+        SmartShopProduct.objects.create(name=f"Lamp {i}", category="Home", price=Decimal(f"{i}.50"))
+        for i in range(1, 5)
+    ]
+    SmartShopPurchaseOrder.objects.create(user=user, product=products[0])
+
+    first = reco_service.get_recommendations_for_user(user, max_items=2)
+    assert not first["cached"] and len(engine_runs) == 1
+
+    with CaptureQueriesContext(connection) as ctx:
+        second = reco_service.get_recommendations_for_user(user, max_items=2)
+    assert second["cached"] and second["recommended"] == first["recommended"]
+    assert second["also_bought"] == first["also_bought"] and second["signature"] == first["signature"]
+    assert len(ctx.captured_queries) == 2, (
+        f"Rendered hit should read the cache row plus one aggregate, got {len(ctx.captured_queries)} queries"
+    )
+
+    # Catalog change: same items, re-rendered with the new product fields, no engine run
+    shown = SmartShopProduct.objects.get(id=second["recommended"][0]["id"])
+    shown.name = "Renamed Lamp"
+    shown.save()
+    third = reco_service.get_recommendations_for_user(user, max_items=2)
+    assert third["cached"] and len(engine_runs) == 1
+    assert third["recommended"][0]["name"] == "Renamed Lamp"
+
+    # New purchase: signature changes, engines run again
+    SmartShopPurchaseOrder.objects.create(user=user, product=products[1])
+    fourth = reco_service.get_recommendations_for_user(user, max_items=2)
+    assert not fourth["cached"] and len(engine_runs) == 2
+    assert products[1].id not in [p["id"] for p in fourth["recommended"]]
+
+
+@pytest.mark.django_db
+def test_payload_rendered_by_the_worker_is_a_hit_in_a_web_process(monkeypatch):
+    from django.core.cache import cache
+
+    from smartshop import catalog_snapshot
+    from smartshop.refresh import refresh_recommendations
+
+    monkeypatch.setattr(reco_service, "llm_available", lambda feature: False)
+    user = get_user_model().objects.create_user(username="worker_payload", password="x")
+    products = [
+        SmartShopProduct.objects.create(name=f"Mug {i}", category="Kitchen", price=Decimal(f"{i}.00"))
+        for i in range(1, 5)
+    ]
+    SmartShopPurchaseOrder.objects.create(user=user, product=products[0])
+
+    # Background refresh (run_ai_worker process)
+    refresh_recommendations(user.id)
+
+    # Web process: its own local cache and version memo
+    cache.clear()
+    catalog_snapshot.reset_catalog_snapshot()
+    with CaptureQueriesContext(connection) as ctx:
+        data = reco_service.get_recommendations_for_user(user, max_items=4)
+    assert data["cached"] and data["engine"] is None
+    assert len(ctx.captured_queries) == 3, (
+        f"Expected a rendered hit (cache row, aggregate, catalog version), got {len(ctx.captured_queries)} queries"
+    )
@@ -0,0 +1,53 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from smartshop import ai_insights, refresh, reco_service
+from smartshop.models import AITask, ProductDailySales, SmartShopProduct, UserAIInsight, UserRecommendationCache
+from smartshop.tasks import run_pending
+
+
+@pytest.mark.django_db
+@override_settings(REFRESH_DEBOUNCE_SECONDS=5)
+def test_purchase_burst_queues_one_refresh_and_warms_caches(monkeypatch):
+    monkeypatch.setattr(reco_service, "llm_available", lambda feature: False)
+    monkeypatch.setattr(ai_insights, "generate_user_insights_bullets", lambda **kw: ["Buys lamps."])
+
+    user = get_user_model().objects.create_user(username="refresh_user", password="x")
+    products = [
+        SmartShopProduct.objects.create(name=f"Lamp {i}", category="Home", price=Decimal(f"{i}.00"))
+        for i in range(1, 6)
+    ]
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        for p in products[:3]:
+            assert client.post("/api/purchases/buy/", {"product_id": p.id}, format="json").status_code == 200
+
+    queued = sorted(AITask.objects.filter(status=AITask.STATUS_QUEUED).values_list("task_type", flat=True))
+    assert queued == ["insights.refresh", "outbox.consume", "recommendations.refresh"], (
+        f"Burst should collapse to one task per type: {queued}"
+    )
+    assert run_pending() == {"done": 0, "failed": 0}, "Nothing runs before the debounce deadline"
+
+    stats = run_pending(now=timezone.now() + timedelta(seconds=6))
+    assert stats == {"done": 3, "failed": 0}
+    assert UserRecommendationCache.objects.get(user=user).payload_json
+    assert UserAIInsight.objects.get(user=user).bullets_json == ["Buys lamps."]
+    assert ProductDailySales.objects.filter(product__in=products[:3]).count() == 3
+
+    assert client.get("/api/ai/recommendations/").json()["cached"] is True
+    assert client.get("/api/ai/insights/").json()["cached"] is True
+
+
+@pytest.mark.django_db
+@override_settings(REFRESH_ON_PURCHASE=False)
+def test_refresh_can_be_disabled():
+    assert refresh.schedule_user_refresh(1) is False
+    assert not AITask.objects.exists()
@@ -0,0 +1,76 @@
+import pytest
+from django.test import override_settings
+
+from smartshop import llm
+from smartshop.ai_insights import generate_user_insights_bullets
+from smartshop.llm_cache import clear_memory_cache
+from smartshop.structured_output import (
+    IncrementalJSONParser,
+    extract_json_object,
+    parse_structured,
+)
+
+
+def test_extract_handles_fences_and_trailing_braces():
+    text = '```json\n{"bullets": ["a", "b"]}\n```\nNote: use {placeholders} carefully }'
+    assert extract_json_object(text) == {"bullets": ["a", "b"]}
+
+
+def test_extract_skips_invalid_candidates():
+    text = 'Here is {not json} and then {"ranked": [{"id": 3, "reason": "ok {x}"}]}'
+    assert extract_json_object(text) == {"ranked": [{"id": 3, "reason": "ok {x}"}]}
+    assert extract_json_object("no json here") is None
+    assert extract_json_object("") is None
+
+
+def test_parse_structured_returns_first_object_matching_schema():
+    text = '{"note": "thinking"} {"recommended": "oops"} {"recommended": [{"id": 1, "reason": "r"}]}'
+    data = parse_structured(text, "recommendations")
+    assert data == {"recommended": [{"id": 1, "reason": "r"}]}, f"Unexpected: {data}"
+    assert parse_structured('{"bullets": "not a list"}', "insights") is None
+
+
+def test_incremental_parser_yields_items_before_object_completes():
+    response = 'Sure!\n{"intent": "recommend", "ranked": [{"id": 1, "reason": "a \\"}\\" b"}, {"id": 2, "reason": "c"}]}'
+    parser = IncrementalJSONParser()
+
+    events = []
+    for i in range(0, len(response), 7):
+        events.extend(parser.feed(response[i:i + 7]))
+
+    items = [e for e in events if e[0] == "item"]
+    assert [(k, obj["id"]) for _e, k, obj in items] == [("ranked", 1), ("ranked", 2)], f"Events: {events}"
+    assert items[0][2]["reason"] == 'a "}" b'
+    assert events[-1][0] == "object", "The full object comes last"
+    assert parser.result("search_rerank")["intent"] == "recommend"
+
+
+@pytest.mark.django_db
+def test_generate_text_requests_json_mode_with_feature_schema(monkeypatch):
+    configs = []
+
+    class _FakeModels:
+        def generate_content(self, *, model, contents, config=None):
+            configs.append(config)
+            return type("Resp", (), {"text": '{"bullets": ["one", "two"]}', "usage_metadata": None})()
+
+    class _FakeClient:
+        def __init__(self, api_key=None, **kwargs):
+            self.models = _FakeModels()
+
+    monkeypatch.setattr(llm.genai, "Client", _FakeClient)
+    clear_memory_cache()
+
+    text = generate_user_insights_bullets(
+        api_key="k", model_name="m", username="u", purchases=[], recs=[],
+    )
+
+    assert text == ["one", "two"]
+    assert configs[0].response_mime_type == "application/json"
+    assert configs[0].response_schema["required"] == ["bullets"], f"Schema not passed: {configs[0]}"
+
+    # Same prompt without a schema is a different cache entry
+    with override_settings(LLM_STRUCTURED_OUTPUT=False):
+        generate_user_insights_bullets(api_key="k", model_name="m", username="u", purchases=[], recs=[])
+    assert len(configs) == 2 and configs[1] is None
+    clear_memory_cache()
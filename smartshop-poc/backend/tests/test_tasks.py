@@ -0,0 +1,144 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+
+from smartshop import tasks
+from smartshop.models import AITask
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    seen = []
+
+    def ok(item):
+        seen.append(item)
+
+    def flaky(item):
+        seen.append(item)
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(tasks._handlers, "test.ok", tasks.TaskHandler("test.ok", ok, concurrency=1, max_attempts=3, priority=0))
+    monkeypatch.setitem(tasks._handlers, "test.flaky", tasks.TaskHandler("test.flaky", flaky, concurrency=1, max_attempts=2, priority=0))
+    return seen
+
+
+@pytest.mark.django_db
+def test_enqueue_dedupes_by_key_and_runs_by_priority(calls):
+    first = tasks.enqueue("test.ok", {"item": "a"}, key="a", delay=60)
+    again = tasks.enqueue("test.ok", {"item": "a"}, key="a", priority=9)
+    assert again.id == first.id and AITask.objects.count() == 1
+    assert again.priority == 9 and again.run_after <= timezone.now(), "Merging keeps the earliest start"
+
+    debounced = tasks.enqueue("test.ok", {"item": "a"}, key="a", delay=60, debounce=True)
+    assert debounced.run_after > timezone.now() + timedelta(seconds=50), "debounce pushes the start back"
+
+    tasks.enqueue("test.ok", {"item": "low"}, priority=1)
+    tasks.enqueue("test.ok", {"item": "high"}, priority=5)
+    assert tasks.run_pending() == {"done": 2, "failed": 0}
+    assert calls == ["high", "low"]
+
+    with pytest.raises(ValueError):
+        tasks.enqueue("test.nope")
+
+
+@pytest.mark.django_db
+@override_settings(TASK_RETRY_BASE_SECONDS=30)
+def test_failures_retry_with_backoff_then_fail(calls):
+    task = tasks.enqueue("test.flaky", {"item": "x"}, key="x")
+    assert tasks.run_pending() == {"done": 0, "failed": 1}
+    task.refresh_from_db()
+    assert task.status == AITask.STATUS_QUEUED and task.attempts == 1 and "boom" in task.last_error
+    assert task.active_key == "test.flaky:x", "A retried task is the queued one for its key again"
+    assert task.run_after > timezone.now() + timedelta(seconds=25)
+
+    assert tasks.run_pending() == {"done": 0, "failed": 0}, "Retry waits for its backoff"
+    tasks.run_pending(now=timezone.now() + timedelta(minutes=2))
+    task.refresh_from_db()
+    assert task.status == AITask.STATUS_FAILED and task.attempts == 2 and task.finished_at
+
+
+@pytest.mark.django_db
+def test_concurrency_limit_and_stale_locks(calls):
+    tasks.enqueue("test.ok", {"item": "a"})
+    tasks.enqueue("test.ok", {"item": "b"})
+    claimed = tasks.claim_next("w1")
+    assert claimed is not None and claimed.status == AITask.STATUS_RUNNING
+    assert tasks.claim_next("w2") is None, "test.ok allows one running task at a time"
+
+    with override_settings(TASK_CONCURRENCY={"test.ok": 2}):
+        assert tasks.claim_next("w2") is not None
+
+    stats = tasks.queue_stats()
+    assert stats["types"]["test.ok"]["running"] == 2
+
+    assert tasks.requeue_stale(now=timezone.now() + timedelta(hours=1)) == 2
+    assert tasks.queue_stats()["queued_due"] == 2
+
+    call_command("run_ai_worker", "--once", "--types", "test.ok")
+    assert sorted(calls) == ["a", "b"]
+    assert not AITask.objects.exclude(status=AITask.STATUS_DONE).exists()
+
+
+@pytest.mark.django_db
+def test_enqueue_does_not_merge_into_a_task_claimed_meanwhile(calls, monkeypatch):
+    first = tasks.enqueue("test.ok", {"item": "a"}, key="a")
+    read = tasks._queued_with_key
+
+    def claimed_after_read(task_type, key):
+        existing = read(task_type, key)
+        if existing is not None:
+            tasks.claim_next("w1")
+        return existing
+
+    monkeypatch.setattr(tasks, "_queued_with_key", claimed_after_read)
+    again = tasks.enqueue("test.ok", {"item": "a"}, key="a", priority=9)
+    assert again.id != first.id and again.status == AITask.STATUS_QUEUED and again.priority == 9
+    first.refresh_from_db()
+    assert first.status == AITask.STATUS_RUNNING and first.priority == 0, "The running task is left alone"
+
+
+@pytest.mark.django_db
+def test_concurrency_limit_is_checked_when_claiming(calls, monkeypatch):
+    tasks.enqueue("test.ok", {"item": "a"})
+    tasks.enqueue("test.ok", {"item": "b"})
+    assert tasks.claim_next("w1") is not None
+
+    # A stale "nothing running" read must not let a second task through
+    monkeypatch.setattr(tasks, "_blocked_types", lambda: [])
+    assert tasks.claim_next("w2") is None
+    assert AITask.objects.filter(status=AITask.STATUS_RUNNING).count() == 1
+
+
+@pytest.mark.django_db
+def test_one_queued_task_per_key_is_enforced_by_a_plain_unique_index(calls):
+    from django.db import IntegrityError, connection, transaction
+
+    # Conditional unique constraints are ignored on MySQL (W036)
+    assert not [c for c in AITask._meta.constraints if getattr(c, "condition", None) is not None]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, AITask._meta.db_table)
+    assert any(c["unique"] and c["columns"] == ["active_key"] for c in constraints.values()), (
+        f"No unique index on active_key for {connection.vendor}"
+    )
+
+    task = tasks.enqueue("test.ok", {"item": "a"}, key="a")
+    assert task.active_key == "test.ok:a"
+    with pytest.raises(IntegrityError), transaction.atomic():
+        AITask.objects.create(task_type="test.ok", dedupe_key="a", active_key="test.ok:a")
+
+    claimed = tasks.claim_next("w1")
+    assert claimed.id == task.id and claimed.active_key is None
+    again = tasks.enqueue("test.ok", {"item": "a"}, key="a")
+    assert again.id != task.id and again.active_key == "test.ok:a"
+
+    # A failed running task cannot go back to the queue over the new one
+    tasks._requeue(task.id, run_after=timezone.now(), error="retry")
+    task.refresh_from_db()
+    assert task.status == AITask.STATUS_FAILED and task.active_key is None
+    tasks.run_pending()
+    again.refresh_from_db()
+    assert again.status == AITask.STATUS_DONE and again.active_key is None
+    assert tasks.enqueue("test.ok", {"item": "b"}).active_key is None
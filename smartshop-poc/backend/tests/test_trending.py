@@ -0,0 +1,111 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from smartshop import outbox
+from smartshop.models import SmartShopProduct, SmartShopPurchaseOrder, TrendingSketchState
+from smartshop.reco_service import _social_proof_context
+from smartshop.trending import CountMinSketch, TrendingCounter, reset_trending, trending_products
+
+CONFIG = {"bucket_seconds": 3600, "buckets": 3, "width": 256, "depth": 4, "top_k": 5}
+T0 = 1_800_000_000.0
+
+
+def _later():
+    return timezone.now() + timedelta(seconds=60)
+
+
+def test_count_min_sketch_never_undercounts_and_merges_exactly():
+    a, b = CountMinSketch(64, 4), CountMinSketch(64, 4)
+    for pid in range(500):
+        a.add(pid, 1)
+    a.add(7, 100)
+    b.add(7, 5)
+    assert a.estimate(7) >= 101
+    a.merge(b)
+    assert a.estimate(7) >= 106
+    assert all(a.estimate(pid) >= 1 for pid in range(500)), "Count-min estimates are upper bounds"
+
+
+def test_trending_counter_ranks_heavy_hitters_with_bounded_memory_and_slides():
+    c = TrendingCounter(CONFIG)
+    for pid in range(1, 1001):
+        c.add(pid, 1, at=T0)
+    c.add(42, 50, at=T0)
+    c.add(43, 30, at=T0 + 3600)
+    c.add(44, 20, at=T0 + 3600)
+
+    top = c.top(3, now=T0 + 3600)
+    assert [pid for pid, _ in top] == [42, 43, 44], f"Unexpected ranking: {top}"
+    assert all(len(b.heavy) <= CONFIG["top_k"] for b in c.buckets.values())
+    assert all(len(b.sketch.table) == 256 * 4 for b in c.buckets.values())
+
+    assert [pid for pid, _ in c.top(1, window_seconds=3600, now=T0 + 3600)] == [43]
+    # Three buckets later the first hour has slid out of the window
+    c.add(45, 1, at=T0 + 3 * 3600)
+    assert 42 not in dict(c.top(10, now=T0 + 3 * 3600))
+
+    restored = TrendingCounter.from_bytes(c.to_bytes(), CONFIG)
+    assert restored.top(10, now=T0 + 3 * 3600) == c.top(10, now=T0 + 3 * 3600)
+    assert not TrendingCounter.from_bytes(c.to_bytes(), dict(CONFIG, width=128)).buckets
+
+
+@pytest.mark.django_db
+def test_buy_feeds_trending_api_and_social_proof_through_the_outbox():
+    user = get_user_model().objects.create_user(username="trend_user", password="x")
+    hot = SmartShopProduct.objects.create(name="Hot Mug", category="Home", price=Decimal("9.90"))
+    cold = SmartShopProduct.objects.create(name="Cold Brew Kit", category="Home", price=Decimal("29.00"))
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+    with CaptureQueriesContext(connection) as ctx:
+        for product, qty in ((hot, 3), (cold, 1), (hot, 2)):
+            r = client.post("/api/purchases/buy/", {"product_id": product.id, "quantity": qty}, format="json")
+            assert r.status_code == 200, r.content
+    assert not any("smartshop_trendingsketchstate" in q["sql"] for q in ctx.captured_queries), (
+        "The buy request must not touch the shared sketch"
+    )
+    assert TrendingSketchState.objects.count() == 0
+
+    assert outbox.consume("trending", now=_later()) == 3
+    r = APIClient().get("/api/ai/trending/?limit=5")
+    assert r.status_code == 200, r.content
+    results = r.json()["results"]
+    assert [p["id"] for p in results] == [hot.id, cold.id]
+    assert results[0]["name"] == "Hot Mug" and results[0]["units_estimate"] >= 5
+
+    reset_trending()
+    assert [row["product_id"] for row in trending_products(limit=2)] == [hot.id, cold.id], (
+        "A fresh worker must read the persisted counts"
+    )
+
+    trending = _social_proof_context(user)["trending_now"]
+    assert trending and trending[0]["name"] == "Hot Mug"
+
+
+@pytest.mark.django_db
+@override_settings(TRENDING_RELOAD_SECONDS=0)
+def test_failed_merge_keeps_the_events_for_the_next_round(monkeypatch):
+    user = get_user_model().objects.create_user(username="trend_retry", password="x")
+    product = SmartShopProduct.objects.create(name="Teapot", category="Home", price=Decimal("25.00"))
+    SmartShopPurchaseOrder.objects.create(user=user, product=product, quantity=4)
+
+    def broken_save(self, *args, **kwargs):
+        raise DatabaseError("lost connection")
+
+    with monkeypatch.context() as m:
+        m.setattr(TrendingSketchState, "save", broken_save)
+        with pytest.raises(DatabaseError):
+            outbox.consume("trending", now=_later())
+    assert trending_products() == []
+
+    assert outbox.consume("trending", now=_later()) == 1
+    assert trending_products() == [{"product_id": product.id, "units": 4}]
+    assert outbox.consume("trending", now=_later()) == 0, "Counted exactly once"